@@ -17,7 +17,6 @@ Structure uniforme basée sur un modèle A5 Landscape avec:
 """
 
 from reportlab.lib.pagesizes import landscape, A5
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import mm
 from reportlab.platypus import (
     SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, 
@@ -25,12 +24,13 @@ from reportlab.platypus import (
 )
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-import psycopg2
 import json
 import os
 import subprocess
 from datetime import datetime
 from resource_utils import get_config_path
+from db_pool import connecter
+import rendu_pdf
 
 
 class EtatPDFMouvements:
@@ -74,7 +74,7 @@ class EtatPDFMouvements:
     def connect_db(self):
         """Établit la connexion à la base de données."""
         try:
-            self.conn = psycopg2.connect(
+            self.conn = connecter(
                 host=self.db_config['host'],
                 user=self.db_config['user'],
                 password=self.db_config['password'],
@@ -95,48 +95,20 @@ class EtatPDFMouvements:
     # ========================================================
     
     def _get_societe_info(self):
-        """Récupère les informations de la société depuis tb_infosociete."""
-        if not self.conn:
-            return {
-                'nomsociete': 'IJEERY',
-                'adressesociete': 'Adresse Non Configurée',
-                'villesociete': '',
-                'contactsociete': 'Contact: Non Configuré',
-                'nifsociete': 'NIF: Non Configuré',
-                'statsociete': 'STAT: Non Configurée',
-                'cifsociete': 'CIF: Non Configuré'
-            }
-        
+        """Informations société (tb_infosociete lue une fois par processus, cf. rendu_pdf)."""
         try:
-            cur = self.conn.cursor()
-            cur.execute("""
-                SELECT 
-                    nomsociete, villesociete, adressesociete, contactsociete,
-                    nifsociete, statsociete, cifsociete
-                FROM tb_infosociete LIMIT 1
-            """)
-            row = cur.fetchone()
-            if row:
-                return {
-                    'nomsociete': row[0] or 'IJEERY',
-                    'villesociete': row[1] or '',
-                    'adressesociete': row[2] or 'Adresse Non Configurée',
-                    'contactsociete': row[3] or 'Contact: Non Configuré',
-                    'nifsociete': row[4] or 'NIF: Non Configuré',
-                    'statsociete': row[5] or 'STAT: Non Configurée',
-                    'cifsociete': row[6] or 'CIF: Non Configuré'
-                }
+            infos = rendu_pdf.societe()
         except Exception as e:
             print(f"Erreur lors de la récupération des infos société: {e}")
-        
+            infos = {}
         return {
-            'nomsociete': 'IJEERY',
-            'adressesociete': 'Adresse Non Configurée',
-            'villesociete': '',
-            'contactsociete': 'Contact: Non Configuré',
-            'nifsociete': 'NIF: Non Configuré',
-            'statsociete': 'STAT: Non Configurée',
-            'cifsociete': 'CIF: Non Configuré'
+            'nomsociete': infos.get('nomsociete') or 'IJEERY',
+            'villesociete': infos.get('villesociete') or '',
+            'adressesociete': infos.get('adressesociete') or 'Adresse Non Configurée',
+            'contactsociete': infos.get('contactsociete') or 'Contact: Non Configuré',
+            'nifsociete': infos.get('nifsociete') or 'NIF: Non Configuré',
+            'statsociete': infos.get('statsociete') or 'STAT: Non Configurée',
+            'cifsociete': infos.get('cifsociete') or 'CIF: Non Configuré'
         }
     
     # ========================================================
@@ -171,15 +143,13 @@ class EtatPDFMouvements:
         )
         
         elements = []
-        styles = getSampleStyleSheet()
         page_width_usable = self.PAGE_WIDTH - 2*self.MARGIN
         
         # ========== 1. TITRE PRINCIPAL AVEC TEXTE SACRÉ ==========
         main_title = Paragraph(
             "Ankino amin'ny Jehovah ny asanao dia ho lavorary izay kasainao. Ohabolana 16:3",
-            ParagraphStyle(
+            rendu_pdf.style(
                 'MainTitle',
-                parent=styles['Normal'],
                 fontSize=10,
                 textColor=colors.black,
                 alignment=TA_CENTER,
@@ -228,9 +198,8 @@ class EtatPDFMouvements:
             f"Contact : {contactsociete}<br/>"
             f"NIF : {nifsociete}<br/>"
             f"STAT : {statsociete}<br/>",
-            ParagraphStyle(
+            rendu_pdf.style(
                 'CompanyDetails',
-                parent=styles['Normal'],
                 fontSize=9,
                 alignment=TA_LEFT,
                 leading=12
@@ -259,9 +228,8 @@ class EtatPDFMouvements:
         # Titre grand et gras (2/3 du bloc droit)
         operation_title = Paragraph(
             titre_entete,
-            ParagraphStyle(
+            rendu_pdf.style(
                 'OpTitle',
-                parent=styles['Normal'],
                 fontSize=14,
                 fontName='Helvetica-Bold',
                 alignment=TA_CENTER,
@@ -275,9 +243,8 @@ class EtatPDFMouvements:
             f"<b>Date et heure:</b> {date_operation} {datetime.now().strftime('%H:%M')}<br/>"
             f"<b>Magasin :</b> {magasin}<br/>"
             f"<b>Opérateur :</b> {operateur}",
-            ParagraphStyle(
+            rendu_pdf.style(
                 'OpInfo',
-                parent=styles['Normal'],
                 fontSize=9,
                 alignment=TA_LEFT,
                 leading=12
@@ -361,9 +328,8 @@ class EtatPDFMouvements:
             col_widths = calculate_column_widths(columns, data_rows, table_width)
             
             # Convertir les cellules en Paragraph pour permettre le wrapping automatique
-            cell_style = ParagraphStyle(
+            cell_style = rendu_pdf.style(
                 'CellText',
-                parent=styles['Normal'],
                 fontSize=8,
                 alignment=TA_LEFT,
                 wordWrap='CJK'  # Permet le wrapping automatique du texte
@@ -423,9 +389,8 @@ class EtatPDFMouvements:
         if description:
             desc_line = Paragraph(
                 f"<b>&nbsp;&nbsp;&nbsp;<u>Description: </u></b> {description}<br/><br/>",
-                ParagraphStyle(
+                rendu_pdf.style(
                     'Description',
-                    parent=styles['Normal'],
                     fontSize=9,
                     alignment=TA_LEFT,
                     leading=10
@@ -435,16 +400,14 @@ class EtatPDFMouvements:
         
         # ========== 5. SIGNATURES EN BAS ==========
         # Deux textes à gauche (stacked) et un à droite
-        sig_left_1 = Paragraph(responsable_1, ParagraphStyle(
+        sig_left_1 = Paragraph(responsable_1, rendu_pdf.style(
             'SigLabel1',
-            parent=styles['Normal'],
             fontSize=8,
             alignment=TA_CENTER
         ))
         
-        sig_right = Paragraph("Contrôleur", ParagraphStyle(
+        sig_right = Paragraph("Contrôleur", rendu_pdf.style(
             'SigLabelRight',
-            parent=styles['Normal'],
             fontSize=8,
             alignment=TA_CENTER
         ))
@@ -483,6 +446,18 @@ class EtatPDFMouvements:
             print(f"❌ Erreur lors de la génération du PDF: {e}")
             return False
     
+    def rendre_pdf_a5(self, widget, output_path, rappel=None, **parametres):
+        """
+        _build_pdf_a5(output_path, **parametres) dans le pool de rendu_pdf :
+        la page appelante rend la main tout de suite, rappel(output_path) est
+        appelé sur le thread Tk une fois le PDF écrit (et ouvert dans Chrome).
+        """
+        return rendu_pdf.rendre(
+            widget, output_path,
+            lambda: self._build_pdf_a5(output_path, **parametres),
+            ouvrir_apres=False, rappel=rappel
+        )
+    
     def _open_pdf_in_chrome(self, pdf_path):
         """Ouvre le PDF généré dans Google Chrome."""
         try:
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import registre_pages  # en premier : point de départ du rapport de démarrage
 import customtkinter as ctk
 from PIL import Image
 import os
@@ -12,6 +13,16 @@ from typing import Optional
 import psycopg2
 from psycopg2 import OperationalError
 import importlib.util
+from contextlib import contextmanager
+import db_pool
+import catalogue_cache
+import recherche_index
+import journal_caisse
+import soldes_journaliers
+import lots_peremption
+import numerotation
+import mesures
+from cache_pages import CachePages
 
 # Ensure the parent directory is in the Python path for absolute imports
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -20,84 +31,13 @@ if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
 
-# Import all your page modules
-from pages.page_activitePrix import PageActivitePrix
-from pages.page_absence import PageAbsence
-from pages.page_article import PageArticle
-from pages.page_ArticleListe import page_listeArticle
-from pages.page_articleFrs import PageArticleFrs
-from pages.page_articleMouvement import PageArticleMouvement
-from pages.page_autorisation import PageAutorisation
-from pages.page_avance15e import PageAVQ
-from pages.page_avanceSpecial_ import FenetreAvanceSpec
-from pages.page_avoir import PageAvoir
-from pages.page_banque import PageBanque
-from pages.page_banqueAjout import PageBanqueNv
-from pages.page_BaseListe import PageBaseListe
-from pages.page_caisse import PageCaisse
-from pages.page_categorieArticle import PageCategorieArticle
-from pages.page_categorieCompte import PageCategorieCompte
-from pages.page_client import PageClient
-from pages.page_clientCrédit import PageClientCrédit
-from pages.page_CmdFrs import PageCommandeFrs
-from pages.page_CodeAutorisation import PageCodeAutorisation
-from pages.page_decaissement import PageDecaissement
-from pages.page_encaissement import PageEncaissement
-from pages.page_evenement import PageEvenement
-from pages.page_decaissementBq import PageDecaissementBq
-from pages.page_encaissementBq import PageEncaissementBq
-from pages.page_Facturation import PageFacturation
-from pages.page_factureListe import PageFactureListe
-from pages.page_fonction import PageFonction
-from pages.page_fournisseur import PageFournisseur
-from pages.page_FrsDette import PageFrsDette
-from pages.page_home import page_home
-from pages.page_chat import PageChat
-from pages.page_infoArticle import PageInfoArticle
-from pages.page_inventaire import PageInventaire
-from pages.page_infoMouvement import PageInfoMouvementStock
-from pages.page_livrFrs import PageBonReception
-from pages.page_LivraisonClient import PageLivraisonClient
-from pages.page_ListeFacture import PageListeFacture
-from pages.page_magasin import PageMagasin
-from pages.page_mainPers import PageMainPersonnel
-from pages.page_personnelAjout import PagePeronnelAjout
-from pages.page_personnel import PagePersonnel
-from pages.page_peremption import PageGestionPeremption
-from pages.page_menu import PageMenu
-from pages.page_mouvementStock import PageMouvementStock
-from pages.page_pmtCredit import PagePmtCredit
-from pages.page_pmtFacture import PagePmtFacture
-from pages.page_pmtFrs import PagePmtFrs
-from pages.page_pmtSalaire import PageValidationSalaire
-from pages.page_presence import PagePresence
-from pages.page_prixListe import PagePrixListe
-from pages.page_prixSaisie import PagePrixSaisie
-from pages.page_proforma import PageCommandeCli
-from pages.page_reinit import DBInitializerApp
-from pages.page_salaireBase_ import PageSalaireBase
-from pages.page_salaireEtatBase_ import PageSalaireEtatSB
-from pages.page_salaireEtatHoraire_ import PageEtatSalaireHoraire
-from pages.page_sauvegarde import PageSauvegarde
-from pages.page_sortie import PageSortie
-from pages.page_stock import PageStock
-from pages.page_StockLivraison import PageStockLivraison
-from pages.page_SuiviCommande import PageSuiviCommande
-from pages.page_transfert import PageTransfert
-from pages.page_transfertBanque import PageTransfertBanque
-from pages.page_transfertCaisse import PageTransfertCaisse
-from pages.page_tauxhoraire import PageTauxHoraire
-from pages.page_typePmt import PageTypePmt
-from pages.page_unite import PageUnite
-from pages.page_unite import PageUniteToplevel
-from pages.page_users import PageUsers
-from pages.page_venteParMsin import PageVenteParMsin
-from pages.page_vente import PageVente
-from pages.page_listeMouvement import PageListeMouvement
+# ✅ Les pages sont importées à la première navigation (registre_pages)
 # from pages.page_absenceMiseAjour import PageAbsenceMJ
 
 from tkinter import messagebox # Import messagebox for logout confirmation
 
+registre_pages.jalon("imports")
+
 def charger_page_dynamique(nom_module, nom_classe, parent_frame, iduser):
     """Charge une classe depuis un fichier .py externe"""
     try:
@@ -140,10 +80,54 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 class DatabaseManager:
+    """
+    Accès base de l'application : les connexions sont empruntées au pool
+    partagé du processus (db_pool) au lieu d'être ouvertes à chaque appel.
+    """
     def __init__(self):
         self.db_params = self._load_db_config()
         self.conn = None
 
+    @property
+    def pool(self):
+        """Pool partagé associé aux paramètres de config.json (None si config absente)."""
+        if self.db_params is None:
+            return None
+        return db_pool.pool_pour(**self.db_params)
+
+    def lease(self):
+        """Emprunte une connexion au pool (à rendre avec release() ou conn.close())."""
+        if self.pool is None:
+            raise OperationalError("Configuration de la base de données manquante")
+        return self.pool.emprunter()
+
+    def release(self, conn):
+        """Rend au pool une connexion obtenue par lease()."""
+        if conn is not None:
+            conn.close()
+
+    @contextmanager
+    def leased_connection(self):
+        """with db_manager.leased_connection() as conn: ... commit en sortie, rollback sur erreur."""
+        if self.pool is None:
+            raise OperationalError("Configuration de la base de données manquante")
+        with self.pool.emprunt() as conn:
+            yield conn
+
+    @contextmanager
+    def leased_cursor(self):
+        """with db_manager.leased_cursor() as cursor: ... (connexion rendue en sortie)."""
+        with self.leased_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    def close_pool(self):
+        """Ferme les connexions inactives de tous les pools (fermeture de l'application)."""
+        db_pool.fermer_pools()
+
     def _load_db_config(self):
         try:
             if getattr(sys, 'frozen', False):
@@ -169,7 +153,7 @@ class DatabaseManager:
             return None
     
     def get_connection(self):
-        """Establishes a new database connection."""
+        """Borrows a database connection from the shared pool."""
         if self.db_params is None:
             print("❌ Cannot connect: Database configuration is missing.")
             return None
@@ -181,14 +165,7 @@ class DatabaseManager:
             print(f"   User: {self.db_params['user']}")
             print(f"   Database: {self.db_params['database']}")
         
-            self.conn = psycopg2.connect(
-                host=self.db_params['host'],
-                user=self.db_params['user'],
-                password=self.db_params['password'],
-                database=self.db_params['database'],
-                port=self.db_params['port'],
-                connect_timeout=10  # Timeout de 10 secondes
-            )
+            self.conn = self.lease()  # Timeout de connexion de 10 secondes
             print("✅ Connection to the database successful!")
             return self.conn
         
@@ -217,6 +194,8 @@ class DatabaseManager:
 class App(ctk.CTk):
     def __init__(self, session_data):
         super().__init__()
+        # ✅ Journal (DEBUG hors exe, INFO dans l'exe) et seuil des requêtes lentes
+        mesures.configurer()
         self.title("iJerry - Tableau de Bord")
         self.geometry("1200x760")
         self.minsize(900, 560)
@@ -250,6 +229,7 @@ class App(ctk.CTk):
         # Initialiser la connexion DB en premier
         self.db_manager = DatabaseManager()
         self.db_conn = self.db_manager.get_connection()
+        registre_pages.jalon("connexion base")
 
         # Récupérer le nom de la société juste après la connexion réussie
         self.fetch_societe_info()
@@ -259,6 +239,19 @@ class App(ctk.CTk):
             messagebox.showerror("Erreur", "Impossible de se connecter à la base de données")
             self.destroy()
             return
+
+        # ✅ Cache catalogue (articles, unités, prix) + écoute LISTEN/NOTIFY
+        catalogue_cache.demarrer()
+        # ✅ Index de recherche (pg_trgm / unaccent), créés une fois en arrière-plan
+        recherche_index.installer_en_arriere_plan()
+        # ✅ Journal de caisse (vue + index de dates), créé une fois en arrière-plan
+        journal_caisse.installer_en_arriere_plan()
+        # ✅ Soldes de caisse et de banque : table des clôtures + clôture de la veille
+        soldes_journaliers.installer_en_arriere_plan()
+        # ✅ Lots de péremption (FEFO) : table + fonctions, reconstruits à la création
+        lots_peremption.installer_en_arriere_plan()
+        # ✅ Compteurs de références des documents (numérotation sans doublon)
+        numerotation.installer_en_arriere_plan()
         
         
         self.grid_rowconfigure(0, weight=1)
@@ -330,74 +323,10 @@ class App(ctk.CTk):
 
 
         # Mapping of page names from DB to actual page classes/functions
-        self.page_mapping = {
-            "PageArticle": PageArticle,
-            "PageAbsence" : PageAbsence,
-            "PageArticleFrs": PageArticleFrs,
-            "page_listeArticle": page_listeArticle,
-            "PageArticleMouvement": PageArticleMouvement,
-            "PageAutorisation" : PageAutorisation,
-            "PageAvoir": PageAvoir,
-            "PageAVQ" : PageAVQ,
-            "FenetreAvanceSpec" : FenetreAvanceSpec,
-            "PageBanque" : PageBanque,
-            "PageBanqueNv" : PageBanqueNv,
-            "PageBaseListe" : PageBaseListe,
-            "PageCaisse": PageCaisse,
-            "PageCategorieArticle": PageCategorieArticle,
-            "PageCategorieCompte" : PageCategorieCompte,
-            "PageClient": PageClient,
-            "PageClientCrédit": PageClientCrédit,
-            "PageCommandeFrs": PageCommandeFrs,
-            "PageCodeAutorisation" : PageCodeAutorisation,
-            "PageDecaissement": PageDecaissement,
-            "PageDecaissementBq": PageDecaissementBq,
-            "PageEncaissement": PageEncaissement,
-            "PageEncaissementBq": PageEncaissementBq,
-            "PageEvenement" : PageEvenement,
-            "PageFacturation" : PageFacturation,
-            "PageFactureListe": PageFactureListe,
-            "PageFonction": PageFonction,
-            "PageFournisseur": PageFournisseur,
-            "PageFrsDette": PageFrsDette,
-            "page_home": page_home,
-            "PageChat": PageChat,
-            "PageInfoArticle": PageInfoArticle,
-            "PageInfoMouvementStock" : PageInfoMouvementStock,
-            "PageBonReception" : PageBonReception,
-            "PageLivraisonClient" : PageLivraisonClient,
-            "PageListeFacture" : PageListeFacture,
-            "PageListeMouvement" : PageListeMouvement,
-            "PageMainPersonnel" : PageMainPersonnel,
-            "PageMagasin" : PageMagasin,
-            "PageMenu": PageMenu,
-            "PageMouvementStock": PageMouvementStock,
-            "PagePrixListe" : PagePrixListe,
-            "PagePresence" : PagePresence,
-            "PageSalaireBase" : PageSalaireBase,
-            "PageSalaireEtatSB" : PageSalaireEtatSB,
-            "PageEtatSalaireHoraire" : PageEtatSalaireHoraire,
-            "PageSauvegarde": PageSauvegarde,
-            "PageSortie": PageSortie,
-            "PageStock": PageStock,
-            "PageStockLivraison" : PageStockLivraison,
-            "PageSuiviCommande" : PageSuiviCommande,
-            "PageTransfert": PageTransfert,
-            "PageTransfertBanque" : PageTransfertBanque,
-            "PageTransfertCaisse" : PageTransfertCaisse,
-            "PageTypePmt" : PageTypePmt,
-            "PageUnite" : PageUnite,
-            "PageTransfertBanque" : PageTransfertBanque,
-            "PageTransfertCaisse" : PageTransfertCaisse,
-            "PageUsers": PageUsers,
-            "PageVente" : PageVente,
-            "PageVenteParMsin" : PageVenteParMsin,
-            "PageValidationSalaire" : PageValidationSalaire,
-            #"ConfigWindow" : ConfigWindow,
-            "PageTauxHoraire" : PageTauxHoraire,
-            "DBInitializerApp" : DBInitializerApp
-            # "page_personnel" : page_personnel # This was a duplicate import
-        }
+        # Mapping of page names from DB to lazily imported pages (registre_pages)
+        self.page_mapping = dict(registre_pages.PAGES)
+        # ✅ Pages déjà construites, réaffichées sans reconstruction (LRU)
+        self.page_cache = CachePages()
 
         
         self.current_submenu_open = None
@@ -405,14 +334,16 @@ class App(ctk.CTk):
         # Set close callback
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
 
+        registre_pages.jalon("fenêtre principale construite")
+
         # Display home page or not authorized message
         if "TABLEAU DE BORD" in self.authorized_menus:
-            self.show_page(page_home)
+            self.show_page(self.page_mapping["page_home"])
         else:
             self.show_page_not_authorized("Vous n'êtes pas autorisé à voir le tableau de bord.")
 
         if "CHAT INTERNE" in self.authorized_menus:
-            self.show_page(PageChat)
+            self.show_page(self.page_mapping["PageChat"])
         else:
             self.show_page_not_authorized("Vous n'êtes pas autorisé à voir le chat interne.")
 
@@ -421,6 +352,14 @@ class App(ctk.CTk):
         self.after(1000, self.update_title_bar_time_only)
         self.bind("<Configure>", self._on_window_resize)
         self.after(120, self._apply_responsive_layout)
+        registre_pages.jalon("première page affichée")
+        self.after_idle(self._apres_affichage)
+
+    def _apres_affichage(self):
+        """Fenêtre affichée : rapport de démarrage puis préchauffage des pages fréquentes."""
+        registre_pages.jalon("fenêtre affichée")
+        print(registre_pages.rapport_demarrage())
+        registre_pages.prechauffer()
 
     def open_db_config_window(self):
         """Ouvre la fenetre de configuration de la base de données"""
@@ -471,6 +410,9 @@ class App(ctk.CTk):
         new_conn = self.connect_to_database()  # Try to connect with new parameters
         if new_conn:
             self.db_conn = new_conn  # Assign the new connection
+            # Les pages en cache ont été construites sur l'ancienne base
+            self.clear_dashboard()
+            self.page_cache.vider()
             self.update_title_bar()  # Update title bar with new DB name/info
             messagebox.showinfo("Connexion mise a jour", "La connexion a la base de donnees a été mise a jour avec succes.")
             # Optional: Refresh the current page if it relies heavily on DB data
@@ -485,7 +427,7 @@ class App(ctk.CTk):
             widget.destroy()
     
         # Créer la page de vente avec l'ID utilisateur
-        page_vente = PageVenteParMsin(self.main_frame, id_user_connecte=self.id_user_connecte)
+        page_vente = self.page_mapping["PageVenteParMsin"](self.main_frame, id_user_connecte=self.id_user_connecte)
         page_vente.pack(fill="both", expand=True)
 
         # --- New method for graceful closing ---
@@ -497,6 +439,8 @@ class App(ctk.CTk):
                 print("Connexion à la base de données fermée proprement.")
             except Exception as e:
                 print(f"Erreur lors de la fermeture de la connexion : {e}")
+        catalogue_cache.arreter()
+        self.db_manager.close_pool()
         self.destroy()
 
     def logout(self):
@@ -656,13 +600,13 @@ class App(ctk.CTk):
         if "TABLEAU DE BORD" in self.authorized_menus:
             self.btn_dashboard = ctk.CTkButton(self.nav_area_frame, text="📊 TABLEAU DE BORD", corner_radius=10, height=60,
                                                 fg_color="#268908", text_color="white", hover_color="#4CE01F",
-                                                font=("Arial", 14), command=lambda: self.show_page(page_home))
+                                                font=("Arial", 14), command=lambda: self.show_page(self.page_mapping["page_home"]))
             self.btn_dashboard.pack(pady=5, padx=10, fill="x")
 
         if "CHAT INTERNE" in self.authorized_menus:
             self.btn_dashboard = ctk.CTkButton(self.nav_area_frame, text="💬 CHAT INTERNE", corner_radius=10, height=60,
                                                 fg_color="#A19407", text_color="white", hover_color="#cad256",
-                                                font=("Arial", 14), command=lambda: self.show_page(PageChat))
+                                                font=("Arial", 14), command=lambda: self.show_page(self.page_mapping["PageChat"]))
             self.btn_dashboard.pack(pady=5, padx=10, fill="x")
 
         # Comemerciale (Parent Menu)
@@ -747,6 +691,7 @@ class App(ctk.CTk):
                                        menu.startswith("PageBaseListe") or
                                        menu.startswith("Autorisation Admin") or
                                        menu.startswith("Menu") or
+                                       menu.startswith("Diagnostics") or
                                        menu.startswith("Init DB")
                                        for menu in self.authorized_menus)
 
@@ -965,132 +910,81 @@ class App(ctk.CTk):
         self._apply_responsive_layout()
 
     def clear_dashboard(self):
+        """Vide la zone de contenu : les pages du cache sont masquées, les autres détruites."""
+        self.page_cache.masquer_courante()
         for widget in self.content_frame.winfo_children():
-            widget.destroy()
+            if not self.page_cache.contient(widget):
+                widget.destroy()
 
     def show_page(self, page_func):
+        """
+        Affiche une page du registre (registre_pages.PageDiffere, importée ici à
+        la première navigation) ou une classe/fonction de page déjà importée.
+        ✅ Durée (import + construction, ou réaffichage depuis le cache)
+        enregistrée dans mesures, catégorie "page".
+        """
+        debut = time.perf_counter()
+        signature = "standard"
+        cle_cache = None
+        if isinstance(page_func, registre_pages.PageDiffere):
+            signature = page_func.signature
+            cle_cache = page_func.cle
+            try:
+                page_func = page_func.charger()
+            except Exception as e:
+                messagebox.showerror("Erreur de Module", f"Impossible de charger {page_func.module} : {e}")
+                self.show_page_not_authorized(f"Erreur de chargement: {e}")
+                import traceback
+                traceback.print_exc()
+                return
+
         # Special handling for DBInitializerApp and other top-level windows
-        if page_func in [DBInitializerApp, DatabaseManager]:
+        if signature == "toplevel" or page_func is DatabaseManager:
             self.open_top_level_window(page_func)
             return
 
+        # ✅ Page déjà construite : simple réaffichage (on_show), sans reconstruction
+        if cle_cache is not None and self.page_cache.obtenir(cle_cache) is not None:
+            self.clear_dashboard()
+            self.page_cache.afficher(cle_cache)
+            mesures.enregistrer(cle_cache, time.perf_counter() - debut, "page", detail="cache")
+            return
+
         self.clear_dashboard()
 
         try:
             page_instance = None
+            nom_page = getattr(page_func, "__name__", str(page_func))
 
             # ========================================
-            # ✅ CAS SPÉCIAL POUR PageVente
+            # ✅ Pages qui exigent l'utilisateur connecté
             # ========================================
-            if page_func == PageVente:
+            if signature in ("id_user_connecte", "iduser", "chat"):
                 if self.id_user_connecte is None:
                     messagebox.showerror(
                         "Erreur Session",
-                        "Aucun utilisateur connecté détecté.\nImpossible d'ouvrir la page de vente."
+                        "Aucun utilisateur connecté détecté.\nImpossible d'ouvrir la page."
                     )
                     return
-    
-                page_instance = page_func(
-                    master=self.content_frame, 
-                    id_user_connecte=self.id_user_connecte
-                )
-                print(f"✅ PageVente créée avec id_user_connecte={self.id_user_connecte}")
 
-            elif page_func == PageVenteParMsin:
-                if self.id_user_connecte is None:
-                    messagebox.showerror(
-                        "Erreur Session",
-                        "Aucun utilisateur connecté détecté.\nImpossible d'ouvrir la page de vente."
-                    )
-                    return
-    
+            if signature == "id_user_connecte":
                 page_instance = page_func(
                     master=self.content_frame,
                     id_user_connecte=self.id_user_connecte
                 )
-                print(f"✅ PageVenteParMsin créée avec id_user_connecte={self.id_user_connecte}")
-            
-            elif page_func == PageLivraisonClient:
-                if self.id_user_connecte is None:
-                    messagebox.showerror(
-                        "Erreur Session",
-                        "Aucun utilisateur connecté détecté.\nImpossible d'ouvrir la page de vente."
-                    )
-                    return
-    
-                page_instance = page_func(
-                    master=self.content_frame,
-                    id_user_connecte=self.id_user_connecte
-                )
-                print(f"✅ PageLivraisonClient créée avec id_user_connecte={self.id_user_connecte}")
-                
-            elif page_func == PageTransfertBanque:
-                if self.id_user_connecte is None:
-                    messagebox.showerror(
-                        "Erreur Session",
-                        "Aucun utilisateur connecté détecté.\nImpossible d'ouvrir la page de vente."
-                    )
-                    return
-    
-                page_instance = page_func(
-                    master=self.content_frame,
-                    id_user_connecte=self.id_user_connecte
-                )
-                print(f"✅ PageTransferbBanque créée avec id_user_connecte={self.id_user_connecte}")
-                
-            elif page_func == PageTransfertCaisse:
-                if self.id_user_connecte is None:
-                    messagebox.showerror(
-                        "Erreur Session",
-                        "Aucun utilisateur connecté détecté.\nImpossible d'ouvrir la page de vente."
-                    )
-                    return
-    
-                page_instance = page_func(
-                    master=self.content_frame,
-                    id_user_connecte=self.id_user_connecte
-                )
-                print(f"✅ PageTransfertCaisse créée avec id_user_connecte={self.id_user_connecte}")
-                
-            elif page_func == PageAVQ:
-                if self.id_user_connecte is None:
-                    messagebox.showerror(
-                        "Erreur Session",
-                        "Aucun utilisateur connecté détecté.\nImpossible d'ouvrir la page de vente."
-                    )
-                    return
-    
-                page_instance = page_func(
-                    master=self.content_frame,
-                    iduser=self.id_user_connecte
-                )
-                print(f"✅ PageAVQ créée avec id_user_connecte={self.id_user_connecte}")
-                
-            elif page_func == FenetreAvanceSpec:
-                if self.id_user_connecte is None:
-                    messagebox.showerror(
-                        "Erreur Session",
-                        "Aucun utilisateur connecté détecté.\nImpossible d'ouvrir la page de vente."
-                    )
-                    return
-    
+                print(f"✅ {nom_page} créée avec id_user_connecte={self.id_user_connecte}")
+
+            elif signature == "iduser":
                 page_instance = page_func(
                     master=self.content_frame,
                     iduser=self.id_user_connecte
                 )
-                print(f"✅ FenetreAvanceSpec créée avec id_user_connecte={self.id_user_connecte}")    
+                print(f"✅ {nom_page} créée avec iduser={self.id_user_connecte}")
 
             # ========================================
             # ✅ CAS SPÉCIAL POUR PageChat
             # ========================================
-            elif page_func == PageChat:
-                if self.id_user_connecte is None:
-                    messagebox.showerror(
-                        "Erreur Session",
-                        "Aucun utilisateur connecté détecté.\nImpossible d'ouvrir le chat."
-                    )
-                    return
-            
+            elif signature == "chat":
                 # Créer les données de session pour le chat
                 chat_session_data = {
                     "iduser": self.id_user_connecte,
@@ -1101,40 +995,10 @@ class App(ctk.CTk):
                     master=self.content_frame,
                     session_data=chat_session_data
                 )
-                print(f"✅ PageChat créée avec iduser={self.id_user_connecte}")
+                print(f"✅ {nom_page} créée avec iduser={self.id_user_connecte}")
 
-            # ========================================
-            # ✅ CAS SPÉCIAL POUR PageInfoMouvementStock
-            # ========================================
-            elif page_func == PageInfoMouvementStock:
-                if self.id_user_connecte is None:
-                    messagebox.showerror(
-                        "Erreur Session",
-                        "Aucun utilisateur connecté détecté.\nImpossible d'ouvrir la page."
-                    )
-                    return
-    
-                page_instance = page_func(
-                    self.content_frame, 
-                    iduser=self.id_user_connecte
-                )
-                print(f"✅ PageInfoMouvementStock créée avec iduser={self.id_user_connecte}")
-
-            # ========================================
-            # Cas spéciaux existants
-            # ========================================
-            elif page_func in [PageTauxHoraire, PageSalaireBase]:
+            elif signature == "app_root":
                 page_instance = page_func(master=self.content_frame, app_root=self)
-            
-            elif page_func == PageFacturation:
-                if self.id_user_connecte is None:
-                    messagebox.showerror("Erreur Session", "Utilisateur non connecté.")
-                    return
-                page_instance = page_func(
-                    master=self.content_frame, 
-                    id_user_connecte=self.id_user_connecte
-                )
-                print(f"✅ PageFacturation créée avec id_user_connecte={self.id_user_connecte}")
 
             # ========================================
             # Autres pages (essais multiples)
@@ -1160,6 +1024,10 @@ class App(ctk.CTk):
                     self.grab_release()
                 else:
                     page_instance.pack(expand=True, fill="both")
+                    if cle_cache is not None:
+                        # ✅ Gardée seulement si la page sait se rafraîchir (on_show / EN_CACHE)
+                        self.page_cache.ajouter(cle_cache, page_instance)
+                    mesures.enregistrer(cle_cache or nom_page, time.perf_counter() - debut, "page")
             else:
                 raise Exception("Impossible de créer l'instance de la page avec les arguments disponibles.")
 
@@ -1177,7 +1045,7 @@ class App(ctk.CTk):
 
         # Instancie la fenêtre Toplevel
         # Si page_activitePrix a besoin de paramètres spécifiques, ajoutez-les ici
-        if page_func == PageActivitePrix: # Si vous avez un cas spécifique pour elle
+        if getattr(page_func, "__name__", "") == "PageActivitePrix": # Si vous avez un cas spécifique pour elle
             self._toplevel_window = page_func(master=self, db_conn=self.db_conn, session_data=self.session_data, db_config=self.db_config)
             # ^ Supprimez 'app_root=self' ici
         else:
@@ -1717,6 +1585,12 @@ class App(ctk.CTk):
                                       font=("Arial", 12), command=lambda: self.show_page(self.page_mapping["PageCodeAutorisation"]))                                      
             btn_aa.pack(pady=2, padx=5, fill="x")
 
+        if "Diagnostics" in self.authorized_menus:
+            btn_diag = ctk.CTkButton(self.database_submenu_frame, text="⏱️ Diagnostics", corner_radius=10, height=40,
+                                      fg_color="#874903", text_color="white", hover_color="#d7956e",
+                                      font=("Arial", 12), command=lambda: self.show_page(self.page_mapping["PageDiagnostics"]))
+            btn_diag.pack(pady=2, padx=5, fill="x")
+
         self.current_submenu_open = "DATABASE"
         self._apply_menu_responsive_styles()
         # self._repack_main_buttons_after_submenu(self.btn_database, self.database_submenu_frame)
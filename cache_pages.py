@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Cache LRU des pages affichées dans la zone de contenu d'App.
+
+Avant : chaque navigation détruisait la page courante (clear_dashboard) puis
+reconstruisait la suivante : widgets, requêtes, chargement des combobox, et
+jusqu'à trois essais de constructeur. Passer de Vente à Stock puis à Caisse
+refaisait tout à chaque clic.
+
+✅ Les pages construites restent vivantes : changer de page = pack_forget()
+   de la page courante + pack() de la page demandée.
+✅ Sur option : seules les pages qui savent se rafraîchir en revenant à
+   l'écran (méthode on_show) ou qui le déclarent (EN_CACHE = True) sont
+   gardées ; les autres sont reconstruites à chaque navigation, comme avant,
+   pour ne jamais réafficher des données périmées. EN_CACHE = False exclut
+   une page qui a pourtant un on_show().
+✅ Taille bornée (TAILLE_MAX pages) et mémoire bornée (MEMOIRE_MAX_MO) : la
+   page utilisée le moins récemment est détruite au-delà.
+✅ Crochets facultatifs des pages :
+       on_hide()  la page quitte l'écran (suspendre minuteries, clignotements...)
+       on_show()  la page revient à l'écran (rafraîchissement incrémental)
+   on_show() n'est PAS appelée à la création : le constructeur a déjà chargé.
+   Toute page à minuterie récurrente (after) l'annule dans on_hide() et la
+   relance dans on_show() ; les abonnés du bus d'événements appellent
+   evenements.suspendre(self) / evenements.reprendre(self).
+
+Réglages optionnels dans config.json (section "pages", valeurs par défaut) :
+    "pages": {"cache_taille": 6, "cache_memoire_mo": 800}
+La mémoire est celle du processus (psutil) si disponible, sinon une estimation
+d'après le nombre de widgets des pages en cache.
+"""
+
+import json
+from collections import OrderedDict
+
+from resource_utils import get_config_path
+
+try:
+    import psutil
+except ImportError:  # dépendance facultative
+    psutil = None
+
+
+TAILLE_MAX = 6             # pages gardées en vie au maximum
+MEMOIRE_MAX_MO = 800       # au-delà, les pages les plus anciennes sont détruites
+KO_PAR_WIDGET = 24         # estimation sans psutil (widget CTk = frame + canvas)
+
+
+def _reglages():
+    """Section "pages" facultative de config.json."""
+    try:
+        with open(get_config_path('config.json'), encoding='utf-8') as f:
+            return json.load(f).get('pages', {}) or {}
+    except Exception:
+        return {}
+
+
+def _nombre_widgets(widget):
+    total, pile = 0, [widget]
+    while pile:
+        w = pile.pop()
+        total += 1
+        try:
+            pile.extend(w.winfo_children())
+        except Exception:
+            pass
+    return total
+
+
+def en_cache(page):
+    """True si la page accepte d'être gardée en vie (EN_CACHE, sinon présence d'on_show)."""
+    choix = getattr(type(page), "EN_CACHE", None)
+    if choix is not None:
+        return bool(choix)
+    return callable(getattr(page, "on_show", None))
+
+
+def _appeler(page, crochet):
+    methode = getattr(page, crochet, None)
+    if callable(methode):
+        try:
+            methode()
+        except Exception as e:
+            print(f"Erreur {crochet} de {type(page).__name__} : {e}")
+
+
+class CachePages:
+    """Pages vivantes indexées par clé de menu, de la moins à la plus récente."""
+
+    def __init__(self, taille_max=None, memoire_max_mo=None):
+        reglages = _reglages()
+        self.taille_max = int(taille_max or reglages.get('cache_taille', TAILLE_MAX))
+        self.memoire_max_mo = float(memoire_max_mo or reglages.get('cache_memoire_mo', MEMOIRE_MAX_MO))
+        self._pages = OrderedDict()
+        self.courante = None        # clé de la page affichée (None : page hors cache)
+
+    def __len__(self):
+        return len(self._pages)
+
+    def contient(self, page):
+        return any(p is page for p in self._pages.values())
+
+    def obtenir(self, cle):
+        """Page vivante pour cette clé (marquée la plus récente), sinon None."""
+        page = self._pages.get(cle)
+        if page is None:
+            return None
+        try:
+            vivante = page.winfo_exists()
+        except Exception:
+            vivante = False
+        if not vivante:
+            del self._pages[cle]
+            return None
+        self._pages.move_to_end(cle)
+        return page
+
+    def masquer_courante(self):
+        """Retire la page courante de l'écran (sans la détruire) et appelle on_hide()."""
+        if self.courante is None:
+            return
+        page = self._pages.get(self.courante)
+        self.courante = None
+        if page is not None:
+            try:
+                page.pack_forget()
+            except Exception:
+                return
+            _appeler(page, "on_hide")
+
+    def afficher(self, cle, **pack):
+        """Réaffiche une page du cache et appelle on_show()."""
+        page = self.obtenir(cle)
+        if page is None:
+            return None
+        self.masquer_courante()
+        page.pack(**(pack or {"expand": True, "fill": "both"}))
+        self.courante = cle
+        _appeler(page, "on_show")
+        return page
+
+    def ajouter(self, cle, page):
+        """
+        Enregistre une page qui vient d'être construite et affichée.
+        Retourne False (page non gardée, détruite à la prochaine navigation)
+        si elle n'accepte pas le cache (voir en_cache).
+        """
+        if not en_cache(page):
+            return False
+        ancienne = self._pages.pop(cle, None)
+        if ancienne is not None and ancienne is not page:
+            self._detruire(ancienne)
+        self._pages[cle] = page
+        self.courante = cle
+        self._evincer()
+        return True
+
+    def retirer(self, cle):
+        page = self._pages.pop(cle, None)
+        if self.courante == cle:
+            self.courante = None
+        if page is not None:
+            self._detruire(page)
+
+    def vider(self):
+        for cle in list(self._pages):
+            self.retirer(cle)
+
+    # ------------------------------------------------------------------
+    def memoire_mo(self):
+        """Mémoire du processus (psutil) ou estimation d'après les widgets en cache."""
+        if psutil is not None:
+            try:
+                return psutil.Process().memory_info().rss / (1024 * 1024)
+            except Exception:
+                pass
+        return sum(_nombre_widgets(p) for p in self._pages.values()) * KO_PAR_WIDGET / 1024
+
+    def _evincer(self):
+        """Détruit les pages les moins récentes (jamais la courante) au-delà des limites."""
+        while len(self._pages) > 1:
+            if len(self._pages) <= self.taille_max and self.memoire_mo() <= self.memoire_max_mo:
+                return
+            cle = next(c for c in self._pages if c != self.courante)
+            print(f"Cache pages : {cle} libérée")
+            self.retirer(cle)
+
+    @staticmethod
+    def _detruire(page):
+        try:
+            page.destroy()
+        except Exception:
+            pass
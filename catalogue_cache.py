@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+"""
+Cache mémoire du catalogue articles, partagé par tout le processus.
+
+Code article, désignation, hiérarchie des unités (tb_unite.niveau/qtunite) et
+dernier prix (tb_prix) étaient relus à chaque fenêtre de recherche et par
+get_article_price / get_unite_niveau_max / verifier_unite_depot_b.
+
+✅ Le catalogue est chargé UNE fois (au démarrage de l'application) dans des
+tableaux compacts (module array) : une ligne par unité, triée par désignation
+puis code (les unités d'un même article sont contiguës). Les recherches filtrent ce cache localement,
+avec la normalisation et le classement de recherche_index.
+
+✅ Invalidation : des triggers (niveau instruction) sur tb_article, tb_unite et
+tb_prix envoient NOTIFY catalogue_change ; un thread d'écoute recharge alors le
+catalogue en arrière-plan et remplace l'instantané d'un seul coup.
+
+Budget mémoire visé : < 20 Mo pour 50 000 unités.
+
+Exemple :
+    from catalogue_cache import catalogue
+    for ligne in catalogue().rechercher("ciment"):
+        print(ligne.codearticle, ligne.designation, ligne.prix)
+"""
+
+import json
+import select
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+import psycopg2
+
+import db_pool
+from recherche_index import normaliser
+from resource_utils import get_config_path
+
+
+CANAL = "catalogue_change"
+
+SQL_ARTICLES = """
+    SELECT idarticle, designation
+    FROM tb_article
+    WHERE deleted = 0
+"""
+
+SQL_UNITES = """
+    SELECT u.idunite, u.idarticle, u.codearticle, u.designationunite,
+           COALESCE(u.niveau, 0), COALESCE(u.qtunite, 1), COALESCE(u.deleted, 0)
+    FROM tb_unite u
+    INNER JOIN tb_article a ON a.idarticle = u.idarticle
+    WHERE a.deleted = 0
+    ORDER BY a.designation ASC, u.idarticle ASC, u.codearticle ASC, u.idunite ASC
+"""
+
+# Dernier prix saisi pour chaque (idarticle, idunite)
+SQL_PRIX = """
+    SELECT DISTINCT ON (idarticle, idunite) idarticle, idunite, prix
+    FROM tb_prix
+    ORDER BY idarticle, idunite, id DESC
+"""
+
+SQL_TRIGGERS = """
+    CREATE OR REPLACE FUNCTION fn_notifier_catalogue() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('""" + CANAL + """', TG_TABLE_NAME);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    DECLARE
+        t TEXT;
+    BEGIN
+        FOREACH t IN ARRAY ARRAY['tb_article', 'tb_unite', 'tb_prix'] LOOP
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_catalogue_' || t) THEN
+                EXECUTE format(
+                    'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+                    'FOR EACH STATEMENT EXECUTE PROCEDURE fn_notifier_catalogue()',
+                    'trg_catalogue_' || t, t
+                );
+            END IF;
+        END LOOP;
+    END;
+    $$;
+"""
+
+LigneCatalogue = namedtuple(
+    "LigneCatalogue",
+    "idarticle idunite codearticle designation designationunite niveau qtunite coeff_hierarchique prix"
+)
+
+
+class Catalogue:
+    """Instantané immuable du catalogue (une ligne par unité)."""
+
+    def __init__(self, articles, unites, prix):
+        self.designations = {idarticle: designation or "" for idarticle, designation in articles}
+        # Désignations / codes normalisés comme f_normaliser (minuscules, sans accents)
+        self._designations_min = {idarticle: normaliser(d) for idarticle, d in self.designations.items()}
+
+        n = len(unites)
+        self.idunite = array('i')
+        self.idarticle = array('i')
+        self.niveau = array('i')
+        self.qtunite = array('d')
+        self.coeff_hierarchique = array('d', bytes(8 * n))
+        self.prix = array('d', bytes(8 * n))
+        self.codearticle = []
+        self._codes_min = []           # code normalisé (même objet si identique)
+        self.designationunite = []
+        self._debut_article = {}       # idarticle -> première ligne (unités contiguës)
+        supprimees = []
+
+        for ligne, (idunite, idarticle, code, desig_unite, niveau, qtunite, deleted) in enumerate(unites):
+            code = code or ""
+            code_min = normaliser(code)
+            self.idunite.append(idunite)
+            self.idarticle.append(idarticle)
+            self.niveau.append(niveau)
+            self.qtunite.append(float(qtunite))
+            self.codearticle.append(code)
+            self._codes_min.append(code if code_min == code else code_min)
+            self.designationunite.append(sys.intern(desig_unite or ""))
+            self._debut_article.setdefault(idarticle, ligne)
+            if deleted:
+                supprimees.append(ligne)
+
+        # Index idunite -> ligne : tableaux triés + bisect (bien plus compact qu'un dict)
+        ordre = sorted(range(n), key=self.idunite.__getitem__)
+        self._unites_triees = array('i', (self.idunite[i] for i in ordre))
+        self._lignes_triees = array('i', ordre)
+
+        # Coefficient hiérarchique : produit cumulé des qtunite (unités actives,
+        # ordonnées par niveau), comme le CTE unite_coeff des pages de stock.
+        supprimees = set(supprimees)
+        for debut in self._debut_article.values():
+            produit = 1.0
+            for ligne in sorted(self._plage(debut), key=lambda i: (self.niveau[i], self.idunite[i])):
+                if ligne in supprimees:
+                    self.coeff_hierarchique[ligne] = 1.0
+                    continue
+                qt = self.qtunite[ligne]
+                produit *= qt if qt > 0 else 1.0
+                self.coeff_hierarchique[ligne] = produit
+
+        for idarticle, idunite, valeur in prix:
+            ligne = self._ligne_unite(idunite)
+            if ligne is not None and self.idarticle[ligne] == idarticle:
+                self.prix[ligne] = float(valeur or 0)
+
+    def __len__(self):
+        return len(self.idunite)
+
+    def _plage(self, debut):
+        """Lignes consécutives d'un même article à partir de debut."""
+        idarticle = self.idarticle[debut]
+        fin = debut
+        while fin < len(self.idarticle) and self.idarticle[fin] == idarticle:
+            fin += 1
+        return range(debut, fin)
+
+    def _ligne_unite(self, idunite):
+        idunite = int(idunite)
+        i = bisect_left(self._unites_triees, idunite)
+        if i < len(self._unites_triees) and self._unites_triees[i] == idunite:
+            return self._lignes_triees[i]
+        return None
+
+    def ligne(self, i):
+        """LigneCatalogue de la ligne i."""
+        idarticle = self.idarticle[i]
+        return LigneCatalogue(
+            idarticle, self.idunite[i], self.codearticle[i],
+            self.designations.get(idarticle, ""), self.designationunite[i],
+            self.niveau[i], self.qtunite[i], self.coeff_hierarchique[i], self.prix[i]
+        )
+
+    def unite(self, idunite):
+        """LigneCatalogue de l'unité, ou None."""
+        i = self._ligne_unite(idunite)
+        return None if i is None else self.ligne(i)
+
+    def unites_article(self, idarticle):
+        """Lignes de toutes les unités d'un article (ordre catalogue)."""
+        debut = self._debut_article.get(int(idarticle))
+        return [] if debut is None else [self.ligne(i) for i in self._plage(debut)]
+
+    def prix_unite(self, idarticle, idunite):
+        """Dernier prix saisi (0.0 si aucun)."""
+        i = self._ligne_unite(idunite)
+        if i is None or self.idarticle[i] != int(idarticle):
+            return 0.0
+        return self.prix[i]
+
+    def niveau_max(self, idarticle):
+        """LigneCatalogue de l'unité de niveau maximum de l'article, ou None."""
+        debut = self._debut_article.get(int(idarticle))
+        if debut is None:
+            return None
+        return self.ligne(max(self._plage(debut), key=lambda i: self.niveau[i]))
+
+    def rechercher(self, terme="", limite=None):
+        """
+        Lignes dont le code ou la désignation contient chaque mot du terme
+        (sans casse ni accents), classées comme recherche_index.search_articles :
+        code identique, code puis désignation commençant par le terme, ordre catalogue.
+        """
+        mots = normaliser(terme).split()
+        if not mots:
+            lignes = range(len(self.idunite))
+            if limite:
+                lignes = lignes[:limite]
+            return [self.ligne(i) for i in lignes]
+
+        terme = " ".join(mots)
+        lignes = None
+        for mot in mots:
+            lignes_mot = {i for i, code in enumerate(self._codes_min) if mot in code}
+            for idarticle, designation in self._designations_min.items():
+                if mot in designation and idarticle in self._debut_article:
+                    lignes_mot.update(self._plage(self._debut_article[idarticle]))
+            lignes = lignes_mot if lignes is None else lignes & lignes_mot
+        trouvees = []
+        for i in lignes:
+            code = self._codes_min[i]
+            rang = (
+                code != terme,
+                not code.startswith(terme),
+                not self._designations_min.get(self.idarticle[i], "").startswith(terme),
+            )
+            trouvees.append((rang, i))
+        trouvees.sort()
+        if limite:
+            trouvees = trouvees[:limite]
+        return [self.ligne(i) for _, i in trouvees]
+
+
+# ==============================================================================
+# Instantané courant + écoute des changements
+# ==============================================================================
+_courant = None
+_verrou = threading.Lock()
+_arret = threading.Event()
+_ecouteur = None
+
+
+def charger(conn=None):
+    """Lit le catalogue (3 requêtes) et remplace l'instantané courant."""
+    global _courant
+    proprietaire = conn is None
+    if proprietaire:
+        conn = db_pool.pool_global().emprunter()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(SQL_ARTICLES)
+        articles = cursor.fetchall()
+        cursor.execute(SQL_UNITES)
+        unites = cursor.fetchall()
+        cursor.execute(SQL_PRIX)
+        prix = cursor.fetchall()
+        cursor.close()
+    finally:
+        if proprietaire:
+            conn.close()
+
+    nouveau = Catalogue(articles, unites, prix)
+    with _verrou:
+        _courant = nouveau
+    print(f"Catalogue chargé : {len(nouveau)} unités")
+    return nouveau
+
+
+def catalogue():
+    """Instantané courant (chargé à la demande s'il ne l'est pas encore)."""
+    courant = _courant
+    return courant if courant is not None else charger()
+
+
+def invalider():
+    """Recharge le catalogue en arrière-plan (après une modification locale par exemple)."""
+    threading.Thread(target=_recharger_silencieux, daemon=True).start()
+
+
+def _recharger_silencieux():
+    try:
+        charger()
+    except Exception as e:
+        print(f"Erreur rechargement catalogue : {e}")
+
+
+def installer_triggers(conn):
+    """Crée (une fois) la fonction et les triggers NOTIFY sur tb_article, tb_unite et tb_prix."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SQL_TRIGGERS)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Triggers catalogue non installés : {e}")
+    finally:
+        cursor.close()
+
+
+def demarrer():
+    """
+    Charge le catalogue et lance le thread d'écoute LISTEN/NOTIFY
+    (à appeler après la connexion de l'utilisateur ; sans effet si déjà lancé).
+    """
+    global _ecouteur
+    if _ecouteur is not None and _ecouteur.is_alive():
+        return
+    _arret.clear()
+    _ecouteur = threading.Thread(target=_ecouter, daemon=True)
+    _ecouteur.start()
+
+
+def arreter():
+    """Arrête le thread d'écoute."""
+    _arret.set()
+
+
+def _ecouter():
+    """Connexion dédiée (hors pool) en LISTEN ; rafales de NOTIFY regroupées."""
+    with open(get_config_path('config.json'), encoding='utf-8') as f:
+        db_config = json.load(f)['database']
+
+    premiere = True
+    while not _arret.is_set():
+        conn = None
+        try:
+            conn = psycopg2.connect(**db_config)
+            if premiere:
+                installer_triggers(conn)
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute(f"LISTEN {CANAL}")
+            # Chargement initial, ou rattrapage des NOTIFY perdus pendant la coupure
+            charger()
+            premiere = False
+
+            while not _arret.is_set():
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                if not conn.notifies:
+                    continue
+                # Regrouper une rafale (import de prix, modification en masse...)
+                time.sleep(0.5)
+                conn.poll()
+                del conn.notifies[:]
+                charger()
+        except Exception as e:
+            print(f"Écoute du catalogue interrompue : {e}")
+            _arret.wait(10)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
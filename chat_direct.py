@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Messages de la messagerie interne (tb_chat) poussés par LISTEN/NOTIFY.
+
+Avant : chaque PageChat ouvrait une connexion toutes les 5 secondes pour
+chercher les messages non lus, puis rechargeait et réaffichait toute la
+conversation au moindre message. Vingt postes = quatre requêtes par seconde
+en permanence sur le serveur, même sans aucun message.
+
+✅ Un trigger AFTER INSERT sur tb_chat envoie NOTIFY chat_message avec
+   "id_destinataire:id_expediteur" (jamais le texte : limite de 8 000 octets).
+✅ UN thread d'écoute par processus, sur une connexion dédiée (hors pool :
+   une connexion en LISTEN ne peut pas être prêtée à d'autres pages).
+   abonner(widget, iduser, rappel) : rappel(id_expediteur, id_destinataire)
+   sur le thread Tk pour chaque message qui concerne iduser ; rappel(None,
+   None) après une reconnexion (messages arrivés pendant la coupure).
+✅ Pages de conversation par clé (date_envoi) : page_conversation() pour la
+   dernière page ou les messages plus anciens, nouveaux_messages() pour ceux
+   arrivés depuis le dernier affiché. L'index (id_destinataire,
+   id_expediteur, date_envoi) sert les deux sens de la conversation.
+
+Sans trigger (droits insuffisants), actif() reste False : PageChat revient
+alors à la vérification périodique.
+
+Exemple :
+    chat_direct.abonner(self, self.id_user_connecte, self.sur_message)
+"""
+
+import json
+import select
+import threading
+import tkinter
+
+import psycopg2
+
+from resource_utils import get_config_path
+import thread_tk
+
+
+CANAL = "chat_message"
+TAILLE_PAGE = 50        # messages chargés par page d'historique
+
+SQL_TRIGGER = """
+    CREATE OR REPLACE FUNCTION fn_notifier_chat() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('""" + CANAL + """', NEW.id_destinataire || ':' || NEW.id_expediteur);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_chat_notifier') THEN
+            CREATE TRIGGER trg_chat_notifier AFTER INSERT ON tb_chat
+            FOR EACH ROW EXECUTE PROCEDURE fn_notifier_chat();
+        END IF;
+    END;
+    $$;
+
+    CREATE INDEX IF NOT EXISTS idx_chat_conversation ON tb_chat (id_destinataire, id_expediteur, date_envoi);
+"""
+
+SQL_CONVERSATION = """
+    SELECT id_expediteur, message, date_envoi FROM tb_chat
+    WHERE ((id_expediteur = %s AND id_destinataire = %s)
+        OR (id_expediteur = %s AND id_destinataire = %s))
+"""
+
+
+# ==============================================================================
+# Lecture des conversations (curseur fourni par la page)
+# ==============================================================================
+def page_conversation(cursor, moi, autre, avant=None, limite=TAILLE_PAGE):
+    """
+    Messages échangés entre moi et autre, du plus ancien au plus récent :
+    les `limite` derniers, ou les `limite` précédant la date `avant`.
+    """
+    sql = SQL_CONVERSATION
+    params = [moi, autre, autre, moi]
+    if avant is not None:
+        sql += " AND date_envoi < %s"
+        params.append(avant)
+    cursor.execute(sql + " ORDER BY date_envoi DESC LIMIT %s", params + [limite])
+    return cursor.fetchall()[::-1]
+
+
+def nouveaux_messages(cursor, moi, autre, apres):
+    """Messages de la conversation postérieurs à la date `apres` (tous si None)."""
+    if apres is None:
+        return page_conversation(cursor, moi, autre)
+    cursor.execute(SQL_CONVERSATION + " AND date_envoi > %s ORDER BY date_envoi ASC",
+                   (moi, autre, autre, moi, apres))
+    return cursor.fetchall()
+
+
+# ==============================================================================
+# Abonnements + thread d'écoute
+# ==============================================================================
+_verrou = threading.Lock()
+_abonnes = {}           # id(widget) -> (widget, iduser, rappel)
+_ecouteur = None
+_actif = threading.Event()      # LISTEN en place et trigger installé
+
+
+def actif():
+    """True si les messages sont poussés (sinon la page doit vérifier elle-même)."""
+    return _actif.is_set()
+
+
+def abonner(widget, iduser, rappel):
+    """
+    rappel(id_expediteur, id_destinataire) sur le thread Tk du widget pour
+    chaque message envoyé ou reçu par iduser ; désabonnement à sa destruction.
+    """
+    global _ecouteur
+    thread_tk.preparer(widget)
+    with _verrou:
+        _abonnes[id(widget)] = (widget, iduser, rappel)
+        if _ecouteur is None:
+            _ecouteur = threading.Thread(target=_ecouter, daemon=True)
+            _ecouteur.start()
+    # tkinter.Misc.bind : CTkFrame.bind lierait le canevas interne, pas le cadre
+    tkinter.Misc.bind(widget, '<Destroy>', lambda e: e.widget is widget and desabonner(widget), '+')
+
+
+def desabonner(widget):
+    with _verrou:
+        _abonnes.pop(id(widget), None)
+
+
+def _sans_abonne():
+    """True (et fin de l'écouteur enregistrée) si plus aucune page n'est abonnée."""
+    global _ecouteur
+    with _verrou:
+        if _abonnes:
+            return False
+        _ecouteur = None
+        _actif.clear()
+        return True
+
+
+def _diffuser(id_destinataire, id_expediteur):
+    with _verrou:
+        abonnes = list(_abonnes.values())
+    for widget, iduser, rappel in abonnes:
+        if id_destinataire is not None and iduser not in (id_destinataire, id_expediteur):
+            continue
+        thread_tk.sur_thread_tk(widget, lambda r=rappel: r(id_expediteur, id_destinataire))
+
+
+def _installer_trigger(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SQL_TRIGGER)
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"Trigger chat non installé : {e}")
+        cursor.execute("SELECT 1 FROM pg_trigger WHERE tgname = 'trg_chat_notifier'")
+        return cursor.fetchone() is not None
+    finally:
+        cursor.close()
+
+
+def _ecouter():
+    """Connexion dédiée en LISTEN ; s'arrête au premier réveil sans abonné."""
+    with open(get_config_path('config.json'), encoding='utf-8') as f:
+        db_config = json.load(f)['database']
+
+    premiere = True
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(**db_config)
+            trigger = _installer_trigger(conn)
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute(f"LISTEN {CANAL}")
+            if trigger:
+                _actif.set()
+            if not premiere:
+                _diffuser(None, None)   # rattrapage après une coupure
+            premiere = False
+
+            while True:
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    if _sans_abonne():
+                        return
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    try:
+                        dest, exp = (int(v) for v in notification.payload.split(":"))
+                    except ValueError:
+                        continue
+                    _diffuser(dest, exp)
+        except Exception as e:
+            _actif.clear()
+            print(f"Écoute du chat interrompue : {e}")
+            threading.Event().wait(10)
+            if _sans_abonne():
+                return
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
@@ -0,0 +1,625 @@
+# -*- coding: utf-8 -*-
+"""
+Pool de connexions PostgreSQL partagé par tout le processus.
+
+Ouvrir une connexion vers le serveur d'une boutique distante coûte 30 à 80 ms :
+les pages ne se connectent donc plus directement, elles EMPRUNTENT une
+connexion déjà ouverte et la rendent au pool quand elles appellent close().
+
+    ✅ Remplaçant direct de psycopg2.connect (mêmes paramètres) :
+        conn = connecter(**db_config)
+        ...
+        conn.close()            # rend la connexion au pool (rollback si besoin)
+
+    ✅ Connexion gardée par une page (self.conn / self.cursor) :
+        self.conn = connecter_page(self, **db_config)
+        -> la connexion réelle n'est empruntée que le temps d'une opération
+           (rappel Tk en lecture seule, ou jusqu'au commit / rollback) :
+           10 pages ouvertes n'immobilisent plus 10 connexions du pool.
+
+    ✅ Gestionnaires de contexte :
+        with emprunt() as conn:       # commit en sortie normale, rollback sinon
+            ...
+        with curseur() as cursor:
+            cursor.execute(...)
+
+Fonctionnement :
+    - un pool par jeu de paramètres de connexion (host, base, utilisateur...) ;
+    - taille maximale par pool ; au-delà, l'emprunt attend qu'une connexion
+      soit rendue puis lève PoolSatureError ;
+    - sur le thread principal (Tk), pas d'attente : un pool saturé ouvre une
+      connexion hors pool, fermée pour de bon par close() (journalisée) ;
+      au-delà de HORS_POOL_MAX connexions hors pool ouvertes, PoolSatureError
+      avec un message destiné à l'utilisateur ;
+    - connect_timeout (DELAI_CONNEXION) ajouté aux paramètres s'il manque :
+      un serveur injoignable ne bloque pas indéfiniment, et pages comme
+      DatabaseManager partagent le même pool ;
+    - contrôle de santé à l'emprunt (socket fermée par le serveur, ou SELECT 1
+      après une longue inactivité) : une connexion morte est remplacée, ce qui
+      reconnecte automatiquement après un redémarrage du serveur ;
+    - une connexion empruntée jamais fermée est rendue au pool dès que l'objet
+      est libéré par le ramasse-miettes ;
+    - chaque cursor.execute est chronométré (mesures.CurseurMesure) : latences
+      par requête et requêtes lentes dans le panneau de diagnostic ; avec le
+      profileur activé (profileur_sql), chaque requête est aussi rattachée à
+      sa page, sa méthode et l'action utilisateur en cours.
+
+Réglages optionnels dans config.json (section "pool", valeurs par défaut) :
+    "pool": {"taille_max": 20, "delai_attente": 10, "verif_inactivite": 60,
+             "hors_pool_max": 5}
+"""
+
+import json
+import re
+import select
+import threading
+import time
+import tkinter
+import weakref
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+import mesures
+import profileur_sql
+from resource_utils import get_config_path
+
+
+TAILLE_MAX = 20          # connexions ouvertes au maximum par pool
+DELAI_ATTENTE = 10       # secondes d'attente d'une connexion libre
+VERIF_INACTIVITE = 60    # secondes d'inactivité avant un SELECT 1 de contrôle
+DELAI_CONNEXION = 10     # connect_timeout par défaut (secondes)
+HORS_POOL_MAX = 5        # connexions hors pool ouvertes au maximum (thread principal)
+
+journal = mesures.journal(__name__)
+
+
+class PoolSatureError(psycopg2.OperationalError):
+    """Aucune connexion libre dans le délai imparti."""
+
+
+class ConnexionEmpruntee:
+    """
+    Connexion prêtée par le pool : se comporte comme une connexion psycopg2,
+    mais close() la rend au pool au lieu de la fermer.
+    Une fois rendue, l'objet est inutilisable (comme une connexion fermée).
+    """
+
+    def __init__(self, pool, brute, rendre=None):
+        self.__dict__['_pool'] = pool
+        self.__dict__['_brute'] = brute
+        finaliseur = weakref.finalize(self, rendre or pool._rendre, brute)
+        finaliseur.atexit = False
+        self.__dict__['_finaliseur'] = finaliseur
+
+    def _connexion(self):
+        brute = self.__dict__['_brute']
+        if brute is None:
+            raise psycopg2.InterfaceError("connection already closed")
+        return brute
+
+    def __getattr__(self, nom):
+        return getattr(self._connexion(), nom)
+
+    def __setattr__(self, nom, valeur):
+        setattr(self._connexion(), nom, valeur)
+
+    @property
+    def closed(self):
+        brute = self.__dict__['_brute']
+        return 1 if brute is None else brute.closed
+
+    def close(self):
+        """Rend la connexion au pool (sans effet si elle l'est déjà)."""
+        if self.__dict__['_brute'] is not None:
+            self.__dict__['_brute'] = None
+            self.__dict__['_finaliseur']()
+
+    def __enter__(self):
+        self._connexion()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Même sémantique que psycopg2 : transaction validée ou annulée,
+        # la connexion reste ouverte.
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def __repr__(self):
+        return f"<ConnexionEmpruntee {self.__dict__['_brute']!r}>"
+
+
+class PoolConnexions:
+    """Pool thread-safe de connexions psycopg2 pour un jeu de paramètres."""
+
+    def __init__(self, parametres, taille_max=TAILLE_MAX, delai_attente=DELAI_ATTENTE,
+                 verif_inactivite=VERIF_INACTIVITE, hors_pool_max=HORS_POOL_MAX):
+        self.parametres = dict(parametres)
+        self.taille_max = taille_max
+        self.delai_attente = delai_attente
+        self.verif_inactivite = verif_inactivite
+        self.hors_pool_max = hors_pool_max
+        self._libres = []          # [(connexion, horodatage du retour)]
+        self._nb_ouvertes = 0
+        self._nb_hors_pool = 0     # connexions de secours ouvertes (cumul)
+        self._hors_pool_ouvertes = 0
+        self._condition = threading.Condition()
+
+    # ------------------------------------------------------------------
+    def emprunter(self):
+        """
+        Retourne une ConnexionEmpruntee saine (réutilisée ou nouvelle).
+        Pool saturé : attente puis PoolSatureError, sauf sur le thread
+        principal qui reçoit aussitôt une connexion hors pool (dans la limite
+        de hors_pool_max, PoolSatureError au-delà).
+        """
+        limite = time.monotonic() + self.delai_attente
+        sur_thread_principal = threading.current_thread() is threading.main_thread()
+        brute, depuis, hors_pool = None, None, 0
+        with self._condition:
+            while True:
+                if self._libres:
+                    brute, depuis = self._libres.pop()
+                    break
+                if self._nb_ouvertes < self.taille_max:
+                    self._nb_ouvertes += 1
+                    break
+                if sur_thread_principal:
+                    if self._hors_pool_ouvertes >= self.hors_pool_max:
+                        raise PoolSatureError(
+                            "Trop de connexions ouvertes vers la base de données "
+                            f"({self.taille_max} + {self.hors_pool_max}).\n"
+                            "Fermez des fenêtres ou des onglets puis réessayez."
+                        )
+                    self._nb_hors_pool += 1
+                    self._hors_pool_ouvertes += 1
+                    hors_pool = self._nb_hors_pool
+                    break
+                reste = limite - time.monotonic()
+                if reste <= 0:
+                    raise PoolSatureError(
+                        f"Pool de connexions saturé ({self.taille_max} connexions empruntées)"
+                    )
+                self._condition.wait(reste)
+
+        if hors_pool:
+            return self._ouvrir_hors_pool(hors_pool)
+
+        # Le créneau est réservé : une connexion morte est remplacée sur place
+        if brute is not None and not self._en_bonne_sante(brute, depuis):
+            self._fermer(brute)
+            brute = None
+
+        if brute is None:
+            try:
+                brute = psycopg2.connect(**self.parametres)
+            except Exception:
+                self._liberer_creneau()
+                raise
+            brute.cursor_factory = profileur_sql.classe_curseur()   # latence (+ profil si activé)
+        return ConnexionEmpruntee(self, brute)
+
+    def _ouvrir_hors_pool(self, numero):
+        """Connexion de secours quand le pool est saturé : close() la ferme pour de bon."""
+        journal.warning("Pool saturé (%d connexions empruntées) : connexion hors pool n°%d",
+                        self.taille_max, numero)
+        try:
+            brute = psycopg2.connect(**self.parametres)
+        except Exception:
+            self._fermer_hors_pool(None)
+            raise
+        brute.cursor_factory = profileur_sql.classe_curseur()
+        return ConnexionEmpruntee(self, brute, rendre=self._fermer_hors_pool)
+
+    def _fermer_hors_pool(self, brute):
+        if brute is not None:
+            self._fermer(brute)
+        with self._condition:
+            self._hors_pool_ouvertes -= 1
+
+    @contextmanager
+    def emprunt(self):
+        """Prête une connexion : commit en sortie normale, rollback sur exception."""
+        conn = self.emprunter()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def fermer_tout(self):
+        """Ferme les connexions libres (les connexions prêtées seront fermées au retour)."""
+        with self._condition:
+            libres, self._libres = self._libres, []
+            self._nb_ouvertes -= len(libres)
+            self._condition.notify_all()
+        for brute, _ in libres:
+            self._fermer(brute)
+
+    def statistiques(self):
+        """{'ouvertes', 'libres', 'empruntees', 'taille_max', 'hors_pool', 'hors_pool_ouvertes'} pour le diagnostic."""
+        with self._condition:
+            libres = len(self._libres)
+            return {
+                'ouvertes': self._nb_ouvertes,
+                'libres': libres,
+                'empruntees': self._nb_ouvertes - libres,
+                'taille_max': self.taille_max,
+                'hors_pool': self._nb_hors_pool,
+                'hors_pool_ouvertes': self._hors_pool_ouvertes,
+            }
+
+    # ------------------------------------------------------------------
+    def _en_bonne_sante(self, brute, depuis):
+        """Contrôle à l'emprunt : gratuit si la socket est calme, SELECT 1 si inactive longtemps."""
+        if brute.closed:
+            return False
+        try:
+            # Un serveur arrêté (ou pg_terminate_backend) envoie un message FATAL :
+            # la socket devient lisible et poll() lève une erreur.
+            lisible, _, _ = select.select([brute], [], [], 0)
+            if lisible:
+                brute.poll()
+                del brute.notifies[:]
+            if time.monotonic() - depuis > self.verif_inactivite:
+                cursor = brute.cursor()
+                cursor.execute("SELECT 1")
+                cursor.close()
+                brute.rollback()
+            return not brute.closed
+        except Exception:
+            return False
+
+    def _rendre(self, brute):
+        """Remet la connexion dans le pool après l'avoir nettoyée (appelé une seule fois)."""
+        try:
+            if brute.closed:
+                raise psycopg2.InterfaceError("connection already closed")
+            if brute.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                brute.rollback()
+            if brute.autocommit:
+                brute.autocommit = False
+            garder = True
+        except Exception:
+            garder = False
+
+        if not garder:
+            self._fermer(brute)
+            self._liberer_creneau()
+            return
+        with self._condition:
+            self._libres.append((brute, time.monotonic()))
+            self._condition.notify()
+
+    def _liberer_creneau(self):
+        with self._condition:
+            self._nb_ouvertes -= 1
+            self._condition.notify()
+
+    @staticmethod
+    def _fermer(brute):
+        try:
+            brute.close()
+        except Exception:
+            pass
+
+
+# ==============================================================================
+# Connexions des pages : emprunt le temps d'une opération
+# ==============================================================================
+# Instructions qui écrivent ou posent un verrou : la transaction est gardée
+# jusqu'au commit / rollback de la page (faux positifs sans danger).
+_RE_ECRITURE = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|CREATE|ALTER|DROP|TRUNCATE|COPY|LOCK|GRANT|REVOKE|"
+    r"COMMENT|CALL|DO|SET|SHARE|NEXTVAL|SETVAL|PG_ADVISORY\w*)\b",
+    re.IGNORECASE,
+)
+
+
+class ConnexionPage:
+    """
+    Connexion qu'une page garde toute sa vie (self.conn, self.cursor) sans
+    immobiliser une connexion du pool : la connexion réelle est empruntée à
+    la première requête et rendue
+      - au commit() / rollback() ;
+      - à la fin du rappel Tk en cours (after_idle) si la transaction n'a
+        fait que lire (les résultats restent lisibles par fetch*).
+    Une transaction qui écrit est gardée jusqu'au commit() / rollback().
+    Hors du thread principal (ou sans fenêtre Tk), la connexion est gardée
+    jusqu'au commit(), rollback() ou close().
+    Sans widget (DatabaseManager partagé), la racine Tk de l'application est
+    utilisée et la connexion n'est pas fermée à la destruction d'une page.
+    """
+
+    def __init__(self, pool, widget=None):
+        self._pool = pool
+        self._racine = widget._root() if widget is not None else None
+        self._verrou = threading.RLock()
+        self._conn = None           # ConnexionEmpruntee pendant une opération
+        self._ecriture = False      # la transaction en cours écrit (ou verrouille)
+        self._fin_prevue = False
+        self._autocommit = False
+        self._ferme = False
+        if widget is not None:
+            # tkinter.Misc.bind : CTkFrame.bind lierait le canevas interne, pas le cadre
+            tkinter.Misc.bind(widget, '<Destroy>', lambda e: e.widget is widget and self.close(), '+')
+
+    # ------------------------------------------------------------------
+    def _acquerir(self):
+        """Connexion réelle de l'opération en cours (empruntée au besoin)."""
+        with self._verrou:
+            if self._ferme:
+                raise psycopg2.InterfaceError("connection already closed")
+            if self._conn is None:
+                self._conn = self._pool.emprunter()
+                if self._autocommit:
+                    self._conn.autocommit = True
+                self._ecriture = False
+            if self._racine is None:
+                # DatabaseManager sans widget : racine Tk de l'application, si elle existe
+                self._racine = getattr(tkinter, '_default_root', None)
+            if (not self._fin_prevue and self._racine is not None
+                    and threading.current_thread() is threading.main_thread()):
+                self._planifier(self._racine.after_idle)
+            return self._conn
+
+    def _planifier(self, after):
+        try:
+            after(self._fin_operation)
+            self._fin_prevue = True
+        except Exception:
+            pass                    # application fermée : rendue par close()
+
+    def _noter(self, sql):
+        if not isinstance(sql, str) or _RE_ECRITURE.search(sql):
+            self._ecriture = True
+
+    def _fin_operation(self):
+        """Fin du rappel Tk : une transaction qui n'a fait que lire rend sa connexion."""
+        if not self._verrou.acquire(blocking=False):
+            # Requête en cours dans un thread de la page : on repassera
+            self._fin_prevue = False
+            self._planifier(lambda rappel: self._racine.after(50, rappel))
+            return
+        try:
+            self._fin_prevue = False
+            if self._conn is not None and (self._autocommit or not self._ecriture):
+                self._rendre()
+        finally:
+            self._verrou.release()
+
+    def _rendre(self):
+        conn, self._conn = self._conn, None
+        self._ecriture = False
+        if conn is not None:
+            conn.close()            # rollback éventuel par le pool
+
+    # ------------------------------------------------------------------
+    def cursor(self, *args, **kwargs):
+        if self._ferme:
+            raise psycopg2.InterfaceError("connection already closed")
+        return CurseurPage(self, args, kwargs)
+
+    def commit(self):
+        with self._verrou:
+            if self._conn is not None:
+                try:
+                    self._conn.commit()
+                finally:
+                    self._rendre()
+
+    def rollback(self):
+        with self._verrou:
+            if self._conn is not None:
+                try:
+                    self._conn.rollback()
+                finally:
+                    self._rendre()
+
+    def close(self):
+        with self._verrou:
+            self._ferme = True
+            self._rendre()
+
+    @property
+    def closed(self):
+        return 1 if self._ferme else 0
+
+    @property
+    def autocommit(self):
+        return self._autocommit
+
+    @autocommit.setter
+    def autocommit(self, valeur):
+        with self._verrou:
+            self._autocommit = bool(valeur)
+            if self._conn is not None:
+                self._conn.autocommit = self._autocommit
+
+    def get_transaction_status(self):
+        with self._verrou:
+            if self._conn is None:
+                return extensions.TRANSACTION_STATUS_IDLE
+            return self._conn.get_transaction_status()
+
+    def __getattr__(self, nom):
+        # dsn, encoding, server_version, cursor_factory... : connexion réelle
+        return getattr(self._acquerir(), nom)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def __repr__(self):
+        return f"<ConnexionPage {self._conn!r}>"
+
+
+class CurseurPage:
+    """Curseur d'une ConnexionPage : recréé sur la connexion réelle de chaque opération."""
+
+    def __init__(self, connexion, args, kwargs):
+        self._connexion = connexion
+        self._args = args
+        self._kwargs = kwargs
+        self._curseur = None
+        self._conn = None
+        self._ferme = False
+        if kwargs.get('name') or (args and args[0]):
+            connexion._ecriture = True      # curseur serveur : vit dans la transaction
+
+    def _reel(self):
+        if self._ferme:
+            raise psycopg2.InterfaceError("cursor already closed")
+        conn = self._connexion._acquerir()
+        if self._curseur is None or self._conn is not conn:
+            self._curseur = conn.cursor(*self._args, **self._kwargs)
+            self._conn = conn
+        return self._curseur
+
+    def execute(self, sql, params=None):
+        with self._connexion._verrou:
+            curseur = self._reel()
+            self._connexion._noter(sql)
+            return curseur.execute(sql, params)
+
+    def executemany(self, sql, params_seq):
+        with self._connexion._verrou:
+            curseur = self._reel()
+            self._connexion._noter(sql)
+            return curseur.executemany(sql, params_seq)
+
+    def callproc(self, *args, **kwargs):
+        with self._connexion._verrou:
+            curseur = self._reel()
+            self._connexion._ecriture = True
+            return curseur.callproc(*args, **kwargs)
+
+    def mogrify(self, sql, params=None):
+        with self._connexion._verrou:
+            return self._reel().mogrify(sql, params)
+
+    @property
+    def connection(self):
+        return self._connexion
+
+    @property
+    def closed(self):
+        return self._ferme
+
+    def close(self):
+        self._ferme = True
+        if self._curseur is not None:
+            try:
+                self._curseur.close()
+            except Exception:
+                pass
+
+    def __getattr__(self, nom):
+        # fetch*, description, rowcount, statusmessage... : résultats du dernier execute
+        if self._curseur is None:
+            return getattr(self._reel(), nom)
+        return getattr(self._curseur, nom)
+
+    def __iter__(self):
+        return iter(self._curseur if self._curseur is not None else ())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+# ==============================================================================
+# Pools du processus (un par jeu de paramètres)
+# ==============================================================================
+_pools = {}
+_verrou = threading.Lock()
+
+
+def _reglages():
+    """Section "pool" facultative de config.json."""
+    try:
+        with open(get_config_path('config.json'), encoding='utf-8') as f:
+            return json.load(f).get('pool', {}) or {}
+    except Exception:
+        return {}
+
+
+def pool_pour(**parametres):
+    """Retourne (en le créant au besoin) le pool associé à ces paramètres de connexion."""
+    parametres.setdefault('connect_timeout', DELAI_CONNEXION)
+    cle = tuple(sorted((k, str(v)) for k, v in parametres.items()))
+    with _verrou:
+        pool = _pools.get(cle)
+        if pool is None:
+            reglages = _reglages()
+            pool = PoolConnexions(
+                parametres,
+                taille_max=int(reglages.get('taille_max', TAILLE_MAX)),
+                delai_attente=float(reglages.get('delai_attente', DELAI_ATTENTE)),
+                verif_inactivite=float(reglages.get('verif_inactivite', VERIF_INACTIVITE)),
+                hors_pool_max=int(reglages.get('hors_pool_max', HORS_POOL_MAX)),
+            )
+            _pools[cle] = pool
+        return pool
+
+
+def connecter(**parametres):
+    """Remplaçant direct de psycopg2.connect : emprunte une connexion au pool."""
+    return pool_pour(**parametres).emprunter()
+
+
+def connecter_page(widget, **parametres):
+    """
+    Connexion gardée par une page (self.conn) : le pool n'est sollicité que le
+    temps d'une opération. widget=None pour un DatabaseManager sans fenêtre.
+    """
+    return ConnexionPage(pool_pour(**parametres), widget)
+
+
+def pool_global():
+    """Pool de la base décrite dans la section "database" de config.json."""
+    with open(get_config_path('config.json'), encoding='utf-8') as f:
+        db_config = json.load(f)['database']
+    return pool_pour(**db_config)
+
+
+@contextmanager
+def emprunt(pool=None):
+    """with emprunt() as conn: ... (commit en sortie normale, rollback sinon)."""
+    with (pool or pool_global()).emprunt() as conn:
+        yield conn
+
+
+@contextmanager
+def curseur(pool=None):
+    """with curseur() as cursor: ... (connexion empruntée puis rendue)."""
+    with emprunt(pool) as conn:
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+
+def fermer_pools():
+    """Ferme toutes les connexions libres de tous les pools (fin d'application, restauration)."""
+    with _verrou:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.fermer_tout()
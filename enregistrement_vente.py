@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Enregistrement d'une vente multi-magasins en une seule transaction.
+
+Avant : PageVenteParMsin.enregistrer_facture lisait le crédit du client,
+validait la création du client dans sa propre transaction, puis insérait
+chaque en-tête et chaque ligne une requête à la fois (sur le thread Tk) :
+une facture de 40 lignes coûtait plus de 80 allers-retours, et une erreur en
+cours de route laissait le client créé sans facture.
+
+✅ enregistrer_vente() : tout ou rien, sur une connexion du pool
+     1. contrôle : crédit du client + stock de toutes les lignes (1 requête)
+     2. client créé si besoin (même transaction)
+     3. références des N factures (un magasin = une facture) en un incrément
+     4. en-têtes (execute_values ... RETURNING) puis lignes (execute_values)
+   Soit environ 5 allers-retours quel que soit le nombre de lignes.
+✅ Refus levés AVANT toute écriture (rollback) :
+     CreditDepasse     total de la vente > crédit autorisé du client
+     StockInsuffisant  lignes dont la quantité dépasse le stock du magasin ;
+                       forcer_stock=True enregistre malgré tout (la page
+                       demande confirmation, comme à l'ajout d'une ligne).
+
+Exemple :
+    try:
+        resultat = enregistrer_vente(client_nom, lignes, date_vente, description, iduser)
+    except StockInsuffisant as e:
+        ...  # e.manques : [(indice de ligne, demandé, disponible)] dans l'unité de la ligne
+    for facture in resultat['factures']:
+        print(facture['ref'], facture['idvente'])
+"""
+
+from contextlib import contextmanager
+
+from psycopg2.extras import execute_values
+
+import db_pool
+import numerotation
+from stock_engine import SQL_LIGNES_RESERVEES, sql_soldes
+
+
+class VenteRefusee(Exception):
+    """Vente non enregistrée (rien n'a été écrit)."""
+
+
+class CreditDepasse(VenteRefusee):
+    def __init__(self, total, limite):
+        super().__init__(f"Crédit dépassé : {total} > {limite}")
+        self.total = total
+        self.limite = limite
+
+
+class StockInsuffisant(VenteRefusee):
+    def __init__(self, manques):
+        super().__init__(f"Stock insuffisant sur {len(manques)} ligne(s)")
+        self.manques = manques
+
+
+# Crédit du client + lignes en rupture, en un seul aller-retour.
+# Toujours au moins une ligne (client éventuel) ; m.i non NULL = ligne en rupture.
+SQL_CONTROLE = """
+    WITH lignes AS (""" + SQL_LIGNES_RESERVEES + """),
+    demande AS (
+        SELECT idarticle, idmag, SUM(base) AS base FROM lignes GROUP BY idarticle, idmag
+    ),
+    solde AS (
+        SELECT s.idarticle, s.idmag, s.solde_base FROM ({soldes}) AS s
+        WHERE s.idarticle = ANY(%(articles)s::INT[])
+    ),
+    client AS (
+        SELECT idclient, credit FROM tb_client
+        WHERE deleted = 0
+          AND (idclient = %(idclient)s OR (%(idclient)s IS NULL AND nomcli = %(client)s))
+        ORDER BY idclient
+        LIMIT 1
+    )
+    SELECT c.idclient, c.credit, m.i, m.demande, m.disponible
+    FROM (SELECT 1) AS un
+    LEFT JOIN client c ON TRUE
+    LEFT JOIN (
+        SELECT l.i,
+               d.base / l.coeff AS demande,
+               GREATEST(COALESCE(s.solde_base, 0), 0) / l.coeff AS disponible
+        FROM lignes l
+        INNER JOIN demande d ON d.idarticle = l.idarticle AND d.idmag = l.idmag
+        LEFT JOIN solde s ON s.idarticle = l.idarticle AND s.idmag = l.idmag
+        WHERE d.base > COALESCE(s.solde_base, 0)
+    ) AS m ON TRUE
+    ORDER BY m.i
+"""
+
+SQL_ENTETES = """
+    INSERT INTO tb_vente (refvente, dateregistre, description, iduser, idclient, totmtvente, idmag, statut, deleted)
+    VALUES %s
+    RETURNING id, refvente
+"""
+
+SQL_LIGNES = """
+    INSERT INTO tb_ventedetail (idvente, idarticle, idunite, qtvente, prixunit, remise, idmag)
+    VALUES %s
+"""
+
+
+@contextmanager
+def _connexion(conn=None):
+    """Connexion fournie (l'appelant valide la transaction) ou empruntée au pool (commit en sortie)."""
+    if conn is not None:
+        yield conn
+    else:
+        with db_pool.emprunt() as conn:
+            yield conn
+
+
+def montant_ligne(ligne):
+    """Montant net d'une ligne (remise unitaire appliquée à la quantité, jamais négatif)."""
+    qtvente = float(ligne['qtvente'])
+    montant = qtvente * float(ligne['prixunit']) - float(ligne.get('remise', 0) or 0) * qtvente
+    return max(montant, 0.0)
+
+
+def controler(cursor, client_nom, lignes, idclient=None):
+    """
+    Retourne (idclient trouvé ou None, crédit autorisé ou None,
+    [(indice de ligne, demandé, disponible)]) ; quantités dans l'unité de chaque ligne.
+    """
+    cursor.execute(SQL_CONTROLE.format(soldes=sql_soldes(cursor)), {
+        'articles': [int(l['idarticle']) for l in lignes],
+        'unites': [int(l['idunite']) for l in lignes],
+        'magasins': [int(l['idmag']) for l in lignes],
+        'quantites': [float(l['qtvente']) for l in lignes],
+        'idclient': idclient,
+        'client': client_nom,
+    })
+    resultats = cursor.fetchall()
+    trouve, credit = resultats[0][0], resultats[0][1]
+    manques = [(int(i) - 1, float(demande), float(disponible))
+               for _, _, i, demande, disponible in resultats if i is not None]
+    return trouve, credit, manques
+
+
+def enregistrer_vente(client_nom, lignes, date_vente, description, iduser,
+                      idclient=None, statut='EN_ATTENTE', forcer_stock=False, conn=None):
+    """
+    Enregistre une facture par magasin présent dans `lignes` (dicts de
+    detail_vente : idarticle, idunite, idmag, designationmag, qtvente,
+    prixunit, remise).
+
+    Retourne {'idclient', 'client_cree', 'factures': [{'idvente', 'ref',
+    'idmag', 'magasin', 'total'}]} ; lève CreditDepasse / StockInsuffisant
+    sans rien écrire.
+    """
+    if not lignes:
+        raise ValueError("Aucune ligne à enregistrer")
+    if not client_nom:
+        raise ValueError("Client manquant")
+
+    # Une facture par magasin, dans l'ordre d'apparition des lignes
+    par_magasin = {}
+    for ligne in lignes:
+        par_magasin.setdefault(ligne['idmag'], []).append(ligne)
+    total_general = sum(montant_ligne(l) for l in lignes)
+
+    with _connexion(conn) as conn:
+        cursor = conn.cursor()
+        try:
+            trouve, credit, manques = controler(cursor, client_nom, lignes, idclient)
+            if credit is not None and total_general > float(credit):
+                raise CreditDepasse(total_general, float(credit))
+            if manques and not forcer_stock:
+                raise StockInsuffisant(manques)
+
+            client_cree = False
+            idclient = idclient or trouve
+            if not idclient:
+                cursor.execute("INSERT INTO tb_client (nomcli, deleted) VALUES (%s, 0) RETURNING idclient",
+                               (client_nom,))
+                idclient = cursor.fetchone()[0]
+                client_cree = True
+
+            references = numerotation.prochaines_references(cursor, "FA", len(par_magasin))
+            factures = []
+            for ref, (idmag, details) in zip(references, par_magasin.items()):
+                factures.append({
+                    'ref': ref,
+                    'idmag': idmag,
+                    'magasin': details[0].get('designationmag', ''),
+                    'total': sum(montant_ligne(l) for l in details),
+                })
+
+            entetes = execute_values(cursor, SQL_ENTETES, [
+                (f['ref'], date_vente, f"{description} - {f['magasin']}", iduser, idclient,
+                 f['total'], f['idmag'], statut, 0)
+                for f in factures
+            ], fetch=True)
+            ids = {ref: idvente for idvente, ref in entetes}
+            for facture in factures:
+                facture['idvente'] = ids[facture['ref']]
+
+            execute_values(cursor, SQL_LIGNES, [
+                (facture['idvente'], l['idarticle'], l['idunite'], l['qtvente'], l['prixunit'],
+                 l.get('remise', 0) or 0, l['idmag'])
+                for facture in factures
+                for l in par_magasin[facture['idmag']]
+            ], page_size=len(lignes))
+        finally:
+            cursor.close()
+
+    return {'idclient': idclient, 'client_cree': client_cree, 'factures': factures}
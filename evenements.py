@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+Bus d'événements du processus : stock, documents et péremptions.
+
+Avant : PageSuiviStockDepot et PageSuiviCommande relisaient tout le stock
+toutes les 60 secondes (boucle_verification), les onglets de vente
+vérifiaient l'alerte stock toutes les 5 minutes et le badge péremption de
+PageStock relisait toutes les livraisons : chaque fenêtre ouverte interrogeait
+les mêmes tables avec sa propre minuterie, qu'il y ait eu un mouvement ou non.
+
+✅ Des triggers (niveau ligne) envoient NOTIFY evenement avec "sujet:clé" :
+     stock       idarticle d'un mouvement (tables de stock_engine.SQL_MOUVEMENTS,
+                 tb_stock, tb_stock_solde ; validation d'une vente : ses articles)
+     peremption  idarticle d'une livraison fournisseur
+     document    "table.id" d'une vente ou d'une commande enregistrée
+   Une clé vide signifie « tout relire ».
+✅ UN thread d'écoute par processus (connexion dédiée hors pool, comme
+   catalogue_cache et chat_direct) regroupe les rafales puis appelle les
+   abonnés avec l'ensemble des clés touchées :
+     abonner(widget, sujet, rappel)  rappel(cles) sur le thread Tk du widget
+     ecouter(sujet, rappel)          rappel(cles) sur le thread d'écoute
+   cles est un set (idarticle, ou (table, id) pour document), ou None pour
+   tout relire (reconnexion, changement de jour pour les péremptions).
+✅ Sans trigger ou sans connexion, actif() est False et le bus envoie None à
+   tous les abonnés toutes les PERIODE_SECOURS secondes : une seule
+   minuterie pour le processus au lieu d'une par fenêtre.
+✅ Page masquée (cache de pages) : suspendre(widget) dans on_hide() cumule
+   ses rafales, reprendre(widget) dans on_show() les applique en une fois ;
+   une page cachée ne relit rien tant qu'elle n'est pas réaffichée.
+
+Exemple :
+    evenements.abonner(self, evenements.STOCK, self.sur_mouvement_stock)
+
+    def sur_mouvement_stock(self, idarticles):
+        self.verifier_stocks(idarticles)      # None : tout relire
+
+    def on_hide(self):
+        evenements.suspendre(self)
+
+    def on_show(self):
+        evenements.reprendre(self)
+"""
+
+import json
+import select
+import threading
+import time
+import tkinter
+from datetime import date
+
+import psycopg2
+
+from resource_utils import get_config_path
+import thread_tk
+
+
+CANAL = "evenement"
+
+STOCK = "stock"
+PEREMPTION = "peremption"
+DOCUMENT = "document"
+SUJETS = (STOCK, PEREMPTION, DOCUMENT)
+
+PERIODE_SECOURS = 120       # secondes entre deux relectures complètes sans NOTIFY
+DELAI_RAFALE = 0.3          # regroupement des NOTIFY d'une même rafale
+
+# (table, sujets) : arguments du trigger
+TABLES = [
+    ("tb_livraisonfrs", (STOCK, PEREMPTION)),
+    ("tb_ventedetail", (STOCK,)),
+    ("tb_transfertdetail", (STOCK,)),
+    ("tb_sortiedetail", (STOCK,)),
+    ("tb_inventaire", (STOCK,)),
+    ("tb_avoirdetail", (STOCK,)),
+    ("tb_consommationinterne_details", (STOCK,)),
+    ("tb_detailchange_entree", (STOCK,)),
+    ("tb_detailchange_sortie", (STOCK,)),
+    ("tb_stock", (STOCK,)),
+    ("tb_stock_solde", (STOCK,)),
+    ("tb_vente", (STOCK, DOCUMENT)),
+    ("tb_commande", (DOCUMENT,)),
+]
+
+SQL_FONCTION = """
+    CREATE OR REPLACE FUNCTION fn_notifier_evenement() RETURNS trigger AS $$
+    DECLARE
+        ligne JSONB;
+        sujet TEXT;
+        cle TEXT;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            ligne := to_jsonb(OLD);
+        ELSE
+            ligne := to_jsonb(NEW);
+        END IF;
+
+        FOREACH sujet IN ARRAY TG_ARGV LOOP
+            IF sujet = 'document' THEN
+                PERFORM pg_notify('""" + CANAL + """', sujet || ':' || TG_TABLE_NAME || '.' || COALESCE(ligne->>'id', ligne->>'idcom', ''));
+            ELSIF TG_TABLE_NAME = 'tb_vente' THEN
+                -- Validation / annulation d'une vente : le stock de ses articles change
+                FOR cle IN SELECT DISTINCT vd.idarticle::TEXT FROM tb_ventedetail vd
+                           WHERE vd.idvente = (ligne->>'id')::INT LOOP
+                    PERFORM pg_notify('""" + CANAL + """', sujet || ':' || cle);
+                END LOOP;
+            ELSE
+                cle := ligne->>'idarticle';
+                IF cle IS NULL AND ligne ? 'codearticle' THEN
+                    SELECT u.idarticle::TEXT INTO cle FROM tb_unite u
+                    WHERE u.codearticle = ligne->>'codearticle' LIMIT 1;
+                END IF;
+                PERFORM pg_notify('""" + CANAL + """', sujet || ':' || COALESCE(cle, ''));
+            END IF;
+        END LOOP;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+SQL_TRIGGER = """
+    DO $$
+    BEGIN
+        IF to_regclass(%(table)s) IS NOT NULL
+           AND NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = %(nom)s) THEN
+            EXECUTE format(
+                'CREATE TRIGGER %%I AFTER INSERT OR UPDATE OR DELETE ON %%I '
+                'FOR EACH ROW EXECUTE PROCEDURE fn_notifier_evenement(%%s)',
+                %(nom)s, %(table)s, %(arguments)s
+            );
+        END IF;
+    END;
+    $$;
+"""
+
+
+# ==============================================================================
+# Abonnements
+# ==============================================================================
+_verrou = threading.Lock()
+_abonnes = {}           # clé -> (widget ou None, sujet, rappel)
+_suspendus = {}         # id(widget) -> {sujet: clés cumulées ou None (tout relire)}
+_ecouteur = None
+_actif = threading.Event()      # LISTEN en place et triggers installés
+
+
+def actif():
+    """True si les événements viennent de la base (sinon relectures périodiques)."""
+    return _actif.is_set()
+
+
+def abonner(widget, sujet, rappel):
+    """
+    rappel(cles) sur le thread Tk du widget pour chaque rafale du sujet ;
+    désabonnement automatique à sa destruction.
+    """
+    cle = (id(widget), sujet)
+    thread_tk.preparer(widget)
+    _enregistrer(cle, (widget, sujet, rappel))
+    # tkinter.Misc.bind : CTkFrame.bind lierait le canevas interne, pas le cadre
+    tkinter.Misc.bind(widget, '<Destroy>', lambda e: e.widget is widget and retirer(cle), '+')
+    return cle
+
+
+def ecouter(sujet, rappel):
+    """rappel(cles) sur le thread d'écoute (abonnés sans widget) ; retirer(jeton) pour arrêter."""
+    jeton = (object(), sujet)
+    _enregistrer(jeton, (None, sujet, rappel))
+    return jeton
+
+
+def retirer(jeton):
+    with _verrou:
+        _abonnes.pop(jeton, None)
+        if not any(cle[0] == jeton[0] for cle in _abonnes):
+            _suspendus.pop(jeton[0], None)
+
+
+def suspendre(widget):
+    """Page masquée : les rafales destinées au widget sont cumulées au lieu d'être appliquées."""
+    with _verrou:
+        _suspendus.setdefault(id(widget), {})
+
+
+def reprendre(widget):
+    """Page réaffichée (on_show, thread Tk) : une rafale cumulée par sujet, appliquée aussitôt."""
+    with _verrou:
+        en_attente = _suspendus.pop(id(widget), None) or {}
+        rappels = {sujet: _abonnes[(id(widget), sujet)][2]
+                   for sujet in en_attente if (id(widget), sujet) in _abonnes}
+    for sujet, rappel in rappels.items():
+        try:
+            rappel(en_attente[sujet])
+        except Exception as e:
+            print(f"Erreur abonné {sujet} : {e}")
+
+
+def publier(sujet, cles=None):
+    """Diffuse un événement local (même chemin que les NOTIFY)."""
+    _diffuser({sujet: None if cles is None else set(cles)})
+
+
+def _enregistrer(cle, abonne):
+    global _ecouteur
+    with _verrou:
+        _abonnes[cle] = abonne
+        if _ecouteur is None:
+            _ecouteur = threading.Thread(target=_ecouter, daemon=True)
+            _ecouteur.start()
+
+
+def _sans_abonne():
+    """True (et fin de l'écouteur enregistrée) si plus personne n'écoute."""
+    global _ecouteur
+    with _verrou:
+        if _abonnes:
+            return False
+        _ecouteur = None
+        _actif.clear()
+        return True
+
+
+def _diffuser(evenements):
+    """evenements : {sujet: set de clés ou None}."""
+    with _verrou:
+        abonnes = []
+        for widget, sujet, rappel in _abonnes.values():
+            if sujet not in evenements:
+                continue
+            cles = evenements[sujet]
+            en_attente = _suspendus.get(id(widget)) if widget is not None else None
+            if en_attente is None:
+                abonnes.append((widget, sujet, rappel, None if cles is None else set(cles)))
+            elif cles is None or (sujet in en_attente and en_attente[sujet] is None):
+                en_attente[sujet] = None
+            else:
+                en_attente.setdefault(sujet, set()).update(cles)
+    for widget, sujet, rappel, cles in abonnes:
+        try:
+            if widget is None:
+                rappel(cles)
+            else:
+                thread_tk.sur_thread_tk(widget, lambda r=rappel, c=cles: r(c))
+        except Exception as e:
+            print(f"Erreur abonné {sujet} : {e}")
+
+
+def _tout_relire():
+    _diffuser(dict.fromkeys(SUJETS))
+
+
+# ==============================================================================
+# Thread d'écoute
+# ==============================================================================
+def _cle(sujet, valeur):
+    """Clé d'un payload : idarticle, (table, id) pour document, None si inconnue."""
+    if not valeur:
+        return None
+    if sujet == DOCUMENT:
+        table, _, ident = valeur.partition(".")
+        return (table, int(ident)) if ident.isdigit() else None
+    return int(valeur) if valeur.isdigit() else None
+
+
+def _lire_notifications(conn, evenements):
+    conn.poll()
+    while conn.notifies:
+        sujet, _, valeur = conn.notifies.pop(0).payload.partition(":")
+        if sujet not in SUJETS:
+            continue
+        cle = _cle(sujet, valeur)
+        if cle is None:
+            evenements[sujet] = None
+        elif evenements.setdefault(sujet, set()) is not None:
+            evenements[sujet].add(cle)
+
+
+def _installer_triggers(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SQL_FONCTION)
+        for table, sujets in TABLES:
+            cursor.execute(SQL_TRIGGER, {
+                "table": table,
+                "nom": f"trg_evenement_{table[3:]}",
+                "arguments": ", ".join(f"'{sujet}'" for sujet in sujets),
+            })
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"Triggers d'événements non installés : {e}")
+        cursor.execute("SELECT 1 FROM pg_trigger WHERE tgname LIKE 'trg_evenement_%'")
+        return cursor.fetchone() is not None
+    finally:
+        cursor.close()
+
+
+def _ecouter():
+    """Connexion dédiée en LISTEN ; s'arrête au premier réveil sans abonné."""
+    with open(get_config_path('config.json'), encoding='utf-8') as f:
+        db_config = json.load(f)['database']
+
+    premiere = True
+    jour = date.today()
+    dernier_secours = time.monotonic()
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(**db_config)
+            trigger = _installer_triggers(conn)
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute(f"LISTEN {CANAL}")
+            if trigger:
+                _actif.set()
+            if not premiere:
+                _tout_relire()      # rattrapage après une coupure
+            premiere = False
+
+            while True:
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    if _sans_abonne():
+                        return
+                    if date.today() != jour:
+                        # Nouveau jour : des lots passent « bientôt périmés » ou « périmés »
+                        jour = date.today()
+                        _diffuser({PEREMPTION: None})
+                    if not _actif.is_set() and time.monotonic() - dernier_secours >= PERIODE_SECOURS:
+                        dernier_secours = time.monotonic()
+                        _tout_relire()
+                    continue
+                evenements = {}
+                _lire_notifications(conn, evenements)
+                # Regrouper une rafale (document de plusieurs lignes, import...)
+                time.sleep(DELAI_RAFALE)
+                _lire_notifications(conn, evenements)
+                if evenements:
+                    _diffuser(evenements)
+        except Exception as e:
+            _actif.clear()
+            print(f"Écoute des événements interrompue : {e}")
+            threading.Event().wait(10)
+            if _sans_abonne():
+                return
+            if time.monotonic() - dernier_secours >= PERIODE_SECOURS:
+                dernier_secours = time.monotonic()
+                _tout_relire()
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+Export des factures de vente en PDF, par lot (archivage, réimpressions).
+
+Avant : "Imprimer toutes" et les réimpressions appelaient get_data_facture
+une facture à la fois (un COUNT(*) de contrôle + deux requêtes chacune),
+puis dessinaient le PDF sur le thread Tk. Archiver 2 000 factures de fin de
+mois prenait l'après-midi.
+
+✅ Lecture groupée : lire_factures(cursor, ids) = DEUX requêtes par tranche
+   de LECTURE factures (en-têtes, puis toutes les lignes avec = ANY(%s)).
+✅ Rendu réparti sur un pool de PROCESSUS (reportlab est du calcul Python :
+   les threads se partageraient un seul cœur). Les factures sont envoyées
+   par lots de LOT ; chaque processus dessine avec facture_a5.
+✅ fusion=True : chaque lot devient un PDF de plusieurs pages, puis les lots
+   sont assemblés en un seul fichier (pypdf ou PyPDF2 si installé ; sinon
+   les fichiers de lot sont conservés tels quels).
+
+Réglage optionnel dans config.json (section "pdf", valeur par défaut) :
+    "pdf": {"processus": 0}          0 = un processus par cœur
+
+Depuis l'application : exporter_en_arriere_plan(...) (bouton "📄 PDF" de la
+liste des factures). En ligne de commande, pour l'archivage mensuel :
+    python export_factures.py --du 2026-01-01 --au 2026-01-31 --dossier Archives --fusion
+    python export_factures.py --refs 2026-FA-01186 2026-FA-01187 --dossier Reimpressions
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import db_pool
+from resource_utils import get_config_path
+import thread_tk
+
+
+LECTURE = 500       # factures lues par aller-retour (en-têtes + lignes)
+LOT = 50            # factures par tâche envoyée à un processus
+
+SQL_ENTETES = """
+    SELECT
+        v.id, v.refvente, v.dateregistre, v.description,
+        u.nomuser, u.prenomuser,
+        c.nomcli, c.adressecli, c.contactcli
+    FROM tb_vente v
+    INNER JOIN tb_users u ON v.iduser = u.iduser
+    LEFT JOIN tb_client c ON v.idclient = c.idclient
+    WHERE v.id = ANY(%s)
+"""
+
+SQL_LIGNES = """
+    SELECT
+        vd.idvente, u.codearticle, a.designation, u.designationunite,
+        vd.qtvente, vd.prixunit, COALESCE(vd.remise, 0) AS remise, m.designationmag
+    FROM tb_ventedetail vd
+    INNER JOIN tb_article a ON vd.idarticle = a.idarticle
+    INNER JOIN tb_unite u ON vd.idunite = u.idunite
+    INNER JOIN tb_magasin m ON vd.idmag = m.idmag
+    WHERE vd.idvente = ANY(%s)
+    ORDER BY vd.idvente, a.designation
+"""
+
+
+def _reglages():
+    """Section "pdf" facultative de config.json."""
+    try:
+        with open(get_config_path('config.json'), encoding='utf-8') as f:
+            return json.load(f).get('pdf', {}) or {}
+    except Exception:
+        return {}
+
+
+# ==============================================================================
+# Sélection des factures
+# ==============================================================================
+def ids_periode(cursor, debut, fin, statut="VALIDEE"):
+    """id des factures du debut au fin inclus (dates), les plus anciennes d'abord."""
+    sql = "SELECT id FROM tb_vente WHERE dateregistre >= %s AND dateregistre < %s"
+    params = [debut, fin + timedelta(days=1)]
+    if statut:
+        sql += " AND statut = %s"
+        params.append(statut)
+    cursor.execute(sql + " ORDER BY dateregistre, id", params)
+    return [ligne[0] for ligne in cursor.fetchall()]
+
+
+def ids_references(cursor, references):
+    """id des factures dont la référence est dans la liste (ordre de la liste)."""
+    cursor.execute("SELECT refvente, id FROM tb_vente WHERE refvente = ANY(%s)", (list(references),))
+    par_ref = dict(cursor.fetchall())
+    return [par_ref[ref] for ref in references if ref in par_ref]
+
+
+# ==============================================================================
+# Lecture groupée
+# ==============================================================================
+def _facture(entete, lignes, societe):
+    """Dictionnaire d'impression (forme attendue par facture_a5) d'une facture."""
+    (_, refvente, dateregistre, description, nomuser, prenomuser,
+     nomcli, adressecli, contactcli) = entete
+    data = {
+        'societe': societe,
+        'vente': {
+            'refvente': refvente,
+            'dateregistre': dateregistre.strftime("%d/%m/%Y %H:%M"),
+            'description': description,
+        },
+        'utilisateur': {
+            'nomuser': nomuser or '',
+            'prenomuser': prenomuser or '',
+        },
+        'client': {
+            'nomcli': nomcli or "Client Divers",
+            'adressecli': adressecli or "N/A",
+            'contactcli': contactcli or "N/A",
+        },
+        'details': [],
+    }
+
+    # Remise = remise unitaire (Ar) appliquée à la quantité
+    premier_magasin = None
+    for code_article, designation, unite, qte, prixunit, remise, magasin in lignes:
+        qte, prixunit, remise = float(qte), float(prixunit), float(remise)
+        if premier_magasin is None:
+            premier_magasin = magasin
+        montant_ht = qte * prixunit
+        montant_remise = remise * qte
+        data['details'].append({
+            'code_article': code_article,
+            'designation': designation,
+            'unite': unite,
+            'qte': qte,
+            'prixunit': prixunit,
+            'remise': remise,
+            'magasin': magasin,
+            'montant_ht': montant_ht,
+            'montant_remise': montant_remise,
+            'montant_ttc': max(montant_ht - montant_remise, 0),
+        })
+
+    # Magasin en tête de la description (sans répéter le nom du dépôt)
+    if premier_magasin:
+        description_avec_depot = f"Magasin {premier_magasin}"
+        if description and description.strip() and premier_magasin not in description:
+            description_clean = description.strip().strip('-').strip()
+            if description_clean:
+                description_avec_depot = f"{description_avec_depot} - {description_clean}"
+        data['vente']['description'] = description_avec_depot
+    data['magasin'] = premier_magasin or ''
+    return data
+
+
+def lire_factures(cursor, ids, societe=None):
+    """
+    Données d'impression des factures `ids` (dans cet ordre, absentes ignorées)
+    en deux requêtes. societe : infos société (rendu_pdf.societe() par défaut).
+    """
+    ids = [int(i) for i in ids]
+    if not ids:
+        return []
+    if societe is None:
+        import rendu_pdf
+        societe = rendu_pdf.societe()
+
+    cursor.execute(SQL_ENTETES, (ids,))
+    entetes = {ligne[0]: ligne for ligne in cursor.fetchall()}
+    cursor.execute(SQL_LIGNES, (ids,))
+    lignes = {}
+    for idvente, *detail in cursor.fetchall():
+        lignes.setdefault(idvente, []).append(detail)
+
+    return [_facture(entetes[i], lignes.get(i, []), societe) for i in ids if i in entetes]
+
+
+# ==============================================================================
+# Rendu (exécuté dans les processus du pool)
+# ==============================================================================
+def nom_fichier(data, mention=None):
+    prefixe = f"{mention}_" if mention else ""
+    return f"{prefixe}Facture_{data['vente']['refvente'].replace('/', '-')}.pdf"
+
+
+def _rendre_lot(factures, dossier, fichier_lot=None, mention=None):
+    """Un fichier par facture, ou toutes les factures du lot dans fichier_lot."""
+    from reportlab.lib.pagesizes import A5
+    from reportlab.pdfgen import canvas
+    from facture_a5 import dessiner_facture_a5, generer_facture_a5
+
+    if fichier_lot:
+        c = canvas.Canvas(fichier_lot, pagesize=A5)
+        for data in factures:
+            dessiner_facture_a5(c, data, mention)
+            c.showPage()
+        c.save()
+        return [fichier_lot]
+
+    chemins = []
+    for data in factures:
+        chemin = os.path.join(dossier, nom_fichier(data, mention))
+        generer_facture_a5(data, chemin, mention)
+        chemins.append(chemin)
+    return chemins
+
+
+def fusionner(parties, destination):
+    """Assemble les PDF `parties` dans `destination` ; False si pypdf / PyPDF2 absent."""
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        try:
+            from PyPDF2 import PdfWriter
+        except ImportError:
+            return False
+    writer = PdfWriter()
+    for partie in parties:
+        writer.append(partie)
+    with open(destination, "wb") as f:
+        writer.write(f)
+    return True
+
+
+# ==============================================================================
+# Export
+# ==============================================================================
+def exporter(ids, dossier, fusion=False, mention=None, processus=None, progression=None):
+    """
+    Exporte les factures `ids` dans `dossier` et renvoie la liste des fichiers.
+    fusion : un seul PDF (Factures_<horodatage>.pdf) au lieu d'un par facture.
+    processus : taille du pool (config "pdf.processus", 0 = un par cœur).
+    progression(faites, total) est appelée depuis le thread appelant.
+    """
+    ids = list(ids)
+    os.makedirs(dossier, exist_ok=True)
+    if processus is None:
+        processus = int(_reglages().get('processus', 0))
+    processus = processus or os.cpu_count() or 1
+
+    horodatage = datetime.now().strftime('%Y%m%d_%H%M%S')
+    dossier_lots = tempfile.mkdtemp(prefix="export_factures_") if fusion else None
+    total, faites = len(ids), 0
+    fichiers, parties = [], []
+
+    try:
+        with ProcessPoolExecutor(max_workers=processus) as pool:
+            taches = {}
+            with db_pool.curseur() as cursor:
+                for debut in range(0, total, LECTURE):
+                    factures = lire_factures(cursor, ids[debut:debut + LECTURE])
+                    for d in range(0, len(factures), LOT):
+                        lot = factures[d:d + LOT]
+                        fichier_lot = (os.path.join(dossier_lots, f"lot_{len(taches):05d}.pdf")
+                                       if fusion else None)
+                        tache = pool.submit(_rendre_lot, lot, dossier, fichier_lot, mention)
+                        taches[tache] = (len(taches), len(lot))
+
+            resultats = {}
+            for tache in as_completed(taches):
+                rang, nb = taches[tache]
+                resultats[rang] = tache.result()
+                faites += nb
+                if progression:
+                    progression(faites, total)
+
+        for rang in sorted(resultats):
+            (parties if fusion else fichiers).extend(resultats[rang])
+
+        if fusion and parties:
+            destination = os.path.join(dossier, f"Factures_{horodatage}.pdf")
+            if len(parties) == 1:
+                shutil.move(parties[0], destination)
+                fichiers = [destination]
+            elif fusionner(parties, destination):
+                fichiers = [destination]
+            else:
+                print("⚠️ pypdf absent : les lots sont conservés séparément")
+                for partie in parties:
+                    cible = os.path.join(dossier, f"Factures_{horodatage}_{os.path.basename(partie)}")
+                    shutil.move(partie, cible)
+                    fichiers.append(cible)
+    finally:
+        if dossier_lots:
+            shutil.rmtree(dossier_lots, ignore_errors=True)
+
+    print(f"✅ Export PDF : {faites} facture(s), {len(fichiers)} fichier(s) dans {dossier}")
+    return fichiers
+
+
+def exporter_en_arriere_plan(widget, selection, dossier, fusion=False, mention=None,
+                             rappel=None, erreur=None, progression=None):
+    """
+    exporter() dans un thread ; selection(cursor) renvoie les id des factures.
+    rappel(fichiers), erreur(exception) et progression(faites, total) sont
+    appelés sur le thread Tk.
+    """
+    thread_tk.preparer(widget)
+
+    def sur_thread_tk(action):
+        thread_tk.sur_thread_tk(widget, action)
+
+    def travail():
+        try:
+            with db_pool.curseur() as cursor:
+                ids = selection(cursor)
+            fichiers = exporter(
+                ids, dossier, fusion=fusion, mention=mention,
+                progression=(lambda f, t: sur_thread_tk(lambda: progression(f, t))) if progression else None
+            )
+            if rappel:
+                sur_thread_tk(lambda: rappel(fichiers))
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            if erreur:
+                sur_thread_tk(lambda e=e: erreur(e))
+
+    threading.Thread(target=travail, daemon=True).start()
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing
+
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Export PDF des factures de vente")
+    parser.add_argument("--du", help="date de début AAAA-MM-JJ")
+    parser.add_argument("--au", help="date de fin AAAA-MM-JJ (incluse)")
+    parser.add_argument("--refs", nargs="+", help="références de factures")
+    parser.add_argument("--statut", default="VALIDEE", help="statut des factures de la période ('' = tous)")
+    parser.add_argument("--dossier", default="Etats Impression", help="dossier de sortie")
+    parser.add_argument("--fusion", action="store_true", help="un seul PDF pour toutes les factures")
+    parser.add_argument("--mention", help="mention ajoutée sur chaque facture (ex. DUPLICATA)")
+    parser.add_argument("--processus", type=int, help="taille du pool (0 = un par cœur)")
+    args = parser.parse_args()
+
+    with db_pool.curseur() as cursor:
+        if args.refs:
+            ids = ids_references(cursor, args.refs)
+        elif args.du and args.au:
+            ids = ids_periode(cursor, datetime.strptime(args.du, "%Y-%m-%d"),
+                              datetime.strptime(args.au, "%Y-%m-%d"), args.statut or None)
+        else:
+            parser.error("indiquer --refs ou --du et --au")
+
+    exporter(ids, args.dossier, fusion=args.fusion, mention=args.mention, processus=args.processus,
+             progression=lambda f, t: print(f"  {f}/{t}"))
+    db_pool.fermer_pools()
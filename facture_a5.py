@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Facture de vente au format A5 (modèle canvas), sans dépendance à l'interface.
+
+Le dessin était une méthode de PageVenteParMsin : impossible de l'appeler
+depuis un processus de travail sans importer customtkinter et la page.
+Il est ici en fonctions simples, utilisées par :
+    - PageVenteParMsin.generate_pdf_a5 (impression après la vente) ;
+    - export_factures (export par lot, pool de processus).
+
+Exemple :
+    from facture_a5 import generer_facture_a5
+    generer_facture_a5(data, "Facture_2026-FA-01186.pdf")
+    generer_facture_a5(data, "DUPLICATA.pdf", mention="DUPLICATA")
+
+`data` a la forme produite par export_factures.lire_factures() :
+    {'societe', 'vente', 'utilisateur', 'client', 'details', 'magasin'}
+"""
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A5
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle, Paragraph
+
+import rendu_pdf
+
+
+# ==============================================================================
+# FONCTION UTILITAIRE : CONVERSION NOMBRE EN LETTRES (FRANÇAIS)
+# ==============================================================================
+
+def nombre_en_lettres_fr(montant: float) -> str:
+    """
+    Convertit un montant numérique en sa représentation en lettres en français.
+    Gère les Millions et les Milliers correctement.
+    """
+    from math import floor
+    
+    if montant is None: return ""
+    
+    try:
+        montant = round(float(montant), 2)
+    except ValueError:
+        return ""
+
+    unites = ["", "un", "deux", "trois", "quatre", "cinq", "six", "sept", "huit", "neuf"]
+    dix_a_dixneuf = ["dix", "onze", "douze", "treize", "quatorze", "quinze", "seize"]
+    dizaines = ["", "dix", "vingt", "trente", "quarante", "cinquante", "soixante", "soixante", "quatre-vingt", "quatre-vingt"]
+    
+    def convertir_nombre_simple(n):
+        if n == 0: return ""
+        texte = []
+        
+        # Unités (0-9)
+        if n < 10:
+            texte.append(unites[n])
+        # 10-16
+        elif n < 17:
+            texte.append(dix_a_dixneuf[n - 10])
+        # 17-19
+        elif n < 20:
+            texte.append("dix-" + unites[n - 10])
+        # 20-99 (simplifié)
+        elif n < 100:
+            d = n // 10
+            u = n % 10
+            
+            partie_dizaine = dizaines[d]
+            if (d == 2 or d > 6) and u == 1: # 21, 71, 91 (simplifié)
+                 partie_dizaine += " et"
+            
+            texte.append(partie_dizaine)
+            if u > 0:
+                if d == 7 or d == 9: # 70-79, 90-99
+                    texte.append("-" + convertir_nombre_simple(n - (d * 10)))
+                else:
+                    texte.append("-" + unites[u])
+        
+        return "".join(texte).replace("--", "-") # Corrige double trait d'union
+
+    def convertir_bloc(n):
+        if n == 0: return ""
+        if n < 100: return convertir_nombre_simple(n)
+        
+        texte = []
+        c = n // 100
+        r = n % 100
+        
+        if c == 1: texte.append("cent")
+        else: 
+            texte.append(convertir_nombre_simple(c) + "-cent")
+            if r == 0: texte[-1] += "s" # Quatre-cents
+        
+        if r > 0:
+            texte.append("-" + convertir_bloc(r))
+
+        return "".join(texte).replace("un-cent", "cent") # Corrige 'un-cent' -> 'cent'
+    
+    entier = floor(montant)
+    centimes = int(round((montant - entier) * 100))
+    
+    # ====================================================================
+    # Gestion des blocs Millions, Milliers, Unités
+    # ====================================================================
+    million = entier // 1_000_000
+    mille_reste = (entier % 1_000_000) // 1_000 
+    reste_unites = entier % 1_000 
+    
+    resultat = []
+    
+    # 1. MILLIONS
+    if million > 0:
+        lettres_million = convertir_bloc(million)
+        bloc_million = "million"
+        if million > 1: bloc_million += "s"
+        resultat.append(f"{lettres_million} {bloc_million}")
+    
+    # 2. MILLIERS (0 à 999)
+    if mille_reste > 0:
+        lettres_mille = convertir_bloc(mille_reste)
+        resultat.append(f"{lettres_mille} mille")
+    
+    # 3. UNITÉS (0 à 999)
+    if reste_unites > 0:
+        resultat.append(convertir_bloc(reste_unites))
+    
+    # 4. CAS SPECIAL: ZÉRO
+    if entier == 0 and centimes == 0 and not resultat:
+        resultat.append("zéro")
+
+    
+    # Monnaie
+    result_str = " ".join(resultat).strip().replace("  ", " ").replace("-", " ") 
+    if not result_str: result_str = "zéro"
+    
+    #unite_monetaire = "Ariary" # Assurez-vous que cette unité est correcte (était "Francs" dans le code précédent)
+    #result_str += " " + unite_monetaire
+    
+    # Centimes
+    if centimes > 0:
+        centime_lettres = convertir_bloc(centimes)
+        centime_monetaire = "centimes"
+        centime_lettres = centime_lettres.replace("-", " ")
+        result_str += " et " + centime_lettres + " " + centime_monetaire
+
+    return result_str.capitalize().replace(" et-", " et ")
+
+
+def formater_nombre_pdf(nombre):
+    """Formate un nombre avec séparateur de milliers SANS décimales pour PDF (1.000.000)"""
+    try:
+        nombre = float(nombre)
+        return "{:,.0f}".format(nombre).replace(',', '.')
+    except (TypeError, ValueError):
+        return "0"
+
+
+# ==============================================================================
+# DESSIN DE LA FACTURE
+# ==============================================================================
+
+def dessiner_facture_a5(c, data, mention=None):
+    """
+    Dessine une facture sur la page courante du canvas `c` (format A5).
+    mention : "DUPLICATA", "ARCHIVE"... ajoutée en rouge sous la mention légale.
+    """
+    width, height = A5
+
+    # ✅ 1. CADRE DU VERSET (Haut de page avec bordure)
+    verset = "Ankino amin'ny Jehovah ny asanao dia ho lavorary izay kasainao. Ohabolana 16:3"
+    c.setLineWidth(1)
+    c.rect(10*mm, height - 13*mm, width - 20*mm, 8*mm)
+    c.setFont("Helvetica-Bold", 9)
+    c.drawCentredString(width/2, height - 10.5*mm, verset)
+
+    # ✅ 2. EN-TÊTE DEUX COLONNES
+    style_p = rendu_pdf.style('style_p', fontSize=9, leading=11)
+
+    societe = data['societe']
+    utilisateur = data['utilisateur']
+    client = data['client']
+    vente = data['vente']
+    magasin = data.get('magasin', '')
+
+    # Adapter les clés de données si nécessaire
+    nomsociete = societe.get('nomsociete', 'N/A')
+    adressesociete = societe.get('adressesociete') or societe.get('adresse', 'N/A')
+    villesociete = societe.get('villesociete') or ''
+    contactsociete = societe.get('contactsociete') or societe.get('tel', 'N/A')
+    nifsociete = societe.get('nifsociete') or societe.get('nif', 'N/A')
+    statsociete = societe.get('statsociete') or societe.get('stat', 'N/A')
+
+    # Insérer la ville juste en dessous de l'adresse si disponible
+    villes_line = f"{villesociete}<br/>" if villesociete else ""
+
+    gauche_text = f"<b><font size='11'>{nomsociete}</font></b><br/>{adressesociete}<br/>{villes_line}TEL: {contactsociete}<br/>NIF: {nifsociete} <br/>STAT: {statsociete}"
+
+    # Gérer si utilisateur est un dict ou une string et éviter d'afficher 'None'
+    if isinstance(utilisateur, dict):
+        pren = utilisateur.get('prenomuser') or ''
+        nomu = utilisateur.get('nomuser') or ''
+        user_name = f"{pren} {nomu}".strip()
+    else:
+        user_name = str(utilisateur) if utilisateur is not None else ''
+
+    # Affichage: titre magasin en gras à la place du label client, puis
+    # le nom du client en italique juste en dessous (vide si absent)
+    magasin_display = magasin or ''
+    client_display = client.get('nomcli') or ''
+    droite_text = (
+        f"<b>Facture N°: {vente['refvente']}</b><br/>"
+        f"{vente['dateregistre']}<br/>"
+        f"<b>MAGASIN {magasin_display}</b><br/><br/>"
+        f"<i>Client: {client_display}</i><br/>"
+        f"<font size='7'>Op: {user_name}</font>"
+    )
+
+    gauche = Paragraph(gauche_text, style_p)
+    droite = Paragraph(droite_text, style_p)
+
+    header_table = Table([[gauche, droite]], colWidths=[64*mm, 64*mm])
+    header_table.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 8),
+        ('TOPPADDING', (0, 0), (-1, -1), 5),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+    ]))
+
+    header_table.wrapOn(c, width, height)
+    header_table.drawOn(c, 10*mm, height - 42*mm)
+
+    # ✅ 3. TABLEAU DES ARTICLES
+    table_top = height - 45*mm
+    table_bottom = 55*mm
+    frame_height = table_top - table_bottom
+
+    row_height = 5.5*mm
+    max_rows = int(frame_height / row_height)
+
+    # Préparer les données du tableau
+    table_data = [['QTE', 'UNITE', 'DESIGNATION', 'PU TTC', 'MONTANT']]
+
+    total_montant = 0
+    num_articles = 0
+    for detail in data['details']:
+        montant = detail.get('montant_ttc', detail.get('montant', 0))
+        total_montant += montant
+        num_articles += 1
+        table_data.append([
+            str(int(detail.get('qte', 0))),
+            str(detail.get('unite', '')),
+            str(detail.get('designation', '')),
+            formater_nombre_pdf(detail.get('prixunit', 0)),
+            formater_nombre_pdf(montant)
+        ])
+
+    # Ajouter des lignes vides
+    montant_fmg = int(total_montant * 5)
+    empty_rows_needed = max_rows - 1 - num_articles - 2
+    for i in range(max(0, empty_rows_needed)):
+        table_data.append(['', '', '', '', ''])
+
+    # Totaux
+    table_data.append(['', '', 'TOTAL Ar:', formater_nombre_pdf(total_montant), ''])
+    table_data.append(['', '', 'Fmg:', formater_nombre_pdf(montant_fmg), ''])
+
+    col_widths = [12*mm, 15*mm, 62*mm, 19.5*mm, 19.5*mm]
+
+    # Dessiner le cadre et lignes
+    c.setLineWidth(1)
+    c.rect(10*mm, table_bottom, width - 20*mm, frame_height)
+
+    x_pos = 10*mm
+    for w in col_widths[:-1]:
+        x_pos += w
+        c.line(x_pos, table_top, x_pos, table_bottom)
+
+    # Créer le tableau avec hauteurs proportionnelles
+    actual_row_height = frame_height / len(table_data)
+    row_heights = [actual_row_height] * len(table_data)
+
+    articles_table = Table(table_data, colWidths=col_widths, rowHeights=row_heights)
+    articles_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('BACKGROUND', (0, -2), (-1, -1), colors.lightgrey),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, -2), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('FONTSIZE', (0, 1), (-1, -3), 8),
+        ('FONTSIZE', (0, -2), (-1, -1), 9),
+        ('LINEBELOW', (0, 0), (-1, 0), 1, colors.black),
+        ('LINEABOVE', (0, -2), (-1, -2), 1, colors.black),
+        ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
+        ('ALIGN', (0, 0), (2, 0), 'LEFT'),
+        ('ALIGN', (2, -2), (2, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 1),
+        ('RIGHTPADDING', (3, 0), (-1, -1), 1),
+        ('TOPPADDING', (0, 0), (-1, -1), 0),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+    ]))
+
+    articles_table.wrapOn(c, width, height)
+    assert actual_row_height, 'actual_row_height must not be None'
+    actual_total_height = len(table_data) * actual_row_height
+    articles_table.drawOn(c, 10*mm, table_top - actual_total_height)
+
+    # ✅ 4. TEXTE EN LETTRES
+    montant_lettres = nombre_en_lettres_fr(int(total_montant)).upper()
+    text_y = table_bottom - 18*mm
+    c.setFont("Helvetica-Bold", 10)
+    c.drawCentredString(width/2, text_y, f"ARRETE A LA SOMME DE {montant_lettres} ARIARY TTC")
+
+    # ✅ 5. MENTION LÉGALE
+    c.setFont("Helvetica-Oblique", 8)
+    c.drawCentredString(width/2, text_y - 5*mm, "Nous déclinons la responsabilité des marchandises non livrées au-delà de 5 jours")
+    if mention:
+        c.setFont("Helvetica-Bold", 9)
+        c.setFillColor(colors.HexColor("#D32F2F"))
+        c.drawCentredString(width/2, text_y - 9*mm, f"CECI EST UN {mention} DE LA FACTURE")
+        c.setFillColor(colors.black)
+
+    # ✅ 6. SIGNATURES
+    sig_y = 15*mm
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(15*mm, sig_y, "Le Client")
+    c.drawCentredString(width/2, sig_y, "Le Caissier")
+    c.drawString(width - 35*mm, sig_y, "Le Magasinier")
+
+
+def generer_facture_a5(data, filename, mention=None):
+    """Écrit la facture dans `filename` (une page A5)."""
+    c = canvas.Canvas(filename, pagesize=A5)
+    dessiner_facture_a5(c, data, mention)
+    c.save()
+    return filename
@@ -1,4 +1,5 @@
 # -*- mode: python ; coding: utf-8 -*-
+from PyInstaller.utils.hooks import collect_submodules
 
 
 a = Analysis(
@@ -6,7 +7,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('image', 'image'), ('icons', 'icons'), ('pages', 'pages'), ('config.json', '.'), ('config.ini', '.'), ('settings.json', '.'), ('session.json', '.')],
-    hiddenimports=['customtkinter', 'psycopg2', 'reportlab', 'PIL', 'openpyxl', 'pandas'],
+    hiddenimports=['customtkinter', 'psycopg2', 'reportlab', 'PIL', 'openpyxl', 'pandas'] + collect_submodules('pages'),
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
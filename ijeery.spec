@@ -1,5 +1,6 @@
 # -*- mode: python ; coding: utf-8 -*-
 # PyInstaller spec file for iJeery V5.0
+from PyInstaller.utils.hooks import collect_submodules
 
 block_cipher = None
 
@@ -33,7 +34,7 @@ a = Analysis(
         'fpdf2',
         'pandas',
         'numpy',
-    ],
+    ] + collect_submodules('pages'),  # pages importées à la demande (registre_pages)
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -2,6 +2,8 @@ import customtkinter as ctk
 from page_login import LoginWindow # Importation absolue pour page_login.py
 
 if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()
     # Configure le mode d'apparence de CustomTkinter (Light, Dark, System)
     ctk.set_appearance_mode("light")
     ctk.set_default_color_theme("blue")
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Journal de caisse : toutes les opérations hors banque dans une seule source.
+
+Avant : PageCaisse lançait sept agrégats par catégorie, une UNION de neuf
+tables pour les modes, puis neuf requêtes de détail (une par table) pour la
+grille, toutes filtrées par `datepmt::date BETWEEN` : le cast empêchait
+l'usage d'un index sur datepmt, chaque clic sur un cadre relisait tout.
+
+✅ v_journal_caisse : vue UNION ALL des tables de paiement (hors banque) et
+   des transferts de caisse, avec une colonne `categorie` (Client, Avoir,
+   Fournisseur, Personnel, Dépenses, Encaissement, Transfert).
+   La plage de dates est sargable (datepmt >= début AND < fin + 1 jour) ;
+   PostgreSQL la pousse dans chaque branche de la vue, où un index partiel
+   (datepmt) WHERE id_banque IS NULL la sert.
+✅ JournalCaisse.lire(debut, fin) : UN parcours de plage ; totaux par
+   catégorie, par mode et grille de détail sont calculés sur ces lignes.
+   Les lignes restent en mémoire : un clic sur un cadre filtre en mémoire,
+   élargir la période ne lit que les jours manquants. Les jours à partir
+   d'aujourd'hui sont toujours relus (opérations en cours de saisie).
+
+    python journal_caisse.py installer      (vue + index, idempotent)
+
+Sans la vue (droits insuffisants), la même UNION est utilisée en sous-requête.
+
+Exemple :
+    journal = JournalCaisse()
+    lignes = journal.lire(conn.cursor(), date_d, date_f)
+    journal.totaux_categories(lignes), journal.totaux_modes(lignes)
+"""
+
+import sys
+import threading
+from datetime import date, datetime, timedelta
+
+import db_pool
+
+
+CATEGORIES = ["Client", "Avoir", "Fournisseur", "Personnel", "Dépenses", "Encaissement"]
+
+# (table, catégorie, colonne de référence, hors banque seulement)
+SOURCES = [
+    ("tb_pmtfacture", "Client", "refpmt", True),
+    ("tb_pmtcredit", "Client", "refpmt", True),
+    ("tb_pmtavoir", "Avoir", "refavoir", True),
+    ("tb_pmtcom", "Fournisseur", "refpmt", True),
+    ("tb_avancepers", "Personnel", "refpmt", True),
+    ("tb_avancespecpers", "Personnel", "refpmt", True),
+    ("tb_pmtsalaire", "Personnel", "refpmt", True),
+    ("tb_decaissement", "Dépenses", "refpmt", True),
+    ("tb_encaissement", "Encaissement", "refpmt", True),
+    ("tb_transfertcaisse", "Transfert", "refpmt", False),
+]
+
+SQL_JOURNAL = "\n    UNION ALL\n".join(
+    f"""    SELECT '{table}'::TEXT AS source, '{categorie}'::TEXT AS categorie,
+           datepmt, {ref}::TEXT AS ref, observation::TEXT AS observation, mtpaye,
+           idtypeoperation, idmode, iduser
+    FROM {table}""" + ("\n    WHERE id_banque IS NULL" if hors_banque else "")
+    for table, categorie, ref, hors_banque in SOURCES
+)
+
+# Index partiels : la condition id_banque IS NULL de la vue les rend utilisables
+INDEX_DATES = [
+    (f"idx_{table[3:]}_datepmt_caisse", table, "(datepmt)" + (" WHERE id_banque IS NULL" if hors_banque else ""))
+    for table, _, _, hors_banque in SOURCES
+]
+
+SQL_LIGNES = """
+    SELECT j.datepmt, j.ref, j.observation, j.mtpaye, j.idtypeoperation,
+           j.idmode, j.categorie,
+           COALESCE(m.modedepaiement, CASE WHEN j.categorie = 'Transfert' THEN 'Espèces' ELSE 'Inconnu' END),
+           COALESCE(u.username, CASE WHEN j.categorie = 'Transfert' THEN 'admin' ELSE 'Système' END)
+    FROM {source} j
+    LEFT JOIN tb_modepaiement m ON j.idmode = m.idmode
+    LEFT JOIN tb_users u ON j.iduser = u.iduser
+    WHERE j.datepmt >= %s AND j.datepmt < %s
+"""
+
+_verrou = threading.Lock()
+_vue_disponible = {}        # dsn -> bool
+
+
+# ==============================================================================
+# Installation
+# ==============================================================================
+def installer(conn=None):
+    """Crée (ou remplace) la vue et les index de dates (idempotent, CONCURRENTLY)."""
+    proprietaire = conn is None
+    if proprietaire:
+        conn = db_pool.pool_global().emprunter()
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"CREATE OR REPLACE VIEW v_journal_caisse AS\n{SQL_JOURNAL}")
+        for nom, table, expression in INDEX_DATES:
+            cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nom} ON {table} {expression}")
+    finally:
+        cursor.close()
+        conn.autocommit = autocommit
+        with _verrou:
+            _vue_disponible.pop(conn.dsn, None)
+        if proprietaire:
+            conn.close()
+
+
+def installer_en_arriere_plan():
+    """installer() dans un thread (au démarrage de l'application)."""
+    def travail():
+        try:
+            installer()
+        except Exception as e:
+            print(f"Journal de caisse non installé : {e}")
+    threading.Thread(target=travail, daemon=True).start()
+
+
+def source(cursor):
+    """v_journal_caisse si elle existe sur cette base, sinon l'UNION en sous-requête."""
+    dsn = cursor.connection.dsn
+    with _verrou:
+        disponible = _vue_disponible.get(dsn)
+    if disponible is None:
+        cursor.execute("SELECT to_regclass('v_journal_caisse') IS NOT NULL")
+        disponible = bool(cursor.fetchone()[0])
+        with _verrou:
+            _vue_disponible[dsn] = disponible
+    return "v_journal_caisse" if disponible else f"(\n{SQL_JOURNAL}\n)"
+
+
+# ==============================================================================
+# Lecture incrémentale par période
+# ==============================================================================
+def _jour(valeur):
+    return valeur.date() if isinstance(valeur, datetime) else valeur
+
+
+def _instant(valeur):
+    """datepmt (date ou timestamp) en datetime, pour le tri."""
+    return valeur if isinstance(valeur, datetime) else datetime.combine(valeur, datetime.min.time())
+
+
+class JournalCaisse:
+    """
+    Lignes du journal gardées pour la période déjà lue (jours clos uniquement).
+    Ligne : (datepmt, ref, observation, mtpaye, idtypeoperation, idmode,
+             categorie, mode, utilisateur)
+    """
+
+    def __init__(self):
+        self._debut = None          # jours [_debut, _fin] en mémoire (tous < aujourd'hui)
+        self._fin = None
+        self._lignes = []
+
+    def invalider(self):
+        self._debut = self._fin = None
+        self._lignes = []
+
+    def _lire_plage(self, cursor, debut, fin):
+        """Un parcours de plage sur [debut, fin] (jours inclus)."""
+        cursor.execute(SQL_LIGNES.format(source=source(cursor)), (debut, fin + timedelta(days=1)))
+        return cursor.fetchall()
+
+    def lire(self, cursor, debut, fin):
+        """Opérations du debut au fin inclus, les plus récentes d'abord."""
+        debut, fin = _jour(debut), _jour(fin)
+        if fin < debut:
+            return []
+        aujourdhui = date.today()
+        fin_close = min(fin, aujourdhui - timedelta(days=1))
+
+        if debut <= fin_close:
+            contigu = (self._debut is not None
+                       and debut <= self._fin + timedelta(days=1)
+                       and fin_close >= self._debut - timedelta(days=1))
+            if not contigu:
+                self._lignes = self._lire_plage(cursor, debut, fin_close)
+                self._debut, self._fin = debut, fin_close
+            else:
+                # Seuls les jours manquants de part et d'autre sont lus
+                if debut < self._debut:
+                    self._lignes += self._lire_plage(cursor, debut, self._debut - timedelta(days=1))
+                    self._debut = debut
+                if fin_close > self._fin:
+                    self._lignes += self._lire_plage(cursor, self._fin + timedelta(days=1), fin_close)
+                    self._fin = fin_close
+
+        lignes = [l for l in self._lignes if debut <= _jour(l[0]) <= fin_close]
+        if fin >= aujourdhui:
+            lignes += self._lire_plage(cursor, max(debut, aujourdhui), fin)
+        lignes.sort(key=lambda l: _instant(l[0]), reverse=True)
+        return lignes
+
+    # ------------------------------------------------------------------
+    # Agrégats et filtres en mémoire
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _signe(ligne):
+        return float(ligne[3]) if ligne[4] == 1 else -float(ligne[3])
+
+    def totaux_categories(self, lignes):
+        """{catégorie: encaissements - décaissements} (transferts exclus)."""
+        totaux = dict.fromkeys(CATEGORIES, 0.0)
+        for ligne in lignes:
+            if ligne[6] in totaux:
+                totaux[ligne[6]] += self._signe(ligne)
+        return totaux
+
+    def totaux_modes(self, lignes):
+        """{nom du mode en base: encaissements - décaissements} (transferts exclus)."""
+        totaux = {}
+        for ligne in lignes:
+            if ligne[6] != "Transfert":
+                totaux[ligne[7]] = totaux.get(ligne[7], 0.0) + self._signe(ligne)
+        return totaux
+
+    @staticmethod
+    def filtrer(lignes, idmode=None, categorie="Tous"):
+        """
+        Lignes de la grille : catégorie et mode choisis. Les transferts de caisse
+        ne figurent que sans filtre de catégorie, avec le mode Espèces (id 1) ou sans mode.
+        """
+        resultat = []
+        for ligne in lignes:
+            if ligne[6] == "Transfert":
+                if categorie == "Tous" and (not idmode or idmode == 1):
+                    resultat.append(ligne)
+            elif categorie in ("Tous", ligne[6]) and (idmode is None or ligne[5] == idmode):
+                resultat.append(ligne)
+        return resultat
+
+
+if __name__ == "__main__":
+    if (sys.argv[1] if len(sys.argv) > 1 else "") == "installer":
+        installer()
+        print("✅ v_journal_caisse et index de dates installés")
+    else:
+        print("Usage : python journal_caisse.py installer")
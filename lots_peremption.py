@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+"""
+Registre des lots par date de péremption, consommé premier-périmé-premier-sorti (FEFO).
+
+Avant : PageGestionPeremption recalculait le stock par sous-requêtes
+corrélées (réceptions - ventes - sorties seulement) et classait les dates de
+tb_livraisonfrs sans savoir ce qui restait de chaque livraison ; le badge de
+PageStock relisait toutes les livraisons datées à chaque rafraîchissement.
+
+✅ tb_lot_peremption : quantité restante (unité de base, comme stock_engine)
+   par (idarticle, idmag, dateperemption) ; 'infinity' = stock sans date.
+✅ Tenu à jour dans la transaction de chaque document, par les mêmes appels
+   que tb_stock_solde (stock_engine.appliquer_mouvements / appliquer_requete) :
+     sortie  -> fn_lot_consommer : lots les plus proches de la péremption
+                d'abord (le manque éventuel rend le lot sans date négatif) ;
+     entrée  -> fn_lot_entree : lot de la date fournie (réception) ; sans
+                date, l'entrée reprend les dates sorties du même article dans
+                le même document (transferts, annulations de transfert).
+   Invariant : somme des lots d'un (article, magasin) = solde de stock_engine.
+✅ lots(cursor, jours) : lots restants expirant sous N jours, servis par un
+   index partiel (dateperemption) WHERE qt_restante > 0.
+
+    python lots_peremption.py installer       (table + fonctions, reconstruit à la création)
+    python lots_peremption.py reconstruire
+    python lots_peremption.py verifier
+
+Sans la table (droits insuffisants), les pages gardent leur ancien calcul.
+
+Exemple :
+    from lots_peremption import lots
+    for idarticle, idmag, dateperemption, qt_base in lots(cursor, jours=30):
+        ...
+"""
+
+import sys
+import threading
+from contextlib import contextmanager
+
+from psycopg2.extras import execute_values
+
+import db_pool
+import stock_engine     # import mutuel : attributs lus à l'appel seulement
+
+
+SANS_DATE = "infinity"      # dateperemption des lots sans date (triés en dernier)
+VERROU_INSTALLATION = 731_020
+
+SQL_CREATE = """
+    CREATE TABLE IF NOT EXISTS tb_lot_peremption (
+        idarticle INT NOT NULL,
+        idmag INT NOT NULL,
+        dateperemption DATE NOT NULL,
+        qt_entree NUMERIC(18, 4) NOT NULL DEFAULT 0,
+        qt_restante NUMERIC(18, 4) NOT NULL DEFAULT 0,
+        datemaj TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (idarticle, idmag, dateperemption)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_lot_peremption_restant
+        ON tb_lot_peremption (dateperemption) WHERE qt_restante > 0;
+"""
+
+SQL_FONCTIONS = """
+    CREATE OR REPLACE FUNCTION fn_lot_consommer(p_article INT, p_mag INT, p_qt NUMERIC)
+    RETURNS TABLE (date_lot DATE, qt_prise NUMERIC) AS $$
+    DECLARE
+        lot RECORD;
+        reste NUMERIC := p_qt;
+    BEGIN
+        FOR lot IN
+            SELECT l.dateperemption, l.qt_restante FROM tb_lot_peremption l
+            WHERE l.idarticle = p_article AND l.idmag = p_mag AND l.qt_restante > 0
+            ORDER BY l.dateperemption
+            FOR UPDATE
+        LOOP
+            EXIT WHEN reste <= 0;
+            qt_prise := LEAST(reste, lot.qt_restante);
+            UPDATE tb_lot_peremption SET qt_restante = qt_restante - qt_prise, datemaj = NOW()
+            WHERE idarticle = p_article AND idmag = p_mag AND dateperemption = lot.dateperemption;
+            reste := reste - qt_prise;
+            date_lot := NULLIF(lot.dateperemption, 'infinity');
+            RETURN NEXT;
+        END LOOP;
+
+        IF reste > 0 THEN
+            -- Sortie sans stock en lot : déficit porté par le lot sans date
+            INSERT INTO tb_lot_peremption (idarticle, idmag, dateperemption, qt_restante)
+            VALUES (p_article, p_mag, 'infinity', -reste)
+            ON CONFLICT (idarticle, idmag, dateperemption) DO UPDATE
+                SET qt_restante = tb_lot_peremption.qt_restante - reste, datemaj = NOW();
+        END IF;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION fn_lot_entree(p_article INT, p_mag INT, p_date DATE, p_qt NUMERIC)
+    RETURNS VOID AS $$
+    DECLARE
+        deficit NUMERIC;
+        couvert NUMERIC := 0;
+    BEGIN
+        -- Une entrée comble d'abord un déficit (sortie enregistrée avant la réception)
+        SELECT -l.qt_restante INTO deficit FROM tb_lot_peremption l
+        WHERE l.idarticle = p_article AND l.idmag = p_mag AND l.dateperemption = 'infinity'
+          AND l.qt_restante < 0
+        FOR UPDATE;
+        IF deficit > 0 THEN
+            couvert := LEAST(deficit, p_qt);
+            UPDATE tb_lot_peremption SET qt_restante = qt_restante + couvert, datemaj = NOW()
+            WHERE idarticle = p_article AND idmag = p_mag AND dateperemption = 'infinity';
+        END IF;
+
+        INSERT INTO tb_lot_peremption (idarticle, idmag, dateperemption, qt_entree, qt_restante)
+        VALUES (p_article, p_mag, p_date, p_qt, p_qt - couvert)
+        ON CONFLICT (idarticle, idmag, dateperemption) DO UPDATE
+            SET qt_entree = tb_lot_peremption.qt_entree + EXCLUDED.qt_entree,
+                qt_restante = tb_lot_peremption.qt_restante + EXCLUDED.qt_restante,
+                datemaj = NOW();
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+# (indice, quantité en unité de base) des lignes d'un document
+SQL_BASE = """
+    SELECT v.i, v.quantite * {coeff}
+    FROM (VALUES %s) AS v (i, idarticle, idunite, quantite)
+    INNER JOIN tb_unite u ON u.idarticle = v.idarticle AND u.idunite = v.idunite
+"""
+
+SQL_CONSOMMER = """
+    SELECT v.idarticle, c.date_lot, c.qt_prise
+    FROM (VALUES %s) AS v (idarticle, idmag, quantite)
+    CROSS JOIN LATERAL fn_lot_consommer(v.idarticle, v.idmag, v.quantite) AS c
+"""
+
+SQL_ENTREE = """
+    SELECT fn_lot_entree(v.idarticle, v.idmag, v.dateperemption, v.quantite)
+    FROM (VALUES %s) AS v (idarticle, idmag, dateperemption, quantite)
+"""
+
+SQL_LOTS = """
+    SELECT idarticle, idmag, dateperemption, qt_restante
+    FROM tb_lot_peremption
+    WHERE qt_restante > 0 AND dateperemption < 'infinity'
+"""
+
+SQL_VERIFIER = """
+    SELECT COALESCE(l.idarticle, s.idarticle),
+           COALESCE(l.idmag, s.idmag),
+           COALESCE(l.total, 0),
+           COALESCE(s.solde_base, 0)
+    FROM (SELECT idarticle, idmag, SUM(qt_restante) AS total
+          FROM tb_lot_peremption GROUP BY idarticle, idmag) AS l
+    FULL OUTER JOIN ({soldes}) AS s
+        ON s.idarticle = l.idarticle AND s.idmag = l.idmag
+    WHERE ABS(COALESCE(l.total, 0) - COALESCE(s.solde_base, 0)) > %s
+    ORDER BY 1, 2
+"""
+
+_verrou = threading.Lock()
+_table_disponible = {}      # dsn -> bool
+
+
+@contextmanager
+def _connexion(conn=None):
+    """Connexion fournie (l'appelant valide la transaction) ou empruntée au pool (commit en sortie)."""
+    if conn is not None:
+        yield conn
+    else:
+        with db_pool.emprunt() as conn:
+            yield conn
+
+
+# ==============================================================================
+# Installation
+# ==============================================================================
+def installer(conn=None):
+    """Crée la table, l'index et les fonctions ; reconstruit les lots à la création."""
+    with _connexion(conn) as conn:
+        cursor = conn.cursor()
+        try:
+            # Un seul poste installe ; les autres attendent puis trouvent la table prête
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (VERROU_INSTALLATION,))
+            cursor.execute("SELECT to_regclass('tb_lot_peremption') IS NOT NULL")
+            existait = cursor.fetchone()[0]
+            cursor.execute(SQL_CREATE)
+            cursor.execute(SQL_FONCTIONS)
+        finally:
+            cursor.close()
+        if not existait:
+            reconstruire(conn)
+    with _verrou:
+        _table_disponible.clear()
+
+
+def installer_en_arriere_plan():
+    """installer() dans un thread (au démarrage de l'application)."""
+    def travail():
+        try:
+            installer()
+        except Exception as e:
+            print(f"Lots de péremption non installés : {e}")
+    threading.Thread(target=travail, daemon=True).start()
+
+
+def table_disponible(cursor):
+    """True si tb_lot_peremption existe sur cette base (vérifié une fois)."""
+    dsn = cursor.connection.dsn
+    with _verrou:
+        disponible = _table_disponible.get(dsn)
+    if disponible is None:
+        cursor.execute("SELECT to_regclass('tb_lot_peremption') IS NOT NULL")
+        disponible = bool(cursor.fetchone()[0])
+        with _verrou:
+            _table_disponible[dsn] = disponible
+    return disponible
+
+
+# ==============================================================================
+# Mise à jour par document (dans la transaction de l'appelant)
+# ==============================================================================
+def appliquer_mouvements(cursor, mouvements):
+    """
+    Consomme (sorties) ou crédite (entrées) les lots, dans la transaction du curseur.
+
+    mouvements : itérable de (idarticle, idunite, idmag, quantite_signee[, dateperemption]),
+    quantité dans l'unité du document. Trois allers-retours au plus par document.
+    """
+    lignes = [
+        (int(a), int(u), int(m), float(q), reste[0] if reste else None)
+        for a, u, m, q, *reste in mouvements
+        if a is not None and u is not None and m is not None and q
+    ]
+    if not lignes or not table_disponible(cursor):
+        return
+
+    base = dict(execute_values(
+        cursor, SQL_BASE.format(coeff=stock_engine.COEFF_BASE),
+        [(i, a, u, q) for i, (a, u, m, q, d) in enumerate(lignes)],
+        template="(%s::int, %s::int, %s::int, %s::numeric)", page_size=len(lignes), fetch=True
+    ))
+
+    # Sorties d'abord : leurs dates servent aux entrées sans date du même document
+    consommes = {}      # idarticle -> [[date, quantité]] dans l'ordre FEFO
+    sorties = [(a, m, -float(base[i])) for i, (a, u, m, q, d) in enumerate(lignes) if q < 0 and i in base]
+    if sorties:
+        for idarticle, date_lot, qt in execute_values(
+            cursor, SQL_CONSOMMER, sorties,
+            template="(%s::int, %s::int, %s::numeric)", page_size=len(sorties), fetch=True
+        ):
+            consommes.setdefault(idarticle, []).append([date_lot, float(qt)])
+
+    entrees = {}        # (idarticle, idmag, date) -> quantité
+    for i, (a, u, m, q, d) in enumerate(lignes):
+        if q < 0 or i not in base:
+            continue
+        reste = float(base[i])
+        if d is None:
+            for lot in consommes.get(a, []):
+                pris = min(reste, lot[1])
+                if pris > 0:
+                    cle = (a, m, lot[0] or SANS_DATE)
+                    entrees[cle] = entrees.get(cle, 0.0) + pris
+                    lot[1] -= pris
+                    reste -= pris
+        if reste > 0:
+            cle = (a, m, d or SANS_DATE)
+            entrees[cle] = entrees.get(cle, 0.0) + reste
+    if entrees:
+        execute_values(
+            cursor, SQL_ENTREE, [(a, m, d, qt) for (a, m, d), qt in entrees.items()],
+            template="(%s::int, %s::int, %s::date, %s::numeric)", page_size=len(entrees)
+        )
+
+
+def appliquer_requete(cursor, select_sql, params=None, signe=1):
+    """Comme appliquer_mouvements, pour les lignes d'un SELECT (idarticle, idunite, idmag, quantite)."""
+    if not table_disponible(cursor):
+        return
+    cursor.execute(select_sql, params)
+    appliquer_mouvements(cursor, [
+        (a, u, m, signe * float(q or 0)) for a, u, m, q in cursor.fetchall()
+    ])
+
+
+def retirer_date(cursor, idarticle, dateperemption):
+    """Lot vérifié / réglé : sa quantité restante rejoint le stock sans date (tous magasins)."""
+    if not table_disponible(cursor):
+        return
+    cursor.execute("""
+        SELECT fn_lot_entree(idarticle, idmag, 'infinity', qt_restante)
+        FROM tb_lot_peremption
+        WHERE idarticle = %s AND dateperemption = %s AND qt_restante > 0
+    """, (idarticle, dateperemption))
+    cursor.execute(
+        "DELETE FROM tb_lot_peremption WHERE idarticle = %s AND dateperemption = %s",
+        (idarticle, dateperemption)
+    )
+
+
+# ==============================================================================
+# Lecture
+# ==============================================================================
+def lots(cursor, jours=None, idarticles=None):
+    """
+    Lots datés restants [(idarticle, idmag, dateperemption, qt_base)], du plus
+    proche au plus lointain ; jours : seulement ceux qui expirent sous N jours
+    (déjà périmés compris).
+    """
+    sql, params = SQL_LOTS, []
+    if jours is not None:
+        sql += " AND dateperemption <= CURRENT_DATE + %s"
+        params.append(int(jours))
+    if idarticles is not None:
+        sql += " AND idarticle = ANY(%s)"
+        params.append(sorted({int(a) for a in idarticles}))
+    cursor.execute(sql + " ORDER BY dateperemption, idarticle, idmag", params)
+    return [(a, m, d, float(qt)) for a, m, d, qt in cursor.fetchall()]
+
+
+def compter_alertes(cursor, jours=30):
+    """(nb lots périmés, nb lots expirant sous `jours` jours) restants, par article et date."""
+    cursor.execute("""
+        SELECT COUNT(*) FILTER (WHERE dateperemption <= CURRENT_DATE),
+               COUNT(*) FILTER (WHERE dateperemption > CURRENT_DATE)
+        FROM (SELECT DISTINCT idarticle, dateperemption FROM tb_lot_peremption
+              WHERE qt_restante > 0 AND dateperemption <= CURRENT_DATE + %s) AS l
+    """, (int(jours),))
+    nb_perimes, nb_urgents = cursor.fetchone()
+    return nb_perimes, nb_urgents
+
+
+# ==============================================================================
+# Maintenance
+# ==============================================================================
+def _repartir(soldes, receptions):
+    """
+    Lots reconstitués {(idarticle, idmag, date): quantité}. Le FEFO consomme
+    les dates proches en premier : le stock restant de chaque magasin prend
+    les dates les plus lointaines reçues (tous magasins, transferts compris),
+    le reste va au lot sans date.
+    """
+    par_article = {}
+    for (idarticle, dateperemption), qt in receptions.items():
+        par_article.setdefault(idarticle, []).append([dateperemption, qt])
+    for dates in par_article.values():
+        dates.sort(reverse=True)
+
+    resultat = {}
+    for (idarticle, idmag), solde in sorted(soldes.items()):
+        reste = solde
+        for lot in par_article.get(idarticle, []):
+            pris = min(reste, lot[1])
+            if pris > 0:
+                resultat[(idarticle, idmag, lot[0])] = pris
+                lot[1] -= pris
+                reste -= pris
+        if reste:
+            resultat[(idarticle, idmag, SANS_DATE)] = reste
+    return resultat
+
+
+def reconstruire(conn=None):
+    """
+    🔄 Reconstitue les lots depuis les soldes (stock_engine) et les dates des
+    réceptions. Retourne le nombre de lots écrits.
+    """
+    with _connexion(conn) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(SQL_CREATE)
+            # Bloque les documents concurrents pendant la reconstruction
+            cursor.execute("LOCK TABLE tb_lot_peremption IN ACCESS EXCLUSIVE MODE")
+            cursor.execute(f"SELECT idarticle, idmag, solde_base FROM ({stock_engine.sql_soldes(cursor)}) AS s")
+            soldes = {(a, m): float(s or 0) for a, m, s in cursor.fetchall() if s}
+            cursor.execute(f"""
+                SELECT lf.idarticle, lf.dateperemption, SUM(lf.qtlivrefrs * {stock_engine.COEFF_BASE})
+                FROM tb_livraisonfrs lf
+                INNER JOIN tb_unite u ON u.idarticle = lf.idarticle AND u.idunite = lf.idunite
+                WHERE lf.deleted = 0 AND lf.dateperemption IS NOT NULL
+                GROUP BY lf.idarticle, lf.dateperemption
+            """)
+            receptions = {(a, d): float(qt or 0) for a, d, qt in cursor.fetchall()}
+
+            cursor.execute("DELETE FROM tb_lot_peremption")
+            lignes = [(a, m, d, qt, qt) for (a, m, d), qt in _repartir(soldes, receptions).items()]
+            if lignes:
+                execute_values(
+                    cursor,
+                    "INSERT INTO tb_lot_peremption (idarticle, idmag, dateperemption, qt_entree, qt_restante) VALUES %s",
+                    lignes, template="(%s::int, %s::int, %s::date, %s::numeric, %s::numeric)", page_size=1000
+                )
+            return len(lignes)
+        finally:
+            cursor.close()
+
+
+def verifier(tolerance=0.001, conn=None):
+    """
+    🔍 Compare la somme des lots de chaque (article, magasin) au solde de stock_engine.
+    Retourne les écarts [(idarticle, idmag, total_lots, solde)].
+    """
+    with _connexion(conn) as conn:
+        cursor = conn.cursor()
+        try:
+            if not table_disponible(cursor):
+                return []
+            cursor.execute(SQL_VERIFIER.format(soldes=stock_engine.sql_soldes(cursor)), (tolerance,))
+            return [(a, m, float(lots_), float(solde)) for a, m, lots_, solde in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+
+if __name__ == "__main__":
+    commande = sys.argv[1] if len(sys.argv) > 1 else ""
+
+    if commande == "installer":
+        installer()
+        print("✅ tb_lot_peremption installée")
+    elif commande == "reconstruire":
+        installer()
+        print(f"✅ Lots reconstruits : {reconstruire()} lot(s)")
+    elif commande == "verifier":
+        ecarts = verifier()
+        for idarticle, idmag, total, solde in ecarts:
+            print(f"⚠️ Article {idarticle} / magasin {idmag} : lots={total} solde={solde}")
+        print(f"{'✅ Aucun écart' if not ecarts else f'❌ {len(ecarts)} écart(s)'}")
+        sys.exit(1 if ecarts else 0)
+    else:
+        print("Usage : python lots_peremption.py [installer|reconstruire|verifier]")
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+Journalisation et mesures de temps de l'application.
+
+Avant : les chemins chauds affichaient des bandeaux de débogage par print()
+(get_data_facture faisait même un COUNT(*) pour l'afficher, charger_stocks
+écrivait toutes les 100 insertions), y compris dans l'exe, et rien ne disait
+où le temps passait réellement.
+
+✅ Journal à niveaux : journal(__name__).debug(...) / .info(...) / .warning(...)
+   DEBUG par défaut en développement, INFO dans l'exe (sys.frozen).
+✅ Mesures : histogrammes de latence par (catégorie, nom)
+       with mesurer("charger_stocks", "page"):      # gestionnaire de contexte
+           ...
+       @chronometre("operation")                    # décorateur (nom = qualname)
+       def charger_stocks(self): ...
+   Catégories utilisées : "page" (construction d'une page, app_main.show_page),
+   "requete" (chaque cursor.execute des connexions du pool, CurseurMesure),
+   "operation" (méthodes décorées).
+✅ Requêtes lentes (au-delà du seuil) : texte SQL ajouté à requetes_lentes.log.
+✅ plus_lentes() : opérations les plus lentes de la session (PageDiagnostics).
+
+Réglages optionnels dans config.json (section "journalisation", valeurs par défaut) :
+    "journalisation": {"niveau": "INFO", "seuil_requete_lente_ms": 300,
+                       "fichier": ""}
+    niveau : DEBUG / INFO / WARNING (défaut DEBUG hors exe) ;
+    fichier : journal écrit en plus de la console (utile pour l'exe sans console).
+
+Exemple :
+    journal = mesures.journal(__name__)
+    with mesures.mesurer("impression facture", detail=ref):
+        ...
+    journal.debug("%d articles affichés", n)
+"""
+
+import bisect
+import functools
+import heapq
+import itertools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from psycopg2 import extensions
+
+from resource_utils import get_config_path
+
+
+SEUIL_REQUETE_LENTE_MS = 300
+NB_PLUS_LENTES = 50         # opérations conservées pour le panneau de diagnostic
+FICHIER_REQUETES_LENTES = "requetes_lentes.log"
+
+# Bornes supérieures des classes de l'histogramme (ms) ; au-delà : dernière classe
+BORNES_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+# ==============================================================================
+# Journal
+# ==============================================================================
+_configure = False
+_verrou_config = threading.Lock()
+_seuil_requete_lente = SEUIL_REQUETE_LENTE_MS / 1000
+
+
+def _reglages():
+    """Section "journalisation" facultative de config.json."""
+    try:
+        with open(get_config_path('config.json'), encoding='utf-8') as f:
+            return json.load(f).get('journalisation', {}) or {}
+    except Exception:
+        return {}
+
+
+def _dossier():
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def configurer():
+    """Niveau, sorties et seuil des requêtes lentes (une fois par processus)."""
+    global _configure, _seuil_requete_lente
+    if _configure:
+        return
+    with _verrou_config:
+        if _configure:
+            return
+        _configure = True
+        reglages = _reglages()
+        defaut = "INFO" if getattr(sys, 'frozen', False) else "DEBUG"
+        niveau = getattr(logging, str(reglages.get('niveau', defaut)).upper(), logging.INFO)
+        _seuil_requete_lente = float(reglages.get('seuil_requete_lente_ms', SEUIL_REQUETE_LENTE_MS)) / 1000
+
+        racine = logging.getLogger("ijeery")
+        racine.setLevel(niveau)
+        racine.propagate = False
+        format_ = logging.Formatter("%(asctime)s %(levelname)-7s %(name)s : %(message)s", "%H:%M:%S")
+        if sys.stderr is not None:      # exe fenêtré : pas de console
+            console = logging.StreamHandler()
+            console.setFormatter(format_)
+            racine.addHandler(console)
+        if reglages.get('fichier'):
+            fichier = logging.FileHandler(os.path.join(_dossier(), reglages['fichier']),
+                                          encoding='utf-8', delay=True)
+            fichier.setFormatter(format_)
+            racine.addHandler(fichier)
+
+        lentes = logging.getLogger("ijeery.requetes_lentes")
+        sortie = logging.FileHandler(os.path.join(_dossier(), FICHIER_REQUETES_LENTES),
+                                     encoding='utf-8', delay=True)
+        sortie.setFormatter(logging.Formatter("%(asctime)s %(message)s", "%Y-%m-%d %H:%M:%S"))
+        lentes.addHandler(sortie)
+
+
+def journal(nom):
+    """Logger de l'application pour un module (journal(__name__))."""
+    configurer()
+    return logging.getLogger(f"ijeery.{nom}")
+
+
+# ==============================================================================
+# Histogrammes
+# ==============================================================================
+class Histogramme:
+    """Latences d'une opération, par classes de BORNES_MS."""
+
+    def __init__(self):
+        self.classes = [0] * (len(BORNES_MS) + 1)
+        self.nombre = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def ajouter(self, duree):
+        self.classes[bisect.bisect_left(BORNES_MS, duree * 1000)] += 1
+        self.nombre += 1
+        self.total += duree
+        self.maximum = max(self.maximum, duree)
+
+    @property
+    def moyenne(self):
+        return self.total / self.nombre if self.nombre else 0.0
+
+    def centile(self, p):
+        """Borne supérieure (s) de la classe contenant le centile p (0-100) ; maximum si au-delà."""
+        rang = self.nombre * p / 100
+        cumul = 0
+        for i, effectif in enumerate(self.classes):
+            cumul += effectif
+            if effectif and cumul >= rang:
+                return min(BORNES_MS[i] / 1000, self.maximum) if i < len(BORNES_MS) else self.maximum
+        return self.maximum
+
+
+_histogrammes = {}          # (catégorie, nom) -> Histogramme
+_plus_lentes = []           # tas (durée, n°, entrée) des NB_PLUS_LENTES plus lentes
+_compteur = itertools.count()
+_verrou = threading.Lock()
+
+
+def enregistrer(nom, duree, categorie="operation", detail=None):
+    """Ajoute une durée (secondes) à l'histogramme et au classement des plus lentes."""
+    entree = {
+        'categorie': categorie,
+        'nom': nom,
+        'duree': duree,
+        'heure': datetime.now(),
+        'thread': threading.current_thread().name,
+        'detail': detail,
+    }
+    with _verrou:
+        histogramme = _histogrammes.get((categorie, nom))
+        if histogramme is None:
+            histogramme = _histogrammes[(categorie, nom)] = Histogramme()
+        histogramme.ajouter(duree)
+        element = (duree, next(_compteur), entree)
+        if len(_plus_lentes) < NB_PLUS_LENTES:
+            heapq.heappush(_plus_lentes, element)
+        elif duree > _plus_lentes[0][0]:
+            heapq.heapreplace(_plus_lentes, element)
+
+
+@contextmanager
+def mesurer(nom, categorie="operation", detail=None):
+    """Chronomètre le bloc (exception comprise) et l'enregistre."""
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        enregistrer(nom, time.perf_counter() - debut, categorie, detail)
+
+
+def chronometre(categorie="operation", nom=None):
+    """Décorateur : chaque appel est mesuré sous `nom` (qualname de la fonction par défaut)."""
+    def decorer(fonction):
+        cle = nom or fonction.__qualname__
+
+        @functools.wraps(fonction)
+        def enveloppe(*args, **kwargs):
+            with mesurer(cle, categorie):
+                return fonction(*args, **kwargs)
+        return enveloppe
+    return decorer
+
+
+def statistiques():
+    """[{categorie, nom, nombre, moyenne, p50, p95, maximum, total}] trié par temps total décroissant."""
+    with _verrou:
+        resultats = [{
+            'categorie': categorie,
+            'nom': nom,
+            'nombre': h.nombre,
+            'moyenne': h.moyenne,
+            'p50': h.centile(50),
+            'p95': h.centile(95),
+            'maximum': h.maximum,
+            'total': h.total,
+        } for (categorie, nom), h in _histogrammes.items()]
+    return sorted(resultats, key=lambda s: -s['total'])
+
+
+def plus_lentes(nombre=NB_PLUS_LENTES):
+    """Opérations les plus lentes de la session, de la plus lente à la moins lente."""
+    with _verrou:
+        elements = list(_plus_lentes)
+    return [entree for _, _, entree in sorted(elements, key=lambda e: (-e[0], e[1]))[:nombre]]
+
+
+def reinitialiser():
+    with _verrou:
+        _histogrammes.clear()
+        _plus_lentes.clear()
+
+
+# ==============================================================================
+# Requêtes
+# ==============================================================================
+_RE_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+([A-Za-z_][\w.]*)", re.IGNORECASE)
+
+
+def resume_sql(sql):
+    """Nom court d'une requête pour l'histogramme : verbe + première table (SELECT tb_vente)."""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    else:
+        sql = str(sql)
+    mots = sql.split(None, 1)
+    if not mots:
+        return "?"
+    tables = _RE_TABLE.findall(sql)
+    table = next((t for t in tables if t.lower().startswith("tb_")), tables[0] if tables else "")
+    return f"{mots[0].upper()} {table}".strip()
+
+
+def _noter_requete(curseur, sql, params, duree):
+    if not isinstance(sql, (str, bytes)):       # psycopg2.sql.Composed
+        try:
+            sql = sql.as_string(curseur)
+        except Exception:
+            sql = str(sql)
+    resume = resume_sql(sql)
+    if duree < _seuil_requete_lente:
+        enregistrer(resume, duree, "requete")
+        return
+    # Requête lente : texte gardé pour le panneau de diagnostic et requetes_lentes.log
+    configurer()
+    texte = " ".join((sql.decode('utf-8', 'replace') if isinstance(sql, bytes) else str(sql)).split())
+    enregistrer(resume, duree, "requete", detail=texte[:300])
+    nb_params = len(params) if isinstance(params, (list, tuple, dict)) else 0
+    logging.getLogger("ijeery.requetes_lentes").warning(
+        "%.0f ms  %s  (%d paramètres)\n%s", duree * 1000, resume, nb_params, texte[:2000])
+
+
+class CurseurMesure(extensions.cursor):
+    """Curseur psycopg2 qui mesure chaque execute (cursor_factory des connexions du pool)."""
+
+    def execute(self, sql, params=None):
+        debut = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self._noter(sql, params, time.perf_counter() - debut)
+
+    def executemany(self, sql, params_seq):
+        debut = time.perf_counter()
+        try:
+            return super().executemany(sql, params_seq)
+        finally:
+            self._noter(sql, None, time.perf_counter() - debut)
+
+    def _noter(self, sql, params, duree):
+        """Point d'extension des sous-classes (profileur_sql.CurseurProfile)."""
+        _noter_requete(self, sql, params, duree)
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Numérotation des documents (2026-FA-00001, 2026-BR-00001...).
+
+Avant : chaque page calculait la référence à l'ouverture par
+SELECT ref ... ILIKE '%2026-FA-%' ORDER BY id DESC LIMIT 1, puis l'insérait
+à l'enregistrement. Deux postes ouverts en même temps enregistraient la même
+référence, et la recherche ILIKE '%...%' parcourait toute la table.
+
+✅ tb_compteur_document : dernier numéro attribué par (type, année).
+✅ prochaine_reference(cursor, type_doc) incrémente le compteur DANS la
+   transaction de l'enregistrement : la ligne reste verrouillée jusqu'au
+   commit (les autres postes attendent puis prennent le numéro suivant) et un
+   rollback rend le numéro (pas de trou).
+✅ Premier numéro de l'année : repris du plus grand numéro déjà enregistré
+   dans la table du document (migration sans renumérotation).
+✅ apercu(cursor, type_doc) : référence probable affichée à l'ouverture de la
+   page ; la référence définitive est celle de prochaine_reference.
+
+    python numerotation.py installer
+
+Sans la table (droits insuffisants), prochaine_reference garde le calcul
+MAX + 1 mais sous pg_advisory_xact_lock : l'attribution reste unique.
+
+Exemple :
+    ref = numerotation.prochaine_reference(cursor, "FA")
+    cursor.execute("INSERT INTO tb_vente (refvente, ...) VALUES (%s, ...)", (ref, ...))
+    conn.commit()
+"""
+
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import db_pool
+
+
+VERROU_NUMEROTATION = 731_021
+
+# type -> (table, colonne de la référence)
+TYPES = {
+    "FA": ("tb_vente", "refvente"),
+    "AV": ("tb_avoir", "refavoir"),
+    "BS": ("tb_sortie", "refsortie"),
+    "CI": ("tb_consommationinterne", "refconsommation"),
+    "TRA": ("tb_transfert", "reftransfert"),
+    "BR": ("tb_livraisonfrs", "reflivfrs"),
+    "BC": ("tb_commande", "refcom"),
+    "PRO": ("tb_proforma", "refprof"),
+    "CHG": ("tb_changement", "refchg"),
+}
+
+SQL_CREATE = """
+    CREATE TABLE IF NOT EXISTS tb_compteur_document (
+        type_doc VARCHAR(10) NOT NULL,
+        annee INT NOT NULL,
+        dernier INT NOT NULL,
+        datemaj TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (type_doc, annee)
+    );
+"""
+
+SQL_INCREMENTER = """
+    UPDATE tb_compteur_document SET dernier = dernier + %(nombre)s, datemaj = NOW()
+    WHERE type_doc = %(type_doc)s AND annee = %(annee)s
+    RETURNING dernier
+"""
+
+# Création du compteur de l'année ; un poste concurrent qui l'a créé entre-temps -> + nombre
+SQL_CREER = """
+    INSERT INTO tb_compteur_document (type_doc, annee, dernier)
+    VALUES (%(type_doc)s, %(annee)s, %(premier)s + %(nombre)s - 1)
+    ON CONFLICT (type_doc, annee) DO UPDATE
+        SET dernier = tb_compteur_document.dernier + %(nombre)s, datemaj = NOW()
+    RETURNING dernier
+"""
+
+SQL_DERNIER = r"""
+    SELECT COALESCE(MAX(substring({colonne} FROM '(\d{{1,9}})$')::INT), 0)
+    FROM {table} WHERE {colonne} LIKE %s
+"""
+
+_verrou = threading.Lock()
+_table_disponible = {}      # dsn -> bool
+
+
+@contextmanager
+def _connexion(conn=None):
+    """Connexion fournie (l'appelant valide la transaction) ou empruntée au pool (commit en sortie)."""
+    if conn is not None:
+        yield conn
+    else:
+        with db_pool.emprunt() as conn:
+            yield conn
+
+
+# ==============================================================================
+# Installation
+# ==============================================================================
+def installer(conn=None):
+    """Crée tb_compteur_document (les compteurs sont créés au premier numéro de l'année)."""
+    with _connexion(conn) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(SQL_CREATE)
+        finally:
+            cursor.close()
+    with _verrou:
+        _table_disponible.clear()
+
+
+def installer_en_arriere_plan():
+    """installer() dans un thread (au démarrage de l'application)."""
+    def travail():
+        try:
+            installer()
+        except Exception as e:
+            print(f"Compteurs de documents non installés : {e}")
+    threading.Thread(target=travail, daemon=True).start()
+
+
+def table_disponible(cursor):
+    """True si tb_compteur_document existe sur cette base (vérifié une fois)."""
+    dsn = cursor.connection.dsn
+    with _verrou:
+        disponible = _table_disponible.get(dsn)
+    if disponible is None:
+        cursor.execute("SELECT to_regclass('tb_compteur_document') IS NOT NULL")
+        disponible = bool(cursor.fetchone()[0])
+        with _verrou:
+            _table_disponible[dsn] = disponible
+    return disponible
+
+
+# ==============================================================================
+# Références
+# ==============================================================================
+def formater(type_doc, annee, numero):
+    return f"{annee}-{type_doc}-{numero:05d}"
+
+
+def _dernier_enregistre(cursor, type_doc, annee):
+    """Plus grand numéro déjà présent dans la table du document (0 si aucun / type inconnu)."""
+    if type_doc not in TYPES:
+        return 0
+    table, colonne = TYPES[type_doc]
+    cursor.execute(SQL_DERNIER.format(table=table, colonne=colonne), (f"{annee}-{type_doc}-%",))
+    return cursor.fetchone()[0]
+
+
+def prochaine_reference(cursor, type_doc, annee=None):
+    """
+    Attribue la référence suivante dans la transaction du curseur.
+    Appeler juste avant l'INSERT du document : le compteur reste verrouillé
+    jusqu'au commit ou au rollback de l'appelant.
+    """
+    return prochaines_references(cursor, type_doc, 1, annee)[0]
+
+
+def prochaines_references(cursor, type_doc, nombre, annee=None):
+    """Attribue `nombre` références consécutives en un seul incrément (facture multi-magasins)."""
+    annee = annee or datetime.now().year
+    if table_disponible(cursor):
+        params = {"type_doc": type_doc, "annee": annee, "nombre": nombre}
+        cursor.execute(SQL_INCREMENTER, params)
+        ligne = cursor.fetchone()
+        if ligne is None:
+            params["premier"] = _dernier_enregistre(cursor, type_doc, annee) + 1
+            cursor.execute(SQL_CREER, params)
+            ligne = cursor.fetchone()
+        dernier = ligne[0]
+    else:
+        cle = annee * 100 + (list(TYPES).index(type_doc) if type_doc in TYPES else 99)
+        cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", (VERROU_NUMEROTATION, cle))
+        dernier = _dernier_enregistre(cursor, type_doc, annee) + nombre
+    return [formater(type_doc, annee, numero) for numero in range(dernier - nombre + 1, dernier + 1)]
+
+
+def apercu(cursor, type_doc, annee=None):
+    """Référence que recevrait le prochain document (affichage seulement, rien n'est réservé)."""
+    annee = annee or datetime.now().year
+    if table_disponible(cursor):
+        cursor.execute("SELECT dernier FROM tb_compteur_document WHERE type_doc = %s AND annee = %s",
+                       (type_doc, annee))
+        ligne = cursor.fetchone()
+        if ligne is not None:
+            return formater(type_doc, annee, ligne[0] + 1)
+    return formater(type_doc, annee, _dernier_enregistre(cursor, type_doc, annee) + 1)
+
+
+if __name__ == "__main__":
+    commande = sys.argv[1] if len(sys.argv) > 1 else ""
+
+    if commande == "installer":
+        installer()
+        print("✅ tb_compteur_document installée")
+    else:
+        print("Usage : python numerotation.py installer")
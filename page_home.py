@@ -1,5 +1,7 @@
 import customtkinter as ctk
 import psycopg2
+from db_pool import connecter_page
+from soldes_journaliers import solde_caisse
 from tkinter import messagebox, filedialog 
 from datetime import date # Pour la date du jour pour les absences
 import json
@@ -46,7 +48,8 @@ class DatabaseManager:
             return False
 
         try:
-            self.conn = psycopg2.connect(
+            self.conn = connecter_page(
+                None,
                 host=self.db_params['host'],
                 user=self.db_params['user'],
                 password=self.db_params['password'],
@@ -310,30 +313,8 @@ def get_solde_caisse():
     conn = get_db_connection()
     if conn:
         try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                WITH toutes_operations_caisse AS (
-                    SELECT idtypeoperation, mtpaye FROM tb_pmtfacture WHERE id_banque IS NULL
-                    UNION ALL 
-                    SELECT idtypeoperation, mtpaye FROM tb_pmtcom WHERE id_banque IS NULL
-                    UNION ALL 
-                    SELECT idtypeoperation, mtpaye FROM tb_encaissement WHERE id_banque IS NULL
-                    UNION ALL 
-                    SELECT idtypeoperation, mtpaye FROM tb_decaissement WHERE id_banque IS NULL
-                    UNION ALL 
-                    SELECT idtypeoperation, mtpaye FROM tb_avancepers WHERE id_banque IS NULL
-                    UNION ALL 
-                    SELECT idtypeoperation, mtpaye FROM tb_pmtsalaire WHERE id_banque IS NULL
-                    UNION ALL 
-                    SELECT idtypeoperation, mtpaye FROM tb_transfertcaisse
-                    UNION ALL 
-                    SELECT idtypeoperation, mtpaye FROM tb_pmtavoir WHERE id_banque IS NULL
-                )
-                SELECT COALESCE(SUM(CASE WHEN idtypeoperation = 1 THEN mtpaye ELSE 0 END), 0) - 
-                       COALESCE(SUM(CASE WHEN idtypeoperation = 2 THEN mtpaye ELSE 0 END), 0) 
-                FROM toutes_operations_caisse;
-            """) 
-            solde = cursor.fetchone()[0] or 0
+            # ✅ Dernière clôture journalière + mouvements du jour (soldes_journaliers)
+            solde = solde_caisse(conn.cursor())
             # Formater le montant avec des séparateurs de milliers et décimales
             return f"{solde:,.2f}".replace(",", " ").replace(".", ",") + " Ar"
         except psycopg2.Error as e:
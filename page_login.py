@@ -14,6 +14,7 @@ import subprocess
 # Assurez-vous que configDataBase.py est dans le même dossier
 from configDataBase import ConfigDataBase 
 from resource_utils import get_resource_path, get_config_path, get_session_path, safe_file_read
+from db_pool import connecter
 
 def resource_path(relative_path):
     """DEPRECATED: Utiliser get_resource_path() depuis resource_utils.py"""
@@ -112,7 +113,7 @@ class LoginWindow(ctk.CTk):
             config = json.loads(config_content)
             db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -383,5 +384,8 @@ class LoginWindow(ctk.CTk):
         self.bind("<Return>", lambda event: self.login())
 
 if __name__ == "__main__":
+    # ✅ Exécutable figé : les processus d'export_factures relancent ce point d'entrée
+    import multiprocessing
+    multiprocessing.freeze_support()
     login_window = LoginWindow()
     login_window.start()
@@ -8,7 +8,9 @@ import sys
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill
 from datetime import datetime
+from treeview_virtuel import TreeviewVirtuel
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
 
 
 # ====================================================================
@@ -167,7 +169,7 @@ class page_listeArticle(customtkinter.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -325,8 +327,8 @@ class page_listeArticle(customtkinter.CTkFrame):
         # Colonnes
         columns = ("ID", "Code", "Designation", "Unite", "Quantite", "Poids", "Categorie")
         
-        # Création du Treeview
-        self.tree = ttk.Treeview(tree_frame, columns=columns, show='headings', height=15)
+        # Création du Treeview virtuel (seules les lignes visibles sont créées)
+        self.tree = TreeviewVirtuel(tree_frame, columns=columns, show='headings', height=15)
         self.tree.tag_configure("even", background="#FFFFFF", foreground="#000000")
         self.tree.tag_configure("odd", background="#DCE5FA", foreground="#000000")
         
@@ -356,15 +358,12 @@ class page_listeArticle(customtkinter.CTkFrame):
         self.tree.grid(row=0, column=0, sticky='nsew')
         scrollbar.grid(row=0, column=1, sticky='ns')
         
+        self.tree.activer_tri(columns[1:])
+
         # Bind events
         self.tree.bind('<Double-Button-1>', self.on_double_click)
         self.tree.bind('<ButtonRelease-1>', self.on_single_click)
 
-    def _insert_rows_with_alternating_colors(self, rows):
-        for index, row in enumerate(rows):
-            tag = "even" if index % 2 == 0 else "odd"
-            self.tree.insert('', 'end', values=row, tags=(tag,))
-
     def on_single_click(self, event):
         """Gère le clic simple"""
         selection = self.tree.selection()
@@ -536,54 +535,33 @@ class page_listeArticle(customtkinter.CTkFrame):
             )
 
     def load_data(self):
-        """Récupère les données depuis la DB et les insère dans le Treeview."""
-        # Effacer les données existantes
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
+        """Récupère les données depuis la DB et les confie au Treeview virtuel."""
         # Récupérer les données
         self.all_data = self.fetch_articles_from_db()
         
-        # Insérer les données
-        if self.all_data:
-            self._insert_rows_with_alternating_colors(self.all_data)
-            self.update_count(len(self.all_data))
-        else:
-            # S'assurer que le message d'absence de données est visible
-            self.tree.insert('', 'end', values=("", "", "Aucun article trouvé", "", "", "", ""), tags=("even",))
-            self.update_count(0)
+        # Message d'absence de données si la liste est vide
+        self.tree.filtrer(None)
+        self.tree.definir_lignes(self.all_data, vide=("", "", "Aucun article trouvé", "", "", "", ""))
+        self.update_count(len(self.all_data))
 
     def filter_data(self):
         """Filtre les données selon le critère de recherche"""
-        # Effacer le Treeview
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
         # Récupérer la valeur de recherche
         search_term = self.entry_search.get().lower().strip()
         
-        # Si vide, afficher tout
+        # Si vide, afficher tout (sans relire la base)
         if not search_term:
-            self.load_data()
+            self.tree.filtrer(None)
+            self.update_count(self.tree.nombre())
             return
         
-        # Filtrer
-        filtered_data = []
-        for row in self.all_data:
-            # Concaténation des colonnes à rechercher (Code, Désignation, Unité, Catégorie)
-            # Les indices correspondent : [1]Code, [2]Désignation, [3]Unité, [6]Catégorie
-            searchable_text = f"{row[1]} {row[2]} {row[3]} {row[6]}".lower()
-            
-            if search_term in searchable_text:
-                filtered_data.append(row)
-        
-        # Insérer
-        if filtered_data:
-            self._insert_rows_with_alternating_colors(filtered_data)
-            self.update_count(len(filtered_data))
-        else:
-            self.tree.insert('', 'end', values=("", "", "Aucun résultat trouvé", "", "", "", ""), tags=("even",))
-            self.update_count(0)
+        # Concaténation des colonnes à rechercher (Code, Désignation, Unité, Catégorie)
+        # Les indices correspondent : [1]Code, [2]Désignation, [3]Unité, [6]Catégorie
+        self.tree.filtrer(
+            lambda row: search_term in f"{row[1]} {row[2]} {row[3]} {row[6]}".lower(),
+            vide=("", "", "Aucun résultat trouvé", "", "", "", "")
+        )
+        self.update_count(self.tree.nombre())
 
     def reset_filters(self):
         """Réinitialise le filtre"""
@@ -596,18 +574,13 @@ class page_listeArticle(customtkinter.CTkFrame):
 
     def export_to_excel(self):
         """Export vers Excel"""
-        items = self.tree.get_children()
+        # Lignes filtrées, dans l'ordre affiché (la ligne "Aucun ... trouvé" n'en fait pas partie)
+        items = self.tree.lignes_affichees()
         
         if not items:
             messagebox.showwarning("Aucune donnée", "Aucune donnée à exporter.")
             return
         
-        first_item = self.tree.item(items[0])
-        # Vérifie si la première ligne est le message "Aucun article/résultat trouvé"
-        if not first_item['values'] or first_item['values'][2] in ["Aucun article trouvé", "Aucun résultat trouvé"]:
-            messagebox.showwarning("Aucune donnée", "Aucune donnée valide à exporter.")
-            return
-        
         filename = filedialog.asksaveasfilename(
             defaultextension=".xlsx",
             filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
@@ -636,9 +609,8 @@ class page_listeArticle(customtkinter.CTkFrame):
             
             # Écriture des données
             valid_items_count = 0
-            for item in items:
+            for values in items:
                 # Les valeurs commencent à l'indice 1 pour exclure l'ID de la DB (index 0)
-                values = self.tree.item(item)['values']
                 if values and values[1]: # Assurez-vous qu'il y a un code article
                     ws.append(values[1:])
                     valid_items_count += 1
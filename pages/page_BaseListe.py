@@ -2,11 +2,11 @@ import customtkinter as ctk
 import tkinter as tk
 from tkinter import messagebox, filedialog
 from tkinter import ttk
-import psycopg2
 import json
 import os
 import sys
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
 
 
 # Configuration du chemin pour les imports
@@ -57,7 +57,8 @@ class PageBaseListe(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter_page(
+                self,
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
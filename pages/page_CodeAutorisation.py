@@ -1,9 +1,9 @@
 import customtkinter as ctk
 from tkinter import ttk, messagebox
-import psycopg2
 import json
 import os
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
 
 
 class PageCodeAutorisation(ctk.CTkFrame):
@@ -67,7 +67,7 @@ class PageCodeAutorisation(ctk.CTkFrame):
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
                 db_config = config['database']
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
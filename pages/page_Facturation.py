@@ -3,6 +3,8 @@ from tkinter import ttk, messagebox
 import psycopg2
 import json
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+from stock_engine import stock_article, stock_unites
 
 
 from pages.page_venteParMsin import PageVenteParMsin
@@ -34,7 +36,7 @@ class PageFacturation(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -190,6 +192,12 @@ class PageFacturation(ctk.CTkFrame):
         """)
         
         articles = cur.fetchall()
+
+        # Stocks de tous les articles × magasins en un seul appel au moteur
+        stocks_calcules = stock_unites(
+            [(a[0], a[1], mag[0]) for a in articles for mag in self.magasins],
+            conn=conn
+        )
         conn.close()
 
         # Afficher chaque article avec son stock dans tous les magasins
@@ -203,7 +211,7 @@ class PageFacturation(ctk.CTkFrame):
             total = 0
             
             for mag in self.magasins:
-                qte = self.calculer_stock_article(idarticle, idunite, mag[0])
+                qte = stocks_calcules[(idarticle, idunite, mag[0])]
                 stocks.append(self.formater_nombre(qte))
                 total += qte
             
@@ -229,9 +237,10 @@ class PageFacturation(ctk.CTkFrame):
         # Formater le code avec les zéros initiaux
         code_formate = str(code).zfill(10) if code else ""
 
-        total = 0
-        for mag in self.magasins:
-            total += self.calculer_stock_article(idarticle, idunite, mag[0])
+        stocks_calcules = stock_unites(
+            [(idarticle, idunite, mag[0]) for mag in self.magasins]
+        )
+        total = sum(stocks_calcules.values())
 
         if check_only:
             print(f"Check only: retour total = {total}")
@@ -244,7 +253,7 @@ class PageFacturation(ctk.CTkFrame):
         # Calculer les stocks par magasin
         stocks = []
         for mag in self.magasins:
-            qte = self.calculer_stock_article(idarticle, idunite, mag[0])
+            qte = stocks_calcules[(idarticle, idunite, mag[0])]
             stocks.append(self.formater_nombre(qte))
             print(f"Magasin {mag[1]}: {qte}")
 
@@ -260,256 +269,17 @@ class PageFacturation(ctk.CTkFrame):
     # ------------------------------------------------------------------
     # CALCUL STOCK
     # ------------------------------------------------------------------
-    def calculer_stock_article(self, idarticle, idunite, idmag=None):
+    def calculer_stock_article(self, idarticle, idunite_cible, idmag=None):
         """
-        Calcule le stock d'un article pour un magasin donné
-        Prend en compte les conversions d'unités hiérarchiques ET les ajustements d'inventaire
+        ✅ CALCUL CONSOLIDÉ via le moteur partagé (stock_engine) :
+        réservoir commun en unité de base sur les 10 sources de mouvements,
+        divisé par le qtunite de l'unité cible. Une seule requête ensembliste.
         """
-        conn = self.connect_db()
-        if not conn:
-            return 0
-
         try:
-            cursor = conn.cursor()
-    
-            # Récupérer toutes les unités de cet article avec leur qtunite
-            cursor.execute("""
-            SELECT idunite, COALESCE(qtunite, 1) as qtunite
-            FROM tb_unite 
-            WHERE idarticle = %s
-            ORDER BY idunite ASC 
-        """, (idarticle,))
-            unites_article = cursor.fetchall()
-    
-            if not unites_article:
-                return 0
-    
-            # L'unité de base est la première dans la liste triée
-            idunite_base = unites_article[0][0]
-    
-            # Créer un dictionnaire : {idunite: facteur_vers_base}
-            facteurs_conversion = {}
-    
-            # L'unité de base a un facteur de 1
-            facteurs_conversion[idunite_base] = 1.0
-    
-            # Pour les autres unités, calculer le facteur cumulatif
-            facteur_cumul = 1.0
-            for i, (id_unite, qt_unite) in enumerate(unites_article):
-                if i == 0:
-                    facteurs_conversion[id_unite] = 1.0
-                else:
-                    facteur_cumul *= qt_unite
-                    facteurs_conversion[id_unite] = facteur_cumul
-    
-            # Construire la clause WHERE pour le magasin
-            clause_mag = "AND idmag = %s" if idmag else ""
-            params_mag = [idmag] if idmag else []
-    
-            # Calculer le stock total dans l'unité de base
-            stock_en_unite_base = 0
-    
-            # Pour chaque unité de l'article, calculer le stock et le convertir vers l'unité de base
-            for idunite_source, qtunite_source in unites_article:
-                # 1. Livraisons fournisseurs (ENTRÉE)
-                query_livraison = f"""
-                SELECT COALESCE(SUM(qtlivrefrs), 0) 
-                FROM tb_livraisonfrs 
-                WHERE idarticle = %s AND idunite = %s {clause_mag}
-            """
-                cursor.execute(query_livraison, [idarticle, idunite_source] + params_mag)
-                total_livraison = cursor.fetchone()[0] or 0
-        
-                # 2. Ventes (SORTIE)
-                query_vente = f"""
-                SELECT COALESCE(SUM(qtvente), 0) 
-                FROM tb_ventedetail 
-                WHERE idarticle = %s AND idunite = %s {clause_mag}
-            """
-                cursor.execute(query_vente, [idarticle, idunite_source] + params_mag)
-                total_vente = cursor.fetchone()[0] or 0
-        
-                # 3. Sorties (SORTIE)
-                query_sortie = f"""
-                SELECT COALESCE(SUM(qtsortie), 0) 
-                FROM tb_sortiedetail 
-                WHERE idarticle = %s AND idunite = %s {clause_mag}
-            """
-                cursor.execute(query_sortie, [idarticle, idunite_source] + params_mag)
-                total_sortie = cursor.fetchone()[0] or 0
-        
-                # 4. Transferts sortants (SORTIE)
-                query_transfert_sortie = """
-                SELECT COALESCE(SUM(td.qttransfertsortie), 0)
-                FROM tb_transfertdetail td
-                INNER JOIN tb_transfert t ON td.idtransfert = t.idtransfert
-                WHERE td.idarticle = %s AND td.idunite = %s
-            """
-                params_transfert_sortie = [idarticle, idunite_source]
-                if idmag:
-                    query_transfert_sortie += " AND t.idmagsortie = %s"
-                    params_transfert_sortie.append(idmag)
-        
-                cursor.execute(query_transfert_sortie, params_transfert_sortie)
-                total_transfert_sortie = cursor.fetchone()[0] or 0
-        
-                # 5. Transferts entrants (ENTRÉE)
-                query_transfert_entree = """
-                SELECT COALESCE(SUM(td.qttransfertentree), 0)
-                FROM tb_transfertdetail td
-                INNER JOIN tb_transfert t ON td.idtransfert = t.idtransfert
-                WHERE td.idarticle = %s AND td.idunite = %s
-            """
-                params_transfert_entree = [idarticle, idunite_source]
-                if idmag:
-                    query_transfert_entree += " AND t.idmagentree = %s"
-                    params_transfert_entree.append(idmag)
-        
-                cursor.execute(query_transfert_entree, params_transfert_entree)
-                total_transfert_entree = cursor.fetchone()[0] or 0
-            
-                # 6. AVOIR (ENTRÉE)
-                query_avoir = f"""
-                SELECT COALESCE(SUM(qtavoir), 0) 
-                FROM tb_avoirdetail 
-                WHERE idarticle = %s AND idunite = %s {clause_mag}
-            """
-                cursor.execute(query_avoir, [idarticle, idunite_source] + params_mag)
-                total_avoir = cursor.fetchone()[0] or 0
-        
-                # Calcul du stock pour cette unité source
-                stock_unite_source = (total_livraison + total_avoir + total_transfert_entree - 
-                             total_vente - total_sortie - total_transfert_sortie)
-        
-                # Convertir vers l'unité de base
-                facteur_vers_base = facteurs_conversion.get(idunite_source, 1.0)
-                stock_en_unite_base += stock_unite_source * facteur_vers_base
-    
-            # ✅ CORRECTION MAJEURE : Récupérer le codearticle pour chercher les inventaires
-            cursor.execute("""
-            SELECT codearticle FROM tb_unite WHERE idarticle = %s AND idunite = %s
-        """, (idarticle, idunite))
-            res_code = cursor.fetchone()
-        
-            if res_code and idmag:
-                code_article = res_code[0]
-            
-                # 7. AJUSTEMENTS D'INVENTAIRE
-                # Récupérer le dernier inventaire validé pour cet article et ce magasin
-                cursor.execute("""
-                SELECT qtinventaire, date 
-                FROM tb_inventaire 
-                WHERE codearticle = %s AND idmag = %s
-                ORDER BY date DESC
-                LIMIT 1
-            """, (code_article, idmag))
-            
-                dernier_inventaire = cursor.fetchone()
-            
-                if dernier_inventaire:
-                    qt_inventaire = dernier_inventaire[0]
-                    date_inventaire = dernier_inventaire[1]
-                
-                    # Convertir l'unité de base vers l'unité cible
-                    facteur_cible = facteurs_conversion.get(idunite, 1.0)
-                    if facteur_cible == 0:
-                        return 0
-                    
-                    stock_calcule_avant_inv = stock_en_unite_base / facteur_cible
-                
-                    # Calculer les mouvements APRÈS l'inventaire
-                    mouvements_apres = 0
-                
-                    for idunite_source, qtunite_source in unites_article:
-                        # Livraisons après inventaire
-                        cursor.execute(f"""
-                        SELECT COALESCE(SUM(qtlivrefrs), 0) 
-                        FROM tb_livraisonfrs 
-                        WHERE idarticle = %s AND idunite = %s AND idmag = %s
-                        AND dateregistre > %s
-                    """, (idarticle, idunite_source, idmag, date_inventaire))
-                        liv_apres = cursor.fetchone()[0] or 0
-                    
-                        # Ventes après inventaire
-                        cursor.execute(f"""
-                        SELECT COALESCE(SUM(vd.qtvente), 0) 
-                        FROM tb_ventedetail vd
-                        INNER JOIN tb_vente v ON vd.idvente = v.id
-                        WHERE vd.idarticle = %s AND vd.idunite = %s AND vd.idmag = %s
-                        AND v.dateregistre > %s
-                    """, (idarticle, idunite_source, idmag, date_inventaire))
-                        vte_apres = cursor.fetchone()[0] or 0
-                    
-                        # Sorties après inventaire
-                        cursor.execute(f"""
-                        SELECT COALESCE(SUM(sd.qtsortie), 0) 
-                        FROM tb_sortiedetail sd
-                        INNER JOIN tb_sortie s ON sd.idsortie = s.id
-                        WHERE sd.idarticle = %s AND sd.idunite = %s AND sd.idmag = %s
-                        AND s.dateregistre > %s
-                    """, (idarticle, idunite_source, idmag, date_inventaire))
-                        sort_apres = cursor.fetchone()[0] or 0
-                    
-                        # Avoir après inventaire
-                        cursor.execute(f"""
-                        SELECT COALESCE(SUM(ad.qtavoir), 0) 
-                        FROM tb_avoirdetail ad
-                        INNER JOIN tb_avoir a ON ad.idavoir = a.id
-                        WHERE ad.idarticle = %s AND ad.idunite = %s AND ad.idmag = %s
-                        AND a.dateregistre > %s
-                    """, (idarticle, idunite_source, idmag, date_inventaire))
-                        avoir_apres = cursor.fetchone()[0] or 0
-                    
-                        # Transferts sortants après inventaire
-                        cursor.execute("""
-                        SELECT COALESCE(SUM(td.qttransfertsortie), 0)
-                        FROM tb_transfertdetail td
-                        INNER JOIN tb_transfert t ON td.idtransfert = t.idtransfert
-                        WHERE td.idarticle = %s AND td.idunite = %s
-                        AND t.idmagsortie = %s AND t.dateregistre > %s
-                    """, (idarticle, idunite_source, idmag, date_inventaire))
-                        transf_sort_apres = cursor.fetchone()[0] or 0
-                    
-                        # Transferts entrants après inventaire
-                        cursor.execute("""
-                        SELECT COALESCE(SUM(td.qttransfertentree), 0)
-                        FROM tb_transfertdetail td
-                        INNER JOIN tb_transfert t ON td.idtransfert = t.idtransfert
-                        WHERE td.idarticle = %s AND td.idunite = %s
-                        AND t.idmagentree = %s AND t.dateregistre > %s
-                    """, (idarticle, idunite_source, idmag, date_inventaire))
-                        transf_entr_apres = cursor.fetchone()[0] or 0
-                    
-                        # Calculer mouvement dans cette unité et convertir
-                        mouv_unite = (liv_apres + avoir_apres + transf_entr_apres - 
-                                 vte_apres - sort_apres - transf_sort_apres)
-                    
-                        facteur_vers_base = facteurs_conversion.get(idunite_source, 1.0)
-                        mouvements_apres += mouv_unite * facteur_vers_base
-                
-                    # Stock final = Inventaire + Mouvements après inventaire (converti)
-                    mouvements_apres_converti = mouvements_apres / facteur_cible
-                    stock_final = qt_inventaire + mouvements_apres_converti
-                
-                    return stock_final
-    
-            # Convertir de l'unité de base vers l'unité cible demandée
-            facteur_cible = facteurs_conversion.get(idunite, 1.0)
-    
-            if facteur_cible == 0:
-                return 0
-    
-            stock_final = stock_en_unite_base / facteur_cible
-            return stock_final
-    
+            return stock_article(idarticle, idunite_cible, idmag)
         except Exception as e:
-            print(f"Erreur calcul stock: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            print(f"Erreur calcul stock consolidé : {e}")
             return 0
-        finally:
-            cursor.close()
-            conn.close()
 
 # ----------------------------------------------------------------------
 # TEST
@@ -7,6 +7,7 @@ import os
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
 
 
 # IMPORTER LA CLASSE DE PAIEMENT
@@ -193,7 +194,7 @@ class PageFrsDette(ctk.CTkFrame):
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
                 db_config = config['database']
-            conn = psycopg2.connect(**db_config)
+            conn = connecter(**db_config)
             return conn
         except Exception as e:
             messagebox.showerror("Erreur DB", str(e))
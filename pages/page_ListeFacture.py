@@ -1,12 +1,18 @@
 import customtkinter as ctk
 from tkinter import ttk, messagebox, filedialog
-import psycopg2
 import json
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 from tkcalendar import DateEntry # Importation nécessaire
 import os
 from resource_utils import get_config_path, get_session_path, safe_file_read
+from db_pool import connecter
+from stock_engine import appliquer_requete
+from treeview_virtuel import TreeviewVirtuel
+from recherche_async import ControleurRecherche
+from recherche_index import filtre_clients
+import rendu_pdf
+from export_factures import lire_factures, exporter_en_arriere_plan
 
 
 class PageDetailFacture(ctk.CTkToplevel):
@@ -114,7 +120,7 @@ class PageDetailFacture(ctk.CTkToplevel):
         try:
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
-            conn = psycopg2.connect(**config['database'])
+            conn = connecter(**config['database'])
             cursor = conn.cursor()
             
             # Récupérer les infos de la facture (montant total, mode paiement)
@@ -167,109 +173,31 @@ class PageDetailFacture(ctk.CTkToplevel):
             
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
-            conn = psycopg2.connect(**config['database'])
-            cursor = conn.cursor()
-            
-            # Récupérer toutes les infos de la facture
-            sql = """
-                SELECT 
-                    v.refvente, v.dateregistre, v.description, 
-                    u.nomuser, u.prenomuser, 
-                    c.nomcli, c.adressecli, c.contactcli,
-                    v.totmtvente
-                FROM tb_vente v 
-                INNER JOIN tb_users u ON v.iduser = u.iduser 
-                LEFT JOIN tb_client c ON v.idclient = c.idclient 
-                WHERE v.id = %s
-            """
-            cursor.execute(sql, (self.idvente,))
-            result = cursor.fetchone()
+            conn = connecter(**config['database'])
+            try:
+                # ✅ Même lecture que l'export par lot (en-tête + lignes, infos société en cache)
+                factures = lire_factures(conn.cursor(), [self.idvente])
+            finally:
+                conn.close()
             
-            if not result:
+            if not factures:
                 messagebox.showerror("Erreur", "Impossible de récupérer les données de la facture")
                 return
-            
-            (refvente, dateregistre, description, nomuser, prenomuser, nomcli, adressecli, contactcli, totmtvente) = result
-            
-            # Récupérer les détails
-            sql_details = """
-                SELECT 
-                    u.codearticle, a.designation, u.designationunite, 
-                    vd.qtvente, vd.prixunit, m.designationmag
-                FROM tb_ventedetail vd 
-                INNER JOIN tb_article a ON vd.idarticle = a.idarticle 
-                INNER JOIN tb_unite u ON vd.idunite = u.idunite
-                INNER JOIN tb_magasin m ON vd.idmag = m.idmag
-                WHERE vd.idvente = %s
-                ORDER BY a.designation
-            """
-            cursor.execute(sql_details, (self.idvente,))
-            details_rows = cursor.fetchall()
-            
-            # Récupérer infos société
-            sql_societe = """
-                SELECT nomsociete, adressesociete, contactsociete, nifsociete, statsociete
-                FROM tb_infosociete LIMIT 1
-            """
-            cursor.execute(sql_societe)
-            societe_result = cursor.fetchone()
-            
-            conn.close()
-            
-            # Préparer les données
-            societe_info = {
-                'nomsociete': societe_result[0] if societe_result else 'N/A',
-                'adressesociete': societe_result[1] if societe_result else 'N/A',
-                'contactsociete': societe_result[2] if societe_result else 'N/A',
-                'nifsociete': societe_result[3] if societe_result else 'N/A',
-                'statsociete': societe_result[4] if societe_result else 'N/A',
-            }
-            
-            data = {
-                'societe': societe_info,
-                'vente': {
-                    'refvente': refvente,
-                    'dateregistre': dateregistre.strftime("%d/%m/%Y %H:%M"),
-                    'description': description,
-                },
-                'utilisateur': {
-                    'nomuser': nomuser,
-                    'prenomuser': prenomuser,
-                },
-                'client': {
-                    'nomcli': nomcli or "Client Divers",
-                    'adressecli': adressecli or "N/A",
-                    'contactcli': contactcli or "N/A",
-                },
-                'details': [
-                    {
-                        'code_article': r[0],
-                        'designation': r[1],
-                        'unite': r[2],
-                        'qte': r[3],
-                        'prixunit': r[4],
-                        'magasin': r[5],
-                        'montant': r[3] * r[4]
-                    }
-                    for r in details_rows
-                ]
-            }
+            data = factures[0]
+            refvente = data['vente']['refvente']
             
             # Créer une instance de PageVente pour accéder à la méthode generate_pdf_a5
             page_vente = PageVente.__new__(PageVente)
-            page_vente.infos_societe = societe_info
+            page_vente.infos_societe = data['societe']
             
             # Générer le PDF avec "DUPLICATA" dans le titre
             filename = os.path.expanduser(f"~\\Desktop\\DUPLICATA_Facture_{refvente.replace('/', '-')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
             
-            # Appeler generate_pdf_a5_duplicata (version modifiée)
-            self.generate_pdf_a5_duplicata(data, filename, page_vente)
-            
-            messagebox.showinfo("Succès", f"Duplicata généré avec succès !\n{filename}")
-            
-            # Ouvrir le fichier
-            if os.path.exists(filename):
-                os.startfile(filename)
+            # ✅ Rendu dans le pool de rendu_pdf, puis ouverture du fichier
+            rendu_pdf.rendre(
+                self, filename, lambda: self.generate_pdf_a5_duplicata(data, filename, page_vente),
+                rappel=lambda f: messagebox.showinfo("Succès", f"Duplicata généré avec succès !\n{f}")
+            )
                 
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur lors de la génération du duplicata : {str(e)}")
@@ -282,9 +210,18 @@ class PageDetailFacture(ctk.CTkToplevel):
             try:
                 with open(get_config_path('config.json')) as f:
                     config = json.load(f)
-                conn = psycopg2.connect(**config['database'])
+                conn = connecter(**config['database'])
                 cursor = conn.cursor()
                 
+                # Une facture VALIDEE annulée remet ses quantités en stock (tb_stock_solde)
+                appliquer_requete(cursor, """
+                    SELECT vd.idarticle, vd.idunite, v.idmag, vd.qtvente
+                    FROM tb_ventedetail vd
+                    JOIN tb_vente v ON v.id = vd.idvente
+                    WHERE v.refvente = %s AND v.deleted = 0 AND vd.deleted = 0
+                      AND v.statut = 'VALIDEE'
+                """, (self.refvente,), signe=1)
+
                 # Mettre à jour le statut à 'ANNULE'
                 sql = "UPDATE tb_vente SET statut = %s WHERE refvente = %s"
                 cursor.execute(sql, ("ANNULE", self.refvente))
@@ -481,12 +418,22 @@ class PageDetailFacture(ctk.CTkToplevel):
 
 
 class PageListeFacture(ctk.CTkFrame):
+    # ✅ Pagination par clé (dateregistre, id) : on ne lit que TAILLE_PAGE factures
+    # à la fois ; la page suivante est chargée quand la fin du tableau devient visible.
+    # Le nombre de factures et le montant total viennent d'une requête d'agrégat.
+    TAILLE_PAGE = 200
+
     def __init__(self, parent, session_data=None):
         super().__init__(parent)
         self.session_data = session_data
         self.id_user_connecte = self.get_connected_user_id(parent, session_data)
         self.magasin_map = {}
         self.user_default_magasin_nom = None
+        self.criteres = None          # filtres de la liste affichée
+        self.derniere_cle = None      # (dateregistre, id) de la dernière facture chargée
+        self.fin_atteinte = True
+        self.nb_total = 0
+        self.chargement_en_cours = False   # première page ou page suivante en cours de lecture
         
         self.grid_columnconfigure(0, weight=1)
         self.grid_rowconfigure(1, weight=1)
@@ -529,7 +476,7 @@ class PageListeFacture(ctk.CTkFrame):
         try:
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
-            return psycopg2.connect(**config['database'])
+            return connecter(**config['database'])
         except Exception as e:
             return None
 
@@ -541,7 +488,7 @@ class PageListeFacture(ctk.CTkFrame):
         # 1. Recherche textuelle existante
         self.entry_search = ctk.CTkEntry(search_frame, width=250, placeholder_text="Facture, Client...")
         self.entry_search.pack(side="left", padx=5, pady=10)
-        self.entry_search.bind("<KeyRelease>", lambda e: self.charger_donnees())
+        self.entry_search.bind("<KeyRelease>", lambda e: self.charger_donnees(immediat=False))
 
         # 2. Sélecteur Date Début
         ctk.CTkLabel(search_frame, text="Du:").pack(side="left", padx=2)
@@ -589,12 +536,20 @@ class PageListeFacture(ctk.CTkFrame):
                                         command=self.exporter_excel)
         self.btn_export.pack(side="right", padx=10)
 
+        self.btn_pdf = ctk.CTkButton(search_frame, text="📄 PDF", width=80,
+                                     fg_color="#b71c1c", hover_color="#7f0000",
+                                     command=self.exporter_pdf)
+        self.btn_pdf.pack(side="right", padx=(10, 0))
+
         # --- Tableau ---
         table_frame = ctk.CTkFrame(self)
         table_frame.grid(row=1, column=0, sticky="nsew", padx=10, pady=5)
         
         columns = ("date", "n_facture", "magasin", "client", "montant", "statut", "user")
-        self.tree = ttk.Treeview(table_frame, columns=columns, show="headings")
+        # Treeview virtuel : lignes = (idvente, valeurs affichées) ; page suivante en fin de défilement
+        self.tree = TreeviewVirtuel(table_frame, columns=columns, show="headings",
+                                    valeurs_ligne=lambda ligne: ligne[1],
+                                    sur_fin=self.charger_plus)
         self.tree.tag_configure("even", background="#FFFFFF", foreground="#000000")
         self.tree.tag_configure("odd", background="#E6EFF8", foreground="#000000")
         
@@ -609,11 +564,20 @@ class PageListeFacture(ctk.CTkFrame):
         self.tree.pack(side="left", fill="both", expand=True)
         self.tree.bind("<Double-1>", self.on_double_click)
 
+        # Recherche en arrière-plan avec anti-rebond : première page + agrégat,
+        # ou page suivante (même contrôleur : une nouvelle recherche périme la suite en cours)
+        self.recherche = ControleurRecherche(
+            self, self.requete_factures, self.afficher_factures, erreur=self.echec_chargement
+        )
+
         # --- Footer ---
         footer_frame = ctk.CTkFrame(self)
         footer_frame.grid(row=2, column=0, sticky="ew", padx=10, pady=10)
         self.lbl_count = ctk.CTkLabel(footer_frame, text="Factures: 0")
         self.lbl_count.pack(side="left", padx=20)
+        self.btn_plus = ctk.CTkButton(footer_frame, text="⬇ Charger plus", width=110,
+                                      command=self.charger_plus, state="disabled")
+        self.btn_plus.pack(side="left", padx=5)
         self.lbl_total_mt = ctk.CTkLabel(footer_frame, text="Total: 0 Ar", font=("Arial", 16, "bold"), text_color="#2ecc71")
         self.lbl_total_mt.pack(side="right", padx=20)
 
@@ -663,9 +627,8 @@ class PageListeFacture(ctk.CTkFrame):
         finally:
             conn.close()
 
-    def charger_donnees(self):
-        for item in self.tree.get_children(): self.tree.delete(item)
-        
+    def lire_criteres(self):
+        """Filtres saisis (lus sur le thread Tk)."""
         val = self.entry_search.get().strip()
         val_num = None
         if val:
@@ -673,95 +636,165 @@ class PageListeFacture(ctk.CTkFrame):
                 val_num = float(val.replace(" ", "").replace(".", "").replace(",", "."))
             except Exception:
                 val_num = None
-        d1 = self.date_debut.get_date()
-        d2 = self.date_fin.get_date()
-        statut_filtre = self.combo_statut.get()
         magasin_filtre_nom = self.combo_magasin.get() if hasattr(self, "combo_magasin") else "Tout"
-        magasin_filtre_id = self.magasin_map.get(magasin_filtre_nom)
-        
-        conn = self.connect_db()
-        if not conn: return
-        
-        try:
-            cursor = conn.cursor()
-            # SQL incluant le filtre de date et statut
-            sql = """
-                SELECT v.dateregistre, v.refvente, COALESCE(m.designationmag, ''), COALESCE(c.nomcli, 'Client Divers'), v.totmtvente, v.statut, u.username, v.id
-                FROM tb_vente v
-                LEFT JOIN tb_client c ON v.idclient = c.idclient
-                LEFT JOIN tb_users u ON v.iduser = u.iduser
-                LEFT JOIN tb_magasin m ON v.idmag = m.idmag
-                WHERE (
-                    v.refvente ILIKE %s
-                    OR c.nomcli ILIKE %s
-                    OR CAST(COALESCE(v.totmtvente, 0) AS TEXT) ILIKE %s
-                    OR CAST(COALESCE(v.totmtvente, 0) AS TEXT) ILIKE %s
-                    OR (%s IS NOT NULL AND COALESCE(v.totmtvente, 0) = %s)
-                )
-                AND v.dateregistre::date BETWEEN %s AND %s
-            """
-            params = [
-                f"%{val}%",
-                f"%{val}%",
-                f"%{val}%",
-                f"%{val.replace(',', '.')}%",
-                val_num,
-                val_num,
-                d1,
-                d2
-            ]
-            
-            # Ajouter filtre statut si différent de "Tout"
-            if statut_filtre != "Tout":
-                sql += " AND v.statut = %s"
-                params.append(statut_filtre)
-
-            if magasin_filtre_nom != "Tout" and magasin_filtre_id:
-                sql += " AND v.idmag = %s"
-                params.append(magasin_filtre_id)
-            
-            sql += " ORDER BY v.dateregistre DESC, v.id DESC"
-            
-            cursor.execute(sql, params)
-            rows = cursor.fetchall()
-            
-            total = 0
-            for idx, r in enumerate(rows):
-                mt_format = self.formater_montant(r[4]) # Utilisation de la fonction
-                zebra_tag = "even" if idx % 2 == 0 else "odd"
-                self.tree.insert("", "end", iid=str(r[7]), values=(
-                    r[0].strftime("%d/%m/%Y %H:%M:%S"), 
-                    r[1], 
-                    r[2], 
-                    r[3], 
-                    mt_format, 
-                    r[5],  # Statut
-                    r[6]   # User
-                ), tags=(zebra_tag,))
-                total += float(r[4])
-        
-            self.lbl_count.configure(text=f"Total factures : {len(rows)}")
-            self.lbl_total_mt.configure(text=f"Montant Total en Ar: {self.formater_montant(total)}")
-        finally:
-            conn.close()
+        return {
+            'texte': val,
+            'montant': val_num,
+            'debut': self.date_debut.get_date(),
+            'fin': self.date_fin.get_date(),
+            'statut': self.combo_statut.get(),
+            'idmag': self.magasin_map.get(magasin_filtre_nom) if magasin_filtre_nom != "Tout" else None,
+        }
+
+    def construire_filtre(self, cursor, criteres):
+        """
+        Clause WHERE commune à la liste, à l'agrégat et à l'export.
+        Plage de dates "sargable" (>= début, < fin + 1 jour) : l'index (dateregistre, id) sert.
+        """
+        conditions = ["v.dateregistre >= %s", "v.dateregistre < %s"]
+        params = [criteres['debut'], criteres['fin'] + timedelta(days=1)]
+
+        if criteres['texte']:
+            # Référence, nom du client (index trigramme) ou montant exact
+            filtre_cli, params_cli = filtre_clients(cursor, criteres['texte'])
+            conditions.append(f"(v.refvente ILIKE %s OR {filtre_cli} OR v.totmtvente = %s)")
+            params += [f"%{criteres['texte']}%"] + params_cli + [criteres['montant']]
+
+        # Ajouter filtre statut si différent de "Tout"
+        if criteres['statut'] != "Tout":
+            conditions.append("v.statut = %s")
+            params.append(criteres['statut'])
+
+        if criteres['idmag']:
+            conditions.append("v.idmag = %s")
+            params.append(criteres['idmag'])
+
+        return " AND ".join(conditions), params
+
+    def lire_page(self, cursor, criteres, apres=None, limite=None):
+        """Factures suivant la clé `apres` (dateregistre, id), de la plus récente à la plus ancienne."""
+        where, params = self.construire_filtre(cursor, criteres)
+        if apres is not None:
+            where += " AND (v.dateregistre, v.id) < (%s, %s)"
+            params += list(apres)
+        sql = f"""
+            SELECT v.dateregistre, v.refvente, COALESCE(m.designationmag, ''), COALESCE(c.nomcli, 'Client Divers'), v.totmtvente, v.statut, u.username, v.id
+            FROM tb_vente v
+            LEFT JOIN tb_client c ON v.idclient = c.idclient
+            LEFT JOIN tb_users u ON v.iduser = u.iduser
+            LEFT JOIN tb_magasin m ON v.idmag = m.idmag
+            WHERE {where}
+            ORDER BY v.dateregistre DESC, v.id DESC
+        """
+        if limite:
+            sql += " LIMIT %s"
+            params.append(limite)
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+    def requete_factures(self, cursor, criteres, apres=None):
+        """Thread de travail : page suivant la clé `apres`, ou première page + agrégat."""
+        if apres is not None:
+            return self.lire_page(cursor, criteres, apres=apres, limite=self.TAILLE_PAGE)
+        return self.requete_premiere_page(cursor, criteres)
+
+    def afficher_factures(self, resultat, criteres, apres=None):
+        """Thread Tk, résultat de la recherche la plus récente uniquement."""
+        self.chargement_en_cours = False
+        if apres is not None:
+            self.tree.ajouter_lignes(self.formater_lignes(resultat))
+            self.memoriser_position(resultat)
+        else:
+            self.afficher_premiere_page(resultat, criteres)
+
+    def echec_chargement(self, e):
+        self.chargement_en_cours = False
+        messagebox.showerror("Erreur", f"Erreur lors du chargement des factures: {e}")
+
+    def requete_premiere_page(self, cursor, criteres):
+        """Thread de travail : première page + nombre et montant total (agrégat SQL)."""
+        where, params = self.construire_filtre(cursor, criteres)
+        cursor.execute(f"""
+            SELECT COUNT(*), COALESCE(SUM(v.totmtvente), 0)
+            FROM tb_vente v
+            LEFT JOIN tb_client c ON v.idclient = c.idclient
+            WHERE {where}
+        """, params)
+        nb, total = cursor.fetchone()
+        return self.lire_page(cursor, criteres, limite=self.TAILLE_PAGE), nb, total
+
+    def afficher_premiere_page(self, resultat, criteres):
+        rows, nb, total = resultat
+        self.criteres = criteres
+        self.nb_total = nb
+        self.tree.definir_lignes(self.formater_lignes(rows))
+        self.memoriser_position(rows)
+        self.lbl_total_mt.configure(text=f"Montant Total en Ar: {self.formater_montant(total)}")
+
+    def formater_lignes(self, rows):
+        return [(r[7], (
+            r[0].strftime("%d/%m/%Y %H:%M:%S"), 
+            r[1], 
+            r[2], 
+            r[3], 
+            self.formater_montant(r[4]), 
+            r[5],  # Statut
+            r[6]   # User
+        )) for r in rows]
+
+    def memoriser_position(self, rows):
+        if rows:
+            self.derniere_cle = (rows[-1][0], rows[-1][7])
+        self.fin_atteinte = len(rows) < self.TAILLE_PAGE
+        self.btn_plus.configure(state="disabled" if self.fin_atteinte else "normal")
+        self.lbl_count.configure(text=f"Total factures : {self.nb_total} (affichées : {self.tree.nombre()})")
+
+    def charger_donnees(self, immediat=True):
+        """Relance la liste depuis la première page (anti-rebond pendant la frappe)."""
+        criteres = self.lire_criteres()
+        self.chargement_en_cours = True
+        if immediat:
+            self.recherche.lancer(criteres)
+        else:
+            self.recherche.declencher(criteres)
+
+    def on_show(self):
+        """Retour sur la page (cache de pages d'App) : première page et totaux relus."""
+        self.charger_donnees()
+
+    def charger_plus(self):
+        """Page suivante (bouton, ou fin du tableau atteinte en défilant), lue en arrière-plan."""
+        # ✅ Pas de double chargement, et pas d'annulation d'une nouvelle recherche en attente
+        if self.fin_atteinte or self.criteres is None or self.chargement_en_cours:
+            return
+        self.chargement_en_cours = True
+        self.recherche.lancer(self.criteres, self.derniere_cle)
 
     def on_double_click(self, event):
         """Action lors du double clic"""
-        selected_item = self.tree.focus()
-        if not selected_item: return
+        ligne = self.tree.ligne_selectionnee()
+        if not ligne: return
         
         # Récupérer les infos de la ligne
-        values = self.tree.item(selected_item)['values']
+        idvente, values = ligne
         ref_facture = values[1]
         statut = values[5]  # Statut de la facture
         
         # Ouvrir la fenêtre de détails
-        PageDetailFacture(self, selected_item, ref_facture, statut, parent_page=self)
+        PageDetailFacture(self, idvente, ref_facture, statut, parent_page=self)
 
     def exporter_excel(self):
+        # Toutes les factures du filtre courant, pas seulement les pages chargées
         lignes = []
-        for item in self.tree.get_children():
-            lignes.append(self.tree.item(item)['values'])
+        if self.criteres is not None:
+            conn = self.connect_db()
+            if conn:
+                try:
+                    cursor = conn.cursor()
+                    lignes = [valeurs for _, valeurs in self.formater_lignes(self.lire_page(cursor, self.criteres))]
+                    cursor.close()
+                finally:
+                    conn.close()
         
         if not lignes:
             messagebox.showwarning("Vide", "Rien à exporter")
@@ -779,5 +812,42 @@ class PageListeFacture(ctk.CTkFrame):
             df.to_excel(file_path, index=False)
             messagebox.showinfo("Export réussi", f"Le fichier a été enregistré sous :\n{file_path}")
 
+    def exporter_pdf(self):
+        """Factures PDF de tout le filtre courant (archivage), rendues par export_factures."""
+        if self.criteres is None or not self.nb_total:
+            messagebox.showwarning("Vide", "Rien à exporter")
+            return
+
+        dossier = filedialog.askdirectory(title="Dossier des factures PDF")
+        if not dossier:
+            return
+        fusion = messagebox.askyesno(
+            "Export PDF", f"{self.nb_total} facture(s) à exporter.\n\nRegrouper toutes les factures dans un seul PDF ?"
+        )
+        criteres = self.criteres
+
+        def selection(cursor):
+            where, params = self.construire_filtre(cursor, criteres)
+            cursor.execute(f"""
+                SELECT v.id
+                FROM tb_vente v
+                LEFT JOIN tb_client c ON v.idclient = c.idclient
+                WHERE {where}
+                ORDER BY v.dateregistre, v.id
+            """, params)
+            return [r[0] for r in cursor.fetchall()]
+
+        def progression(faites, total):
+            self.btn_pdf.configure(text=f"📄 {faites}/{total}")
+
+        def termine(fichiers):
+            self.btn_pdf.configure(text="📄 PDF", state="normal")
+            messagebox.showinfo("Export réussi", f"{len(fichiers)} fichier(s) PDF enregistré(s) dans :\n{dossier}")
 
+        def echec(e):
+            self.btn_pdf.configure(text="📄 PDF", state="normal")
+            messagebox.showerror("Erreur", f"Erreur lors de l'export PDF : {e}")
 
+        self.btn_pdf.configure(text="📄 ...", state="disabled")
+        exporter_en_arriere_plan(self, selection, dossier, fusion=fusion,
+                                 rappel=termine, erreur=echec, progression=progression)
@@ -1,6 +1,7 @@
 import customtkinter as ctk
 from tkinter import ttk, messagebox
 import psycopg2
+from db_pool import connecter
 import json
 import os
 from datetime import datetime
@@ -40,7 +41,7 @@ class PageLivraisonClient(ctk.CTkFrame):
             with open(config_path, 'r') as f:
                 config = json.load(f)
                 db_config = config['database']
-            return psycopg2.connect(**db_config)
+            return connecter(**db_config)
         except Exception as e:
             messagebox.showerror("Erreur de chemin", f"Impossible de trouver config.json à la racine.\nErreur: {e}")
             return None
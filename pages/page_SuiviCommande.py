@@ -1,5 +1,4 @@
 import customtkinter as ctk
-import psycopg2
 import json
 from tkinter import messagebox, filedialog, ttk
 import winsound
@@ -7,6 +6,11 @@ import pandas as pd
 from datetime import datetime
 import threading
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+import db_pool
+from stock_engine import stock_article, sql_soldes
+import evenements
+import thread_tk
 
 
 class PageSuiviCommande(ctk.CTkFrame):
@@ -74,7 +78,20 @@ class PageSuiviCommande(ctk.CTkFrame):
 
         self.donnees_actuelles = []
         self.donnees_completes = []  # Pour stocker toutes les données avant filtrage
-        self.boucle_verification()
+        self.positions = {}          # idarticle -> index dans donnees_completes
+        self.verifier_stocks()
+        # ✅ Plus de relecture complète toutes les 60 s : mouvements de stock et
+        # commandes enregistrées relisent seulement les articles concernés
+        evenements.abonner(self, evenements.STOCK, self.actualiser_articles)
+        evenements.abonner(self, evenements.DOCUMENT, self.sur_document)
+
+    def on_hide(self):
+        """Page masquée (cache de pages) : mouvements cumulés sans relecture."""
+        evenements.suspendre(self)
+
+    def on_show(self):
+        """Retour sur la page : articles mouvementés pendant l'absence relus en une fois."""
+        evenements.reprendre(self)
 
     def setup_treeview(self):
         """Configuration du Treeview avec colonnes séparées"""
@@ -120,7 +137,7 @@ class PageSuiviCommande(ctk.CTkFrame):
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
                 db_config = config['database']
-            return psycopg2.connect(
+            return connecter(
                 host=db_config['host'], user=db_config['user'],
                 password=db_config['password'], database=db_config['database'],
                 port=db_config['port']
@@ -131,119 +148,15 @@ class PageSuiviCommande(ctk.CTkFrame):
 
     def calculer_stock_article(self, idarticle, idunite_cible, idmag=None):
         """
-        Calcule le stock consolidé pour un article (MÊME LOGIQUE que page_stock.py).
-        Cette fonction calcule le stock réel basé sur tous les mouvements :
-        réceptions, ventes, sorties, transferts, inventaires, avoirs.
+        ✅ CALCUL CONSOLIDÉ via le moteur partagé (stock_engine) :
+        réservoir commun en unité de base sur les 10 sources de mouvements,
+        divisé par le qtunite de l'unité cible. Une seule requête ensembliste.
         """
-        conn = self.connect_db()
-        if not conn: 
-            return 0
-    
         try:
-            cursor = conn.cursor()
-            
-            # 1. Récupérer TOUTES les unités liées à cet idarticle
-            cursor.execute("""
-                SELECT idunite, codearticle, COALESCE(qtunite, 1) 
-                FROM tb_unite 
-                WHERE idarticle = %s
-            """, (idarticle,))
-            unites_liees = cursor.fetchall()
-            
-            # 2. Identifier le qtunite de l'unité qu'on veut afficher
-            qtunite_affichage = 1
-            for idu, code, qt_u in unites_liees:
-                if idu == idunite_cible:
-                    qtunite_affichage = qt_u if qt_u > 0 else 1
-                    break
-
-            total_stock_global_base = 0  # Le "réservoir" total en unité de base (qtunite=1)
-
-            # 3. Sommer les mouvements de chaque variante
-            for idu_boucle, code_boucle, qtunite_boucle in unites_liees:
-                # Réceptions
-                q_rec = "SELECT COALESCE(SUM(qtlivrefrs), 0) FROM tb_livraisonfrs WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_rec = [idarticle, idu_boucle]
-                if idmag: 
-                    q_rec += " AND idmag = %s"
-                    p_rec.append(idmag)
-                cursor.execute(q_rec, p_rec)
-                receptions = cursor.fetchone()[0] or 0
-        
-                # Ventes
-                q_ven = "SELECT COALESCE(SUM(qtvente), 0) FROM tb_ventedetail WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_ven = [idarticle, idu_boucle]
-                if idmag: 
-                    q_ven += " AND idmag = %s"
-                    p_ven.append(idmag)
-                cursor.execute(q_ven, p_ven)
-                ventes = cursor.fetchone()[0] or 0
-        
-                # Sorties
-                q_sort = "SELECT COALESCE(SUM(qtsortie), 0) FROM tb_sortiedetail WHERE idarticle = %s AND idunite = %s"
-                p_sort = [idarticle, idu_boucle]
-                if idmag: 
-                    q_sort += " AND idmag = %s"
-                    p_sort.append(idmag)
-                cursor.execute(q_sort, p_sort)
-                sorties = cursor.fetchone()[0] or 0
-        
-                # Transferts (In)
-                q_tin = "SELECT COALESCE(SUM(qttransfert), 0) FROM tb_transfertdetail WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_tin = [idarticle, idu_boucle]
-                if idmag:
-                    q_tin += " AND idmagentree = %s"
-                    p_tin.append(idmag)
-                cursor.execute(q_tin, p_tin)
-                t_in = cursor.fetchone()[0] or 0
-                
-                # Transferts (Out)
-                q_tout = "SELECT COALESCE(SUM(qttransfert), 0) FROM tb_transfertdetail WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_tout = [idarticle, idu_boucle]
-                if idmag:
-                    q_tout += " AND idmagsortie = %s"
-                    p_tout.append(idmag)
-                cursor.execute(q_tout, p_tout)
-                t_out = cursor.fetchone()[0] or 0
-        
-                # Inventaires (via codearticle)
-                q_inv = "SELECT COALESCE(SUM(qtinventaire), 0) FROM tb_inventaire WHERE codearticle = %s"
-                p_inv = [code_boucle]
-                if idmag: 
-                    q_inv += " AND idmag = %s"
-                    p_inv.append(idmag)
-                cursor.execute(q_inv, p_inv)
-                inv = cursor.fetchone()[0] or 0
-
-                # Avoirs (AUGMENTENT le stock - annulation de vente)
-                q_avoir = """
-                    SELECT COALESCE(SUM(ad.qtavoir), 0) 
-                    FROM tb_avoirdetail ad
-                    INNER JOIN tb_avoir a ON ad.idavoir = a.id
-                    WHERE ad.idarticle = %s AND ad.idunite = %s 
-                    AND a.deleted = 0 AND ad.deleted = 0
-                """
-                p_avoir = [idarticle, idu_boucle]
-                if idmag: 
-                    q_avoir += " AND ad.idmag = %s"
-                    p_avoir.append(idmag)
-                cursor.execute(q_avoir, p_avoir)
-                avoirs = cursor.fetchone()[0] or 0
-
-                # Normalisation : (Solde unité) * (Son poids)
-                solde_unite = (receptions + t_in + inv + avoirs - ventes - sorties - t_out)
-                total_stock_global_base += (solde_unite * qtunite_boucle)
-
-            # 4. Conversion finale pour l'affichage
-            stock_final = total_stock_global_base / qtunite_affichage
-            return max(0, stock_final)
-        
+            return stock_article(idarticle, idunite_cible, idmag)
         except Exception as e:
             print(f"Erreur calcul stock consolidé : {e}")
             return 0
-        finally:
-            cursor.close()
-            conn.close()
 
     def verifier_stocks_optimise(self):
         """Version ULTRA-OPTIMISÉE avec calcul SQL unique (comme page_stock.py)"""
@@ -278,138 +191,7 @@ class PageSuiviCommande(ctk.CTkFrame):
             try:
                 cursor = conn.cursor()
                 
-                # REQUÊTE SQL OPTIMISÉE : Calcul global en une seule passe
-                query = """
-                WITH mouvements_bruts AS (
-                    -- Réceptions
-                    SELECT
-                        lf.idarticle, lf.idunite,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        lf.qtlivrefrs as quantite,
-                        'reception' as type_mouvement
-                    FROM tb_livraisonfrs lf
-                    INNER JOIN tb_unite u ON lf.idarticle = u.idarticle AND lf.idunite = u.idunite
-                    WHERE lf.deleted = 0
-                    
-                    UNION ALL
-                    
-                    -- Ventes
-                    SELECT
-                        vd.idarticle, vd.idunite,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        vd.qtvente as quantite,
-                        'vente' as type_mouvement
-                    FROM tb_ventedetail vd
-                    INNER JOIN tb_vente v ON vd.idvente = v.id AND v.deleted = 0
-                    INNER JOIN tb_unite u ON vd.idarticle = u.idarticle AND vd.idunite = u.idunite
-                    WHERE vd.deleted = 0
-                    
-                    UNION ALL
-                    
-                    -- Transferts entrants
-                    SELECT
-                        t.idarticle, t.idunite,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        t.qttransfert as quantite,
-                        'transfert_in' as type_mouvement
-                    FROM tb_transfertdetail t
-                    INNER JOIN tb_unite u ON t.idarticle = u.idarticle AND t.idunite = u.idunite
-                    WHERE t.deleted = 0
-                    
-                    UNION ALL
-                    
-                    -- Transferts sortants
-                    SELECT
-                        t.idarticle, t.idunite,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        t.qttransfert as quantite,
-                        'transfert_out' as type_mouvement
-                    FROM tb_transfertdetail t
-                    INNER JOIN tb_unite u ON t.idarticle = u.idarticle AND t.idunite = u.idunite
-                    WHERE t.deleted = 0
-                    
-                    UNION ALL
-                    
-                    -- Sorties
-                    SELECT
-                        sd.idarticle, sd.idunite,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        sd.qtsortie as quantite,
-                        'sortie' as type_mouvement
-                    FROM tb_sortiedetail sd
-                    INNER JOIN tb_unite u ON sd.idarticle = u.idarticle AND sd.idunite = u.idunite
-                    
-                    UNION ALL
-                    
-                    -- Inventaires
-                    SELECT
-                        u.idarticle, u.idunite,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        i.qtinventaire as quantite,
-                        'inventaire' as type_mouvement
-                    FROM tb_inventaire i
-                    INNER JOIN tb_unite u ON i.codearticle = u.codearticle
-                    
-                    UNION ALL
-                    
-                    -- Avoirs
-                    SELECT
-                        ad.idarticle, ad.idunite,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        ad.qtavoir as quantite,
-                        'avoir' as type_mouvement
-                    FROM tb_avoir a
-                    INNER JOIN tb_avoirdetail ad ON a.id = ad.idavoir
-                    INNER JOIN tb_unite u ON ad.idarticle = u.idarticle AND ad.idunite = u.idunite
-                    WHERE a.deleted = 0 AND ad.deleted = 0
-                ),
-                
-                solde_base_par_article AS (
-                    SELECT
-                        idarticle,
-                        SUM(
-                            CASE type_mouvement
-                                WHEN 'reception'     THEN  quantite * qtunite_source
-                                WHEN 'transfert_in'  THEN  quantite * qtunite_source
-                                WHEN 'inventaire'    THEN  quantite * qtunite_source
-                                WHEN 'avoir'         THEN  quantite * qtunite_source
-                                WHEN 'vente'         THEN -quantite * qtunite_source
-                                WHEN 'sortie'        THEN -quantite * qtunite_source
-                                WHEN 'transfert_out' THEN -quantite * qtunite_source
-                                ELSE 0
-                            END
-                        ) as solde_base
-                    FROM mouvements_bruts
-                    GROUP BY idarticle
-                ),
-                
-                LastSupplier AS (
-                    SELECT DISTINCT ON (u.idarticle)
-                        u.idarticle,
-                        f.nomfrs
-                    FROM tb_unite u
-                    JOIN tb_commandedetail dc ON u.idunite = dc.idunite
-                    JOIN tb_commande c ON dc.idcom = c.idcom
-                    JOIN tb_fournisseur f ON c.idfrs = f.idfrs
-                    ORDER BY u.idarticle, c.datecom DESC
-                )
-                
-                SELECT DISTINCT ON (a.idarticle)
-                    u.codearticle,
-                    a.designation,
-                    u.designationunite,
-                    COALESCE(sb.solde_base, 0) / NULLIF(COALESCE(u.qtunite, 1), 0) as stock,
-                    a.alert,
-                    COALESCE(ls.nomfrs, 'Aucun fournisseur') as dernier_frs
-                FROM tb_article a
-                INNER JOIN tb_unite u ON a.idarticle = u.idarticle
-                LEFT JOIN solde_base_par_article sb ON sb.idarticle = u.idarticle
-                LEFT JOIN LastSupplier ls ON a.idarticle = ls.idarticle
-                WHERE a.deleted = 0
-                ORDER BY a.idarticle, u.codearticle DESC;
-                """
-                
-                cursor.execute(query)
+                cursor.execute(self.requete_stocks(cursor))
                 articles = cursor.fetchall()
                 
                 # Nettoyer le Treeview
@@ -418,8 +200,10 @@ class PageSuiviCommande(ctk.CTkFrame):
                 alerte_active = False
                 donnees_pour_export = []
                 
-                for idx, art in enumerate(articles):
+                positions = {}
+                for idx, (idarticle, *art) in enumerate(articles):
                     code, nom, unite, stock, alert, frs = art
+                    positions[idarticle] = idx
                     
                     stock = max(0, float(stock or 0))
                     stock_formate = "{:.2f}".format(stock)
@@ -442,6 +226,7 @@ class PageSuiviCommande(ctk.CTkFrame):
                 
                 self.donnees_actuelles = donnees_pour_export
                 self.donnees_completes = donnees_pour_export  # Pour le filtrage
+                self.positions = positions
                 
                 # Mettre à jour le compteur
                 self.after(0, lambda t=len(donnees_pour_export): 
@@ -469,9 +254,106 @@ class PageSuiviCommande(ctk.CTkFrame):
         thread = threading.Thread(target=charger_optimise, daemon=True)
         thread.start()
 
+    def requete_stocks(self, cursor, filtre=False):
+        """Stock et dernier fournisseur par article ; filtre : articles %(ids)s seulement."""
+        condition = "AND {col} = ANY(%(ids)s)" if filtre else ""
+        # REQUÊTE SQL OPTIMISÉE : soldes en unité de base fournis par stock_engine
+        return f"""
+        WITH solde_base_par_article AS (
+            SELECT idarticle, SUM(solde_base) AS solde_base
+            FROM ({sql_soldes(cursor)}) AS s
+            WHERE TRUE {condition.format(col="s.idarticle")}
+            GROUP BY idarticle
+        ),
+        
+        LastSupplier AS (
+            SELECT DISTINCT ON (u.idarticle)
+                u.idarticle,
+                f.nomfrs
+            FROM tb_unite u
+            JOIN tb_commandedetail dc ON u.idunite = dc.idunite
+            JOIN tb_commande c ON dc.idcom = c.idcom
+            JOIN tb_fournisseur f ON c.idfrs = f.idfrs
+            WHERE TRUE {condition.format(col="u.idarticle")}
+            ORDER BY u.idarticle, c.datecom DESC
+        )
+        
+        SELECT DISTINCT ON (a.idarticle)
+            a.idarticle,
+            u.codearticle,
+            a.designation,
+            u.designationunite,
+            COALESCE(sb.solde_base, 0) / NULLIF(COALESCE(u.qtunite, 1), 0) as stock,
+            a.alert,
+            COALESCE(ls.nomfrs, 'Aucun fournisseur') as dernier_frs
+        FROM tb_article a
+        INNER JOIN tb_unite u ON a.idarticle = u.idarticle
+        LEFT JOIN solde_base_par_article sb ON sb.idarticle = u.idarticle
+        LEFT JOIN LastSupplier ls ON a.idarticle = ls.idarticle
+        WHERE a.deleted = 0 {condition.format(col="a.idarticle")}
+        ORDER BY a.idarticle, u.codearticle DESC;
+        """
+
     def verifier_stocks(self):
         """Utilise la version optimisée par défaut"""
         self.verifier_stocks_optimise()
+        self.lbl_status.configure(text=f"Mise à jour : {datetime.now().strftime('%H:%M:%S')}")
+
+    def sur_document(self, documents):
+        """Commande enregistrée : le dernier fournisseur de ses articles peut changer."""
+        if documents is None:
+            self.actualiser_articles(None)
+            return
+        idcoms = [ident for table, ident in documents if table == "tb_commande"]
+        if idcoms:
+            self.actualiser_articles(None, idcoms)
+
+    def actualiser_articles(self, idarticles, idcoms=None):
+        """Relit en arrière-plan les articles donnés (ou ceux des commandes idcoms), puis met à jour le tableau."""
+        if idarticles is None and idcoms is None:
+            self.verifier_stocks()
+            return
+
+        def charger():
+            # Thread de travail : aucun appel Tk, résultat et erreur passent par thread_tk
+            try:
+                with db_pool.curseur() as cursor:
+                    ids = list(idarticles or [])
+                    if idcoms:
+                        cursor.execute(
+                            "SELECT DISTINCT u.idarticle FROM tb_commandedetail dc "
+                            "JOIN tb_unite u ON u.idunite = dc.idunite WHERE dc.idcom = ANY(%s)",
+                            (list(idcoms),)
+                        )
+                        ids += [row[0] for row in cursor.fetchall()]
+                    if not ids:
+                        return
+                    cursor.execute(self.requete_stocks(cursor, filtre=True), {"ids": ids})
+                    articles = cursor.fetchall()
+            except Exception as e:
+                print(f"Erreur actualisation articles : {e}")
+                thread_tk.sur_thread_tk(self, lambda e=e: self.lbl_status.configure(
+                    text=f"Actualisation impossible : {e}"))
+                return
+            thread_tk.sur_thread_tk(self, lambda: self.appliquer_articles(articles))
+
+        thread_tk.preparer(self)
+        threading.Thread(target=charger, daemon=True).start()
+
+    def appliquer_articles(self, articles):
+        """Remplace (ou ajoute) les lignes relues puis réaffiche avec le filtre courant."""
+        for idarticle, code, nom, unite, stock, alert, frs in articles:
+            ligne = (code, nom, unite, max(0, float(stock or 0)), alert, frs)
+            if idarticle in self.positions:
+                self.donnees_completes[self.positions[idarticle]] = ligne
+            else:
+                self.positions[idarticle] = len(self.donnees_completes)
+                self.donnees_completes.append(ligne)
+        self.donnees_actuelles = self.donnees_completes
+        self.filtrer_stocks()
+        if any(stock <= alert for _, _, _, stock, alert, _ in self.donnees_completes):
+            self.notifier()
+        self.lbl_status.configure(text=f"Mise à jour : {datetime.now().strftime('%H:%M:%S')}")
 
     def exporter_excel(self):
         if not self.donnees_actuelles:
@@ -495,12 +377,6 @@ class PageSuiviCommande(ctk.CTkFrame):
             except Exception as e:
                 messagebox.showerror("Erreur", f"Export impossible : {e}")
 
-    def boucle_verification(self):
-        self.verifier_stocks()
-        now = datetime.now().strftime("%H:%M:%S")
-        self.lbl_status.configure(text=f"Mise à jour : {now}")
-        self.after(60000, self.boucle_verification)
-
     def notifier(self):
         winsound.Beep(1000, 400)
         current = self.icon_notif.cget("text_color")
@@ -1,11 +1,12 @@
 import customtkinter as ctk
-import psycopg2
 import json
 from tkinter import messagebox, filedialog, ttk
 import winsound
 import pandas as pd
 from datetime import datetime
-from resource_utils import get_config_path, safe_file_read
+from resource_utils import get_config_path
+from db_pool import connecter
+import evenements
 
 
 class PageSuiviStockDepot(ctk.CTkFrame):
@@ -42,7 +43,18 @@ class PageSuiviStockDepot(ctk.CTkFrame):
         self.lbl_status.pack(side="right", padx=10)
 
         self.donnees_actuelles = []
-        self.boucle_verification()
+        self.lignes = {}            # idarticle -> (code, désignation, unité, stock, seuil, magasin)
+        self.verifier_stocks()
+        # ✅ Plus de relecture toutes les 60 s : seuls les articles mouvementés sont relus
+        evenements.abonner(self, evenements.STOCK, self.verifier_stocks)
+
+    def on_hide(self):
+        """Page masquée (cache de pages) : mouvements cumulés sans relecture."""
+        evenements.suspendre(self)
+
+    def on_show(self):
+        """Retour sur la page : articles mouvementés pendant l'absence relus en une fois."""
+        evenements.reprendre(self)
 
     def setup_treeview(self):
         self.tree_frame = ctk.CTkFrame(self)
@@ -60,7 +72,6 @@ class PageSuiviStockDepot(ctk.CTkFrame):
                         foreground="#000000",
                         fieldbackground="#FFFFFF",
                         borderwidth=0)
-                        borderwidth=0)
         
         style.configure("Treeview.Heading", 
                         font=('Segoe UI', 8, 'bold'), 
@@ -103,7 +114,7 @@ class PageSuiviStockDepot(ctk.CTkFrame):
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
                 db_config = config['database']
-            return psycopg2.connect(
+            return connecter(
                 host=db_config['host'], 
                 user=db_config['user'],
                 password=db_config['password'], 
@@ -114,7 +125,10 @@ class PageSuiviStockDepot(ctk.CTkFrame):
             messagebox.showerror("Erreur", f"Erreur de connexion : {e}")
             return None
 
-    def verifier_stocks(self):
+    def verifier_stocks(self, idarticles=None):
+        """Stocks de tous les articles, ou seulement de ceux donnés (bus d'événements)."""
+        if idarticles is not None and not idarticles:
+            return
         conn = self.connect_db()
         if not conn: 
             return
@@ -123,6 +137,7 @@ class PageSuiviStockDepot(ctk.CTkFrame):
             cursor = conn.cursor()
             query = """
                 SELECT DISTINCT ON (a.idarticle)
+                    a.idarticle,
                     u.codearticle, 
                     a.designation, 
                     u.designationunite, 
@@ -133,55 +148,62 @@ class PageSuiviStockDepot(ctk.CTkFrame):
                 JOIN tb_unite u ON a.idarticle = u.idarticle
                 JOIN tb_stock s ON u.codearticle = s.codearticle
                 LEFT JOIN tb_magasin m ON a.idmag = m.idmag
-                WHERE a.deleted = 0
+                WHERE a.deleted = 0 {filtre}
                 ORDER BY a.idarticle, u.codearticle DESC;
             """
-            cursor.execute(query)
+            if idarticles is None:
+                cursor.execute(query.format(filtre=""))
+            else:
+                cursor.execute(query.format(filtre="AND a.idarticle = ANY(%s)"), (list(idarticles),))
             articles = cursor.fetchall()
             
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-            
-            self.donnees_actuelles = []
-            alerte_detectee = False
+            if idarticles is None:
+                for item in self.tree.get_children():
+                    self.tree.delete(item)
+                self.lignes = {}
+            else:
+                # Articles relus absents du résultat : supprimés entre-temps
+                for idarticle in set(idarticles) - {art[0] for art in articles}:
+                    self.lignes.pop(idarticle, None)
+                    if self.tree.exists(str(idarticle)):
+                        self.tree.delete(str(idarticle))
 
-            for i, art in enumerate(articles):
+            for idarticle, *art in articles:
                 code, desig, unite, stock, seuil, mag = art
                 seuil = seuil or 0
                 stock = stock or 0
                 
                 stock_formate = "{:.2f}".format(float(stock)) if stock is not None else "0.00"
-                
-                # Gestion de l'alternance des couleurs et de l'alerte
-                tags = []
-                if stock <= seuil:
-                    tags.append('alerte')
-                    alerte_detectee = True
-                
-                # Ajouter la couleur de ligne alternée si pas d'alerte (ou en complément)
-                if i % 2 == 0:
-                    tags.append('evenrow')
+                valeurs = (code, desig, unite, stock_formate, seuil, mag)
+                iid = str(idarticle)
+                if self.tree.exists(iid):
+                    self.tree.item(iid, values=valeurs)
                 else:
-                    tags.append('oddrow')
-                
-                self.tree.insert("", "end", values=(code, desig, unite, stock_formate, seuil, mag), tags=tuple(tags))
-                self.donnees_actuelles.append(art)
+                    self.tree.insert("", "end", iid=iid, values=valeurs)
+                self.lignes[idarticle] = tuple(art)
+                self.appliquer_tags(iid, stock <= seuil)
 
+            self.donnees_actuelles = list(self.lignes.values())
+
+            alerte_detectee = any((stock or 0) <= (seuil or 0) for _, _, _, stock, seuil, _ in self.lignes.values())
             if alerte_detectee:
                 self.notifier()
             else:
                 self.icon_notif.configure(text_color="white")
 
+            now = datetime.now().strftime("%H:%M:%S")
+            self.lbl_status.configure(text=f"Mise à jour : {now}")
+
         except Exception as e:
             print(f"Erreur SQL: {e}")
         finally:
             conn.close()
 
-    def boucle_verification(self):
-        self.verifier_stocks()
-        now = datetime.now().strftime("%H:%M:%S")
-        self.lbl_status.configure(text=f"Mise à jour : {now}")
-        self.after(60000, self.boucle_verification)
+    def appliquer_tags(self, iid, alerte):
+        """Alerte + couleur de ligne alternée selon la position dans le tableau."""
+        tags = ['alerte'] if alerte else []
+        tags.append('evenrow' if self.tree.index(iid) % 2 == 0 else 'oddrow')
+        self.tree.item(iid, tags=tuple(tags))
 
     def notifier(self):
         winsound.Beep(1000, 400)
@@ -9,6 +9,7 @@ import sys
 import os
 import json
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
 
 
 # Importations spécifiques pour le PDF
@@ -64,7 +65,8 @@ class PageAbsence(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter_page(
+                self,
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
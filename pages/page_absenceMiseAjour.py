@@ -1,12 +1,12 @@
 import customtkinter as ctk
 from tkinter import messagebox
 from tkcalendar import Calendar
-import psycopg2
 from datetime import datetime
 import json
 import os
 import sys
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
 
 
 # Ensure the parent directory is in the Python path for absolute imports
@@ -117,7 +117,8 @@ class PageAbsenceMJ(ctk.CTkToplevel):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter_page(
+                self,
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import customtkinter as ctk
 import psycopg2
+from db_pool import connecter_page
 from datetime import datetime
 import sys
 import tkinter.messagebox
@@ -39,7 +40,8 @@ class DatabaseManager:
             return None
         
         try:
-            self.conn = psycopg2.connect(
+            self.conn = connecter_page(
+                None,
                 host=self.db_params['host'],
                 user=self.db_params['user'],
                 password=self.db_params['password'],
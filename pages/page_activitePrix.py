@@ -8,6 +8,7 @@ import sys
 from datetime import datetime
 from tkinter import filedialog
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter, connecter_page
 
 
 # Ensure the parent directory is in the Python path for absolute imports
@@ -52,7 +53,8 @@ class DatabaseManager:
             return False
 
         try:
-            self.conn = psycopg2.connect(
+            self.conn = connecter_page(
+                None,
                 host=self.db_params['host'],
                 user=self.db_params['user'],
                 password=self.db_params['password'],
@@ -145,7 +147,7 @@ class PageActivitePrix(ctk.CTkFrame):
         """Récupère les données d'activités, de séries et l'ID de la dernière année scolaire."""
         conn = None
         try:
-            conn = psycopg2.connect(**self.db_params)
+            conn = connecter(**self.db_params)
             cur = conn.cursor()
 
             cur.execute("SELECT id, designationactivite FROM tb_activite ORDER BY designationactivite")
@@ -399,7 +401,7 @@ class PageActivitePrix(ctk.CTkFrame):
 
         conn = None
         try:
-            conn = psycopg2.connect(**self.db_params)
+            conn = connecter(**self.db_params)
             cur = conn.cursor()
 
             sql = """
@@ -433,7 +435,7 @@ class PageActivitePrix(ctk.CTkFrame):
 
         conn = None
         try:
-            conn = psycopg2.connect(**self.db_params)
+            conn = connecter(**self.db_params)
             cur = conn.cursor()
 
             # Étape 1 : Trouver le dernier idanneescolaire
@@ -534,7 +536,7 @@ class PageActivitePrix(ctk.CTkFrame):
 
         conn = None
         try:
-            conn = psycopg2.connect(**self.db_params)
+            conn = connecter(**self.db_params)
             cur = conn.cursor()
 
             cur.execute("""
@@ -592,7 +594,7 @@ class PageActivitePrix(ctk.CTkFrame):
             id_serie = self.series_data.get(selected_serie)
             id_annee = self.latest_annee_scolaire_id
             if id_activite and id_serie and id_annee:
-                conn = psycopg2.connect(**self.db_params)
+                conn = connecter(**self.db_params)
                 cur = conn.cursor()
                 cur.execute("""
                     SELECT montant FROM tb_activiteprix
@@ -706,7 +708,7 @@ class PageActivitePrix(ctk.CTkFrame):
         """Recharge la liste des activités dans la combobox après ajout."""
         conn = None
         try:
-            conn = psycopg2.connect(**self.db_params)
+            conn = connecter(**self.db_params)
             cur = conn.cursor()
             cur.execute("SELECT id, designationactivite FROM tb_activite ORDER BY designationactivite")
             self.activites_data = {designation: activite_id for activite_id, designation in cur.fetchall()}
@@ -7,6 +7,7 @@ import os
 import shutil
 import sys
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
 
 
 # --- IMPORTATIONS DES PAGES ---
@@ -47,7 +48,7 @@ class PageArticle(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
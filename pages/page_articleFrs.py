@@ -1,11 +1,12 @@
 import customtkinter as ctk
-import psycopg2
 import json
 import os
 import sys
 from tkinter import messagebox
 from tkinter import ttk
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
+from recherche_index import search_articles
 
 
 # Configuration de base pour customtkinter
@@ -102,7 +103,8 @@ class PageArticleFrs(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter_page(
+                self,
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -179,16 +181,9 @@ class PageArticleFrs(ctk.CTkFrame):
             if not self.conn: return
             
             filtre = entry_search.get()
-            cursor = self.conn.cursor()
-            query = """
-                SELECT tu.codearticle, ta.designation, tu.designationunite 
-                FROM tb_unite tu 
-                JOIN tb_article ta ON tu.idarticle = ta.idarticle
-                WHERE ta.designation ILIKE %s OR tu.codearticle ILIKE %s
-            """
-            cursor.execute(query, (f'%{filtre}%', f'%{filtre}%'))
-            for row in cursor.fetchall():
-                tree.insert("", "end", values=row)
+            # Recherche indexée (trigrammes, sans accents), classée par pertinence
+            for r in search_articles(filtre, limite=None, conn=self.conn, inclure_supprimees=True):
+                tree.insert("", "end", values=(r.codearticle, r.designation, r.designationunite))
 
         def selectionner_et_fermer(event=None):
             item_sel = tree.selection()
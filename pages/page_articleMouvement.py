@@ -5,6 +5,10 @@ import psycopg2
 import json
 from datetime import datetime
 from resource_utils import get_config_path, get_session_path, safe_file_read
+from db_pool import connecter
+from recherche_index import filtre_articles
+from catalogue_cache import catalogue
+from treeview_virtuel import TreeviewVirtuel
 
 
 class FenetreRechercheArticle(ctk.CTkToplevel):
@@ -29,7 +33,7 @@ class FenetreRechercheArticle(ctk.CTkToplevel):
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
                 db_config = config['database']
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -86,7 +90,7 @@ class FenetreRechercheArticle(ctk.CTkToplevel):
         
         # Treeview
         columns = ("ID", "Désignation", "Catégorie")
-        self.tree = ttk.Treeview(
+        self.tree = TreeviewVirtuel(
             tree_frame,
             columns=columns,
             show="headings",
@@ -132,9 +136,6 @@ class FenetreRechercheArticle(ctk.CTkToplevel):
     
     def charger_articles(self):
         """Charge tous les articles"""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
         conn = self.connect_db()
         if conn:
             cursor = conn.cursor()
@@ -149,9 +150,7 @@ class FenetreRechercheArticle(ctk.CTkToplevel):
                 ORDER BY a.designation
             """)
             
-            for idx, row in enumerate(cursor.fetchall()):
-                tag = "even" if idx % 2 == 0 else "odd"
-                self.tree.insert("", "end", values=row, tags=(tag,))
+            self.tree.definir_lignes(cursor.fetchall())
             
             cursor.close()
             conn.close()
@@ -164,13 +163,13 @@ class FenetreRechercheArticle(ctk.CTkToplevel):
             self.charger_articles()
             return
         
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
         conn = self.connect_db()
         if conn:
             cursor = conn.cursor()
-            cursor.execute("""
+            # Filtre indexé (trigrammes, sans accents) ou identifiant exact
+            filtre, params = filtre_articles(cursor, recherche, unite=None)
+            idarticle = int(recherche) if recherche.isdigit() else None
+            cursor.execute(f"""
                 SELECT DISTINCT 
                     a.idarticle, 
                     a.designation,
@@ -178,16 +177,11 @@ class FenetreRechercheArticle(ctk.CTkToplevel):
                 FROM tb_article a
                 LEFT JOIN tb_categoriearticle c ON a.idca = c.idca
                 WHERE a.deleted = 0
-                AND (
-                    LOWER(a.designation) LIKE %s 
-                    OR CAST(a.idarticle AS TEXT) LIKE %s
-                )
+                AND ({filtre} OR a.idarticle = %s)
                 ORDER BY a.designation
-            """, (f"%{recherche}%", f"%{recherche}%"))
+            """, params + [idarticle])
             
-            for idx, row in enumerate(cursor.fetchall()):
-                tag = "even" if idx % 2 == 0 else "odd"
-                self.tree.insert("", "end", values=row, tags=(tag,))
+            self.tree.definir_lignes(cursor.fetchall())
             
             cursor.close()
             conn.close()
@@ -263,7 +257,7 @@ class PageArticleMouvement(ctk.CTkFrame):
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
                 db_config = config['database']
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -458,18 +452,18 @@ class PageArticleMouvement(ctk.CTkFrame):
         
         try:
             cursor = conn.cursor()
-            cursor.execute("""
+            # Filtre indexé (trigrammes, sans accents) ou identifiant exact
+            filtre, params = filtre_articles(cursor, recherche, unite=None)
+            idarticle = int(recherche) if recherche.isdigit() else None
+            cursor.execute(f"""
                 SELECT idarticle, designation, COALESCE(c.designationcat, 'Sans catégorie')
                 FROM tb_article a
                 LEFT JOIN tb_categoriearticle c ON a.idca = c.idca
                 WHERE a.deleted = 0
-                AND (
-                    LOWER(a.designation) LIKE %s 
-                    OR CAST(a.idarticle AS TEXT) LIKE %s
-                )
+                AND ({filtre} OR a.idarticle = %s)
                 ORDER BY a.designation
                 LIMIT 1
-            """, (f"%{recherche}%", f"%{recherche}%"))
+            """, params + [idarticle])
             
             resultat = cursor.fetchone()
             cursor.close()
@@ -652,7 +646,8 @@ class PageArticleMouvement(ctk.CTkFrame):
         
         # Treeview
         columns = ("Date", "Référence", "Type", "Désignation", "Unité", "Entrée", "Sortie", "Magasin", "Utilisateur")
-        self.tree = ttk.Treeview(
+        # Treeview virtuel : seules les lignes visibles sont créées
+        self.tree = TreeviewVirtuel(
             tree_frame,
             columns=columns,
             show="headings",
@@ -1105,8 +1100,7 @@ class PageArticleMouvement(ctk.CTkFrame):
         
         try:
             # Effacer le treeview
-            for item in self.tree.get_children():
-                self.tree.delete(item)
+            self.tree.vider()
             
             # Récupérer les filtres
             date_debut = self.date_debut.get_date()
@@ -1175,10 +1169,9 @@ class PageArticleMouvement(ctk.CTkFrame):
                 username = mouv[7] or ""
                 idunite = mouv[8]
 
-                # Récupérer la désignation de l'unité
-                cursor.execute("SELECT designationunite FROM tb_unite WHERE idunite = %s", (idunite,))
-                result = cursor.fetchone()
-                unite_display = result[0] if result else ""
+                # Désignation de l'unité depuis le cache catalogue (plus de requête par ligne)
+                unite = catalogue().unite(idunite) if idunite is not None else None
+                unite_display = unite.designationunite if unite else ""
 
                 row_values = (
                     date_format,
@@ -1194,13 +1187,11 @@ class PageArticleMouvement(ctk.CTkFrame):
 
                 rows_to_display.append(row_values)
 
-            # Insérer toutes les lignes dans le treeview
-            for idx, row in enumerate(rows_to_display):
-                tag = "even" if idx % 2 == 0 else "odd"
-                self.tree.insert("", "end", values=row, tags=(tag,))
-
-            # Sauvegarder la liste complète pour le filtrage côté client
+            # Confier toutes les lignes au treeview virtuel
+            # (la liste complète sert aussi au filtrage côté client)
             self.full_display_rows = rows_to_display
+            self.tree.filtrer(None)
+            self.tree.definir_lignes(rows_to_display)
             self.label_total.configure(text=f"Nombre total de documents: {len(rows_to_display)}")
             
             cursor.close()
@@ -1217,33 +1208,14 @@ class PageArticleMouvement(ctk.CTkFrame):
         search = self.entry_recherche_article.get().strip().lower()
         rows = getattr(self, 'full_display_rows', [])
 
-        # Vider le treeview
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
         if not search:
-            for idx, row in enumerate(rows):
-                tag = "even" if idx % 2 == 0 else "odd"
-                self.tree.insert("", "end", values=row, tags=(tag,))
+            self.tree.filtrer(None)
             self.label_total.configure(text=f"Nombre total de documents: {len(rows)}")
             return
 
-        filtered = []
-        for row in rows:
-            # Vérifier si le texte est présent dans une des colonnes
-            match = False
-            for cell in row:
-                if search in str(cell).lower():
-                    match = True
-                    break
-            if match:
-                filtered.append(row)
-
-        for idx, row in enumerate(filtered):
-            tag = "even" if idx % 2 == 0 else "odd"
-            self.tree.insert("", "end", values=row, tags=(tag,))
-
-        self.label_total.configure(text=f"Nombre total de documents: {len(filtered)} (filtré)")
+        # Le texte doit être présent dans une des colonnes
+        self.tree.filtrer(lambda row: any(search in str(cell).lower() for cell in row))
+        self.label_total.configure(text=f"Nombre total de documents: {self.tree.nombre()} (filtré)")
 
 
 # Test de la classe (optionnel)
@@ -6,6 +6,7 @@ import tkinter as tk
 import os
 import json
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
 
 
 class PageAutorisation(ctk.CTkFrame):
@@ -41,7 +42,8 @@ class PageAutorisation(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter_page(
+                self,
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
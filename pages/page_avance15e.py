@@ -10,6 +10,8 @@ import os
 import json
 import sys
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
+import soldes_journaliers
 
 
 # Ensure the parent directory is in the Python path for absolute imports
@@ -65,7 +67,8 @@ class PageAVQ(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter_page(
+                self,
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -307,7 +310,12 @@ class PageAVQ(ctk.CTkFrame):
                         UPDATE tb_avancepers
                         SET mtpaye = %s, observation = %s
                         WHERE id = %s
+                        RETURNING datepmt
                     """, (nouveau_montant, nouvelle_observation, avance_id))
+                    ligne = self.cursor.fetchone()
+                    # ✅ Avance d'un jour clôturé : soldes recalculés à partir de sa date
+                    if ligne:
+                        soldes_journaliers.invalider_depuis(ligne[0], self.conn)
                     self.conn.commit()
                     messagebox.showinfo("Succès", "Avance modifiée avec succès !")
                     self.rafraichir_treeview()
@@ -335,7 +343,10 @@ class PageAVQ(ctk.CTkFrame):
                 if not self.conn or not self.cursor:
                     messagebox.showerror("Erreur de connexion", "Impossible de se connecter à la base de données.")
                     return
-                self.cursor.execute("DELETE FROM tb_avancepers WHERE id = %s", (avance_id,))
+                self.cursor.execute("DELETE FROM tb_avancepers WHERE id = %s RETURNING datepmt", (avance_id,))
+                ligne = self.cursor.fetchone()
+                if ligne:
+                    soldes_journaliers.invalider_depuis(ligne[0], self.conn)
                 self.conn.commit()
                 messagebox.showinfo("Succès", "Avance annulée avec succès !")
                 self.rafraichir_treeview()
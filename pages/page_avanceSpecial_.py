@@ -10,6 +10,8 @@ import json
 import sys
 import os
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
+import soldes_journaliers
 
 
 # Ensure the parent directory is in the Python path for absolute imports
@@ -71,7 +73,8 @@ class FenetreAvanceSpec(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter_page(
+                self,
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -362,7 +365,12 @@ class FenetreAvanceSpec(ctk.CTkFrame):
                     UPDATE tb_avancespecpers
                     SET mtpaye = %s, nbremboursement = %s, observation = %s
                     WHERE id = %s
+                    RETURNING datepmt
                 """, (new_montant, new_nbrem, new_obs, avance_id))
+                ligne = self.cursor.fetchone()
+                # ✅ Avance d'un jour clôturé : soldes recalculés à partir de sa date
+                if ligne:
+                    soldes_journaliers.invalider_depuis(ligne[0], self.conn)
                 self.conn.commit()
                 messagebox.showinfo("Succès", "Avance modifiée avec succès.")
                 edit_window.destroy()
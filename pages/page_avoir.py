@@ -10,6 +10,12 @@ import os
 import sys # Ajouté pour open_file sur Linux/macOS
 import textwrap # Ajouté pour le formatage du ticket de caisse
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+from stock_engine import stock_article, stock_unites, appliquer_mouvements
+from recherche_async import ControleurRecherche
+from catalogue_cache import catalogue
+from recherche_index import search_clients
+import numerotation
 
 
 
@@ -235,7 +241,6 @@ class PageAvoir(ctk.CTkFrame):
         self.charger_magasins()
         self.charger_client()
         self.charger_infos_societe()
-        self.conn = self.connect_db() 
 
         
 
@@ -246,7 +251,7 @@ class PageAvoir(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -311,7 +316,13 @@ class PageAvoir(ctk.CTkFrame):
 
     def get_article_price(self, idarticle, idunite):
         """Récupère le dernier prix unitaire pour l'article et l'unité donnés."""
-        conn = self.conn   # <<< UTILISATION DE LA CONNEXION PRINCIPALE
+        # ✅ Cache catalogue (aucun aller-retour base dans le cas courant)
+        prix = catalogue().prix_unite(idarticle, idunite)
+        if prix > 0:
+            return float(prix)
+
+        # ✅ Connexion empruntée au pool le temps de la lecture (plus de self.conn gardée)
+        conn = self.connect_db()
         if not conn:
             return 0.0
 
@@ -353,139 +364,20 @@ class PageAvoir(ctk.CTkFrame):
         finally:
             if 'cursor' in locals():
                 cursor.close()
+            conn.close()
 
     
     def calculer_stock_article(self, idarticle, idunite_cible, idmag=None):
         """
-        Calcule le stock d'un article pour un magasin donné, dans l'unité cible.
-        (Méthode inchangée pour la vérification du stock)
+        ✅ CALCUL CONSOLIDÉ via le moteur partagé (stock_engine) :
+        réservoir commun en unité de base sur les 10 sources de mouvements,
+        divisé par le qtunite de l'unité cible. Une seule requête ensembliste.
         """
-        # ... (La logique de calcul de stock reste inchangée et est omise ici pour la concision)
-        conn = self.connect_db()
-        if not conn:
-            return 0
-    
         try:
-            cursor = conn.cursor()
-        
-            # Récupérer toutes les unités de cet article avec leur qtunite
-            cursor.execute("""
-                SELECT idunite, COALESCE(qtunite, 1) as qtunite
-                FROM tb_unite 
-                WHERE idarticle = %s
-                ORDER BY idunite ASC 
-            """, (idarticle,))
-            unites_article = cursor.fetchall()
-        
-            if not unites_article:
-                return 0
-        
-            # Créer un dictionnaire : {idunite: facteur_vers_base}
-            facteurs_conversion = {}
-        
-            facteur_cumul = 1.0
-            for i, (id_unite, qt_unite) in enumerate(unites_article):
-                if i == 0:
-                    facteurs_conversion[id_unite] = 1.0 
-                else:
-                    facteur_cumul *= qt_unite
-                    facteurs_conversion[id_unite] = facteur_cumul
-        
-            facteur_cible = facteurs_conversion.get(idunite_cible, 1.0)
-            if facteur_cible == 0:
-                return 0 
-        
-            clause_mag = "AND idmag = %s" if idmag else ""
-            params_mag = [idmag] if idmag else []
-        
-            stock_en_unite_base = 0
-        
-            for idunite_source, _ in unites_article:
-                # Calcul des mouvements (Entrées - Sorties) pour cette unité source et ce magasin
-                
-                # Livraisons fournisseurs (ENTRÉE)
-                query_livraison = f"""
-                    SELECT COALESCE(SUM(qtlivrefrs), 0) 
-                    FROM tb_livraisonfrs 
-                    WHERE idarticle = %s AND idunite = %s {clause_mag}
-                """
-                cursor.execute(query_livraison, [idarticle, idunite_source] + params_mag)
-                total_livraison = cursor.fetchone()[0] or 0
-            
-                # Ventes (SORTIE)
-                query_vente = f"""
-                    SELECT COALESCE(SUM(qtvente), 0) 
-                    FROM tb_ventedetail 
-                    WHERE idarticle = %s AND idunite = %s {clause_mag}
-                """
-                cursor.execute(query_vente, [idarticle, idunite_source] + params_mag)
-                total_vente = cursor.fetchone()[0] or 0
-                
-                # Avoir (ENTREE)
-                query_avoir = f"""
-                    SELECT COALESCE(SUM(qtavoir), 0) 
-                    FROM tb_avoirdetail 
-                    WHERE idarticle = %s AND idunite = %s {clause_mag}
-                """
-                cursor.execute(query_avoir, [idarticle, idunite_source] + params_mag)
-                total_avoir = cursor.fetchone()[0] or 0
-            
-                # Sorties (SORTIE)
-                query_sortie = f"""
-                    SELECT COALESCE(SUM(qtsortie), 0) 
-                    FROM tb_sortiedetail sd 
-                    INNER JOIN tb_sortie s ON sd.idsortie = s.id
-                    WHERE sd.idarticle = %s AND sd.idunite = %s AND s.deleted = 0 {clause_mag}
-                """
-                cursor.execute(query_sortie, [idarticle, idunite_source] + params_mag)
-                total_sortie = cursor.fetchone()[0] or 0
-                
-                # Transferts sortants (SORTIE)
-                query_transfert_sortie = """
-                    SELECT COALESCE(SUM(td.qttransfertsortie), 0)
-                    FROM tb_transfertdetail td
-                    INNER JOIN tb_transfert t ON td.reftransfert = t.reftransfert
-                    WHERE td.idarticle = %s AND td.idunite = %s AND t.deleted = 0
-                """
-                params_transfert_sortie = [idarticle, idunite_source]
-                if idmag:
-                    query_transfert_sortie += " AND t.idmagsortie = %s"
-                    params_transfert_sortie.append(idmag)
-            
-                cursor.execute(query_transfert_sortie, params_transfert_sortie)
-                total_transfert_sortie = cursor.fetchone()[0] or 0
-            
-                # Transferts entrants (ENTRÉE)
-                query_transfert_entree = """
-                    SELECT COALESCE(SUM(td.qttransfertentree), 0)
-                    FROM tb_transfertdetail td
-                    INNER JOIN tb_transfert t ON td.reftransfert = t.reftransfert
-                    WHERE td.idarticle = %s AND td.idunite = %s AND t.deleted = 0
-                """
-                params_transfert_entree = [idarticle, idunite_source]
-                if idmag:
-                    query_transfert_entree += " AND t.idmagentree = %s"
-                    params_transfert_entree.append(idmag)
-            
-                cursor.execute(query_transfert_entree, params_transfert_entree)
-                total_transfert_entree = cursor.fetchone()[0] or 0
-            
-                stock_unite_source = (total_livraison + total_avoir + total_transfert_entree - 
-                                     total_vente - total_sortie - total_transfert_sortie)
-            
-                facteur_vers_base = facteurs_conversion.get(idunite_source, 1.0)
-                stock_en_unite_base += stock_unite_source * facteur_vers_base
-        
-            stock_final = stock_en_unite_base / facteur_cible
-        
-            return stock_final
-        
+            return stock_article(idarticle, idunite_cible, idmag)
         except Exception as e:
-            # traceback.print_exc()
+            print(f"Erreur calcul stock consolidé : {e}")
             return 0
-        finally:
-            if 'cursor' in locals() and cursor: cursor.close()
-            if conn: conn.close()
     # --------------------------------------------------------------------------
 
     def setup_ui(self):
@@ -783,39 +675,17 @@ class PageAvoir(ctk.CTkFrame):
                 return
 
             try:
-                cursor = conn.cursor()
                 selected_type = type_filter_combo.get()
-                type_condition = ""
-                if selected_type == "Client à crédit":
-                    type_condition = " AND COALESCE(idtypeclient, 1) = 2 "
-                elif selected_type == "Client au comptant":
-                    type_condition = " AND COALESCE(idtypeclient, 1) = 1 "
+                idtypeclient = {"Client à crédit": 2, "Client au comptant": 1}.get(selected_type)
 
-                sql = """
-                    SELECT
-                        idclient,
-                        nomcli,
-                        CASE
-                            WHEN COALESCE(idtypeclient, 1) = 1 AND (contactcli IS NULL OR TRIM(contactcli) = '')
-                                THEN 'Aucun contact enregistré'
-                            ELSE COALESCE(NULLIF(TRIM(contactcli), ''), 'Aucun contact enregistré')
-                        END AS contact_affiche,
-                        CASE
-                            WHEN COALESCE(idtypeclient, 1) = 1 AND (adressecli IS NULL OR TRIM(adressecli) = '')
-                                THEN 'Aucun adrresse enregistré'
-                            ELSE COALESCE(NULLIF(TRIM(adressecli), ''), 'Aucun adrresse enregistré')
-                        END AS adresse_affiche
-                    FROM tb_client
-                    WHERE deleted = 0 AND nomcli ILIKE %s
-                """ + type_condition + """
-                    ORDER BY nomcli
-                """
-                cursor.execute(sql, (f"%{filtre}%",))
-                for idx, (idc, nom, contact, adresse) in enumerate(cursor.fetchall()):
+                # Recherche indexée (trigrammes, sans accents), classée par pertinence
+                clients = search_clients(filtre, conn=conn, idtypeclient=idtypeclient)
+                for idx, c in enumerate(clients):
+                    contact = (c.contactcli or "").strip() or 'Aucun contact enregistré'
+                    adresse = (c.adressecli or "").strip() or 'Aucun adrresse enregistré'
                     zebra_tag = "even" if idx % 2 == 0 else "odd"
-                    tree.insert("", "end", values=(idc, nom, contact, adresse), tags=(zebra_tag,))
+                    tree.insert("", "end", values=(c.idclient, c.nomcli, contact, adresse), tags=(zebra_tag,))
             finally:
-                cursor.close()
                 conn.close()
 
         # Recherche en direct
@@ -865,41 +735,20 @@ class PageAvoir(ctk.CTkFrame):
         
         try:
             cursor = conn.cursor()
-            
-            annee = datetime.now().year
-            
-            sql_max_id = """
-                SELECT refavoir 
-                FROM tb_avoir 
-                WHERE EXTRACT(YEAR FROM dateregistre) = %s 
-                ORDER BY id DESC 
-                LIMIT 1
-            """
-            cursor.execute(sql_max_id, (annee,))
-            derniere_ref = cursor.fetchone()
-
-            nouveau_numero = 1
-            if derniere_ref:
-                parts = derniere_ref[0].split('-')
-                if len(parts) == 3 and parts[1] == 'AV':
-                     try:
-                        partie_num = parts[-1]
-                        nouveau_numero = int(partie_num) + 1
-                     except ValueError:
-                         nouveau_numero = 1
-                
-            nouvelle_ref = f"{annee}-AV-{nouveau_numero:05d}"
-            
-            self.entry_ref_avoir.configure(state="normal")
-            self.entry_ref_avoir.delete(0, "end")
-            self.entry_ref_avoir.insert(0, nouvelle_ref)
-            self.entry_ref_avoir.configure(state="readonly")
+            # ✅ Aperçu : la référence définitive est attribuée à l'enregistrement
+            self.afficher_reference(numerotation.apercu(cursor, "AV"))
             
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur lors de la génération de la référence: {str(e)}")
         finally:
             conn.close()
 
+    def afficher_reference(self, reference):
+        self.entry_ref_avoir.configure(state="normal")
+        self.entry_ref_avoir.delete(0, "end")
+        self.entry_ref_avoir.insert(0, reference)
+        self.entry_ref_avoir.configure(state="readonly")
+
     def charger_magasins(self):
         # ... (Méthode inchangée)
         conn = self.connect_db()
@@ -1076,64 +925,61 @@ class PageAvoir(ctk.CTkFrame):
         label_count.pack(pady=(0, 5))
         
         # Fonctions de chargement et de recherche
-        def charger_articles(terme_recherche=""):
-            """Charge les articles (une ligne par unité) en fonction du terme de recherche et calcule le stock."""
+        def requete_articles(cursor, terme_recherche, idmag_selectionne):
+            """Articles (une ligne par unité) filtrés dans le cache catalogue + stock, en arrière-plan."""
+            resultats = [
+                (l.idarticle, l.designation, l.idunite, l.codearticle, l.designationunite, l.prix)
+                for l in catalogue().rechercher(terme_recherche)
+            ]
+
+            # Stock de toutes les lignes en une seule passe (stock_engine)
+            stocks = stock_unites(
+                {(row[0], row[2], idmag_selectionne) for row in resultats},
+                conn=cursor.connection
+            )
+            return resultats, stocks
+
+        def afficher_articles(donnees, terme_recherche, idmag_selectionne):
+            """Remplit le Treeview avec le résultat de la recherche la plus récente."""
+            resultats, stocks = donnees
             for item in tree.get_children():
                 tree.delete(item)
+
+            count = 0
+            for idx, row in enumerate(resultats):
+                idarticle, designation, idunite, codearticle, designationunite, prix = row
+                stock_actuel = stocks.get((idarticle, idunite, idmag_selectionne), 0)
+
+                zebra_tag = "even" if idx % 2 == 0 else "odd"
+                tree.insert('', 'end', values=(
+                    idarticle,
+                    idunite,
+                    codearticle,
+                    designation,
+                    designationunite,
+                    self.formater_nombre(prix),
+                    self.formater_nombre(stock_actuel)
+                ), tags=(zebra_tag,))
+                count += 1
             
-            conn = self.connect_db()
-            if not conn:
-                return
+            label_count.configure(text=f"Nombre d'articles/unités : {count}")
 
-            try:
-                cursor = conn.cursor()
-                sql = """
-                    SELECT 
-                        a.idarticle, a.designation, u.idunite, u.codearticle, u.designationunite
-                    FROM tb_article a 
-                    INNER JOIN tb_unite u ON a.idarticle = u.idarticle
-                    WHERE a.deleted = 0 
-                      AND (u.codearticle ILIKE %s OR a.designation ILIKE %s)
-                    ORDER BY a.designation, u.idunite
-                """
-                
-                terme = f"%{terme_recherche.strip()}%"
-                cursor.execute(sql, (terme, terme))
-                resultats = cursor.fetchall()
-                
-                designationmag = self.combo_magasin.get()
-                idmag_selectionne = self.magasin_map.get(designationmag)
-                
-                count = 0
-                for idx, row in enumerate(resultats):
-                    idarticle, designation, idunite, codearticle, designationunite = row
-                    
-                    stock_actuel = self.calculer_stock_article(idarticle, idunite, idmag_selectionne)
-                    
-                    prix = self.get_article_price(idarticle, idunite)
+        recherche = ControleurRecherche(
+            fenetre_recherche, requete_articles, afficher_articles,
+            erreur=lambda e: messagebox.showerror("Erreur", f"Erreur lors du chargement des articles: {str(e)}")
+        )
 
-                    zebra_tag = "even" if idx % 2 == 0 else "odd"
-                    tree.insert('', 'end', values=(
-                        idarticle,
-                        idunite,
-                        codearticle,
-                        designation,
-                        designationunite,
-                        self.formater_nombre(prix),
-                        self.formater_nombre(stock_actuel)
-                    ), tags=(zebra_tag,))
-                    count += 1
-                
-                label_count.configure(text=f"Nombre d'articles/unités : {count}")
-            except Exception as e:
-                messagebox.showerror("Erreur", f"Erreur lors du chargement des articles: {str(e)}")
-            finally:
-                if 'cursor' in locals() and cursor: cursor.close()
-                if conn: conn.close()
+        def charger_articles(terme_recherche="", immediat=True):
+            """Lance la recherche (immédiate, ou après l'anti-rebond pendant la frappe)."""
+            idmag_selectionne = self.magasin_map.get(self.combo_magasin.get())
+            if immediat:
+                recherche.lancer(terme_recherche, idmag_selectionne)
+            else:
+                recherche.declencher(terme_recherche, idmag_selectionne)
 
         def rechercher(*args):
             """Appelé lors de la frappe dans le champ de recherche."""
-            charger_articles(entry_search.get())
+            charger_articles(entry_search.get(), immediat=False)
 
         entry_search.bind('<KeyRelease>', rechercher)
         
@@ -2055,6 +1901,10 @@ class PageAvoir(ctk.CTkFrame):
             # ✅ Date aujourdh'ui
             dateavoir = datetime.now()
 
+            # ✅ Référence attribuée dans la transaction (unique même entre postes)
+            ref_avoir = numerotation.prochaine_reference(cur, "AV")
+            self.afficher_reference(ref_avoir)
+
             # ✅ Insérer en-tête avoir avec mtavoir et dateavoir
             sql_avoir = """
                 INSERT INTO tb_avoir (refavoir, dateregistre, dateavoir, observation, iduser, idclient, mtavoir, deleted)
@@ -2089,6 +1939,11 @@ class PageAvoir(ctk.CTkFrame):
 
             cur.executemany(sql_detail, params)
 
+            # Retour marchandise : solde de stock (tb_stock_solde) dans la même transaction
+            appliquer_mouvements(cur, [
+                (d['idarticle'], d['idunite'], d['idmag'], d['qtvente']) for d in details_a_enregistrer
+            ])
+
             # ✅ RÉCUPÉRATION DE refvente SI EXISTANT (depuis idvente_charge)
             refvente_associe = None
             if self.idvente_charge:
@@ -3,13 +3,14 @@ import tkinter as tk
 from tkinter import ttk
 from tkcalendar import DateEntry
 from tkinter import messagebox
-import psycopg2
 from datetime import datetime
 import pandas as pd
 import os
 import json
 import sys
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
+from soldes_journaliers import solde_banque
 
 
 # Ensure the parent directory is in the Python path for absolute imports
@@ -61,7 +62,8 @@ class PageBanque(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter_page(
+                self,
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -270,21 +272,12 @@ class PageBanque(ctk.CTkFrame):
 
     def update_solde_global(self, bank_id):
         try:
-            self.cursor.execute("""
-                SELECT SUM(CASE WHEN idtypeoperation = 1 THEN mtpaye ELSE -mtpaye END) 
-                FROM (
-                    SELECT idtypeoperation, mtpaye FROM tb_encaissementbq WHERE id_banque = %s
-                    UNION ALL SELECT idtypeoperation, mtpaye FROM tb_decaissementbq WHERE id_banque = %s
-                    UNION ALL SELECT idtypeoperation, mtpaye FROM tb_pmtfacture WHERE id_banque = %s
-                    UNION ALL SELECT idtypeoperation, mtpaye FROM tb_pmtcom WHERE id_banque = %s
-                    UNION ALL SELECT idtypeoperation, mtpaye FROM tb_transfertbanque WHERE id_banque = %s
-                ) as total
-            """, (bank_id, bank_id, bank_id, bank_id, bank_id))
-            res = self.cursor.fetchone()
-            solde = res[0] if res and res[0] else 0
+            # ✅ Dernière clôture journalière + mouvements du jour (soldes_journaliers)
+            solde = solde_banque(bank_id, self.cursor)
             self.label_solde.configure(text=f"Solde : {self.format_montant(solde)} Ar")
         except Exception as e:
             print(f"Erreur calcul solde: {e}")
+            self.conn.rollback()
 
     def exporter_excel(self):
         if not self.donnees_export:
@@ -8,6 +8,9 @@ from datetime import datetime
 import json
 import os
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
+from journal_caisse import JournalCaisse
+from soldes_journaliers import solde_caisse
 
 
 # Imports ReportLab pour le PDF
@@ -58,6 +61,9 @@ class PageCaisse(ctk.CTkFrame):
         # Mapping inverse pour retrouver l'ID rapidement
         self.mode_bd_to_id = {}
 
+        # ✅ Journal de caisse : un parcours de plage, cadres et grille calculés en mémoire
+        self.journal = JournalCaisse()
+
         # Connexion à la base de données
         self.conn = self.connect_db()
         if self.conn:
@@ -183,6 +189,11 @@ class PageCaisse(ctk.CTkFrame):
         self.charger_modes_paiement()
         self.appliquer_filtres()
 
+    def on_show(self):
+        """Retour sur la page (cache de pages d'App) : opérations relues avec les filtres courants."""
+        self.journal.invalider()
+        self.appliquer_filtres()
+
     def creer_cadre_doc(self, parent, nom, couleur):
         """Crée un cadre cliquable pour un type de document"""
         frame = ctk.CTkFrame(parent, fg_color=couleur, corner_radius=8, width=155, height=50)
@@ -264,7 +275,8 @@ class PageCaisse(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter_page(
+                self,
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -347,118 +359,26 @@ class PageCaisse(ctk.CTkFrame):
             import traceback
             traceback.print_exc()
 
-    def calculer_montants_categories(self, date_d, date_f):
+    def lire_journal(self, date_d, date_f):
+        """Opérations de la période (journal_caisse : jours déjà lus gardés en mémoire)."""
+        try:
+            return self.journal.lire(self.cursor, date_d, date_f)
+        except psycopg2.Error as e:
+            print(f"❌ Erreur lecture journal de caisse: {e}")
+            self.conn.rollback()
+            self.journal.invalider()
+            return []
+
+    def calculer_montants_categories(self, date_d, date_f, lignes=None):
         """Calcule les soldes (Encaissement - Décaissement) pour chaque catégorie et mode de paiement"""
-        d_str, f_str = date_d.strftime('%Y-%m-%d'), date_f.strftime('%Y-%m-%d')
-        
-        # Réinitialiser les montants
-        self.montants_docs = {"Client": 0, "Avoir": 0, "Fournisseur": 0, "Personnel": 0, "Dépenses": 0, "Encaissement": 0}
-        self.montants_modes = {}
+        if lignes is None:
+            lignes = self.lire_journal(date_d, date_f)
         
         try:
-            # Calculer par type de document (Encaissement - Décaissement)
-            
-            # Clients (Encaissements) - inclut tb_pmtfacture + tb_pmtcredit
-            query_clients = """
-                SELECT SUM(CASE WHEN idtypeoperation = 1 THEN mtpaye ELSE -mtpaye END)
-                FROM (
-                    SELECT idtypeoperation, mtpaye FROM tb_pmtfacture 
-                    WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-                    UNION ALL
-                    SELECT idtypeoperation, mtpaye FROM tb_pmtcredit 
-                    WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-                ) as clients
-            """
-            self.cursor.execute(query_clients, [d_str, f_str, d_str, f_str])
-            result = self.cursor.fetchone()
-            self.montants_docs["Client"] = float(result[0]) if result and result[0] else 0
-            
-            # Avoir
-            query_avoir = """
-                SELECT SUM(CASE WHEN idtypeoperation = 1 THEN mtpaye ELSE -mtpaye END)
-                FROM tb_pmtavoir 
-                WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-            """
-            self.cursor.execute(query_avoir, [d_str, f_str])
-            result = self.cursor.fetchone()
-            self.montants_docs["Avoir"] = float(result[0]) if result and result[0] else 0
-            
-            # Fournisseurs (Décaissements)
-            query_fournisseurs = """
-                SELECT SUM(CASE WHEN idtypeoperation = 1 THEN mtpaye ELSE -mtpaye END)
-                FROM tb_pmtcom 
-                WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-            """
-            self.cursor.execute(query_fournisseurs, [d_str, f_str])
-            result = self.cursor.fetchone()
-            self.montants_docs["Fournisseur"] = float(result[0]) if result and result[0] else 0
-            
-            # Personnel (avances + salaires)
-            query_pers = """
-                SELECT SUM(CASE WHEN idtypeoperation = 1 THEN mtpaye ELSE -mtpaye END)
-                FROM (
-                    SELECT idtypeoperation, mtpaye FROM tb_avancepers WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-                    UNION ALL
-                    SELECT idtypeoperation, mtpaye FROM tb_avancespecpers WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-                    UNION ALL
-                    SELECT idtypeoperation, mtpaye FROM tb_pmtsalaire WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-                ) as pers
-            """
-            self.cursor.execute(query_pers, [d_str, f_str, d_str, f_str, d_str, f_str])
-            result = self.cursor.fetchone()
-            self.montants_docs["Personnel"] = float(result[0]) if result and result[0] else 0
-            
-            # Dépenses (seulement tb_decaissement - référence DEC...)
-            query_depenses = """
-                SELECT SUM(CASE WHEN idtypeoperation = 1 THEN mtpaye ELSE -mtpaye END)
-                FROM tb_decaissement 
-                WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-            """
-            self.cursor.execute(query_depenses, [d_str, f_str])
-            result = self.cursor.fetchone()
-            self.montants_docs["Dépenses"] = float(result[0]) if result and result[0] else 0
-            
-            # Encaissements (seulement tb_encaissement - référence ENC...)
-            query_encaissements = """
-                SELECT SUM(CASE WHEN idtypeoperation = 1 THEN mtpaye ELSE -mtpaye END)
-                FROM tb_encaissement 
-                WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-            """
-            self.cursor.execute(query_encaissements, [d_str, f_str])
-            result = self.cursor.fetchone()
-            self.montants_docs["Encaissement"] = float(result[0]) if result and result[0] else 0
-            
-            # Calculer par mode de paiement (Encaissement - Décaissement)
-            query_modes = """
-                SELECT COALESCE(t2.modedepaiement, 'Inconnu'), 
-                       SUM(CASE WHEN t1.idtypeoperation = 1 THEN t1.mtpaye ELSE -t1.mtpaye END)
-                FROM (
-                    SELECT idmode, mtpaye, idtypeoperation FROM tb_pmtfacture WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-                    UNION ALL
-                    SELECT idmode, mtpaye, idtypeoperation FROM tb_pmtcom WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-                    UNION ALL
-                    SELECT idmode, mtpaye, idtypeoperation FROM tb_encaissement WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-                    UNION ALL
-                    SELECT idmode, mtpaye, idtypeoperation FROM tb_decaissement WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-                    UNION ALL
-                    SELECT idmode, mtpaye, idtypeoperation FROM tb_avancepers WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-                    UNION ALL
-                    SELECT idmode, mtpaye, idtypeoperation FROM tb_avancespecpers WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-                    UNION ALL
-                    SELECT idmode, mtpaye, idtypeoperation FROM tb_pmtsalaire WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-                    UNION ALL
-                    SELECT idmode, mtpaye, idtypeoperation FROM tb_pmtavoir WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-                    UNION ALL
-                    SELECT idmode, mtpaye, idtypeoperation FROM tb_pmtcredit WHERE datepmt::date BETWEEN %s AND %s AND id_banque IS NULL
-                ) t1
-                LEFT JOIN tb_modepaiement t2 ON t1.idmode = t2.idmode
-                GROUP BY t2.modedepaiement
-            """
-            params = [d_str, f_str] * 9
-            self.cursor.execute(query_modes, params)
-            for row in self.cursor.fetchall():
-                mode, solde = row
-                self.montants_modes[mode] = float(solde) if solde else 0
+            # Par type de document : Clients = tb_pmtfacture + tb_pmtcredit, Personnel = avances + salaires...
+            self.montants_docs = self.journal.totaux_categories(lignes)
+            # Par mode de paiement (nom du mode en base)
+            self.montants_modes = self.journal.totaux_modes(lignes)
             
             # Mettre à jour l'affichage des cadres
             self.mettre_a_jour_cadres()
@@ -511,240 +431,42 @@ class PageCaisse(ctk.CTkFrame):
         date_d = self.entry_debut.get_date()
         date_f = self.entry_fin.get_date()
         
+        # ✅ Une seule lecture de la période pour les cadres et la grille
+        lignes = self.lire_journal(date_d, date_f)
+        
         # Calculer les montants des catégories
-        self.calculer_montants_categories(date_d, date_f)
+        self.calculer_montants_categories(date_d, date_f, lignes)
         
         # Charger les données filtrées
-        self.charger_donnees(date_d, date_f, mode_id, type_doc)
+        self.charger_donnees(date_d, date_f, mode_id, type_doc, lignes)
 
-    def charger_donnees(self, date_d, date_f, mode_id=None, type_doc="Tous"):
+    def charger_donnees(self, date_d, date_f, mode_id=None, type_doc="Tous", lignes=None):
         if not self.conn: return
-        d_str, f_str = date_d.strftime('%Y-%m-%d'), date_f.strftime('%Y-%m-%d')
+        if lignes is None:
+            lignes = self.lire_journal(date_d, date_f)
 
         for item in self.tree.get_children(): self.tree.delete(item)
-        all_ops = []
-
-        # Construire la clause WHERE pour le mode
-        sql_mode = ""
-        mode_params = []
-        if mode_id is not None:
-            sql_mode = " AND t1.idmode = %s"
-            mode_params = [mode_id]
 
         try:
             # ==================================================================
-            # LOGIQUE CORRECTE :
+            # LOGIQUE CORRECTE (catégories de journal_caisse.SOURCES) :
             # - CLIENTS = tb_pmtfacture + tb_pmtcredit (tous modes de paiement)
             # - AVOIR = tb_pmtavoir
             # - FOURNISSEURS = tb_pmtcom
             # - PERSONNEL = tb_avancepers + tb_avancespecpers + tb_pmtsalaire
             # - DÉPENSES = tb_decaissement
             # - ENCAISSEMENTS = tb_encaissement
+            # - Transferts : seulement si "Tous" et mode Espèces ou pas de filtre mode
             # ==================================================================
-            
-            # 1. tb_pmtfacture (CLIENTS - tous les paiements de factures clients)
-            if type_doc in ["Tous", "Client"]:
-                query_pmtfacture = f"""
-                    SELECT t1.datepmt, t1.refpmt, t1.observation, t1.mtpaye, t1.idtypeoperation, 
-                        COALESCE(t2.modedepaiement, 'Inconnu'), COALESCE(t3.username, 'Système')
-                    FROM tb_pmtfacture t1
-                    LEFT JOIN tb_modepaiement t2 ON t1.idmode = t2.idmode
-                    LEFT JOIN tb_users t3 ON t1.iduser = t3.iduser
-                    WHERE t1.datepmt::date BETWEEN %s AND %s AND t1.id_banque IS NULL {sql_mode}
-                """
-                params = [d_str, f_str] + mode_params
-                try:
-                    self.cursor.execute(query_pmtfacture, params)
-                    all_ops.extend(self.cursor.fetchall())
-                    print(f"✅ tb_pmtfacture: {self.cursor.rowcount} lignes")
-                except psycopg2.Error as e:
-                    print(f"❌ Erreur sur tb_pmtfacture: {e}")
-                    self.conn.rollback()
-
-            # 2. tb_pmtcredit (CLIENTS - paiements de crédits clients)
-            if type_doc in ["Tous", "Client"]:
-                query_pmtcredit = f"""
-                    SELECT t1.datepmt, t1.refpmt, t1.observation, t1.mtpaye, t1.idtypeoperation, 
-                        COALESCE(t2.modedepaiement, 'Inconnu'), COALESCE(t3.username, 'Système')
-                    FROM tb_pmtcredit t1
-                    LEFT JOIN tb_modepaiement t2 ON t1.idmode = t2.idmode
-                    LEFT JOIN tb_users t3 ON t1.iduser = t3.iduser
-                    WHERE t1.datepmt::date BETWEEN %s AND %s AND t1.id_banque IS NULL {sql_mode}
-                """
-                params = [d_str, f_str] + mode_params
-                try:
-                    self.cursor.execute(query_pmtcredit, params)
-                    all_ops.extend(self.cursor.fetchall())
-                    print(f"✅ tb_pmtcredit: {self.cursor.rowcount} lignes")
-                except psycopg2.Error as e:
-                    print(f"❌ Erreur sur tb_pmtcredit: {e}")
-                    self.conn.rollback()
-
-            # 3. tb_pmtavoir (AVOIR)
-            if type_doc in ["Tous", "Avoir"]:
-                query_avoir = f"""
-                    SELECT t1.datepmt, t1.refavoir, t1.observation, t1.mtpaye, t1.idtypeoperation, 
-                        COALESCE(t2.modedepaiement, 'Inconnu'), COALESCE(t3.username, 'Système')
-                    FROM tb_pmtavoir t1
-                    LEFT JOIN tb_modepaiement t2 ON t1.idmode = t2.idmode
-                    LEFT JOIN tb_users t3 ON t1.iduser = t3.iduser
-                    WHERE t1.datepmt::date BETWEEN %s AND %s AND t1.id_banque IS NULL {sql_mode}
-                """
-                params = [d_str, f_str] + mode_params
-                try:
-                    self.cursor.execute(query_avoir, params)
-                    all_ops.extend(self.cursor.fetchall())
-                    print(f"✅ tb_pmtavoir: {self.cursor.rowcount} lignes")
-                except psycopg2.Error as e:
-                    print(f"❌ Erreur sur tb_pmtavoir: {e}")
-                    self.conn.rollback()
-
-            # 4. tb_pmtcom (FOURNISSEURS)
-            if type_doc in ["Tous", "Fournisseur"]:
-                query_pmtcom = f"""
-                    SELECT t1.datepmt, t1.refpmt, t1.observation, t1.mtpaye, t1.idtypeoperation, 
-                        COALESCE(t2.modedepaiement, 'Inconnu'), COALESCE(t3.username, 'Système')
-                    FROM tb_pmtcom t1
-                    LEFT JOIN tb_modepaiement t2 ON t1.idmode = t2.idmode
-                    LEFT JOIN tb_users t3 ON t1.iduser = t3.iduser
-                    WHERE t1.datepmt::date BETWEEN %s AND %s AND t1.id_banque IS NULL {sql_mode}
-                """
-                params = [d_str, f_str] + mode_params
-                try:
-                    self.cursor.execute(query_pmtcom, params)
-                    all_ops.extend(self.cursor.fetchall())
-                    print(f"✅ tb_pmtcom: {self.cursor.rowcount} lignes")
-                except psycopg2.Error as e:
-                    print(f"❌ Erreur sur tb_pmtcom: {e}")
-                    self.conn.rollback()
-
-            # 5. tb_encaissement (ENCAISSEMENTS)
-            if type_doc in ["Tous", "Encaissement"]:
-                query_enc = f"""
-                    SELECT t1.datepmt, t1.refpmt, t1.observation, t1.mtpaye, t1.idtypeoperation, 
-                        COALESCE(t2.modedepaiement, 'Inconnu'), COALESCE(t3.username, 'Système')
-                    FROM tb_encaissement t1
-                    LEFT JOIN tb_modepaiement t2 ON t1.idmode = t2.idmode
-                    LEFT JOIN tb_users t3 ON t1.iduser = t3.iduser
-                    WHERE t1.datepmt::date BETWEEN %s AND %s AND t1.id_banque IS NULL {sql_mode}
-                """
-                params = [d_str, f_str] + mode_params
-                try:
-                    self.cursor.execute(query_enc, params)
-                    all_ops.extend(self.cursor.fetchall())
-                    print(f"✅ tb_encaissement: {self.cursor.rowcount} lignes")
-                except psycopg2.Error as e:
-                    print(f"❌ Erreur sur tb_encaissement: {e}")
-                    self.conn.rollback()
-
-            # 6. tb_decaissement (DÉPENSES)
-            if type_doc in ["Tous", "Dépenses"]:
-                query_dec = f"""
-                    SELECT t1.datepmt, t1.refpmt, t1.observation, t1.mtpaye, t1.idtypeoperation, 
-                        COALESCE(t2.modedepaiement, 'Inconnu'), COALESCE(t3.username, 'Système')
-                    FROM tb_decaissement t1
-                    LEFT JOIN tb_modepaiement t2 ON t1.idmode = t2.idmode
-                    LEFT JOIN tb_users t3 ON t1.iduser = t3.iduser
-                    WHERE t1.datepmt::date BETWEEN %s AND %s AND t1.id_banque IS NULL {sql_mode}
-                """
-                params = [d_str, f_str] + mode_params
-                try:
-                    self.cursor.execute(query_dec, params)
-                    all_ops.extend(self.cursor.fetchall())
-                    print(f"✅ tb_decaissement: {self.cursor.rowcount} lignes")
-                except psycopg2.Error as e:
-                    print(f"❌ Erreur sur tb_decaissement: {e}")
-                    self.conn.rollback()
-
-            # 7. Tables PERSONNEL (avances et salaires)
-            if type_doc in ["Tous", "Personnel"]:
-                # tb_avancepers
-                query_avpers = f"""
-                    SELECT t1.datepmt, t1.refpmt, t1.observation, t1.mtpaye, t1.idtypeoperation, 
-                        COALESCE(t2.modedepaiement, 'Inconnu'), COALESCE(t3.username, 'Système')
-                    FROM tb_avancepers t1
-                    LEFT JOIN tb_modepaiement t2 ON t1.idmode = t2.idmode
-                    LEFT JOIN tb_users t3 ON t1.iduser = t3.iduser
-                    WHERE t1.datepmt::date BETWEEN %s AND %s AND t1.id_banque IS NULL {sql_mode}
-                """
-                params = [d_str, f_str] + mode_params
-                try:
-                    self.cursor.execute(query_avpers, params)
-                    all_ops.extend(self.cursor.fetchall())
-                    print(f"✅ tb_avancepers: {self.cursor.rowcount} lignes")
-                except psycopg2.Error as e:
-                    print(f"❌ Erreur sur tb_avancepers: {e}")
-                    self.conn.rollback()
-
-                # tb_avancespecpers
-                query_avspec = f"""
-                    SELECT t1.datepmt, t1.refpmt, t1.observation, t1.mtpaye, t1.idtypeoperation, 
-                        COALESCE(t2.modedepaiement, 'Inconnu'), COALESCE(t3.username, 'Système')
-                    FROM tb_avancespecpers t1
-                    LEFT JOIN tb_modepaiement t2 ON t1.idmode = t2.idmode
-                    LEFT JOIN tb_users t3 ON t1.iduser = t3.iduser
-                    WHERE t1.datepmt::date BETWEEN %s AND %s AND t1.id_banque IS NULL {sql_mode}
-                """
-                params = [d_str, f_str] + mode_params
-                try:
-                    self.cursor.execute(query_avspec, params)
-                    all_ops.extend(self.cursor.fetchall())
-                    print(f"✅ tb_avancespecpers: {self.cursor.rowcount} lignes")
-                except psycopg2.Error as e:
-                    print(f"❌ Erreur sur tb_avancespecpers: {e}")
-                    self.conn.rollback()
-
-                # tb_pmtsalaire
-                query_sal = f"""
-                    SELECT t1.datepmt, t1.refpmt, t1.observation, t1.mtpaye, t1.idtypeoperation, 
-                        COALESCE(t2.modedepaiement, 'Inconnu'), COALESCE(t3.username, 'Système')
-                    FROM tb_pmtsalaire t1
-                    LEFT JOIN tb_modepaiement t2 ON t1.idmode = t2.idmode
-                    LEFT JOIN tb_users t3 ON t1.iduser = t3.iduser
-                    WHERE t1.datepmt::date BETWEEN %s AND %s AND t1.id_banque IS NULL {sql_mode}
-                """
-                params = [d_str, f_str] + mode_params
-                try:
-                    self.cursor.execute(query_sal, params)
-                    all_ops.extend(self.cursor.fetchall())
-                    print(f"✅ tb_pmtsalaire: {self.cursor.rowcount} lignes")
-                except psycopg2.Error as e:
-                    print(f"❌ Erreur sur tb_pmtsalaire: {e}")
-                    self.conn.rollback()
-
-            # 8. Transferts (seulement si "Tous" et mode Espèces ou pas de filtre mode)
-            if (not mode_id or mode_id == 1) and type_doc == "Tous": 
-                query_transfert = """
-                    SELECT t1.datepmt, t1.refpmt, t1.observation, t1.mtpaye, t1.idtypeoperation, 
-                        COALESCE(t2.modedepaiement, 'Espèces'), COALESCE(t3.username, 'admin')
-                    FROM tb_transfertcaisse t1
-                    LEFT JOIN tb_modepaiement t2 ON t1.idmode = t2.idmode
-                    LEFT JOIN tb_users t3 ON t1.iduser = t3.iduser
-                    WHERE t1.datepmt::date BETWEEN %s AND %s
-                """
-                try:
-                    self.cursor.execute(query_transfert, [d_str, f_str])
-                    all_ops.extend(self.cursor.fetchall())
-                    print(f"✅ tb_transfertcaisse: {self.cursor.rowcount} lignes")
-                except psycopg2.Error as e:
-                    print(f"❌ Erreur sur tb_transfertcaisse: {e}")
-                    self.conn.rollback()
-
-            # Convertir toutes les dates en datetime pour le tri
-            def get_datetime(op):
-                dt = op[0]
-                if isinstance(dt, datetime):
-                    return dt
-                else:  # C'est un objet date
-                    return datetime.combine(dt, datetime.min.time())
-            
-            all_ops.sort(key=get_datetime, reverse=True)
+            all_ops = self.journal.filtrer(lignes, mode_id, type_doc)
+            print(f"✅ Journal de caisse: {len(all_ops)} / {len(lignes)} lignes")
+
             self.donnees_pour_pdf = []
             self.total_enc_periode = 0
             self.total_dec_periode = 0
 
             for i, r in enumerate(all_ops):
-                dt, ref, obs, mt, typ, mod, usr = r
+                dt, ref, obs, mt, typ, _, _, mod, usr = r
                 enc = float(mt) if typ == 1 else 0
                 dec = float(mt) if typ == 2 else 0
                 self.total_enc_periode += enc
@@ -780,31 +502,15 @@ class PageCaisse(ctk.CTkFrame):
 
     def update_solde_global(self):
         try:
-            query = """
-                SELECT SUM(CASE WHEN idtypeoperation = 1 THEN mtpaye ELSE -mtpaye END) 
-                FROM (
-                    SELECT idtypeoperation, mtpaye FROM tb_pmtfacture WHERE id_banque IS NULL
-                    UNION ALL SELECT idtypeoperation, mtpaye FROM tb_pmtcom WHERE id_banque IS NULL
-                    UNION ALL SELECT idtypeoperation, mtpaye FROM tb_encaissement WHERE id_banque IS NULL
-                    UNION ALL SELECT idtypeoperation, mtpaye FROM tb_decaissement WHERE id_banque IS NULL
-                    UNION ALL SELECT idtypeoperation, mtpaye FROM tb_avancepers WHERE id_banque IS NULL
-                    UNION ALL SELECT idtypeoperation, mtpaye FROM tb_avancespecpers WHERE id_banque IS NULL
-                    UNION ALL SELECT idtypeoperation, mtpaye FROM tb_pmtsalaire WHERE id_banque IS NULL
-                    UNION ALL SELECT idtypeoperation, mtpaye FROM tb_transfertcaisse
-                    UNION ALL SELECT idtypeoperation, mtpaye FROM tb_pmtavoir WHERE id_banque IS NULL
-                    UNION ALL SELECT idtypeoperation, mtpaye FROM tb_pmtcredit WHERE id_banque IS NULL
-                ) as total
-            """
-            self.cursor.execute(query)
-            res = self.cursor.fetchone()
-            
-            solde = float(res[0]) if res and res[0] is not None else 0.0
+            # ✅ Dernière clôture journalière + mouvements du jour (soldes_journaliers)
+            solde = solde_caisse(self.cursor)
             
             self.label_solde_global.configure(
                 text=f"Solde de caisse : {self.format_montant(solde)} Ar"
             )
         except Exception as e:
             print(f"Erreur calcul solde global: {e}")
+            self.conn.rollback()
             self.label_solde_global.configure(text="Solde de caisse : Erreur Ar")
 
     def generer_pdf(self):
@@ -892,6 +598,7 @@ class PageCaisse(ctk.CTkFrame):
     
         win = PageDecaissement(self.master, username="VotreUsername")
         self.master.wait_window(win)
+        self.journal.invalider()
         self.appliquer_filtres()
 
     def open_page_encaissement(self):
@@ -902,6 +609,7 @@ class PageCaisse(ctk.CTkFrame):
     
         win = PageEncaissement(self.master, username="VotreUsername")
         self.master.wait_window(win)
+        self.journal.invalider()
         self.appliquer_filtres()
 
 if __name__ == "__main__":
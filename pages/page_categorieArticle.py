@@ -6,6 +6,7 @@ import json
 import os
 import sys
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
 
 
 class PageCategorieArticle(ctk.CTkFrame):
@@ -37,7 +38,8 @@ class PageCategorieArticle(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter_page(
+                self,
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -5,6 +5,7 @@ import psycopg2
 import json
 import os
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
 
 
 # Héritage de ctk.CTk pour en faire la fenêtre principale unique
@@ -46,7 +47,8 @@ class PageCategorieCompte(ctk.CTkToplevel):  # Changer CTk en CTkToplevel
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter_page(
+                self,
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
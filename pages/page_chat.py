@@ -1,9 +1,10 @@
 import customtkinter as ctk
 from tkinter import messagebox
-import psycopg2
 import json
 from datetime import datetime
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+import chat_direct
 
 
 class PageChat(ctk.CTkFrame):
@@ -25,6 +26,9 @@ class PageChat(ctk.CTkFrame):
         
         self.destinataire_actuel = None 
         self.boutons_contact = {} 
+        # Conversation affichée : dates du message le plus ancien / le plus récent (clés de page)
+        self.plus_ancien = None
+        self.plus_recent = None
 
         # Layout
         self.grid_columnconfigure(1, weight=1)
@@ -47,6 +51,10 @@ class PageChat(ctk.CTkFrame):
         self.header_chat = ctk.CTkLabel(self.chat_container, text="Sélectionnez un collègue", font=ctk.CTkFont(family="Segoe UI", size=14))
         self.header_chat.grid(row=0, column=0, pady=10)
 
+        self.btn_anciens = ctk.CTkButton(self.chat_container, text="⬆ Messages précédents", width=160,
+                                         fg_color="transparent", text_color=("#1f6aa5", "#8ab4f8"),
+                                         command=self.charger_plus_anciens)
+
         self.text_display = ctk.CTkTextbox(self.chat_container, state="disabled", wrap="word")
         self.text_display.grid(row=1, column=0, sticky="nsew", padx=5, pady=5)
 
@@ -62,14 +70,29 @@ class PageChat(ctk.CTkFrame):
         self.btn_send.grid(row=0, column=1)
 
         self.charger_employes()
-        self.auto_refresh()
+        # ✅ Messages poussés par LISTEN/NOTIFY (chat_direct) ; vérification des non lus une fois
+        chat_direct.abonner(self, self.id_user_connecte, self.sur_message)
+        self.verifier_nouveaux_messages()
+        self.id_auto_refresh = self.after(5000, self.auto_refresh)
+
+    def on_hide(self):
+        """Page masquée (cache de pages) : plus de vérification périodique."""
+        if self.id_auto_refresh is not None:
+            self.after_cancel(self.id_auto_refresh)
+            self.id_auto_refresh = None
+
+    def on_show(self):
+        """Retour sur la page : non lus vérifiés puis vérification périodique relancée."""
+        self.on_hide()
+        self.verifier_nouveaux_messages()
+        self.id_auto_refresh = self.after(5000, self.auto_refresh)
 
     def connect_db(self):
         try:
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
                 db_config = config['database']
-            return psycopg2.connect(**db_config)
+            return connecter(**db_config)
         except Exception as err:
             messagebox.showerror("Erreur de connexion", f"Impossible de se connecter à la base de données: {err}")
             return None
@@ -123,33 +146,96 @@ class PageChat(ctk.CTkFrame):
         self.charger_messages()
 
     def charger_messages(self):
+        """Dernière page de la conversation (TAILLE_PAGE messages)."""
         if not self.destinataire_actuel: 
             return
         conn = self.connect_db()
         if conn:
             try:
                 cur = conn.cursor()
-                query = """SELECT id_expediteur, message, date_envoi FROM tb_chat 
-                           WHERE (id_expediteur = %s AND id_destinataire = %s)
-                           OR (id_expediteur = %s AND id_destinataire = %s)
-                           ORDER BY date_envoi ASC"""
-                cur.execute(query, (self.id_user_connecte, self.destinataire_actuel, self.destinataire_actuel, self.id_user_connecte))
-                messages = cur.fetchall()
+                messages = chat_direct.page_conversation(cur, self.id_user_connecte, self.destinataire_actuel)
+                cur.close()
                 
                 self.text_display.configure(state="normal")
                 self.text_display.delete("1.0", "end")
-                for msg in messages:
-                    prefix = "Moi : " if msg[0] == self.id_user_connecte else f"{self.boutons_contact[msg[0]]['name']} : "
-                    date_str = msg[2].strftime('%H:%M') if msg[2] else ""
-                    self.text_display.insert("end", f"[{date_str}] {prefix}{msg[1]}\n\n")
+                self.text_display.insert("end", self.formater_messages(messages))
                 self.text_display.see("end")
                 self.text_display.configure(state="disabled")
-                cur.close()
+
+                self.plus_ancien = messages[0][2] if messages else None
+                self.plus_recent = messages[-1][2] if messages else None
+                self.afficher_bouton_anciens(len(messages) == chat_direct.TAILLE_PAGE)
             except Exception as e:
                 messagebox.showerror("Erreur", f"Erreur lors du chargement des messages: {e}")
             finally: 
                 conn.close()
 
+    def charger_plus_anciens(self):
+        """Page précédente de l'historique, insérée en haut sans relire le reste."""
+        if not self.destinataire_actuel or self.plus_ancien is None:
+            return
+        conn = self.connect_db()
+        if conn:
+            try:
+                cur = conn.cursor()
+                messages = chat_direct.page_conversation(
+                    cur, self.id_user_connecte, self.destinataire_actuel, avant=self.plus_ancien
+                )
+                cur.close()
+                if messages:
+                    self.text_display.configure(state="normal")
+                    self.text_display.insert("1.0", self.formater_messages(messages))
+                    self.text_display.see("1.0")
+                    self.text_display.configure(state="disabled")
+                    self.plus_ancien = messages[0][2]
+                self.afficher_bouton_anciens(len(messages) == chat_direct.TAILLE_PAGE)
+            except Exception as e:
+                messagebox.showerror("Erreur", f"Erreur lors du chargement des messages: {e}")
+            finally:
+                conn.close()
+
+    def ajouter_nouveaux_messages(self):
+        """Ajoute en bas les messages postérieurs au dernier affiché."""
+        if not self.destinataire_actuel:
+            return
+        conn = self.connect_db()
+        if conn:
+            try:
+                cur = conn.cursor()
+                messages = chat_direct.nouveaux_messages(
+                    cur, self.id_user_connecte, self.destinataire_actuel, self.plus_recent
+                )
+                cur.close()
+                if messages:
+                    self.text_display.configure(state="normal")
+                    self.text_display.insert("end", self.formater_messages(messages))
+                    self.text_display.see("end")
+                    self.text_display.configure(state="disabled")
+                    self.plus_recent = messages[-1][2]
+                    if self.plus_ancien is None:
+                        self.plus_ancien = messages[0][2]
+            except Exception as e:
+                print(f"Erreur lors de l'ajout des nouveaux messages: {e}")
+            finally:
+                conn.close()
+
+    def formater_messages(self, messages):
+        lignes = []
+        for msg in messages:
+            if msg[0] == self.id_user_connecte:
+                prefix = "Moi : "
+            else:
+                prefix = f"{self.boutons_contact.get(msg[0], {}).get('name', '?')} : "
+            date_str = msg[2].strftime('%H:%M') if msg[2] else ""
+            lignes.append(f"[{date_str}] {prefix}{msg[1]}\n\n")
+        return "".join(lignes)
+
+    def afficher_bouton_anciens(self, visible):
+        if visible:
+            self.btn_anciens.grid(row=0, column=0, sticky="e", padx=5)
+        else:
+            self.btn_anciens.grid_remove()
+
     def envoyer_message(self):
         msg_text = self.entry_msg.get().strip()
         if not msg_text or not self.destinataire_actuel: 
@@ -163,40 +249,59 @@ class PageChat(ctk.CTkFrame):
                 conn.commit()
                 self.entry_msg.delete(0, "end")
                 cur.close()
-                self.charger_messages()
+                self.ajouter_nouveaux_messages()
             except Exception as e:
                 messagebox.showerror("Erreur", f"Erreur lors de l'envoi du message: {e}")
             finally: 
                 conn.close()
 
     def verifier_nouveaux_messages(self):
+        """Non lus de tous les contacts (ouverture de la page, reconnexion, mode sans NOTIFY)."""
         conn = self.connect_db()
         if conn:
             try:
                 cur = conn.cursor()
-                cur.execute("SELECT id_expediteur FROM tb_chat WHERE id_destinataire = %s AND lu = 0", (self.id_user_connecte,))
+                cur.execute("SELECT DISTINCT id_expediteur FROM tb_chat WHERE id_destinataire = %s AND lu = 0", (self.id_user_connecte,))
                 nouveaux = cur.fetchall()
-                
-                if nouveaux:
-                    self.bell()  # 🔊 BIP
-                    for row in nouveaux:
-                        id_exp = row[0]
-                        if id_exp in self.boutons_contact and id_exp != self.destinataire_actuel:
-                            nom = self.boutons_contact[id_exp]["name"]
-                            self.boutons_contact[id_exp]["btn"].configure(text=f"● {nom}", text_color="red")
-                        elif id_exp == self.destinataire_actuel:
-                            # Si on est déjà sur la discussion, on marque comme lu immédiatement
-                            self.marquer_comme_lu(id_exp)
-                            self.charger_messages()
                 cur.close()
             except Exception as e:
                 print(f"Erreur lors de la vérification des nouveaux messages: {e}")
+                return
             finally: 
                 conn.close()
 
+            if nouveaux:
+                self.bell()  # 🔊 BIP
+                for row in nouveaux:
+                    self.signaler_message(row[0])
+
+    def signaler_message(self, id_exp):
+        """Message reçu de id_exp : point rouge, ou ajout direct si la discussion est ouverte."""
+        if id_exp in self.boutons_contact and id_exp != self.destinataire_actuel:
+            nom = self.boutons_contact[id_exp]["name"]
+            self.boutons_contact[id_exp]["btn"].configure(text=f"● {nom}", text_color="red")
+        elif id_exp == self.destinataire_actuel:
+            # Si on est déjà sur la discussion, on marque comme lu immédiatement
+            self.marquer_comme_lu(id_exp)
+            self.ajouter_nouveaux_messages()
+
+    def sur_message(self, id_expediteur, id_destinataire):
+        """Notification chat_direct (thread Tk) ; (None, None) après une reconnexion."""
+        if id_expediteur is None:
+            self.verifier_nouveaux_messages()
+            self.ajouter_nouveaux_messages()
+        elif id_destinataire == self.id_user_connecte:
+            self.bell()  # 🔊 BIP
+            self.signaler_message(id_expediteur)
+        elif id_destinataire == self.destinataire_actuel:
+            # Message envoyé par ce même utilisateur depuis un autre poste
+            self.ajouter_nouveaux_messages()
+
     def auto_refresh(self):
-        self.verifier_nouveaux_messages()
-        self.after(5000, self.auto_refresh)
+        """Vérification périodique seulement si les messages ne sont pas poussés."""
+        if not chat_direct.actif():
+            self.verifier_nouveaux_messages()
+        self.id_auto_refresh = self.after(5000, self.auto_refresh)
 
 # --- BLOC DE TEST SÉCURISÉ ---
 if __name__ == "__main__":
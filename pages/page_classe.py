@@ -1,6 +1,7 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import psycopg2
+from db_pool import connecter_page
 import customtkinter as ctk
 from datetime import date
 from datetime import datetime
@@ -44,7 +45,8 @@ class DatabaseManager:
             return None
         
         try:
-            conn = psycopg2.connect(
+            conn = connecter_page(
+                None,
                 host=self.db_params['host'],
                 user=self.db_params['user'],
                 password=self.db_params['password'],
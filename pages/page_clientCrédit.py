@@ -7,6 +7,7 @@ import os
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
 
 
 # IMPORTER LA CLASSE DE PAIEMENT
@@ -45,7 +46,7 @@ class PageClientCrédit(ctk.CTkFrame):
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
                 db_config = config['database']
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
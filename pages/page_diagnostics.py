@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Panneau de diagnostic : où passe le temps pendant la session.
+
+✅ Opérations les plus lentes (pages, requêtes, méthodes chronométrées),
+   avec le texte SQL des requêtes lentes.
+✅ Latences par opération : nombre d'appels, moyenne, p50, p95, maximum,
+   temps total (histogrammes de mesures.py).
+✅ Profileur SQL activé (profileur_sql) : requêtes par page, suspects N+1,
+   export CSV / JSON.
+Données en mémoire seulement : rien n'est lu en base.
+"""
+
+import customtkinter as ctk
+from tkinter import ttk, filedialog, messagebox
+
+import mesures
+import profileur_sql
+
+
+CATEGORIES = ["Toutes", "page", "requete", "operation"]
+
+
+class PageDiagnostics(ctk.CTkFrame):
+    def __init__(self, master, db_conn=None, session_data=None):
+        super().__init__(master)
+        self.setup_ui()
+        self.actualiser()
+
+    def on_show(self):
+        """Retour sur la page : mesures relues (elles ont continué pendant la navigation)."""
+        self.actualiser()
+
+    def setup_ui(self):
+        barre = ctk.CTkFrame(self)
+        barre.pack(fill="x", padx=10, pady=(10, 5))
+
+        ctk.CTkLabel(barre, text="⏱️ Diagnostics de la session", font=("Arial", 16, "bold")).pack(side="left", padx=10)
+        ctk.CTkButton(barre, text="Réinitialiser", width=110, command=self.reinitialiser,
+                      fg_color="#e74c3c", hover_color="#c0392b").pack(side="right", padx=5)
+        ctk.CTkButton(barre, text="Actualiser", width=110, command=self.actualiser,
+                      fg_color="#3498db", hover_color="#2980b9").pack(side="right", padx=5)
+        self.filtre = ctk.CTkOptionMenu(barre, values=CATEGORIES, width=120,
+                                        command=lambda _: self.actualiser())
+        self.filtre.pack(side="right", padx=5)
+        ctk.CTkLabel(barre, text="Catégorie :").pack(side="right", padx=5)
+        if profileur_sql.ACTIF:
+            ctk.CTkButton(barre, text="Exporter JSON", width=110, command=lambda: self.exporter("json"),
+                          fg_color="#2ecc71", hover_color="#27ae60").pack(side="right", padx=5)
+            ctk.CTkButton(barre, text="Exporter CSV", width=110, command=lambda: self.exporter("csv"),
+                          fg_color="#2ecc71", hover_color="#27ae60").pack(side="right", padx=5)
+
+        # --- Opérations les plus lentes ---
+        ctk.CTkLabel(self, text="Opérations les plus lentes", font=("Arial", 13, "bold")).pack(anchor="w", padx=15)
+        self.tree_lentes = self._creer_tree(
+            [("duree", "Durée (ms)", 90, "e"), ("categorie", "Catégorie", 90, "w"),
+             ("nom", "Opération", 260, "w"), ("heure", "Heure", 80, "center"),
+             ("thread", "Thread", 110, "w"), ("detail", "Détail", 500, "w")])
+
+        # --- Latences par opération ---
+        ctk.CTkLabel(self, text="Latences par opération", font=("Arial", 13, "bold")).pack(anchor="w", padx=15)
+        self.tree_stats = self._creer_tree(
+            [("categorie", "Catégorie", 90, "w"), ("nom", "Opération", 260, "w"),
+             ("nombre", "Appels", 70, "e"), ("moyenne", "Moyenne (ms)", 100, "e"),
+             ("p50", "p50 (ms)", 80, "e"), ("p95", "p95 (ms)", 80, "e"),
+             ("maximum", "Max (ms)", 90, "e"), ("total", "Total (ms)", 100, "e")])
+
+        # --- Profileur SQL ---
+        if profileur_sql.ACTIF:
+            ctk.CTkLabel(self, text="Requêtes par page (profileur SQL)",
+                         font=("Arial", 13, "bold")).pack(anchor="w", padx=15)
+            self.tree_pages = self._creer_tree(
+                [("page", "Page", 200, "w"), ("requetes", "Requêtes", 80, "e"),
+                 ("duree", "Total (ms)", 100, "e"), ("empreintes", "Requêtes distinctes", 130, "e"),
+                 ("actions", "Actions", 70, "e"), ("n_plus_1", "N+1", 60, "e"),
+                 ("frequente", "Plus fréquente", 500, "w")])
+            ctk.CTkLabel(self, text="Suspects N+1 (même requête répétée dans une action)",
+                         font=("Arial", 13, "bold")).pack(anchor="w", padx=15)
+            self.tree_n_plus_1 = self._creer_tree(
+                [("nombre", "Exécutions", 90, "e"), ("duree", "Durée (ms)", 90, "e"),
+                 ("action", "Action", 250, "w"), ("appelant", "Appelant", 280, "w"),
+                 ("sql", "Requête", 500, "w")])
+
+        self.label_resume = ctk.CTkLabel(self, text="")
+        self.label_resume.pack(anchor="w", padx=15, pady=(0, 10))
+
+    def _creer_tree(self, colonnes):
+        cadre = ctk.CTkFrame(self)
+        cadre.pack(fill="both", expand=True, padx=10, pady=5)
+        tree = ttk.Treeview(cadre, columns=[c[0] for c in colonnes], show="headings", height=10)
+        for cle, titre, largeur, ancre in colonnes:
+            tree.heading(cle, text=titre)
+            tree.column(cle, width=largeur, anchor=ancre, stretch=(cle in ("nom", "detail")))
+        defilement = ttk.Scrollbar(cadre, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=defilement.set)
+        tree.pack(side="left", fill="both", expand=True)
+        defilement.pack(side="right", fill="y")
+        return tree
+
+    @staticmethod
+    def _ms(secondes):
+        return f"{secondes * 1000:,.1f}".replace(",", " ")
+
+    def actualiser(self):
+        categorie = self.filtre.get()
+        garder = (lambda c: True) if categorie == "Toutes" else (lambda c: c == categorie)
+
+        self.tree_lentes.delete(*self.tree_lentes.get_children())
+        for entree in mesures.plus_lentes():
+            if garder(entree['categorie']):
+                self.tree_lentes.insert("", "end", values=(
+                    self._ms(entree['duree']), entree['categorie'], entree['nom'],
+                    entree['heure'].strftime("%H:%M:%S"), entree['thread'], entree['detail'] or ""))
+
+        statistiques = [s for s in mesures.statistiques() if garder(s['categorie'])]
+        self.tree_stats.delete(*self.tree_stats.get_children())
+        for s in statistiques:
+            self.tree_stats.insert("", "end", values=(
+                s['categorie'], s['nom'], s['nombre'], self._ms(s['moyenne']), self._ms(s['p50']),
+                self._ms(s['p95']), self._ms(s['maximum']), self._ms(s['total'])))
+
+        if profileur_sql.ACTIF:
+            self.tree_pages.delete(*self.tree_pages.get_children())
+            for p in profileur_sql.resume_par_page():
+                frequente = p['plus_frequentes'][0] if p['plus_frequentes'] else None
+                self.tree_pages.insert("", "end", values=(
+                    p['page'], p['requetes'], self._ms(p['duree_ms'] / 1000), p['empreintes'],
+                    p['actions'], p['n_plus_1'],
+                    f"{frequente['nombre']} × {frequente['sql']}" if frequente else ""))
+            self.tree_n_plus_1.delete(*self.tree_n_plus_1.get_children())
+            for s in profileur_sql.suspects_n_plus_1():
+                self.tree_n_plus_1.insert("", "end", values=(
+                    s['nombre'], self._ms(s['duree_ms'] / 1000), s['action'], s['appelant'], s['sql']))
+
+        self.label_resume.configure(
+            text=f"{len(statistiques)} opération(s), {sum(s['nombre'] for s in statistiques)} mesure(s) ; "
+                 f"requêtes lentes (≥ seuil) : {mesures.FICHIER_REQUETES_LENTES}")
+
+    def reinitialiser(self):
+        mesures.reinitialiser()
+        profileur_sql.reinitialiser()
+        self.actualiser()
+
+    def exporter(self, format_):
+        chemin = filedialog.asksaveasfilename(
+            defaultextension=f".{format_}", filetypes=[(format_.upper(), f"*.{format_}")],
+            initialfile=f"profil_sql.{format_}")
+        if not chemin:
+            return
+        try:
+            ecrire = profileur_sql.exporter_csv if format_ == "csv" else profileur_sql.exporter_json
+            nombre = ecrire(chemin)
+        except OSError as e:
+            messagebox.showerror("Erreur", f"Export impossible : {e}")
+            return
+        messagebox.showinfo("Export", f"{nombre} requête(s) exportée(s) vers\n{chemin}")
@@ -11,6 +11,7 @@ from reportlab.lib.units import mm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
 
 
 # Ensure the parent directory is in the Python path for absolute imports
@@ -52,7 +53,8 @@ class DatabaseManager:
             return None
 
         try:
-            conn = psycopg2.connect(
+            conn = connecter_page(
+                None,
                 host=self.db_params['host'],
                 user=self.db_params['user'],
                 password=self.db_params['password'],
@@ -8,6 +8,7 @@ from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 from tkcalendar import DateEntry
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
 
 
 # IMPORTER LA CLASSE DE PAIEMENT
@@ -329,7 +330,7 @@ class PageFactureListe(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
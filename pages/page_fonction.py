@@ -7,6 +7,7 @@ import json
 import os
 import sys
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
 
 
 # Ensure the parent directory is in the Python path for absolute imports
@@ -49,7 +50,8 @@ class DatabaseManager:
             return False
 
         try:
-            self.conn = psycopg2.connect(
+            self.conn = connecter_page(
+                None,
                 host=self.db_params['host'],
                 user=self.db_params['user'],
                 password=self.db_params['password'],
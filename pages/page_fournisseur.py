@@ -5,6 +5,7 @@ from datetime import datetime
 import json
 import os
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
 
 
 from .page_FrsDette import PageFrsDette
@@ -32,7 +33,8 @@ class PageFournisseur(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter_page(
+                self,
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
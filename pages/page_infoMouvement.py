@@ -2,18 +2,22 @@ import customtkinter as ctk
 from tkinter import messagebox, ttk
 import psycopg2
 import json
-import os
 import sys
 import subprocess
 from datetime import datetime
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+from stock_engine import stock_article, appliquer_mouvements, soldes_base_par_magasin
+from catalogue_cache import catalogue
+from recherche_async import ControleurRecherche
+import rendu_pdf
+import numerotation
 
 # Imports pour génération PDF
 from reportlab.lib.pagesizes import A5, landscape
 from reportlab.lib import colors
 from reportlab.lib.units import cm, mm
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageTemplate, Frame
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.pdfgen import canvas
 
@@ -70,7 +74,7 @@ class PageChangementArticle(ctk.CTkFrame):
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
                 db_config = config['database']
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -119,26 +123,8 @@ class PageChangementArticle(ctk.CTkFrame):
             return
         try:
             cursor = conn.cursor()
-            annee_courante = datetime.now().year
-            query = """
-                SELECT refchg FROM tb_changement 
-                WHERE refchg LIKE %s 
-                ORDER BY refchg DESC LIMIT 1
-            """
-            cursor.execute(query, (f"{annee_courante}-CHG-%",))
-            resultat = cursor.fetchone()
-            
-            if resultat:
-                dernier_num = int(resultat[0].split('-')[-1])
-                nouveau_num = dernier_num + 1
-            else:
-                nouveau_num = 1
-            
-            reference = f"{annee_courante}-CHG-{nouveau_num:05d}"
-            self.entry_ref.configure(state="normal")
-            self.entry_ref.delete(0, "end")
-            self.entry_ref.insert(0, reference)
-            self.entry_ref.configure(state="readonly")
+            # ✅ Aperçu : la référence définitive est attribuée à l'enregistrement
+            self.afficher_reference(numerotation.apercu(cursor, "CHG"))
             
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur lors de la génération: {str(e)}")
@@ -148,86 +134,27 @@ class PageChangementArticle(ctk.CTkFrame):
             if conn:
                 conn.close()
 
-    def generer_reference(self):
-        """Génère la référence automatique au format 2025-CHG-00001"""
-        conn = self.connect_db()
-        if not conn:
-            return
-        try:
-            cursor = conn.cursor()
-            annee_courante = datetime.now().year
-            query = """
-                SELECT refchg FROM tb_changement 
-                WHERE refchg LIKE %s 
-                ORDER BY refchg DESC LIMIT 1
-            """
-            cursor.execute(query, (f"{annee_courante}-CHG-%",))
-            resultat = cursor.fetchone()
-            
-            if resultat:
-                dernier_num = int(resultat[0].split('-')[-1])
-                nouveau_num = dernier_num + 1
-            else:
-                nouveau_num = 1
-            
-            reference = f"{annee_courante}-CHG-{nouveau_num:05d}"
-            self.entry_ref.configure(state="normal")
-            self.entry_ref.delete(0, "end")
-            self.entry_ref.insert(0, reference)
-            self.entry_ref.configure(state="readonly")
-            
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Erreur lors de la génération: {str(e)}")
-        finally:
-            if 'cursor' in locals() and cursor:
-                cursor.close()
-            if conn:
-                conn.close()
+    def afficher_reference(self, reference):
+        self.entry_ref.configure(state="normal")
+        self.entry_ref.delete(0, "end")
+        self.entry_ref.insert(0, reference)
+        self.entry_ref.configure(state="readonly")
 
     def _get_societe_info(self):
-        """Récupère les informations de la société depuis tb_infosociete."""
-        conn = self.connect_db()
-        if not conn:
-            return {
-                'nomsociete': 'IJEERY',
-                'adressesociete': 'Adresse Non Configurée',
-                'villesociete': '',
-                'contactsociete': 'Contact: Non Configuré',
-                'nifsociete': 'NIF: Non Configuré',
-                'statsociete': 'STAT: Non Configurée',
-                'cifsociete': 'CIF: Non Configuré'
-            }
-        
+        """Informations société (tb_infosociete lue une fois par processus, cf. rendu_pdf)."""
         try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT 
-                    nomsociete, villesociete, adressesociete, contactsociete,
-                    nifsociete, statsociete, cifsociete
-                FROM tb_infosociete LIMIT 1
-            """)
-            row = cursor.fetchone()
-            if row:
-                return {
-                    'nomsociete': row[0] or 'IJEERY',
-                    'villesociete': row[1] or '',
-                    'adressesociete': row[2] or 'Adresse Non Configurée',
-                    'contactsociete': row[3] or 'Contact: Non Configuré',
-                    'nifsociete': row[4] or 'NIF: Non Configuré',
-                    'statsociete': row[5] or 'STAT: Non Configurée',
-                    'cifsociete': row[6] or 'CIF: Non Configuré'
-                }
+            infos = rendu_pdf.societe()
         except Exception as e:
             print(f"Erreur lors de la récupération des infos société: {e}")
-        
+            infos = {}
         return {
-            'nomsociete': 'IJEERY',
-            'adressesociete': 'Adresse Non Configurée',
-            'villesociete': '',
-            'contactsociete': 'Contact: Non Configuré',
-            'nifsociete': 'NIF: Non Configuré',
-            'statsociete': 'STAT: Non Configurée',
-            'cifsociete': 'CIF: Non Configuré'
+            'nomsociete': infos.get('nomsociete') or 'IJEERY',
+            'villesociete': infos.get('villesociete') or '',
+            'adressesociete': infos.get('adressesociete') or 'Adresse Non Configurée',
+            'contactsociete': infos.get('contactsociete') or 'Contact: Non Configuré',
+            'nifsociete': infos.get('nifsociete') or 'NIF: Non Configuré',
+            'statsociete': infos.get('statsociete') or 'STAT: Non Configurée',
+            'cifsociete': infos.get('cifsociete') or 'CIF: Non Configuré'
         }
 
     def charger_magasins(self):
@@ -486,99 +413,17 @@ class PageChangementArticle(ctk.CTkFrame):
         """Ouvre la fenêtre de recherche d'article pour ENTRÉE"""
         self.open_recherche_article("entree")
 
-    def calculer_stock_article(self, idarticle, idunite, idmag):
+    def calculer_stock_article(self, idarticle, idunite_cible, idmag=None):
         """
-        Calcule le stock consolidé en prenant en compte tous les mouvements.
-        Formule: (Réceptions + Transferts IN + Inventaires + Avoirs - Ventes - Sorties - Transferts OUT)
+        ✅ CALCUL CONSOLIDÉ via le moteur partagé (stock_engine) :
+        réservoir commun en unité de base sur les 10 sources de mouvements,
+        divisé par le qtunite de l'unité cible. Une seule requête ensembliste.
         """
-        conn = self.connect_db()
-        if not conn: 
-            return 0
-    
         try:
-            cursor = conn.cursor()
-            
-            # D'abord récupérer le codearticle pour tb_inventaire
-            cursor.execute("""
-                SELECT codearticle FROM tb_unite WHERE idarticle = %s AND idunite = %s
-            """, (idarticle, idunite))
-            result = cursor.fetchone()
-            codearticle = result[0] if result else None
-            
-            if not codearticle:
-                return 0
-            
-            # Réceptions (tb_livraisonfrs)
-            cursor.execute("""
-                SELECT COALESCE(SUM(qtlivrefrs), 0) 
-                FROM tb_livraisonfrs 
-                WHERE idarticle = %s AND idunite = %s AND deleted = 0 AND idmag = %s
-            """, (idarticle, idunite, idmag))
-            receptions = cursor.fetchone()[0] or 0
-        
-            # Ventes (tb_ventedetail)
-            cursor.execute("""
-                SELECT COALESCE(SUM(qtvente), 0) 
-                FROM tb_ventedetail 
-                WHERE idarticle = %s AND idunite = %s AND deleted = 0 AND idmag = %s
-            """, (idarticle, idunite, idmag))
-            ventes = cursor.fetchone()[0] or 0
-        
-            # Sorties (tb_sortiedetail)
-            cursor.execute("""
-                SELECT COALESCE(SUM(qtsortie), 0) 
-                FROM tb_sortiedetail 
-                WHERE idarticle = %s AND idunite = %s AND idmag = %s
-            """, (idarticle, idunite, idmag))
-            sorties = cursor.fetchone()[0] or 0
-        
-            # Transferts Entrée (tb_transfertdetail)
-            cursor.execute("""
-                SELECT COALESCE(SUM(qttransfert), 0) 
-                FROM tb_transfertdetail 
-                WHERE idarticle = %s AND idunite = %s AND deleted = 0 AND idmagentree = %s
-            """, (idarticle, idunite, idmag))
-            transferts_in = cursor.fetchone()[0] or 0
-            
-            # Transferts Sortie (tb_transfertdetail)
-            cursor.execute("""
-                SELECT COALESCE(SUM(qttransfert), 0) 
-                FROM tb_transfertdetail 
-                WHERE idarticle = %s AND idunite = %s AND deleted = 0 AND idmagsortie = %s
-            """, (idarticle, idunite, idmag))
-            transferts_out = cursor.fetchone()[0] or 0
-        
-            # Inventaires (tb_inventaire utilise codearticle)
-            cursor.execute("""
-                SELECT COALESCE(SUM(qtinventaire), 0) 
-                FROM tb_inventaire 
-                WHERE codearticle = %s AND idmag = %s
-            """, (codearticle, idmag))
-            inventaires = cursor.fetchone()[0] or 0
-
-            # Avoirs (augmentent le stock - annulation de vente)
-            cursor.execute("""
-                SELECT COALESCE(SUM(ad.qtavoir), 0) 
-                FROM tb_avoirdetail ad
-                INNER JOIN tb_avoir a ON ad.idavoir = a.id
-                WHERE ad.idarticle = %s AND ad.idunite = %s AND ad.idmag = %s
-                AND a.deleted = 0 AND ad.deleted = 0
-            """, (idarticle, idunite, idmag))
-            avoirs = cursor.fetchone()[0] or 0
-
-            # Calcul final : Stock = Entrées - Sorties
-            stock_total = (receptions + transferts_in + inventaires + avoirs) - (ventes + sorties + transferts_out)
-            
-            return max(0, stock_total)
-        
+            return stock_article(idarticle, idunite_cible, idmag)
         except Exception as e:
-            print(f"Erreur calcul stock: {e}")
+            print(f"Erreur calcul stock consolidé : {e}")
             return 0
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
 
     def open_recherche_article(self, type_mouvement):
         """Ouvre une fenêtre de recherche d'article avec stock filtré par magasin actif."""
@@ -635,168 +480,55 @@ class PageChangementArticle(ctk.CTkFrame):
         tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
 
-        def charger_articles(filtre=""):
+        # Recherche en arrière-plan : filtrage local du cache catalogue, puis
+        # soldes du magasin en unité de base divisés par le coefficient hiérarchique.
+        def requete_articles(cur, filtre, idmag_actif):
+            lignes = catalogue().rechercher(filtre)
+            soldes = soldes_base_par_magasin({l.idarticle for l in lignes}, conn=cur.connection)
+            return [
+                (l.idarticle, l.idunite, l.codearticle, l.designation, l.designationunite,
+                 max(soldes.get((l.idarticle, idmag_actif), 0.0) / (l.coeff_hierarchique or 1), 0),
+                 l.prix)
+                for l in lignes
+            ]
+
+        def afficher_articles(articles, filtre, idmag_actif):
             for item in tree.get_children():
                 tree.delete(item)
 
-            conn = self.connect_db()
-            if not conn:
-                return
-            try:
-                cur = conn.cursor()
-                filtre_like = f"%{filtre}%"
-
-                query = """
-                WITH mouvements_bruts AS (
-                    SELECT lf.idarticle, lf.idmag, COALESCE(u.qtunite, 1) as qtunite_source, lf.qtlivrefrs as quantite, 'reception' as type_mouvement
-                    FROM tb_livraisonfrs lf
-                    INNER JOIN tb_unite u ON lf.idarticle = u.idarticle AND lf.idunite = u.idunite
-                    WHERE lf.deleted = 0
-                    UNION ALL
-                    SELECT vd.idarticle, v.idmag, COALESCE(u.qtunite, 1) as qtunite_source, vd.qtvente as quantite, 'vente' as type_mouvement
-                    FROM tb_ventedetail vd
-                    INNER JOIN tb_vente v ON vd.idvente = v.id AND v.deleted = 0 AND v.statut = 'VALIDEE'
-                    INNER JOIN tb_unite u ON vd.idarticle = u.idarticle AND vd.idunite = u.idunite
-                    WHERE vd.deleted = 0
-                    UNION ALL
-                    SELECT t.idarticle, t.idmagentree as idmag, COALESCE(u.qtunite, 1) as qtunite_source, t.qttransfert as quantite, 'transfert_in' as type_mouvement
-                    FROM tb_transfertdetail t
-                    INNER JOIN tb_unite u ON t.idarticle = u.idarticle AND t.idunite = u.idunite
-                    WHERE t.deleted = 0
-                    UNION ALL
-                    SELECT t.idarticle, t.idmagsortie as idmag, COALESCE(u.qtunite, 1) as qtunite_source, t.qttransfert as quantite, 'transfert_out' as type_mouvement
-                    FROM tb_transfertdetail t
-                    INNER JOIN tb_unite u ON t.idarticle = u.idarticle AND t.idunite = u.idunite
-                    WHERE t.deleted = 0
-                    UNION ALL
-                    SELECT sd.idarticle, sd.idmag, COALESCE(u.qtunite, 1) as qtunite_source, sd.qtsortie as quantite, 'sortie' as type_mouvement
-                    FROM tb_sortiedetail sd
-                    INNER JOIN tb_unite u ON sd.idarticle = u.idarticle AND sd.idunite = u.idunite
-                    UNION ALL
-                    SELECT u.idarticle, i.idmag, COALESCE(u.qtunite, 1) as qtunite_source, i.qtinventaire as quantite, 'inventaire' as type_mouvement
-                    FROM tb_inventaire i
-                    INNER JOIN tb_unite u ON i.codearticle = u.codearticle
-                    WHERE u.idunite IN (
-                        SELECT DISTINCT ON (idarticle) idunite
-                        FROM tb_unite
-                        WHERE deleted = 0
-                        ORDER BY idarticle, qtunite ASC
-                    )
-                    UNION ALL
-                    SELECT ad.idarticle, ad.idmag, COALESCE(u.qtunite, 1) as qtunite_source, ad.qtavoir as quantite, 'avoir' as type_mouvement
-                    FROM tb_avoir a
-                    INNER JOIN tb_avoirdetail ad ON a.id = ad.idavoir
-                    INNER JOIN tb_unite u ON ad.idarticle = u.idarticle AND ad.idunite = u.idunite
-                    WHERE a.deleted = 0 AND ad.deleted = 0
-                    UNION ALL
-                    SELECT cd.idarticle, cd.idmag, COALESCE(u.qtunite, 1) as qtunite_source, cd.qtconsomme as quantite, 'consommation_interne' as type_mouvement
-                    FROM tb_consommationinterne_details cd
-                    INNER JOIN tb_unite u ON cd.idarticle = u.idarticle AND cd.idunite = u.idunite
-                    UNION ALL
-                    SELECT dce.idarticle, dce.idmagasin, COALESCE(u.qtunite, 1) as qtunite_source, dce.quantite_entree as quantite, 'echange_entree' as type_mouvement
-                    FROM tb_detailchange_entree dce
-                    INNER JOIN tb_unite u ON dce.idarticle = u.idarticle AND dce.idunite = u.idunite
-                    UNION ALL
-                    SELECT dcs.idarticle, dcs.idmagasin, COALESCE(u.qtunite, 1) as qtunite_source, dcs.quantite_sortie as quantite, 'echange_sortie' as type_mouvement
-                    FROM tb_detailchange_sortie dcs
-                    INNER JOIN tb_unite u ON dcs.idarticle = u.idarticle AND dcs.idunite = u.idunite
-                ),
-                solde_base_par_mag AS (
-                    SELECT
-                        idarticle,
-                        idmag,
-                        SUM(
-                            CASE type_mouvement
-                                WHEN 'reception'             THEN  quantite * qtunite_source
-                                WHEN 'transfert_in'          THEN  quantite * qtunite_source
-                                WHEN 'inventaire'            THEN  quantite * qtunite_source
-                                WHEN 'avoir'                 THEN  quantite * qtunite_source
-                                WHEN 'echange_entree'        THEN  quantite * qtunite_source
-                                WHEN 'vente'                 THEN -quantite * qtunite_source
-                                WHEN 'sortie'                THEN -quantite * qtunite_source
-                                WHEN 'transfert_out'         THEN -quantite * qtunite_source
-                                WHEN 'consommation_interne'  THEN -quantite * qtunite_source
-                                WHEN 'echange_sortie'        THEN -quantite * qtunite_source
-                                ELSE 0
-                            END
-                        ) as solde_base
-                    FROM mouvements_bruts
-                    GROUP BY idarticle, idmag
-                ),
-                unite_hierarchie AS (
-                    SELECT idarticle, idunite, niveau, qtunite, designationunite
-                    FROM tb_unite
-                    WHERE deleted = 0
-                ),
-                unite_coeff AS (
-                    SELECT
-                        idarticle,
-                        idunite,
-                        niveau,
-                        qtunite,
-                        designationunite,
-                        exp(sum(ln(NULLIF(CASE WHEN qtunite > 0 THEN qtunite ELSE 1 END, 0)))
-                            OVER (PARTITION BY idarticle ORDER BY niveau ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
-                        ) as coeff_hierarchique
-                    FROM unite_hierarchie
-                ),
-                dernier_prix AS (
-                    SELECT
-                        idarticle,
-                        idunite,
-                        prix,
-                        ROW_NUMBER() OVER (PARTITION BY idarticle, idunite ORDER BY id DESC) AS rn
-                    FROM tb_prix
-                )
-                SELECT
-                    u.idarticle,
-                    u.idunite,
-                    u.codearticle,
-                    a.designation,
-                    uc.designationunite,
-                    GREATEST(COALESCE(sb.solde_base, 0) / NULLIF(COALESCE(uc.coeff_hierarchique, 1), 0), 0) as stock_total,
-                    COALESCE(p.prix, 0) as prix_unitaire
-                FROM tb_article a
-                INNER JOIN tb_unite u ON a.idarticle = u.idarticle
-                LEFT JOIN unite_coeff uc ON uc.idarticle = u.idarticle AND uc.idunite = u.idunite
-                LEFT JOIN solde_base_par_mag sb ON sb.idarticle = u.idarticle AND sb.idmag = %s
-                LEFT JOIN dernier_prix p ON a.idarticle = p.idarticle AND u.idunite = p.idunite AND p.rn = 1
-                WHERE a.deleted = 0
-                  AND (u.codearticle ILIKE %s OR a.designation ILIKE %s)
-                ORDER BY a.designation ASC, u.codearticle ASC, u.idunite ASC
-                """
-
-                designationmag = (self.combo_mag_sortie.get() if type_mouvement == "sortie" else self.combo_mag_entree.get() or "").strip()
-                idmag_actif = self.magasins.get(designationmag)
-                tree.heading("Stock", text=f"Magasin {designationmag}" if designationmag else "Magasin")
-                if idmag_actif is None:
-                    return
+            for idx, row in enumerate(articles):
+                zebra_tag = "even" if idx % 2 == 0 else "odd"
+                tree.insert('', 'end', values=(
+                    row[0],
+                    row[1],
+                    row[2] or "",
+                    row[3] or "",
+                    row[4] or "",
+                    self.formater_nombre(row[5]),
+                    self.formater_nombre(row[6])
+                ), tags=(zebra_tag,))
+
+        recherche = ControleurRecherche(
+            fenetre, requete_articles, afficher_articles,
+            erreur=lambda e: messagebox.showerror("Erreur", f"Erreur chargement articles: {str(e)}")
+        )
 
-                cur.execute(query, (idmag_actif, filtre_like, filtre_like))
-                articles = cur.fetchall()
-
-                for idx, row in enumerate(articles):
-                    zebra_tag = "even" if idx % 2 == 0 else "odd"
-                    tree.insert('', 'end', values=(
-                        row[0],
-                        row[1],
-                        row[2] or "",
-                        row[3] or "",
-                        row[4] or "",
-                        self.formater_nombre(row[5]),
-                        self.formater_nombre(row[6])
-                    ), tags=(zebra_tag,))
+        def charger_articles(filtre="", immediat=True):
+            designationmag = (self.combo_mag_sortie.get() if type_mouvement == "sortie" else self.combo_mag_entree.get() or "").strip()
+            idmag_actif = self.magasins.get(designationmag)
+            tree.heading("Stock", text=f"Magasin {designationmag}" if designationmag else "Magasin")
+            if idmag_actif is None:
+                for item in tree.get_children():
+                    tree.delete(item)
+                return
 
-            except Exception as e:
-                messagebox.showerror("Erreur", f"Erreur chargement articles: {str(e)}")
-            finally:
-                if 'cur' in locals() and cur:
-                    cur.close()
-                if conn:
-                    conn.close()
+            if immediat:
+                recherche.lancer(filtre, idmag_actif)
+            else:
+                recherche.declencher(filtre, idmag_actif)
 
         def rechercher(*args):
-            charger_articles(entry_search.get())
+            charger_articles(entry_search.get(), immediat=False)
 
         entry_search.bind('<KeyRelease>', rechercher)
 
@@ -1009,11 +741,9 @@ class PageChangementArticle(ctk.CTkFrame):
         try:
             cursor = conn.cursor()
             
-            # 1. Récupérer la référence depuis entry_ref
-            refchg = self.entry_ref.get()
-            if not refchg:
-                messagebox.showerror("Erreur", "Référence vide")
-                return
+            # 1. ✅ Référence attribuée dans la transaction (unique même entre postes)
+            refchg = numerotation.prochaine_reference(cursor, "CHG")
+            self.afficher_reference(refchg)
             
             # 2. Insérer dans tb_changement
             note = self.entry_note.get().strip() if self.entry_note.get() else ""
@@ -1058,6 +788,12 @@ class PageChangementArticle(ctk.CTkFrame):
                     article['quantite']
                 ))
             
+            # 5. Solde de stock (tb_stock_solde) mis à jour dans la même transaction
+            appliquer_mouvements(cursor,
+                [(a['idarticle'], a['idunite'], a['idmagasin'], -a['quantite']) for a in self.articles_sortie] +
+                [(a['idarticle'], a['idunite'], a['idmagasin'], a['quantite']) for a in self.articles_entree]
+            )
+            
             conn.commit()
             
             messagebox.showinfo("Succès", 
@@ -1110,15 +846,13 @@ class PageChangementArticle(ctk.CTkFrame):
         )
         
         elements = []
-        styles = getSampleStyleSheet()
         page_width_usable = self.PAGE_WIDTH - 2*self.MARGIN
         
         # ========== 1. TITRE PRINCIPAL ==========
         main_title = Paragraph(
             "Ankino amin'ny Jehovah ny asanao dia ho lavorary izay kasainao",
-            ParagraphStyle(
+            rendu_pdf.style(
                 'MainTitle',
-                parent=styles['Normal'],
                 fontSize=10,
                 textColor=colors.black,
                 alignment=TA_CENTER,
@@ -1160,9 +894,8 @@ class PageChangementArticle(ctk.CTkFrame):
             f"Contact : {contactsociete}<br/>"
             f"NIF : {nifsociete}<br/>"
             f"STAT : {statsociete}<br/>",
-            ParagraphStyle(
+            rendu_pdf.style(
                 'CompanyDetails',
-                parent=styles['Normal'],
                 fontSize=9,
                 alignment=TA_LEFT,
                 leading=12
@@ -1187,9 +920,8 @@ class PageChangementArticle(ctk.CTkFrame):
         
         operation_title = Paragraph(
             titre_entete,
-            ParagraphStyle(
+            rendu_pdf.style(
                 'OpTitle',
-                parent=styles['Normal'],
                 fontSize=14,
                 fontName='Helvetica-Bold',
                 alignment=TA_CENTER,
@@ -1202,9 +934,8 @@ class PageChangementArticle(ctk.CTkFrame):
             f"<b>Date et heure:</b> {date_operation} {datetime.now().strftime('%H:%M')}<br/>"
             f"<b>Magasin :</b> {magasin}<br/>"
             f"<b>Opérateur :</b> {operateur}",
-            ParagraphStyle(
+            rendu_pdf.style(
                 'OpInfo',
-                parent=styles['Normal'],
                 fontSize=9,
                 alignment=TA_LEFT,
                 leading=12
@@ -1272,9 +1003,8 @@ class PageChangementArticle(ctk.CTkFrame):
             table_width = page_width_usable * 0.95
             col_widths = calculate_column_widths(columns, data_rows, table_width)
             
-            cell_style = ParagraphStyle(
+            cell_style = rendu_pdf.style(
                 'CellText',
-                parent=styles['Normal'],
                 fontSize=8,
                 alignment=TA_LEFT,
                 wordWrap='CJK'
@@ -1323,9 +1053,8 @@ class PageChangementArticle(ctk.CTkFrame):
         if description:
             desc_line = Paragraph(
                 f"<b>&nbsp;&nbsp;&nbsp;<u>Description: </u></b> {description}<br/><br/>",
-                ParagraphStyle(
+                rendu_pdf.style(
                     'Description',
-                    parent=styles['Normal'],
                     fontSize=9,
                     alignment=TA_LEFT,
                     leading=10
@@ -1334,16 +1063,14 @@ class PageChangementArticle(ctk.CTkFrame):
             elements.append(desc_line)
         
         # ========== 5. SIGNATURES ==========
-        sig_left_1 = Paragraph(responsable_1, ParagraphStyle(
+        sig_left_1 = Paragraph(responsable_1, rendu_pdf.style(
             'SigLabel1',
-            parent=styles['Normal'],
             fontSize=8,
             alignment=TA_CENTER
         ))
         
-        sig_right = Paragraph(responsable_2, ParagraphStyle(
+        sig_right = Paragraph(responsable_2, rendu_pdf.style(
             'SigLabelRight',
-            parent=styles['Normal'],
             fontSize=8,
             alignment=TA_CENTER
         ))
@@ -1367,21 +1094,10 @@ class PageChangementArticle(ctk.CTkFrame):
         
         elements.append(sig_container)
         
-        # Générer le PDF
-        try:
-            doc.build(elements)
-            print(f"✅ PDF généré avec succès: {output_path}")
-            
-            # Ouvrir le fichier
-            if sys.platform == 'win32':
-                os.startfile(output_path)
-            
-            return output_path
-            
-        except Exception as e:
-            print(f"❌ Erreur sauvegarde PDF : {e}")
-            messagebox.showerror("Erreur", f"Erreur lors de la génération du PDF: {str(e)}")
-            return None
+        # ✅ Mise en page et écriture dans le pool de rendu : la saisie reste disponible
+        rendu_pdf.rendre(self, output_path, lambda: doc.build(elements),
+                         ouvrir_apres=sys.platform == 'win32')
+        return output_path
 
     def generer_pdf_changement(self, refchg, idchg):
         """Génère un PDF Changement au format A5 Landscape en utilisant le modèle _build_pdf_a5"""
@@ -1538,7 +1254,7 @@ class PageInfoMouvementStock(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -4,6 +4,8 @@ import psycopg2
 import json
 from datetime import datetime
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+from stock_engine import stock_article, appliquer_requete
 
 
 class PageInventaire(ctk.CTkToplevel):
@@ -24,7 +26,7 @@ class PageInventaire(ctk.CTkToplevel):
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
                 db_config = config['database']
-            return psycopg2.connect(
+            return connecter(
                 host=db_config['host'], user=db_config['user'],
                 password=db_config['password'], database=db_config['database'],
                 port=db_config['port']
@@ -126,120 +128,15 @@ class PageInventaire(ctk.CTkToplevel):
     
     def calculer_stock_article(self, idarticle, idunite_cible, idmag=None):
         """
-        Calcule le stock consolidé pour un article (MÊME LOGIQUE que page_stock.py).
-        Cette fonction calcule le stock réel basé sur tous les mouvements :
-        réceptions, ventes, sorties, transferts, inventaires, avoirs.
+        ✅ CALCUL CONSOLIDÉ via le moteur partagé (stock_engine) :
+        réservoir commun en unité de base sur les 10 sources de mouvements,
+        divisé par le qtunite de l'unité cible. Une seule requête ensembliste.
         """
-        conn = self.connect_db()
-        if not conn: 
-            return 0
-    
         try:
-            cursor = conn.cursor()
-            
-            # 1. Récupérer TOUTES les unités liées à cet idarticle
-            cursor.execute("""
-                SELECT idunite, codearticle, COALESCE(qtunite, 1) 
-                FROM tb_unite 
-                WHERE idarticle = %s
-            """, (idarticle,))
-            unites_liees = cursor.fetchall()
-            
-            # 2. Identifier le qtunite de l'unité qu'on veut afficher
-            qtunite_affichage = 1
-            for idu, code, qt_u in unites_liees:
-                if idu == idunite_cible:
-                    qtunite_affichage = qt_u if qt_u > 0 else 1
-                    break
-
-            total_stock_global_base = 0  # Le "réservoir" total en unité de base (qtunite=1)
-
-            # 3. Sommer les mouvements de chaque variante
-            for idu_boucle, code_boucle, qtunite_boucle in unites_liees:
-                # Réceptions
-                q_rec = "SELECT COALESCE(SUM(qtlivrefrs), 0) FROM tb_livraisonfrs WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_rec = [idarticle, idu_boucle]
-                if idmag: 
-                    q_rec += " AND idmag = %s"
-                    p_rec.append(idmag)
-                cursor.execute(q_rec, p_rec)
-                receptions = cursor.fetchone()[0] or 0
-        
-                # Ventes
-                q_ven = "SELECT COALESCE(SUM(qtvente), 0) FROM tb_ventedetail WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_ven = [idarticle, idu_boucle]
-                if idmag: 
-                    q_ven += " AND idmag = %s"
-                    p_ven.append(idmag)
-                cursor.execute(q_ven, p_ven)
-                ventes = cursor.fetchone()[0] or 0
-        
-                # Sorties
-                q_sort = "SELECT COALESCE(SUM(qtsortie), 0) FROM tb_sortiedetail WHERE idarticle = %s AND idunite = %s"
-                p_sort = [idarticle, idu_boucle]
-                if idmag: 
-                    q_sort += " AND idmag = %s"
-                    p_sort.append(idmag)
-                cursor.execute(q_sort, p_sort)
-                sorties = cursor.fetchone()[0] or 0
-        
-                # Transferts (In)
-                q_tin = "SELECT COALESCE(SUM(qttransfert), 0) FROM tb_transfertdetail WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_tin = [idarticle, idu_boucle]
-                if idmag:
-                    q_tin += " AND idmagentree = %s"
-                    p_tin.append(idmag)
-                cursor.execute(q_tin, p_tin)
-                t_in = cursor.fetchone()[0] or 0
-                
-                # Transferts (Out)
-                q_tout = "SELECT COALESCE(SUM(qttransfert), 0) FROM tb_transfertdetail WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_tout = [idarticle, idu_boucle]
-                if idmag:
-                    q_tout += " AND idmagsortie = %s"
-                    p_tout.append(idmag)
-                cursor.execute(q_tout, p_tout)
-                t_out = cursor.fetchone()[0] or 0
-        
-                # Inventaires (via codearticle)
-                q_inv = "SELECT COALESCE(SUM(qtinventaire), 0) FROM tb_inventaire WHERE codearticle = %s"
-                p_inv = [code_boucle]
-                if idmag: 
-                    q_inv += " AND idmag = %s"
-                    p_inv.append(idmag)
-                cursor.execute(q_inv, p_inv)
-                inv = cursor.fetchone()[0] or 0
-
-                # Avoirs (AUGMENTENT le stock - annulation de vente)
-                q_avoir = """
-                    SELECT COALESCE(SUM(ad.qtavoir), 0) 
-                    FROM tb_avoirdetail ad
-                    INNER JOIN tb_avoir a ON ad.idavoir = a.id
-                    WHERE ad.idarticle = %s AND ad.idunite = %s 
-                    AND a.deleted = 0 AND ad.deleted = 0
-                """
-                p_avoir = [idarticle, idu_boucle]
-                if idmag: 
-                    q_avoir += " AND ad.idmag = %s"
-                    p_avoir.append(idmag)
-                cursor.execute(q_avoir, p_avoir)
-                avoirs = cursor.fetchone()[0] or 0
-
-                # Normalisation : (Solde unité) * (Son poids)
-                # Les avoirs s'AJOUTENT car c'est une annulation de vente (retour marchandise)
-                solde_unite = (receptions + t_in + inv + avoirs - ventes - sorties - t_out)
-                total_stock_global_base += (solde_unite * qtunite_boucle)
-
-            # 4. Conversion finale pour l'affichage
-            stock_final = total_stock_global_base / qtunite_affichage
-            return max(0, stock_final)
-        
+            return stock_article(idarticle, idunite_cible, idmag)
         except Exception as e:
             print(f"Erreur calcul stock consolidé : {e}")
             return 0
-        finally:
-            cursor.close()
-            conn.close()
 
     def formater_nombre(self, nombre):
         try:
@@ -348,6 +245,12 @@ class PageInventaire(ctk.CTkToplevel):
                     VALUES (%s, %s, %s, %s, %s, NOW())
                     RETURNING id
                     """, (code_lie, idmag, stock_calcule, self.iduser, obs_trim))
+
+                    # Même rattachement que l'historique (codearticle → unité) pour tb_stock_solde
+                    appliquer_requete(cursor, """
+                        SELECT u.idarticle, u.idunite, %s::int, %s::numeric
+                        FROM tb_unite u WHERE u.codearticle = %s
+                    """, (idmag, stock_calcule, code_lie))
                 
                     # Récupération sécurisée du nouvel ID généré (43849, 43850, etc.)
                     resultat = cursor.fetchone()
@@ -13,12 +13,13 @@ Module permettant la consultation des listes de mouvements d'articles avec:
 
 import customtkinter as ctk
 from tkinter import messagebox, ttk, filedialog
-import psycopg2
 import json
 import pandas as pd
 import os
 from datetime import datetime
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+from treeview_virtuel import TreeviewVirtuel
 try:
     from EtatsPDF_Mouvements import EtatPDFMouvements
 except ImportError:
@@ -223,7 +224,7 @@ class PageListeMouvement(ctk.CTkFrame):
         
         # Colonnes du treeview - Configuration par défaut (seront reconfigurées selon le type)
         columns = ("Date", "Référence", "Fournisseur", "Articles", "Montant Total", "Statut", "Utilisateur")
-        self.tree = ttk.Treeview(self.tree_frame, columns=columns, show="headings", height=15)
+        self.tree = TreeviewVirtuel(self.tree_frame, columns=columns, show="headings", height=15)
         
         # Configuration des en-têtes
         for col in columns:
@@ -312,7 +313,7 @@ class PageListeMouvement(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
             
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -493,17 +494,14 @@ class PageListeMouvement(ctk.CTkFrame):
             else:
                 self.tree.column(col, width=140, anchor="w")
 
-        # Insérer les nouvelles lignes
-        for idx, row in df.iterrows():
-            tag = 'even' if idx % 2 == 0 else 'odd'
-            values = tuple(row)
-            self.tree.insert('', 'end', values=values, tags=(tag,))
+        # Confier les lignes au Treeview virtuel (zébrage calculé à l'affichage)
+        self.tree.definir_lignes(df.itertuples(index=False, name=None))
+        self.tree.activer_tri()
     
     
     def clear_tree(self):
         """Vide le tableau de toutes les lignes."""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        self.tree.vider()
     
     
     def search_data(self):
@@ -11,6 +11,10 @@ from tkinter import simpledialog
 import os
 from tkcalendar import DateEntry # Ajoutez cette ligne avec les autres imports
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+from stock_engine import appliquer_mouvements
+import rendu_pdf
+import numerotation
 
 
 class PageBonReception(ctk.CTkFrame):
@@ -37,7 +41,7 @@ class PageBonReception(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -240,27 +244,8 @@ class PageBonReception(ctk.CTkFrame):
             
         try:
             cursor = conn.cursor()
-            annee_courante = datetime.now().year
-            
-            query = """
-                SELECT reflivfrs FROM tb_livraisonfrs 
-                WHERE reflivfrs LIKE %s 
-                ORDER BY reflivfrs DESC LIMIT 1
-            """
-            cursor.execute(query, (f"{annee_courante}-BR-%",))
-            resultat = cursor.fetchone()
-            
-            if resultat:
-                dernier_num = int(resultat[0].split('-')[-1])
-                nouveau_num = dernier_num + 1
-            else:
-                nouveau_num = 1
-            
-            reference = f"{annee_courante}-BR-{nouveau_num:05d}"
-            self.entry_ref.configure(state="normal")
-            self.entry_ref.delete(0, "end")
-            self.entry_ref.insert(0, reference)
-            self.entry_ref.configure(state="readonly")
+            # ✅ Aperçu : la référence définitive est attribuée à l'enregistrement
+            self.afficher_reference(numerotation.apercu(cursor, "BR"))
             
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur lors de la génération de la référence: {str(e)}")
@@ -268,6 +253,12 @@ class PageBonReception(ctk.CTkFrame):
             cursor.close()
             conn.close()
     
+    def afficher_reference(self, reference):
+        self.entry_ref.configure(state="normal")
+        self.entry_ref.delete(0, "end")
+        self.entry_ref.insert(0, reference)
+        self.entry_ref.configure(state="readonly")
+
     def ouvrir_recherche_commande(self):
         """Ouvre une fenêtre pour rechercher et charger une commande avec articles livrés"""
         fenetre = ctk.CTkToplevel(self)
@@ -424,7 +415,7 @@ class PageBonReception(ctk.CTkFrame):
             # Récupérer les articles avec qtlivre > 0
             query_details = """
                 SELECT d.id, d.idarticle, a.designation, u.designationunite, 
-                       d.idunite, d.qtlivre, d.punitcmd
+                       d.idunite, d.qtlivre, d.punitcmd, d.dateperemption
                 FROM tb_commandedetail d
                 INNER JOIN tb_article a ON d.idarticle = a.idarticle
                 INNER JOIN tb_unite u ON d.idunite = u.idunite
@@ -452,7 +443,7 @@ class PageBonReception(ctk.CTkFrame):
             
             # Remplir le treeview
             for detail in details:
-                idcomdetail, idarticle, designation, unite, idunite, qtlivre, punitcmd = detail
+                idcomdetail, idarticle, designation, unite, idunite, qtlivre, punitcmd, dateperemption = detail
                 punitcmd = punitcmd if punitcmd else 0
                 montant = (qtlivre or 0) * punitcmd
                 
@@ -469,7 +460,8 @@ class PageBonReception(ctk.CTkFrame):
                     'idarticle': idarticle,
                     'idunite': idunite,
                     'qtlivre': qtlivre or 0,
-                    'punitcmd': punitcmd
+                    'punitcmd': punitcmd,
+                    'dateperemption': dateperemption or None   # saisie sur la commande (page_CmdFrs)
                 })
             
             self.calculer_total()
@@ -499,23 +491,15 @@ class PageBonReception(ctk.CTkFrame):
             cursor = conn.cursor()
             numero_facture = self.entry_factfrs.get().strip()
             
-            # --- LOGIQUE POUR DATE VIDE ---
-            # Si vous voulez que la date soit optionnelle, vous pouvez ajouter une condition.
-            # Ici, on récupère la date, mais on peut décider qu'elle est NULL 
-            # selon un critère (ex: si une checkbox est décochée).
-            # Sinon, par défaut, on prend la date du calendrier.
-            date_peremption = None  # Widget non créé
-            
-            # Exemple : Si vous voulez permettre le NULL via un dialogue ou autre, 
-            # vous mettriez date_peremption = None
-            # ------------------------------
-
             if not numero_facture:
                 messagebox.showwarning("Attention", "Veuillez saisir le N° Facture Fournisseur.")
                 return
             
             dateregistre = datetime.now()
             idmag = self.magasins.get(self.combo_magasin.get())
+
+            # ✅ Référence attribuée dans la transaction (unique même entre postes)
+            self.afficher_reference(numerotation.prochaine_reference(cursor, "BR"))
     
             query_insert = """
                 INSERT INTO tb_livraisonfrs 
@@ -525,7 +509,7 @@ class PageBonReception(ctk.CTkFrame):
             """
     
             for item in self.items_livraison:
-                # On envoie date_peremption. Si c'est None, psycopg2 insérera NULL automatiquement.
+                # Date de péremption de la ligne de commande (NULL si non saisie)
                 cursor.execute(query_insert, (
                     self.entry_ref.get(),
                     self.idcom_selectionne,
@@ -536,11 +520,14 @@ class PageBonReception(ctk.CTkFrame):
                     idmag,
                     numero_facture,
                     self.iduser,
-                    date_peremption  
+                    item.get('dateperemption')
                 ))
-                
-            # Widget entry_peremption non créé - toujours NULL
-            date_peremption = None
+
+            # Solde de stock (tb_stock_solde) et lots de péremption mis à jour dans la même transaction
+            appliquer_mouvements(cursor, [
+                (item['idarticle'], item['idunite'], idmag, item['qtlivre'], item.get('dateperemption'))
+                for item in self.items_livraison
+            ])
     
             conn.commit()
             self.derniere_reflivfrs_enregistree = self.entry_ref.get()
@@ -579,14 +566,10 @@ class PageBonReception(ctk.CTkFrame):
                     try:
                         from EtatsPDF_Mouvements import EtatPDFMouvements
 
-                        etat = EtatPDFMouvements()
-                        try:
-                            etat.connect_db()
-                        except Exception:
-                            pass
-
-                        success = etat._build_pdf_a5(
-                            output_path=filename,
+                        # ✅ Rendu dans le pool : le formulaire est réinitialisé sans attendre le PDF
+                        EtatPDFMouvements().rendre_pdf_a5(
+                            self, filename,
+                            rappel=self.open_file,
                             titre_entete="BON DE RÉCEPTION",
                             reference=self.entry_ref.get(),
                             date_operation=data['reception'].get('dateregistre', datetime.now().strftime('%d/%m/%Y')),
@@ -598,17 +581,6 @@ class PageBonReception(ctk.CTkFrame):
                             responsable_2=data['reception'].get('fournisseur', 'Fournisseur')
                         )
 
-                        try:
-                            etat.close_db()
-                        except Exception:
-                            pass
-
-                        if success:
-                            try:
-                                self.open_file(filename)
-                            except Exception:
-                                pass
-
                     except Exception as e:
                         # Ne pas interrompre le flux principal si la génération échoue
                         print(f"Erreur génération PDF automatique Bon de Réception: {e}")
@@ -662,57 +634,21 @@ class PageBonReception(ctk.CTkFrame):
         self.calculer_total()
     
     def charger_infos_societe(self):
-        """Charge les informations de la société depuis tb_infosociete."""
-        conn = self.connect_db()
-        if not conn: return
-    
+        """Informations société (tb_infosociete lue une fois par processus, cf. rendu_pdf)."""
         try:
-            cursor = conn.cursor()
-            sql = """
-                SELECT 
-                    nomsociete, adressesociete, contactsociete, villesociete, 
-                    nifsociete, statsociete, cifsociete
-                FROM tb_infosociete 
-                LIMIT 1
-            """
-            cursor.execute(sql)
-            result = cursor.fetchone()
-        
-            if result:
-                self.infos_societe = {
-                    'nomsociete': result[0] or 'SOCIÉTÉ',
-                    'adressesociete': result[1] or 'N/A',
-                    'contactsociete': result[2] or 'N/A',
-                    'villesociete': result[3] or 'N/A',
-                    'nifsociete': result[4] or 'N/A',
-                    'statsociete': result[5] or 'N/A',
-                    'cifsociete': result[6] or 'N/A'
-                }
-            else:
-                self.infos_societe = {
-                    'nomsociete': 'SOCIÉTÉ',
-                    'adressesociete': 'N/A',
-                    'contactsociete': 'N/A',
-                    'villesociete': 'N/A',
-                    'nifsociete': 'N/A',
-                    'statsociete': 'N/A',
-                    'cifsociete': 'N/A'
-                }
-        
+            infos = rendu_pdf.societe()
         except Exception as e:
             print(f"Erreur chargement infos société: {str(e)}")
-            self.infos_societe = {
-                'nomsociete': 'SOCIÉTÉ',
-                'adressesociete': 'N/A',
-                'contactsociete': 'N/A',
-                'villesociete': 'N/A',
-                'nifsociete': 'N/A',
-                'statsociete': 'N/A',
-                'cifsociete': 'N/A'
-            }
-        finally:
-            if 'cursor' in locals() and cursor: cursor.close()
-            if conn: conn.close()
+            infos = {}
+        self.infos_societe = {
+            'nomsociete': infos.get('nomsociete') or 'SOCIÉTÉ',
+            'adressesociete': infos.get('adressesociete') or 'N/A',
+            'contactsociete': infos.get('contactsociete') or 'N/A',
+            'villesociete': infos.get('villesociete') or 'N/A',
+            'nifsociete': infos.get('nifsociete') or 'N/A',
+            'statsociete': infos.get('statsociete') or 'N/A',
+            'cifsociete': infos.get('cifsociete') or 'N/A'
+        }
     
     def get_data_bon_reception(self):
         """Récupère toutes les données nécessaires pour imprimer un bon de réception."""
@@ -14,6 +14,8 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+from recherche_index import search_articles
 
 
 
@@ -61,7 +63,7 @@ class PageCmdFrs(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -229,39 +231,20 @@ class PageCmdFrs(ctk.CTkFrame):
             conn = self.connect_db()
             if not conn: return
             try:
-                cursor = conn.cursor()
-                # La requête retourne l'article et son unité de base/de commande
-                query = """
-                    SELECT T2."idarticle", T1."codearticle", T2."designation", T1."designationunite", T1."idunite"
-                    FROM tb_unite AS T1
-                    INNER JOIN tb_article AS T2 ON T1.idarticle = T2.idarticle
-                    WHERE T2."deleted" = 0
-                """
-                params = []
-                if filtre:
-                    query += """ AND (
-                        LOWER(T1."codearticle") LIKE LOWER(%s) OR 
-                        LOWER(T2."designation") LIKE LOWER(%s)
-                    )"""
-                    params = [f"%{filtre}%", f"%{filtre}%"]
-                query += " ORDER BY T1.\"codearticle\""
-                
-                cursor.execute(query, params)
-                resultats = cursor.fetchall()
-                
-                for idx, row in enumerate(resultats):
-                    if len(row) >= 5:
-                        # row: [idarticle, codearticle, designation, designationunite, idunite]
-                        # Insertion de 5 valeurs: ID_Article, ID_Unite, Code, Désignation, Unité
-                        tag = "even" if idx % 2 == 0 else "odd"
-                        tree.insert('', 'end', values=(row[0], row[4], row[1], row[2], row[3]), tags=(tag,)) # Remplir la colonne ID_Unite avec row[4]
+                # Recherche indexée (trigrammes, sans accents), classée par pertinence
+                # limite=None : toute la liste, comme avant l'index (le compteur reste exact)
+                resultats = search_articles(filtre, limite=None, conn=conn, inclure_supprimees=True)
+
+                for idx, r in enumerate(resultats):
+                    # Insertion de 5 valeurs: ID_Article, ID_Unite, Code, Désignation, Unité
+                    tag = "even" if idx % 2 == 0 else "odd"
+                    tree.insert('', 'end', values=(r.idarticle, r.idunite, r.codearticle, r.designation, r.designationunite), tags=(tag,))
                 
                 label_count.configure(text=f"Nombre d'articles : {len(resultats)}")
                 
             except Exception as e:
                 messagebox.showerror("Erreur", f"Erreur lors du chargement des articles: {str(e)}")
             finally:
-                if 'cursor' in locals() and cursor: cursor.close()
                 if conn: conn.close()
         
         def rechercher(*args):
@@ -967,7 +950,6 @@ class PageCmdFrs(ctk.CTkFrame):
             except Exception as e:
                 messagebox.showerror("Erreur", f"Erreur lors du chargement: {str(e)}")
             finally:
-                if 'cursor' in locals() and cursor: cursor.close()
                 if conn: conn.close()
         
         def rechercher(*args):
@@ -1455,7 +1437,7 @@ class PageChangementArticle(ctk.CTkFrame):
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
                 db_config = config['database']
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -1814,34 +1796,18 @@ class PageChangementArticle(ctk.CTkFrame):
             if not conn:
                 return
             try:
-                cursor = conn.cursor()
-                query = """
-                    SELECT T2."idarticle", T1."idunite", T1."codearticle", T2."designation", T1."designationunite"
-                    FROM tb_unite AS T1
-                    INNER JOIN tb_article AS T2 ON T1.idarticle = T2.idarticle
-                    WHERE T2."deleted" = 0
-                """
-                params = []
-                if filtre:
-                    query += """ AND (
-                        LOWER(T1."codearticle") LIKE LOWER(%s) OR 
-                        LOWER(T2."designation") LIKE LOWER(%s)
-                    )"""
-                    params = [f"%{filtre}%", f"%{filtre}%"]
-                query += " ORDER BY T1.\"codearticle\""
-                cursor.execute(query, params)
-                resultats = cursor.fetchall()
+                # Recherche indexée (trigrammes, sans accents), classée par pertinence
+                # limite=None : toute la liste, comme avant l'index (le compteur reste exact)
+                resultats = search_articles(filtre, limite=None, conn=conn, inclure_supprimees=True)
 
-                for idx, row in enumerate(resultats):
+                for idx, r in enumerate(resultats):
                     tag = "even" if idx % 2 == 0 else "odd"
-                    tree.insert('', 'end', values=(row[0], row[1], row[2], row[3], row[4]), tags=(tag,))
+                    tree.insert('', 'end', values=(r.idarticle, r.idunite, r.codearticle, r.designation, r.designationunite), tags=(tag,))
 
                 label_count.configure(text=f"Articles: {len(resultats)}")
             except Exception as e:
                 messagebox.showerror("Erreur", f"Erreur: {str(e)}")
             finally:
-                if 'cursor' in locals() and cursor:
-                    cursor.close()
                 if conn:
                     conn.close()
 
@@ -1,18 +1,31 @@
 import customtkinter as ctk
 from tkinter import ttk, messagebox
-import psycopg2
 import json
 from datetime import datetime, timedelta
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+from recherche_async import ControleurRecherche
+from recherche_index import filtre_articles
+from stock_engine import COEFF_BASE
+import evenements
+import lots_peremption
 
 
 class PageGestionPeremption(ctk.CTkFrame):
     def __init__(self, parent, iduser=1):
         super().__init__(parent)
         self.iduser = iduser
+        self.articles = None            # "idarticle_idunite" -> article affiché (None : jamais chargé)
+        self.portee_en_cours = False    # lecture en cours : set d'idarticle, None (tout) ; False : aucune
         
         self.setup_ui()
+        # ✅ Lecture en arrière-plan (pool) : seul le résultat de la dernière lecture est affiché
+        self.relecture = ControleurRecherche(self, self.lire_articles, self.appliquer_articles,
+                                             erreur=self.echec_chargement)
         self.charger_donnees()
+        # Lots mouvementés : seuls les articles touchés sont relus ; nouveau jour (None) : tout
+        evenements.abonner(self, evenements.PEREMPTION, self.relire_articles)
+        evenements.abonner(self, evenements.STOCK, self.relire_articles)
 
     def connect_db(self):
         """Connexion à la base de données PostgreSQL"""
@@ -21,7 +34,7 @@ class PageGestionPeremption(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -101,8 +114,66 @@ class PageGestionPeremption(ctk.CTkFrame):
         # Dictionnaire pour stocker les données des cellules
         self.cellules_data = {}
 
-    def get_all_data_optimized(self, cursor, terme_recherche=""):
-        """Récupère toutes les données en une seule requête optimisée"""
+    def get_data_lots(self, cursor, terme_recherche="", idarticles=None):
+        """
+        ✅ Registre des lots (lots_peremption) : quantité RESTANTE de chaque date
+        après consommation FEFO, stock total de l'article, dans l'unité de plus
+        haut niveau. Mêmes colonnes que get_all_data_optimized (sans id de livraison).
+        idarticles : seuls ces articles sont lus (None : tous).
+        """
+        query = f"""
+            WITH unite_affichee AS (
+                SELECT DISTINCT ON (u.idarticle)
+                    u.idarticle, u.idunite, u.codearticle, u.designationunite,
+                    {COEFF_BASE} AS coeff
+                FROM tb_unite u
+                ORDER BY u.idarticle, u.niveau DESC, u.idunite
+            ),
+            stock AS (
+                SELECT idarticle, SUM(qt_restante) AS qt
+                FROM tb_lot_peremption
+                GROUP BY idarticle
+            ),
+            dates AS (
+                SELECT idarticle, dateperemption, SUM(qt_restante) AS qt
+                FROM tb_lot_peremption
+                WHERE qt_restante > 0 AND dateperemption < 'infinity'
+                GROUP BY idarticle, dateperemption
+            )
+            SELECT 
+                u.codearticle,
+                a.designation,
+                u.designationunite,
+                a.idarticle,
+                u.idunite,
+                s.qt / u.coeff,
+                p.dateperemption,
+                p.qt / u.coeff,
+                NULL,
+                ROW_NUMBER() OVER (PARTITION BY a.idarticle ORDER BY p.dateperemption)
+            FROM dates p
+            JOIN stock s ON s.idarticle = p.idarticle
+            JOIN tb_article a ON a.idarticle = p.idarticle
+            JOIN unite_affichee u ON u.idarticle = p.idarticle
+            WHERE s.qt > 0
+        """
+        filtre, params = self.filtre_recherche(cursor, terme_recherche, idarticles)
+        cursor.execute(query + " AND " + filtre + " ORDER BY u.codearticle, p.dateperemption", params)
+        return cursor.fetchall()
+
+    def filtre_recherche(self, cursor, terme_recherche, idarticles):
+        """Filtre de recherche indexé, restreint à `idarticles` s'il est donné."""
+        filtre, params = filtre_articles(cursor, terme_recherche)
+        if idarticles is not None:
+            filtre += " AND a.idarticle = ANY(%s)"
+            params = list(params) + [list(idarticles)]
+        return filtre, params
+
+    def get_all_data_optimized(self, cursor, terme_recherche="", idarticles=None):
+        """Récupère toutes les données en une seule requête optimisée (idarticles : seuls ces articles)"""
+        if lots_peremption.table_disponible(cursor):
+            return self.get_data_lots(cursor, terme_recherche, idarticles)
+
         query = """
             WITH stock_calcul AS (
                 SELECT 
@@ -149,16 +220,9 @@ class PageGestionPeremption(ctk.CTkFrame):
             AND p.dateperemption IS NOT NULL
         """
         
-        if terme_recherche:
-            query += """ AND (
-                LOWER(u.codearticle) LIKE LOWER(%s) 
-                OR LOWER(a.designation) LIKE LOWER(%s)
-            )
-            """
-            cursor.execute(query + " ORDER BY u.codearticle, p.dateperemption", 
-                          (f'%{terme_recherche}%', f'%{terme_recherche}%'))
-        else:
-            cursor.execute(query + " ORDER BY u.codearticle, p.dateperemption")
+        # Filtre indexé (trigrammes, sans accents) ; "TRUE" si pas de terme
+        filtre, params = self.filtre_recherche(cursor, terme_recherche, idarticles)
+        cursor.execute(query + " AND " + filtre + " ORDER BY u.codearticle, p.dateperemption", params)
         
         return cursor.fetchall()
 
@@ -172,178 +236,186 @@ class PageGestionPeremption(ctk.CTkFrame):
         self.search_timer = self.after(500, self.charger_donnees)
 
     def charger_donnees(self):
-        """Charge les données de manière optimisée"""
-        # Afficher un indicateur de chargement
+        """Relit tout le tableau en arrière-plan (bouton Actualiser, recherche)"""
+        self.relire_articles(None)
+
+    def relire_articles(self, idarticles=None):
+        """
+        Lance la lecture en arrière-plan des articles `idarticles` (None : tout le tableau).
+        Une lecture encore en cours est remplacée : ses articles sont relus avec les nouveaux.
+        """
+        if idarticles is not None and not idarticles:
+            return
+        if idarticles is None or self.articles is None or self.portee_en_cours is None:
+            portee = None
+        else:
+            portee = set(idarticles) | (self.portee_en_cours or set())
+        self.portee_en_cours = portee
         self.titre.configure(text="🛡️ Suivi de Péremption par Article - Chargement...")
-        self.update()
-        
+        self.relecture.lancer(self.entry_recherche.get().strip(), portee)
+
+    def lire_articles(self, cursor, terme_recherche, idarticles):
+        """Thread de travail : articles avec dates de péremption, par clé "idarticle_idunite"."""
+        resultats = self.get_all_data_optimized(cursor, terme_recherche, idarticles)
+
+        # Organiser les données par article
+        articles_dict = {}
+
+        for row in resultats:
+            code_art, design_art, design_unite, id_art, id_uni, stock_actuel, date_peremp, qt_livree, id_livraison, rang = row
+
+            key = f"{id_art}_{id_uni}"
+
+            if key not in articles_dict:
+                articles_dict[key] = {
+                    'code': code_art,
+                    'article': design_art,
+                    'unite': design_unite,
+                    'stock': stock_actuel,
+                    'idarticle': id_art,
+                    'idunite': id_uni,
+                    'dates': []
+                }
+
+            if date_peremp:
+                articles_dict[key]['dates'].append({
+                    'date': date_peremp,
+                    'qt': qt_livree,
+                    'id_livraison': id_livraison
+                })
+
+        # Filtrer les articles où stock >= quantité totale en péremption
+        return {key: art for key, art in articles_dict.items()
+                if art['stock'] >= sum(d['qt'] for d in art['dates'])}
+
+    def appliquer_articles(self, articles, terme_recherche, idarticles):
+        """Thread Tk : remplace les articles relus (tous si idarticles est None) puis redessine."""
+        self.portee_en_cours = False
+        if idarticles is None or self.articles is None:
+            self.articles = articles
+        else:
+            self.articles = {key: art for key, art in self.articles.items()
+                             if art['idarticle'] not in idarticles}
+            self.articles.update(articles)
+        self.afficher_articles()
+
+    def echec_chargement(self, e):
+        self.portee_en_cours = False
+        messagebox.showerror("Erreur de chargement", f"Erreur SQL : {e}")
+        self.titre.configure(text="🛡️ Suivi de Péremption par Article - Erreur")
+
+    def afficher_articles(self):
+        """Redessine le tableau depuis self.articles (aucune requête)"""
         # Nettoyer le treeview
         for i in self.tree.get_children():
             self.tree.delete(i)
         
         self.cellules_data = {}
 
-        conn = self.connect_db()
-        if not conn: 
-            self.titre.configure(text="🛡️ Suivi de Péremption par Article")
+        articles_valides = sorted(self.articles.values(), key=lambda art: str(art['code'] or ''))
+        if not articles_valides:
+            self.titre.configure(text="🛡️ Suivi de Péremption par Article - Aucun article avec péremption")
             return
 
-        try:
-            cursor = conn.cursor()
-            
-            # Récupérer le terme de recherche
-            terme_recherche = self.entry_recherche.get().strip()
-            
-            # Récupérer toutes les données en une seule requête
-            resultats = self.get_all_data_optimized(cursor, terme_recherche)
-            
-            if not resultats:
-                self.titre.configure(text="🛡️ Suivi de Péremption par Article - Aucun article avec péremption")
-                return
-            
-            # Organiser les données par article
-            articles_dict = {}
+        # Trouver le nombre maximum de dates
+        max_dates = max([len(art['dates']) for art in articles_valides])
+        
+        # Configurer les colonnes
+        colonnes = ["code", "article", "unite", "stock"]
+        colonnes += [f"date_peremp_{i+1}" for i in range(max_dates)]
+        
+        self.tree["columns"] = colonnes
+        self.tree.column("#0", width=0, stretch=False)
+        
+        # Configurer les en-têtes
+        self.tree.heading("code", text="Code Article")
+        self.tree.heading("article", text="Article")
+        self.tree.heading("unite", text="Unité")
+        self.tree.heading("stock", text="Stock Actuel")
+        
+        for i in range(max_dates):
+            self.tree.heading(f"date_peremp_{i+1}", text=f"Péremption {i+1}")
+        
+        # Configurer les largeurs
+        self.tree.column("code", width=120, anchor="center")
+        self.tree.column("article", width=250, anchor="w")
+        self.tree.column("unite", width=100, anchor="center")
+        self.tree.column("stock", width=100, anchor="center")
+        
+        for i in range(max_dates):
+            self.tree.column(f"date_peremp_{i+1}", width=150, anchor="center")
+
+        # Insérer les données
+        aujourdhui = datetime.now().date()
+        un_mois = aujourdhui + timedelta(days=30)
+        deux_mois = aujourdhui + timedelta(days=60)
+        
+        for art in articles_valides:
+            values = [
+                art['code'],
+                art['article'],
+                art['unite'],
+                f"{art['stock']:,.2f}".replace(',', ' ').replace('.', ',')
+            ]
             
-            for row in resultats:
-                code_art, design_art, design_unite, id_art, id_uni, stock_actuel, date_peremp, qt_livree, id_livraison, rang = row
+            couleurs_cellules = []
+            for i, date_info in enumerate(art['dates']):
+                date_peremp = date_info['date']
+                qt_livree = date_info['qt']
+                id_livraison = date_info['id_livraison']
                 
-                key = f"{id_art}_{id_uni}"
+                cell_value = f"{date_peremp.strftime('%d/%m/%Y')}\n({qt_livree:,.2f})".replace(',', ' ').replace('.', ',')
+                values.append(cell_value)
                 
-                if key not in articles_dict:
-                    articles_dict[key] = {
-                        'code': code_art,
-                        'article': design_art,
-                        'unite': design_unite,
-                        'stock': stock_actuel,
-                        'idarticle': id_art,
-                        'idunite': id_uni,
-                        'dates': []
-                    }
+                # Déterminer la couleur
+                if date_peremp <= aujourdhui:
+                    couleur = 'perime'
+                elif date_peremp <= un_mois:
+                    couleur = 'urgent'
+                elif date_peremp <= deux_mois:
+                    couleur = 'proche'
+                else:
+                    couleur = 'normal'
                 
-                if date_peremp:
-                    articles_dict[key]['dates'].append({
-                        'date': date_peremp,
-                        'qt': qt_livree,
-                        'id_livraison': id_livraison
-                    })
-            
-            # Filtrer les articles où stock >= quantité totale en péremption
-            articles_valides = []
-            for key, art in articles_dict.items():
-                qt_total_peremp = sum([d['qt'] for d in art['dates']])
-                if art['stock'] >= qt_total_peremp:
-                    articles_valides.append(art)
-            
-            if not articles_valides:
-                self.titre.configure(text="🛡️ Suivi de Péremption par Article - Aucun article valide")
-                return
-            
-            # Trouver le nombre maximum de dates
-            max_dates = max([len(art['dates']) for art in articles_valides])
-            
-            # Configurer les colonnes
-            colonnes = ["code", "article", "unite", "stock"]
-            colonnes += [f"date_peremp_{i+1}" for i in range(max_dates)]
-            
-            self.tree["columns"] = colonnes
-            self.tree.column("#0", width=0, stretch=False)
-            
-            # Configurer les en-têtes
-            self.tree.heading("code", text="Code Article")
-            self.tree.heading("article", text="Article")
-            self.tree.heading("unite", text="Unité")
-            self.tree.heading("stock", text="Stock Actuel")
+                couleurs_cellules.append(couleur)
+                
+                # Stocker les données de la cellule
+                cell_key = f"{art['idarticle']}_{art['idunite']}_{i}"
+                self.cellules_data[cell_key] = {
+                    'id_livraison': id_livraison,
+                    'date_peremp': date_peremp,
+                    'qt_livree': qt_livree,
+                    'idarticle': art['idarticle'],
+                    'idunite': art['idunite'],
+                    'code': art['code'],
+                    'article': art['article']
+                }
             
-            for i in range(max_dates):
-                self.tree.heading(f"date_peremp_{i+1}", text=f"Péremption {i+1}")
+            # Compléter avec des valeurs vides
+            while len(values) < len(colonnes):
+                values.append("")
             
-            # Configurer les largeurs
-            self.tree.column("code", width=120, anchor="center")
-            self.tree.column("article", width=250, anchor="w")
-            self.tree.column("unite", width=100, anchor="center")
-            self.tree.column("stock", width=100, anchor="center")
+            # Déterminer le tag global
+            if 'perime' in couleurs_cellules:
+                tag = 'perime'
+            elif 'urgent' in couleurs_cellules:
+                tag = 'urgent'
+            elif 'proche' in couleurs_cellules:
+                tag = 'proche'
+            else:
+                tag = 'normal'
             
-            for i in range(max_dates):
-                self.tree.column(f"date_peremp_{i+1}", width=150, anchor="center")
-
-            # Insérer les données
-            aujourdhui = datetime.now().date()
-            un_mois = aujourdhui + timedelta(days=30)
-            deux_mois = aujourdhui + timedelta(days=60)
+            # Insérer la ligne
+            item_id = self.tree.insert("", "end", values=values, tags=(tag,))
             
-            for art in articles_valides:
-                values = [
-                    art['code'],
-                    art['article'],
-                    art['unite'],
-                    f"{art['stock']:,.2f}".replace(',', ' ').replace('.', ',')
-                ]
-                
-                couleurs_cellules = []
-                for i, date_info in enumerate(art['dates']):
-                    date_peremp = date_info['date']
-                    qt_livree = date_info['qt']
-                    id_livraison = date_info['id_livraison']
-                    
-                    cell_value = f"{date_peremp.strftime('%d/%m/%Y')}\n({qt_livree:,.2f})".replace(',', ' ').replace('.', ',')
-                    values.append(cell_value)
-                    
-                    # Déterminer la couleur
-                    if date_peremp <= aujourdhui:
-                        couleur = 'perime'
-                    elif date_peremp <= un_mois:
-                        couleur = 'urgent'
-                    elif date_peremp <= deux_mois:
-                        couleur = 'proche'
-                    else:
-                        couleur = 'normal'
-                    
-                    couleurs_cellules.append(couleur)
-                    
-                    # Stocker les données de la cellule
-                    cell_key = f"{art['idarticle']}_{art['idunite']}_{i}"
-                    self.cellules_data[cell_key] = {
-                        'id_livraison': id_livraison,
-                        'date_peremp': date_peremp,
-                        'qt_livree': qt_livree,
-                        'idarticle': art['idarticle'],
-                        'idunite': art['idunite'],
-                        'code': art['code'],
-                        'article': art['article']
-                    }
-                
-                # Compléter avec des valeurs vides
-                while len(values) < len(colonnes):
-                    values.append("")
-                
-                # Déterminer le tag global
-                if 'perime' in couleurs_cellules:
-                    tag = 'perime'
-                elif 'urgent' in couleurs_cellules:
-                    tag = 'urgent'
-                elif 'proche' in couleurs_cellules:
-                    tag = 'proche'
-                else:
-                    tag = 'normal'
-                
-                # Insérer la ligne
-                item_id = self.tree.insert("", "end", values=values, tags=(tag,))
-                
-                # Mettre à jour les données avec item_id
-                for i in range(len(art['dates'])):
-                    cell_key = f"{art['idarticle']}_{art['idunite']}_{i}"
-                    if cell_key in self.cellules_data:
-                        self.cellules_data[cell_key]['item_id'] = item_id
-                        self.cellules_data[cell_key]['col_index'] = i + 4
+            # Mettre à jour les données avec item_id
+            for i in range(len(art['dates'])):
+                cell_key = f"{art['idarticle']}_{art['idunite']}_{i}"
+                if cell_key in self.cellules_data:
+                    self.cellules_data[cell_key]['item_id'] = item_id
+                    self.cellules_data[cell_key]['col_index'] = i + 4
 
-            self.titre.configure(text=f"🛡️ Suivi de Péremption par Article - {len(articles_valides)} articles")
-
-        except Exception as e:
-            messagebox.showerror("Erreur de chargement", f"Erreur SQL : {e}")
-            self.titre.configure(text="🛡️ Suivi de Péremption par Article - Erreur")
-        finally:
-            cursor.close()
-            conn.close()
+        self.titre.configure(text=f"🛡️ Suivi de Péremption par Article - {len(articles_valides)} articles")
 
     def on_double_click(self, event):
         """Gère le double-clic sur une cellule"""
@@ -409,7 +481,7 @@ class PageGestionPeremption(ctk.CTkFrame):
 Article: {cell_data['code']} - {cell_data['article']}
 
 Date de péremption: {cell_data['date_peremp'].strftime('%d/%m/%Y')}
-Quantité livrée: {cell_data['qt_livree']:,.2f}
+{"Quantité livrée" if cell_data['id_livraison'] else "Quantité restante"}: {cell_data['qt_livree']:,.2f}
 
 Cette ligne a été vérifiée ou réglée ?
 Souhaitez-vous la supprimer de la liste de suivi ?
@@ -431,17 +503,27 @@ Souhaitez-vous la supprimer de la liste de suivi ?
                 if conn:
                     try:
                         cursor = conn.cursor()
-                        # Mettre à NULL la date de péremption dans tb_livraisonfrs
-                        cursor.execute("""
-                            UPDATE tb_livraisonfrs 
-                            SET dateperemption = NULL 
-                            WHERE idlivraisonfrs = %s
-                        """, (cell_data['id_livraison'],))
+                        if cell_data['id_livraison'] is None:
+                            # Registre des lots : le reste du lot rejoint le stock sans date,
+                            # et les livraisons de cette date ne sont plus suivies
+                            lots_peremption.retirer_date(cursor, cell_data['idarticle'], cell_data['date_peremp'])
+                            cursor.execute("""
+                                UPDATE tb_livraisonfrs 
+                                SET dateperemption = NULL 
+                                WHERE idarticle = %s AND dateperemption = %s
+                            """, (cell_data['idarticle'], cell_data['date_peremp']))
+                        else:
+                            # Mettre à NULL la date de péremption dans tb_livraisonfrs
+                            cursor.execute("""
+                                UPDATE tb_livraisonfrs 
+                                SET dateperemption = NULL 
+                                WHERE idlivraisonfrs = %s
+                            """, (cell_data['id_livraison'],))
                         conn.commit()
                         
                         messagebox.showinfo("Succès", "La date de péremption a été supprimée avec succès.")
                         dialog.destroy()
-                        self.charger_donnees()  # Recharger les données
+                        self.relire_articles({cell_data['idarticle']})  # Relire cet article
                         
                     except Exception as e:
                         conn.rollback()
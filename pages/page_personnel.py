@@ -1,4 +1,3 @@
-import psycopg2
 import pandas as pd
 import customtkinter as ctk
 from tkinter import ttk, messagebox, filedialog
@@ -6,6 +5,7 @@ import json
 import os
 import sys
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
 
 
 # Configuration du chemin pour les imports
@@ -33,7 +33,7 @@ class DatabaseManager:
     def connect(self):
         if self.db_params is None: return False
         try:
-            self.conn = psycopg2.connect(**self.db_params)
+            self.conn = connecter_page(None, **self.db_params)
             self.cursor = self.conn.cursor()
             return True
         except Exception as e:
@@ -1,10 +1,10 @@
 import customtkinter as ctk
 from tkinter import ttk, messagebox
-import psycopg2
 import json
 from datetime import datetime
 from tkcalendar import DateEntry
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
 
 
 from pages.page_personnel import PagePersonnel
@@ -44,7 +44,7 @@ class PagePeronnelAjout(ctk.CTkFrame):
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
                 db_config = config['database']
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'], user=db_config['user'],
                 password=db_config['password'], database=db_config['database'],
                 port=db_config['port']
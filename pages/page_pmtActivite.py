@@ -2,6 +2,7 @@ import customtkinter as ctk
 from tkinter import ttk, messagebox
 from datetime import date
 import psycopg2
+from db_pool import connecter_page
 from datetime import date, datetime
 import os
 from pathlib import Path
@@ -40,7 +41,8 @@ class DatabaseManager:
             return None
         
         try:
-            self.conn = psycopg2.connect(
+            self.conn = connecter_page(
+                None,
                 host=self.db_params['host'],
                 user=self.db_params['user'],
                 password=self.db_params['password'],
@@ -1,6 +1,5 @@
 import customtkinter as ctk
 from tkinter import messagebox
-import psycopg2
 import json
 from datetime import datetime
 import traceback
@@ -9,6 +8,7 @@ import os
 import subprocess
 from tkcalendar import DateEntry
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
 
 
 # --- BIBLIOTHÈQUES POUR LE PDF ---
@@ -65,7 +65,7 @@ class PagePmtCredit(ctk.CTkToplevel):
         try:
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
-            return psycopg2.connect(**config['database'])
+            return connecter(**config['database'])
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur de connexion : {e}")
             return None
@@ -1,14 +1,16 @@
 import customtkinter as ctk
 from tkinter import messagebox, simpledialog
-import psycopg2
 import json
 from datetime import datetime
 import traceback
 import tempfile
 import os
-import subprocess
 from tkcalendar import DateEntry # Nécessite pip install tkcalendar
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+from psycopg2.extras import execute_values
+from stock_engine import appliquer_requete, reserver
+import rendu_pdf
 
 
 # --- BIBLIOTHÈQUES POUR LE PDF ---
@@ -21,6 +23,19 @@ except ImportError:
     num2words = None
 
 class PagePmtFacture(ctk.CTkToplevel):
+    # Cache tb_stock (par codearticle ou idarticle) : mise à jour, sinon création
+    SQL_SYNC_STOCK = """
+        WITH v ({cle}, idmag, qtstock) AS (VALUES %s),
+        maj AS (
+            UPDATE tb_stock s SET qtstock = v.qtstock FROM v
+            WHERE s.{cle} = v.{cle} AND s.idmag = v.idmag
+            RETURNING s.{cle}, s.idmag
+        )
+        INSERT INTO tb_stock ({cle}, idmag, qtstock, qtalert, deleted)
+        SELECT v.{cle}, v.idmag, v.qtstock, 0, 0 FROM v
+        WHERE NOT EXISTS (SELECT 1 FROM maj WHERE maj.{cle} = v.{cle} AND maj.idmag = v.idmag)
+    """
+
     def __init__(self, master, paiement_data, iduser=None):
         super().__init__(master)
         self.data = paiement_data
@@ -106,7 +121,7 @@ class PagePmtFacture(ctk.CTkToplevel):
         try:
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
-            return psycopg2.connect(**config['database'])
+            return connecter(**config['database'])
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur de connexion : {e}")
             return None
@@ -132,164 +147,6 @@ class PagePmtFacture(ctk.CTkToplevel):
         except: return ["Espèces"]
         finally: conn.close()
 
-    def calculer_stock_article_reel(self, idarticle, idunite_cible, idmag):
-        """
-        ✅ CALCUL CONSOLIDÉ DU STOCK RÉEL :
-        Relie tous les mouvements de toutes les unités (PIECE, CARTON, etc.)
-        d'un même idarticle via le coefficient 'qtunite' de tb_unite.
-        
-        Prend en compte :
-        - Réceptions (tb_livraisonfrs) → +stock
-        - Ventes (tb_ventedetail) → -stock
-        - Sorties (tb_sortiedetail) → -stock
-        - Transferts IN et OUT (tb_transfertdetail) → +/- stock
-        - Inventaires (tb_inventaire) → +stock
-        - Avoirs (tb_avoir/tb_avoirdetail.qtavoir) → +stock (annulation de vente)
-        """
-        conn = self.connect_db()
-        if not conn: return 0.0
-        
-        try:
-            cursor = conn.cursor()
-            
-            print(f"\n{'='*80}")
-            print(f"🔬 DEBUG CALCUL STOCK ARTICLE #{idarticle} - MAGASIN {idmag}")
-            print(f"{'='*80}")
-            
-            # 1. Récupérer TOUTES les unités liées à cet idarticle
-            cursor.execute("""
-                SELECT idunite, codearticle, COALESCE(qtunite, 1) 
-                FROM tb_unite 
-                WHERE idarticle = %s
-            """, (idarticle,))
-            unites_liees = cursor.fetchall()
-            
-            print(f"\n📌 Unités trouvées pour idarticle={idarticle}:")
-            for idu, code, qt_u in unites_liees:
-                print(f"   - idunite={idu}, codearticle='{code}', qtunite={qt_u}")
-            
-            # 2. Identifier le qtunite de l'unité qu'on veut afficher
-            qtunite_affichage = 1
-            codearticle_affichage = ""
-            for idu, code, qt_u in unites_liees:
-                if idu == idunite_cible:
-                    qtunite_affichage = qt_u if qt_u > 0 else 1
-                    codearticle_affichage = code
-                    break
-            
-            print(f"\n🎯 Unité d'affichage:")
-            print(f"   idunite_cible={idunite_cible}, qtunite_affichage={qtunite_affichage}, code='{codearticle_affichage}'")
-
-            total_stock_global_base = 0
-
-            # 3. Sommer les mouvements de chaque variante
-            for det_idx, (idu_boucle, code_boucle, qtunite_boucle) in enumerate(unites_liees, 1):
-                print(f"\n{'─'*80}")
-                print(f"📦 Unité #{det_idx}: idunite={idu_boucle}, code='{code_boucle}', qtunite={qtunite_boucle}")
-                print(f"{'─'*80}")
-                
-                # Réceptions
-                cursor.execute(
-                    "SELECT COALESCE(SUM(qtlivrefrs), 0) FROM tb_livraisonfrs WHERE idarticle = %s AND idunite = %s AND deleted = 0 AND idmag = %s",
-                    (idarticle, idu_boucle, idmag)
-                )
-                receptions = cursor.fetchone()[0] or 0
-                print(f"  📥 Réceptions (tb_livraisonfrs): {receptions}")
-        
-                # Ventes (UNIQUEMENT VALIDÉES - cohérent avec page_stock.py)
-                cursor.execute(
-                    """SELECT COALESCE(SUM(vd.qtvente), 0) 
-                       FROM tb_ventedetail vd 
-                       INNER JOIN tb_vente v ON vd.idvente = v.id 
-                       WHERE vd.idarticle = %s AND vd.idunite = %s AND vd.deleted = 0 
-                       AND v.deleted = 0 AND v.statut = 'VALIDEE' AND v.idmag = %s""",
-                    (idarticle, idu_boucle, idmag)
-                )
-                ventes = cursor.fetchone()[0] or 0
-                print(f"  📤 Ventes (tb_ventedetail - VALIDÉE uniquement): {ventes}")
-        
-                # Sorties
-                cursor.execute(
-                    "SELECT COALESCE(SUM(qtsortie), 0) FROM tb_sortiedetail WHERE idarticle = %s AND idunite = %s AND idmag = %s",
-                    (idarticle, idu_boucle, idmag)
-                )
-                sorties = cursor.fetchone()[0] or 0
-                print(f"  📤 Sorties (tb_sortiedetail): {sorties}")
-        
-                # Transferts IN
-                cursor.execute(
-                    "SELECT COALESCE(SUM(qttransfert), 0) FROM tb_transfertdetail WHERE idarticle = %s AND idunite = %s AND deleted = 0 AND idmagentree = %s",
-                    (idarticle, idu_boucle, idmag)
-                )
-                t_in = cursor.fetchone()[0] or 0
-                print(f"  ➡️ Transferts IN (idmagentree): {t_in}")
-                
-                # Transferts OUT
-                cursor.execute(
-                    "SELECT COALESCE(SUM(qttransfert), 0) FROM tb_transfertdetail WHERE idarticle = %s AND idunite = %s AND deleted = 0 AND idmagsortie = %s",
-                    (idarticle, idu_boucle, idmag)
-                )
-                t_out = cursor.fetchone()[0] or 0
-                print(f"  ⬅️ Transferts OUT (idmagsortie): {t_out}")
-        
-                # Inventaires
-                cursor.execute(
-                    "SELECT COALESCE(SUM(qtinventaire), 0) FROM tb_inventaire WHERE codearticle = %s AND idmag = %s",
-                    (code_boucle, idmag)
-                )
-                inv = cursor.fetchone()[0] or 0
-                print(f"  📋 Inventaires (tb_inventaire): {inv}")
-
-                # Avoirs (annulation de vente = +stock)
-                cursor.execute(
-                    """
-                    SELECT COALESCE(SUM(ad.qtavoir), 0) 
-                    FROM tb_avoirdetail ad
-                    INNER JOIN tb_avoir a ON ad.idavoir = a.id
-                    WHERE ad.idarticle = %s AND ad.idunite = %s 
-                    AND a.deleted = 0 AND ad.deleted = 0 AND ad.idmag = %s
-                    """,
-                    (idarticle, idu_boucle, idmag)
-                )
-                avoirs = cursor.fetchone()[0] or 0
-                print(f"  🔄 Avoirs/Retours (tb_avoirdetail): {avoirs}")
-
-                # Calcul du solde pour cette unité
-                solde_unite = (receptions + t_in + inv + avoirs) - (ventes + sorties + t_out)
-                print(f"\n  🧮 Formule: ({receptions} + {t_in} + {inv} + {avoirs}) - ({ventes} + {sorties} + {t_out})")
-                print(f"  = ({receptions + t_in + inv + avoirs}) - ({ventes + sorties + t_out})")
-                print(f"  = {solde_unite}")
-                
-                contribution = solde_unite * qtunite_boucle
-                print(f"  × Poids (qtunite={qtunite_boucle}) = {contribution}")
-                
-                total_stock_global_base += contribution
-
-            # 4. Conversion finale pour l'affichage
-            print(f"\n{'='*80}")
-            print(f"🔢 RÉSUMÉ CALCUL FINAL")
-            print(f"{'='*80}")
-            print(f"  Total stock global (base): {total_stock_global_base}")
-            print(f"  qtunite_affichage: {qtunite_affichage}")
-            print(f"  Calcul: {total_stock_global_base} / {qtunite_affichage}")
-            
-            stock_final = total_stock_global_base / qtunite_affichage
-            stock_affiche = max(0.0, stock_final)
-            
-            print(f"\n✅ STOCK FINAL AFFICHÉ: {stock_affiche}")
-            print(f"{'='*80}\n")
-            
-            return stock_affiche
-        
-        except Exception as e:
-            print(f"❌ Erreur calcul stock consolidé : {e}")
-            import traceback
-            traceback.print_exc()
-            return 0.0
-        finally:
-            cursor.close()
-            conn.close()
-        
     def _verifier_mode_credit(self, choix):
         """Active ou désactive le calendrier selon le mode choisi"""
         if choix.lower() == "crédit":
@@ -498,15 +355,17 @@ class PagePmtFacture(ctk.CTkToplevel):
             print(f"💵 Montant à encaisser: {montant_saisi} Ar")
             print(f"🏪 Mode de paiement: {nom_mode_pmt}")
 
-            # 1. Infos Société
-            cursor.execute("SELECT nomsociete, adressesociete, contactsociete, villesociete FROM tb_infosociete LIMIT 1")
-            info_soc = cursor.fetchone()
+            # 1. Infos Société (lues une fois par processus, cf. rendu_pdf)
+            societe = rendu_pdf.societe()
+            info_soc = (societe['nomsociete'] or "NOM SOCIÉTÉ", societe['adressesociete'],
+                        societe['contactsociete'], societe['villesociete'])
             
-            # 2. Récupérer l'idclient depuis tb_vente
-            cursor.execute("SELECT idclient, idmag FROM tb_vente WHERE refvente = %s", (self.refvente,))
+            # 2. Récupérer l'idclient depuis tb_vente (ligne verrouillée : une seule caisse valide la facture)
+            cursor.execute("SELECT idclient, idmag, statut FROM tb_vente WHERE refvente = %s FOR UPDATE", (self.refvente,))
             res_vente = cursor.fetchone()
             idclient = res_vente[0] if res_vente else None
             idmag_facture = res_vente[1] if res_vente else None
+            deja_validee = bool(res_vente) and res_vente[2] == 'VALIDEE'
             print(f"✓ ID Client: {idclient}")
             print(f"✓ Magasin: {idmag_facture}")
             
@@ -550,16 +409,6 @@ class PagePmtFacture(ctk.CTkToplevel):
             articles = cursor.fetchall()
             
             print(f"✓ Nombre d'articles trouvés: {len(articles)}")
-            for idx, art in enumerate(articles, 1):
-                idarticle, idunite, idmag, codearticle, designation, unite, qtvente, prixunit, montant = art
-                print(f"\n  Article #{idx}:")
-                print(f"    - ID Article: {idarticle}")
-                print(f"    - Code Article: '{codearticle}'")
-                print(f"    - Désignation: {designation}")
-                print(f"    - Unité: {unite}")
-                print(f"    - Quantité vendue: {qtvente}")
-                print(f"    - Prix unitaire: {prixunit}")
-                print(f"    - Magasin: {idmag}")
 
             # 6. Enregistrement du paiement avec dateecheance ET idclient
             cursor.execute("SELECT COALESCE(MAX(id),0)+1 FROM tb_pmtfacture")
@@ -597,6 +446,36 @@ class PagePmtFacture(ctk.CTkToplevel):
 
             # --- MISE A JOUR ATOMIQUE : payment + statut + stock + log ---
             try:
+                # 0) ✅ Réservation : toutes les lignes contrôlées en une requête, soldes des
+                #    articles verrouillés jusqu'au commit (deux caisses ne vendent pas le même stock)
+                #    Paiement suivant d'une facture déjà VALIDEE : son stock est déjà sorti.
+                reservations = [] if deja_validee else reserver(cursor, [(det[0], det[1], det[2], det[6]) for det in articles])
+                manques = [
+                    (det, disponible, demande)
+                    for det, (disponible, demande) in zip(articles, reservations)
+                    if demande > disponible + 1e-9
+                ]
+                if manques:
+                    detail = "\n".join(
+                        f"• {det[4]} ({det[5] or ''}) : {demande:g} demandé(s), {disponible:g} disponible(s)"
+                        for det, disponible, demande in manques
+                    )
+                    if self.charger_settings().get('ClientAPayer_BloquerStockInsuffisant', 1):
+                        conn.rollback()
+                        messagebox.showerror("Stock insuffisant", f"Validation impossible, stock insuffisant pour :\n\n{detail}")
+                        return
+                    print(f"⚠️ Stock insuffisant (validation autorisée par les paramètres) :\n{detail}")
+
+                # 0 bis) Solde de stock (tb_stock_solde) : la vente ne sort du stock qu'au passage
+                #    à VALIDEE, on applique donc le delta avant de changer le statut
+                appliquer_requete(cursor, """
+                    SELECT vd.idarticle, vd.idunite, v.idmag, vd.qtvente
+                    FROM tb_ventedetail vd
+                    JOIN tb_vente v ON v.id = vd.idvente
+                    WHERE v.refvente = %s AND v.deleted = 0 AND vd.deleted = 0
+                      AND v.statut IS DISTINCT FROM 'VALIDEE'
+                """, (self.refvente,), signe=-1)
+
                 # 1) Mettre à jour tb_pmtfacture (déjà inséré), puis tb_vente.statut = 'VALIDEE'
                 query_update_vente = """
                     UPDATE tb_vente 
@@ -613,61 +492,38 @@ class PagePmtFacture(ctk.CTkToplevel):
                 print(f"📦 ÉTAPE 4 : MISE À JOUR DU STOCK")
                 print(f"{'='*70}")
 
-                # 2) Mettre à jour le stock et journaliser
-                for det_idx, det in enumerate(articles, 1):
-                    idarticle = det[0]
-                    idunite = det[1]
-                    idmag = det[2]
-                    codearticle = det[3] or ''
-                    designation = det[4]
-                    qtvente = float(det[6] or 0)
-
-                    print(f"\n  🔄 Article #{det_idx}: {designation}")
-                    print(f"     ID: {idarticle}, Code: '{codearticle}', Magasin: {idmag}, Qté vendue: {qtvente}")
-
-                    # 🎯 UTILISER LE CALCUL CONSOLIDÉ DU STOCK RÉEL
-                    stock_reel = self.calculer_stock_article_reel(idarticle, idunite, idmag)
-                    ancien_stock = stock_reel
-                    print(f"     ✓ Stock RÉEL (consolidé): {ancien_stock}")
-                    
-                    nouveau_stock = ancien_stock - qtvente
-                    print(f"     📊 Calcul: {ancien_stock} - {qtvente} = {nouveau_stock}")
-
-                    # ⚠️ TODO: Vérification disponibilité (empêche validation si stock insuffisant) - À DÉVELOPPER
-                    # if ancien_stock < qtvente:
-                    #     print(f"     ❌ ERREUR: Stock insuffisant!")
-                    #     conn.rollback()
-                    #     messagebox.showerror("Stock insuffisant", f"Stock insuffisant pour l'article {codearticle or idarticle} (mag {idmag}). Ancien: {ancien_stock}, demandé: {qtvente}")
-                    #     return
-
-                    # Mise à jour du stock dans tb_stock (synchronisation du cache)
+                # 2) Cache tb_stock et journal, en lots : stock avant la vente (réservation)
+                #    moins la demande de l'article dans le magasin, dans l'unité de la ligne
+                stock_code, stock_article_mag, journal = {}, {}, []
+                for det, (ancien_stock, demande) in zip(articles, reservations):
+                    idarticle, _, idmag, codearticle = det[0], det[1], det[2], det[3] or ''
                     if codearticle:
-                        cursor.execute("UPDATE tb_stock SET qtstock = %s WHERE codearticle = %s AND idmag = %s", (nouveau_stock, codearticle, idmag))
-                        cursor.execute("SELECT COUNT(*) FROM tb_stock WHERE codearticle = %s AND idmag = %s", (codearticle, idmag))
-                        if cursor.fetchone()[0] == 0:
-                            cursor.execute("INSERT INTO tb_stock (codearticle, idmag, qtstock, qtalert, deleted) VALUES (%s, %s, %s, 0, 0)", (codearticle, idmag, nouveau_stock))
-                        print(f"     ✓ SYNC tb_stock avec codearticle='{codearticle}': qtstock={nouveau_stock}")
+                        stock_code[(codearticle, idmag)] = ancien_stock - demande
                     else:
-                        cursor.execute("UPDATE tb_stock SET qtstock = %s WHERE idarticle = %s AND idmag = %s", (nouveau_stock, idarticle, idmag))
-                        cursor.execute("SELECT COUNT(*) FROM tb_stock WHERE idarticle = %s AND idmag = %s", (idarticle, idmag))
-                        if cursor.fetchone()[0] == 0:
-                            cursor.execute("INSERT INTO tb_stock (idarticle, idmag, qtstock, qtalert, deleted) VALUES (%s, %s, %s, 0, 0)", (idarticle, idmag, nouveau_stock))
-                        print(f"     ✓ SYNC tb_stock avec idarticle={idarticle}: qtstock={nouveau_stock}")
-
-                    # Insérer le log de stock
+                        stock_article_mag[(idarticle, idmag)] = ancien_stock - demande
+                    journal.append((codearticle or None, idmag, ancien_stock,
+                                    ancien_stock - float(det[6] or 0), self.iduser, f"VENTE {self.refvente}"))
+
+                if stock_code:
+                    execute_values(cursor, self.SQL_SYNC_STOCK.format(cle="codearticle"),
+                                   [(c, m, q) for (c, m), q in stock_code.items()],
+                                   template="(%s, %s::int, %s::numeric)", page_size=len(stock_code))
+                if stock_article_mag:
+                    execute_values(cursor, self.SQL_SYNC_STOCK.format(cle="idarticle"),
+                                   [(a, m, q) for (a, m), q in stock_article_mag.items()],
+                                   template="(%s::int, %s::int, %s::numeric)", page_size=len(stock_article_mag))
+
+                # Insérer le journal de stock
+                if journal:
                     try:
                         cursor.execute("SELECT setval(pg_get_serial_sequence('tb_log_stock', 'id'), COALESCE((SELECT MAX(id) FROM tb_log_stock), 0) + 1, false);")
                     except Exception:
                         pass
-
-                    cursor.execute(
-                        """
-                        INSERT INTO tb_log_stock (codearticle, idmag, ancien_stock, nouveau_stock, iduser, type_action, date_action) 
-                        VALUES (%s, %s, %s, %s, %s, %s, NOW())
-                        """,
-                        (codearticle if codearticle else None, idmag, ancien_stock, nouveau_stock, self.iduser, f"VENTE {self.refvente}")
-                    )
-                    print(f"     📋 Log enregistré: ancien={ancien_stock}, nouveau={nouveau_stock}")
+                    execute_values(cursor, """
+                        INSERT INTO tb_log_stock (codearticle, idmag, ancien_stock, nouveau_stock, iduser, type_action, date_action)
+                        VALUES %s
+                    """, journal, template="(%s, %s, %s, %s, %s, %s, NOW())", page_size=len(journal))
+                print(f"✓ Stock et journal mis à jour ({len(journal)} ligne(s))")
 
                 # Commit global (paiement + update vente + stock + log)
                 conn.commit()
@@ -755,179 +611,177 @@ class PagePmtFacture(ctk.CTkToplevel):
         return lignes if lignes else [""]
 
     def _generer_ticket_pdf(self, info_soc, username, articles, montant_paye, mode_paiement, refpmt, date_echeance=None, imprimer_ticket=1):
-        """Génère un ticket de paiement PDF au format 80mm"""
-        try:
-            # Création fichier temporaire
-            temp_dir = tempfile.gettempdir()
-            filename = os.path.join(temp_dir, f"Paiement_{self.refvente}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
-            
-            # Dimensions ticket (80mm de large)
-            largeur = 80 * mm
-            hauteur = 297 * mm  # Hauteur variable
-            
-            c = canvas.Canvas(filename, pagesize=(largeur, hauteur))
-            
-            # Position Y de départ
-            y = hauteur - 10*mm
-            
-            # --- EN-TÊTE SOCIÉTÉ (centré) ---
-            c.setFont("Helvetica-Bold", 10)
-            nom_societe = info_soc[0] if info_soc else "NOM SOCIÉTÉ"
-            c.drawCentredString(largeur/2, y, nom_societe)
-            y -= 4*mm
-            
-            c.setFont("Helvetica", 8)
-            adresse = info_soc[1] if info_soc and len(info_soc) > 1 else ""
-            if adresse:
-                c.drawCentredString(largeur/2, y, adresse)
-                y -= 3.5*mm
-            
-            contact = info_soc[2] if info_soc and len(info_soc) > 2 else ""
-            if contact:
-                c.drawCentredString(largeur/2, y, f"Tél: {contact}")
-                y -= 3.5*mm
-            
-            ville = info_soc[3] if info_soc and len(info_soc) > 3 else ""
-            if ville:
-                c.drawCentredString(largeur/2, y, ville)
-                y -= 5*mm
-            
-            # Ligne de séparation
-            c.line(5*mm, y, largeur - 5*mm, y)
+        """
+        Génère un ticket de paiement PDF au format 80mm dans le pool de rendu_pdf :
+        la fenêtre de paiement se ferme sans attendre le rendu.
+        """
+        temp_dir = tempfile.gettempdir()
+        filename = os.path.join(temp_dir, f"Paiement_{self.refvente}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
+
+        def termine(chemin):
+            if imprimer_ticket == 1:
+                print(f"✅ Ticket de caisse ouvert : {chemin}")
+            else:
+                print(f"📄 Ticket de caisse généré (impression désactivée) : {chemin}")
+
+        rendu_pdf.rendre(
+            self, filename,
+            lambda: self._dessiner_ticket_pdf(filename, info_soc, username, articles, montant_paye,
+                                              mode_paiement, refpmt, date_echeance),
+            ouvrir_apres=imprimer_ticket == 1, rappel=termine
+        )
+
+    def _dessiner_ticket_pdf(self, filename, info_soc, username, articles, montant_paye, mode_paiement, refpmt, date_echeance=None):
+        """Dessine le ticket de paiement (thread de rendu : aucun accès aux widgets)."""
+        # Dimensions ticket (80mm de large)
+        largeur = 80 * mm
+        hauteur = 297 * mm  # Hauteur variable
+        
+        c = canvas.Canvas(filename, pagesize=(largeur, hauteur))
+        
+        # Position Y de départ
+        y = hauteur - 10*mm
+        
+        # --- EN-TÊTE SOCIÉTÉ (centré) ---
+        c.setFont("Helvetica-Bold", 10)
+        nom_societe = info_soc[0] if info_soc else "NOM SOCIÉTÉ"
+        c.drawCentredString(largeur/2, y, nom_societe)
+        y -= 4*mm
+        
+        c.setFont("Helvetica", 8)
+        adresse = info_soc[1] if info_soc and len(info_soc) > 1 else ""
+        if adresse:
+            c.drawCentredString(largeur/2, y, adresse)
+            y -= 3.5*mm
+        
+        contact = info_soc[2] if info_soc and len(info_soc) > 2 else ""
+        if contact:
+            c.drawCentredString(largeur/2, y, f"Tél: {contact}")
+            y -= 3.5*mm
+        
+        ville = info_soc[3] if info_soc and len(info_soc) > 3 else ""
+        if ville:
+            c.drawCentredString(largeur/2, y, ville)
             y -= 5*mm
+        
+        # Ligne de séparation
+        c.line(5*mm, y, largeur - 5*mm, y)
+        y -= 5*mm
+        
+        # --- TITRE ---
+        c.setFont("Helvetica-Bold", 11)
+        c.drawCentredString(largeur/2, y, "REÇU DE PAIEMENT")
+        y -= 5*mm
+        
+        # --- INFORMATIONS PAIEMENT ---
+        c.setFont("Helvetica", 8)
+        c.drawString(5*mm, y, f"Réf. Paiement: {refpmt}")
+        y -= 4*mm
+        c.drawString(5*mm, y, f"Facture N°: {self.refvente}")
+        y -= 4*mm
+        c.drawString(5*mm, y, f"Date: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+        y -= 4*mm
+        c.drawString(5*mm, y, f"Client: {self.client}")
+        y -= 4*mm
+        c.drawString(5*mm, y, f"Utilisateur: {username}")
+        y -= 5*mm
+        
+        # Ligne de séparation
+        c.line(5*mm, y, largeur - 5*mm, y)
+        y -= 5*mm
+        
+        # --- DÉTAILS ARTICLES (avec gestion du texte long) ---
+        c.setFont("Helvetica-Bold", 8)
+        c.drawString(5*mm, y, "DÉTAILS")
+        y -= 4*mm
+        
+        c.setFont("Helvetica", 7)
+        total_calcule = 0
+        
+        for article in articles:
+            code, designation, unite, qte, prix_unit, montant = article
+            total_calcule += float(montant)
+            
+            # Couper la désignation si trop longue (max 30 caractères par ligne)
+            lignes_designation = self._couper_texte(designation, 30)
+            
+            # Première ligne : désignation
+            for i, ligne in enumerate(lignes_designation):
+                c.drawString(5*mm, y, ligne)
+                y -= 3.5*mm
             
-            # --- TITRE ---
-            c.setFont("Helvetica-Bold", 11)
-            c.drawCentredString(largeur/2, y, "REÇU DE PAIEMENT")
-            y -= 5*mm
+            # Détails quantité et prix
+            detail_qte = f"{qte} {unite or 'unité'} × {prix_unit:.2f} Ar"
+            c.drawString(7*mm, y, detail_qte)
+            y -= 3.5*mm
             
-            # --- INFORMATIONS PAIEMENT ---
-            c.setFont("Helvetica", 8)
-            c.drawString(5*mm, y, f"Réf. Paiement: {refpmt}")
-            y -= 4*mm
-            c.drawString(5*mm, y, f"Facture N°: {self.refvente}")
-            y -= 4*mm
-            c.drawString(5*mm, y, f"Date: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
-            y -= 4*mm
-            c.drawString(5*mm, y, f"Client: {self.client}")
-            y -= 4*mm
-            c.drawString(5*mm, y, f"Utilisateur: {username}")
+            # Montant (aligné à droite)
+            montant_str = f"{montant:,.2f} Ar".replace(',', ' ')
+            c.drawRightString(largeur - 5*mm, y, montant_str)
             y -= 5*mm
             
-            # Ligne de séparation
-            c.line(5*mm, y, largeur - 5*mm, y)
-            y -= 5*mm
-            
-            # --- DÉTAILS ARTICLES (avec gestion du texte long) ---
-            c.setFont("Helvetica-Bold", 8)
-            c.drawString(5*mm, y, "DÉTAILS")
-            y -= 4*mm
-            
-            c.setFont("Helvetica", 7)
-            total_calcule = 0
-            
-            for article in articles:
-                code, designation, unite, qte, prix_unit, montant = article
-                total_calcule += float(montant)
-                
-                # Couper la désignation si trop longue (max 30 caractères par ligne)
-                lignes_designation = self._couper_texte(designation, 30)
+            # Vérifier si on a assez de place, sinon nouvelle page
+            if y < 50*mm:
+                c.showPage()
+                y = hauteur - 10*mm
+                c.setFont("Helvetica", 7)
+        
+        # Ligne de séparation
+        c.line(5*mm, y, largeur - 5*mm, y)
+        y -= 5*mm
+        
+        # --- MONTANT TOTAL ---
+        c.setFont("Helvetica-Bold", 10)
+        c.drawString(5*mm, y, "MONTANT TOTAL:")
+        montant_total_str = f"{total_calcule:,.2f} Ar".replace(',', ' ')
+        c.drawRightString(largeur - 5*mm, y, montant_total_str)
+        y -= 6*mm
+        
+        # --- MONTANT PAYÉ ---
+        c.setFont("Helvetica-Bold", 10)
+        c.drawString(5*mm, y, "MONTANT PAYÉ:")
+        montant_paye_str = f"{montant_paye:,.2f} Ar".replace(',', ' ')
+        c.drawRightString(largeur - 5*mm, y, montant_paye_str)
+        y -= 6*mm
+        
+        # --- MODE DE PAIEMENT ---
+        c.setFont("Helvetica", 9)
+        c.drawString(5*mm, y, f"Mode de paiement: {mode_paiement}")
+        y -= 5*mm
+        
+        # --- DATE D'ÉCHÉANCE (si mode crédit) ---
+        if mode_paiement.lower() == "crédit" and date_echeance:
+            c.setFont("Helvetica-Bold", 9)
+            c.drawString(5*mm, y, f"Échéance: {date_echeance.strftime('%d/%m/%Y')}")
+            y -= 6*mm
+        
+        # Ligne de séparation
+        c.line(5*mm, y, largeur - 5*mm, y)
+        y -= 5*mm
+        
+        # --- MONTANT EN LETTRES (optionnel si num2words disponible) ---
+        if num2words:
+            try:
+                montant_lettres = num2words(montant_paye, lang='fr') + " Ariary"
+                c.setFont("Helvetica-Oblique", 7)
+                c.drawString(5*mm, y, "Arrêté le présent reçu à la somme de:")
+                y -= 3.5*mm
                 
-                # Première ligne : désignation
-                for i, ligne in enumerate(lignes_designation):
+                # Couper le montant en lettres si trop long
+                lignes_montant = self._couper_texte(montant_lettres, 35)
+                for ligne in lignes_montant:
                     c.drawString(5*mm, y, ligne)
                     y -= 3.5*mm
                 
-                # Détails quantité et prix
-                detail_qte = f"{qte} {unite or 'unité'} × {prix_unit:.2f} Ar"
-                c.drawString(7*mm, y, detail_qte)
-                y -= 3.5*mm
-                
-                # Montant (aligné à droite)
-                montant_str = f"{montant:,.2f} Ar".replace(',', ' ')
-                c.drawRightString(largeur - 5*mm, y, montant_str)
-                y -= 5*mm
-                
-                # Vérifier si on a assez de place, sinon nouvelle page
-                if y < 50*mm:
-                    c.showPage()
-                    y = hauteur - 10*mm
-                    c.setFont("Helvetica", 7)
-            
-            # Ligne de séparation
-            c.line(5*mm, y, largeur - 5*mm, y)
-            y -= 5*mm
-            
-            # --- MONTANT TOTAL ---
-            c.setFont("Helvetica-Bold", 10)
-            c.drawString(5*mm, y, "MONTANT TOTAL:")
-            montant_total_str = f"{total_calcule:,.2f} Ar".replace(',', ' ')
-            c.drawRightString(largeur - 5*mm, y, montant_total_str)
-            y -= 6*mm
-            
-            # --- MONTANT PAYÉ ---
-            c.setFont("Helvetica-Bold", 10)
-            c.drawString(5*mm, y, "MONTANT PAYÉ:")
-            montant_paye_str = f"{montant_paye:,.2f} Ar".replace(',', ' ')
-            c.drawRightString(largeur - 5*mm, y, montant_paye_str)
-            y -= 6*mm
-            
-            # --- MODE DE PAIEMENT ---
-            c.setFont("Helvetica", 9)
-            c.drawString(5*mm, y, f"Mode de paiement: {mode_paiement}")
-            y -= 5*mm
-            
-            # --- DATE D'ÉCHÉANCE (si mode crédit) ---
-            if mode_paiement.lower() == "crédit" and date_echeance:
-                c.setFont("Helvetica-Bold", 9)
-                c.drawString(5*mm, y, f"Échéance: {date_echeance.strftime('%d/%m/%Y')}")
-                y -= 6*mm
-            
-            # Ligne de séparation
-            c.line(5*mm, y, largeur - 5*mm, y)
-            y -= 5*mm
-            
-            # --- MONTANT EN LETTRES (optionnel si num2words disponible) ---
-            if num2words:
-                try:
-                    montant_lettres = num2words(montant_paye, lang='fr') + " Ariary"
-                    c.setFont("Helvetica-Oblique", 7)
-                    c.drawString(5*mm, y, "Arrêté le présent reçu à la somme de:")
-                    y -= 3.5*mm
-                    
-                    # Couper le montant en lettres si trop long
-                    lignes_montant = self._couper_texte(montant_lettres, 35)
-                    for ligne in lignes_montant:
-                        c.drawString(5*mm, y, ligne)
-                        y -= 3.5*mm
-                    
-                    y -= 2*mm
-                except:
-                    pass
-            
-            # --- PIED DE PAGE ---
-            y -= 5*mm
-            c.setFont("Helvetica", 7)
-            c.drawCentredString(largeur/2, y, "Merci de votre confiance !")
-            y -= 4*mm
-            c.drawCentredString(largeur/2, y, f"Document généré le {datetime.now().strftime('%d/%m/%Y à %H:%M')}")
-            
-            # Sauvegarder et ouvrir
-            c.save()
-            
-            # Ouvrir le PDF seulement si l'impression est activée
-            if imprimer_ticket == 1:
-                try:
-                    if os.name == 'nt':  # Windows
-                        os.startfile(filename)
-                    elif os.name == 'posix':  # Linux/Mac
-                        subprocess.call(['xdg-open', filename])
-                    print(f"✅ Ticket de caisse ouvert : {filename}")
-                except Exception as e:
-                    print(f"⚠️ Erreur lors de l'ouverture du PDF : {e}")
-            else:
-                print(f"📄 Ticket de caisse généré (impression désactivée) : {filename}")
-            
-        except Exception as e:
-            messagebox.showerror("Erreur PDF", f"Erreur lors de la génération du PDF : {e}")
-            traceback.print_exc()
+                y -= 2*mm
+            except:
+                pass
+        
+        # --- PIED DE PAGE ---
+        y -= 5*mm
+        c.setFont("Helvetica", 7)
+        c.drawCentredString(largeur/2, y, "Merci de votre confiance !")
+        y -= 4*mm
+        c.drawCentredString(largeur/2, y, f"Document généré le {datetime.now().strftime('%d/%m/%Y à %H:%M')}")
+        
+        c.save()
@@ -9,6 +9,7 @@ import tempfile
 import os
 import subprocess
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
 
 
 # Importation pour la génération PDF
@@ -70,7 +71,7 @@ class PagePmtFrs(ctk.CTkToplevel):
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
                 db_config = config['database']
-            conn = psycopg2.connect(**db_config)
+            conn = connecter(**db_config)
             return conn
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur de connexion : {e}")
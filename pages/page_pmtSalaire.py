@@ -1,7 +1,6 @@
 import customtkinter as ctk
 import tkinter.messagebox as messagebox
 from datetime import datetime
-import psycopg2
 import pandas as pd
 from reportlab.lib.pagesizes import A5, landscape, letter
 from reportlab.pdfgen import canvas
@@ -11,6 +10,7 @@ from decimal import Decimal, InvalidOperation
 import json
 import sys
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
 
 
 # Configuration du chemin pour les imports
@@ -38,7 +38,7 @@ class DatabaseManager:
     def connect(self):
         if self.db_params is None: return False
         try:
-            self.conn = psycopg2.connect(**self.db_params)
+            self.conn = connecter_page(None, **self.db_params)
             self.cursor = self.conn.cursor()
             return True
         except Exception as e:
@@ -1,13 +1,13 @@
 import customtkinter as ctk
 from tkinter import ttk, messagebox, Toplevel
 from datetime import datetime
-import psycopg2
 import pandas as pd
 import os
 from tkcalendar import Calendar
 import json
 import sys
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
 
 
 # Configuration des chemins
@@ -36,7 +36,7 @@ class DatabaseManager:
     def connect(self):
         if self.db_params is None: return False
         try:
-            self.conn = psycopg2.connect(**self.db_params)
+            self.conn = connecter_page(None, **self.db_params)
             return True
         except Exception as e:
             print(f"Erreur connexion: {e}")
@@ -1,6 +1,8 @@
 import customtkinter as ctk
 from tkinter import ttk, messagebox
 import psycopg2
+from db_pool import connecter
+from recherche_index import filtre_articles
 import json
 import threading
 
@@ -161,7 +163,7 @@ class PagePrixListe(ctk.CTkFrame):
             with open('config.json', 'r', encoding='utf-8') as f:
                 config = json.load(f)
                 db_config = config.get('database', {})
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config.get('host'),
                 user=db_config.get('user'),
                 password=db_config.get('password'),
@@ -195,7 +197,7 @@ class PagePrixListe(ctk.CTkFrame):
         """
         Charger les données :
         - si search_term non vide => recherche flexible
-        - elif self.code_article fourni => filtrage exact sur code article (LPAD 10)
+        - elif self.code_article fourni => filtrage exact sur code article (LPAD 10, indexé)
         - sinon => lister tout
         """
         conn = self.connect_db()
@@ -232,17 +234,15 @@ class PagePrixListe(ctk.CTkFrame):
             params = []
 
             if search_term:
-                # recherche insensible à la casse pour designation/unite, codearticle et prix (text)
-                query += """
-                AND (
-                    LPAD(u.codearticle::TEXT, 10, '0') LIKE %s OR
-                    LOWER(a.designation) LIKE LOWER(%s) OR
-                    LOWER(u.designationunite) LIKE LOWER(%s) OR
-                    COALESCE(prix_recent.prix, 0)::TEXT LIKE %s
-                )
-                """
-                pattern = f"%{search_term}%"
-                params = [pattern, pattern, pattern, pattern]
+                # Filtre indexé (trigrammes, sans accents) sur désignation/code,
+                # ou prix exact si le terme est un nombre
+                filtre, params = filtre_articles(cursor, search_term)
+                try:
+                    prix = float(search_term.replace(" ", "").replace(",", "."))
+                except ValueError:
+                    prix = None
+                query += f" AND ({filtre} OR COALESCE(prix_recent.prix, 0) = %s)"
+                params.append(prix)
                 cursor.execute(query + " ORDER BY a.designation ASC, u.codearticle ASC", params)
 
             elif self.code_article:
@@ -4,6 +4,7 @@ import psycopg2
 from datetime import datetime
 import json
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
 
 
 class PagePrixSaisie(ctk.CTkFrame):
@@ -192,7 +193,7 @@ class PagePrixSaisie(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -6,6 +6,10 @@ from datetime import datetime
 from html import escape
 from math import floor
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+from recherche_async import ControleurRecherche
+from catalogue_cache import catalogue
+import numerotation
 
 
 # --- IMPORTS REPORTLAB POUR PDF ---
@@ -160,7 +164,7 @@ class PageCommandeCli(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -620,28 +624,8 @@ class PageCommandeCli(ctk.CTkFrame):
             
         try:
             cursor = conn.cursor()
-            annee_courante = datetime.now().year
-            
-            query = """
-                SELECT refprof FROM tb_proforma 
-                WHERE refprof LIKE %s 
-                ORDER BY refprof DESC LIMIT 1
-            """
-            cursor.execute(query, (f"{annee_courante}-PRO-%",))
-            resultat = cursor.fetchone()
-            
-            if resultat:
-                # Extraire le numéro après "PRO-"
-                dernier_num = int(resultat[0].split('-')[-1])
-                nouveau_num = dernier_num + 1
-            else:
-                nouveau_num = 1
-            
-            reference = f"{annee_courante}-PRO-{nouveau_num:05d}"
-            self.entry_ref.configure(state="normal")
-            self.entry_ref.delete(0, "end")
-            self.entry_ref.insert(0, reference)
-            self.entry_ref.configure(state="readonly")
+            # ✅ Aperçu : la référence définitive est attribuée à l'enregistrement
+            self.afficher_reference(numerotation.apercu(cursor, "PRO"))
             
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur lors de la génération de la référence: {str(e)}")
@@ -649,6 +633,12 @@ class PageCommandeCli(ctk.CTkFrame):
             if 'cursor' in locals() and cursor: cursor.close()
             if conn: conn.close()
     
+    def afficher_reference(self, reference):
+        self.entry_ref.configure(state="normal")
+        self.entry_ref.delete(0, "end")
+        self.entry_ref.insert(0, reference)
+        self.entry_ref.configure(state="readonly")
+
     def charger_Clients(self):
         """Charge la liste des clients"""
         conn = self.connect_db()
@@ -1153,51 +1143,36 @@ class PageCommandeCli(ctk.CTkFrame):
         label_count = ctk.CTkLabel(main_frame, text="Nombre d'articles : 0")
         label_count.pack(pady=5)
         
-        def charger_articles(filtre=""):
+        def requete_articles(cursor, filtre):
+            # Filtrage local du cache catalogue : article et ses unités
+            return [
+                (l.idarticle, l.codearticle, l.designation, l.designationunite, l.idunite)
+                for l in catalogue().rechercher(filtre)
+            ]
+
+        def afficher_articles(resultats, filtre):
             for item in tree.get_children():
                 tree.delete(item)
+
+            for row in resultats:
+                if len(row) >= 5:
+                    # row: [idarticle, codearticle, designation, designationunite, idunite]
+                    # Insertion de 5 valeurs: ID_Article, ID_Unite, Code, Désignation, Unité
+                    tree.insert('', 'end', values=(row[0], row[4], row[1], row[2], row[3])) 
             
-            conn = self.connect_db()
-            if not conn:
-                return
-            
-            try:
-                cursor = conn.cursor()
-                # La requête retourne l'article et son unité de base/de commande
-                query = """
-                    SELECT T2."idarticle", T1."codearticle", T2."designation", T1."designationunite", T1."idunite" 
-                    FROM tb_unite AS T1 
-                    INNER JOIN tb_article AS T2 ON T1.idarticle = T2.idarticle
-                    WHERE T2."deleted" = 0 
-                """
-                params = []
-                if filtre:
-                    query += """ AND (
-                        LOWER(T1."codearticle") LIKE LOWER(%s) OR 
-                        LOWER(T2."designation") LIKE LOWER(%s)
-                    )"""
-                    params = [f"%{filtre}%", f"%{filtre}%"]
-                
-                query += " ORDER BY T2.\"designation\" ASC, T1.\"codearticle\" ASC"
-                cursor.execute(query, params)
-                resultats = cursor.fetchall()
-                
-                for row in resultats:
-                    if len(row) >= 5:
-                        # row: [idarticle, codearticle, designation, designationunite, idunite]
-                        # Insertion de 5 valeurs: ID_Article, ID_Unite, Code, Désignation, Unité
-                        tree.insert('', 'end', values=(row[0], row[4], row[1], row[2], row[3])) 
-                
-                label_count.configure(text=f"Nombre d'articles : {len(resultats)}")
-                
-            except Exception as e:
-                messagebox.showerror("Erreur", f"Erreur lors du chargement des articles: {str(e)}")
-            finally:
-                if 'cursor' in locals() and cursor: cursor.close()
-                if conn: conn.close()
+            label_count.configure(text=f"Nombre d'articles : {len(resultats)}")
+
+        # Recherche en arrière-plan avec anti-rebond (ControleurRecherche), sans base
+        recherche = ControleurRecherche(
+            fenetre_recherche, requete_articles, afficher_articles, avec_base=False,
+            erreur=lambda e: messagebox.showerror("Erreur", f"Erreur lors du chargement des articles: {str(e)}")
+        )
+
+        def charger_articles(filtre=""):
+            recherche.lancer(filtre)
         
         def rechercher(*args):
-            charger_articles(entry_search.get())
+            recherche.declencher(entry_search.get())
         
         entry_search.bind('<KeyRelease>', rechercher)
         
@@ -1447,6 +1422,8 @@ class PageCommandeCli(ctk.CTkFrame):
                 
             else:
                 # Mode Création (INSERT)
+                # ✅ Référence attribuée dans la transaction (unique même entre postes)
+                self.afficher_reference(numerotation.prochaine_reference(cursor, "PRO"))
                 
                 # --- MODIFICATION: Ajout du statut dans l'INSERT de la commande principale ---
                 query_commande = """
@@ -11,6 +11,7 @@ import tkinter.ttk as ttk  # Import ttk
 import json
 import sys
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
 
 
 # Ensure the parent directory is in the Python path for absolute imports
@@ -53,7 +54,8 @@ class DatabaseManager:
             return False
 
         try:
-            self.conn = psycopg2.connect(
+            self.conn = connecter_page(
+                None,
                 host=self.db_params['host'],
                 user=self.db_params['user'],
                 password=self.db_params['password'],
@@ -233,7 +235,8 @@ class Salaire(ctk.CTkFrame):  # ou autre base selon votre structure
             config = json.loads(config_content)
             db_config = config['database']
 
-            return psycopg2.connect(
+            return connecter_page(
+                self,
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
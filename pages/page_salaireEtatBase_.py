@@ -1,7 +1,6 @@
 import customtkinter as ctk
 import tkinter.messagebox as messagebox
 from datetime import datetime
-import psycopg2
 import pandas as pd
 from reportlab.lib.pagesizes import letter, landscape
 from reportlab.pdfgen import canvas
@@ -11,6 +10,7 @@ import tkinter.ttk as ttk
 import json
 import sys
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter_page
 
 
 # Ensure the parent directory is in the Python path for absolute imports
@@ -40,7 +40,8 @@ class DatabaseManager:
         """Establishes a new database connection."""
         if self.db_params is None: return False
         try:
-            self.conn = psycopg2.connect(
+            self.conn = connecter_page(
+                None,
                 host=self.db_params['host'],
                 user=self.db_params['user'],
                 password=self.db_params['password'],
@@ -8,6 +8,7 @@ import threading
 import json
 import sys
 from resource_utils import get_config_path, safe_file_read
+from db_pool import fermer_pools
 
 
 # Ensure the parent directory is in the Python path for absolute imports
@@ -205,6 +206,8 @@ class PageSauvegarde(ctk.CTkFrame):
 
     def terminate_all_db_connections(self, dbname_to_terminate):
         conn_sys = None
+        # Les connexions inactives du pool partagé sont fermées proprement d'abord
+        fermer_pools()
         try:
             conn_sys = psycopg2.connect(
                 dbname="postgres",
@@ -5,11 +5,16 @@ import json
 from datetime import datetime
 import calendar 
 from typing import Optional, Dict, Any, List
-import traceback 
 import os
 import sys
 import subprocess
 from resource_utils import get_config_path, get_session_path, safe_file_read
+from db_pool import connecter
+from stock_engine import stock_article, appliquer_mouvements, soldes_base_par_magasin
+from catalogue_cache import catalogue
+from recherche_async import ControleurRecherche
+import rendu_pdf
+import numerotation
 
 
 # --- NOUVELLES IMPORTATIONS POUR L'IMPRESSION ---
@@ -64,8 +69,6 @@ class PageSortie(ctk.CTkFrame):
         self.generer_reference()
         self.charger_magasins()
         self.charger_infos_societe() # Charger les infos société
-        # Initialisation de la connexion pour enregistrer (sera refaite dans enregistrer_sortie)
-        self.conn = self.connect_db() 
 
     def connect_db(self):
         """Connexion à la base de données PostgreSQL (Méthode fournie par l'utilisateur)"""
@@ -74,7 +77,7 @@ class PageSortie(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -109,123 +112,15 @@ class PageSortie(ctk.CTkFrame):
 
     def calculer_stock_article(self, idarticle, idunite_cible, idmag=None):
         """
-        ✅ CALCUL CONSOLIDÉ (identique à page_stock) :
-        Relie tous les mouvements de toutes les unités (PIECE, CARTON, etc.)
-        d'un même idarticle via le coefficient 'qtunite' de tb_unite.
-        Tous les mouvements sont convertis en "unité de base", sommés dans un
-        réservoir commun par magasin, puis divisés par le qtunite de l'unité cible.
+        ✅ CALCUL CONSOLIDÉ via le moteur partagé (stock_engine) :
+        réservoir commun en unité de base sur les 10 sources de mouvements,
+        divisé par le qtunite de l'unité cible. Une seule requête ensembliste.
         """
-        conn = self.connect_db()
-        if not conn:
-            return 0
-
         try:
-            cursor = conn.cursor()
-
-            # 1. Récupérer TOUTES les unités liées à cet idarticle
-            cursor.execute("""
-                SELECT idunite, codearticle, COALESCE(qtunite, 1) 
-                FROM tb_unite 
-                WHERE idarticle = %s
-            """, (idarticle,))
-            unites_liees = cursor.fetchall()
-
-            # 2. Identifier le qtunite de l'unité qu'on veut afficher
-            qtunite_affichage = 1
-            for idu, code, qt_u in unites_liees:
-                if idu == idunite_cible:
-                    qtunite_affichage = qt_u if qt_u > 0 else 1
-                    break
-
-            total_stock_global_base = 0  # Le "réservoir" total en unité de base (qtunite=1)
-
-            # 3. Sommer les mouvements de chaque variante
-            for idu_boucle, code_boucle, qtunite_boucle in unites_liees:
-                # Réceptions
-                q_rec = "SELECT COALESCE(SUM(qtlivrefrs), 0) FROM tb_livraisonfrs WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_rec = [idarticle, idu_boucle]
-                if idmag:
-                    q_rec += " AND idmag = %s"
-                    p_rec.append(idmag)
-                cursor.execute(q_rec, p_rec)
-                receptions = cursor.fetchone()[0] or 0
-
-                # Ventes
-                q_ven = "SELECT COALESCE(SUM(qtvente), 0) FROM tb_ventedetail WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_ven = [idarticle, idu_boucle]
-                if idmag:
-                    q_ven += " AND idmag = %s"
-                    p_ven.append(idmag)
-                cursor.execute(q_ven, p_ven)
-                ventes = cursor.fetchone()[0] or 0
-
-                # Sorties
-                q_sort = "SELECT COALESCE(SUM(qtsortie), 0) FROM tb_sortiedetail WHERE idarticle = %s AND idunite = %s"
-                p_sort = [idarticle, idu_boucle]
-                if idmag:
-                    q_sort += " AND idmag = %s"
-                    p_sort.append(idmag)
-                cursor.execute(q_sort, p_sort)
-                sorties = cursor.fetchone()[0] or 0
-
-                # Transferts entrants
-                q_tin = "SELECT COALESCE(SUM(qttransfert), 0) FROM tb_transfertdetail WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_tin = [idarticle, idu_boucle]
-                if idmag:
-                    q_tin += " AND idmagentree = %s"
-                    p_tin.append(idmag)
-                cursor.execute(q_tin, p_tin)
-                t_in = cursor.fetchone()[0] or 0
-
-                # Transferts sortants
-                q_tout = "SELECT COALESCE(SUM(qttransfert), 0) FROM tb_transfertdetail WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_tout = [idarticle, idu_boucle]
-                if idmag:
-                    q_tout += " AND idmagsortie = %s"
-                    p_tout.append(idmag)
-                cursor.execute(q_tout, p_tout)
-                t_out = cursor.fetchone()[0] or 0
-
-                # Inventaires (via codearticle)
-                q_inv = "SELECT COALESCE(SUM(qtinventaire), 0) FROM tb_inventaire WHERE codearticle = %s"
-                p_inv = [code_boucle]
-                if idmag:
-                    q_inv += " AND idmag = %s"
-                    p_inv.append(idmag)
-                cursor.execute(q_inv, p_inv)
-                inv = cursor.fetchone()[0] or 0
-
-                # Avoirs (AUGMENTENT le stock - annulation de vente)
-                q_avoir = """
-                    SELECT COALESCE(SUM(ad.qtavoir), 0) 
-                    FROM tb_avoirdetail ad
-                    INNER JOIN tb_avoir a ON ad.idavoir = a.id
-                    WHERE ad.idarticle = %s AND ad.idunite = %s 
-                    AND a.deleted = 0 AND ad.deleted = 0
-                """
-                p_avoir = [idarticle, idu_boucle]
-                if idmag:
-                    q_avoir += " AND ad.idmag = %s"
-                    p_avoir.append(idmag)
-                cursor.execute(q_avoir, p_avoir)
-                avoirs = cursor.fetchone()[0] or 0
-
-                # Normalisation : (Solde unité) * (Son poids qtunite)
-                # Les avoirs s'AJOUTENT car c'est une annulation de vente (retour marchandise)
-                solde_unite = (receptions + t_in + inv + avoirs - ventes - sorties - t_out)
-                total_stock_global_base += (solde_unite * qtunite_boucle)
-
-            # 4. Conversion finale pour l'affichage
-            stock_final = total_stock_global_base / qtunite_affichage
-            return max(0, stock_final)
-
+            return stock_article(idarticle, idunite_cible, idmag)
         except Exception as e:
-            print(f"Erreur calcul stock consolidé: {str(e)}")
-            traceback.print_exc()
+            print(f"Erreur calcul stock consolidé : {e}")
             return 0
-        finally:
-            cursor.close()
-            conn.close()
     # --------------------------------------------------------------------------
 
     def setup_ui(self):
@@ -475,52 +370,20 @@ class PageSortie(ctk.CTkFrame):
         
         try:
             cursor = conn.cursor()
-            
-            annee = datetime.now().year
-            type_prefix = self.type_sortie  # "BS" ou "CI"
-            
-            # ✅ CORRECTION: Chercher dans la bonne table selon le type
-            if self.type_sortie == "CI":
-                # Chercher dans tb_consommationinterne pour les CI
-                sql_max_id = """
-                    SELECT refconsommation 
-                    FROM tb_consommationinterne 
-                    WHERE EXTRACT(YEAR FROM dateregistre) = %s 
-                      AND refconsommation LIKE %s
-                    ORDER BY id DESC 
-                    LIMIT 1
-                """
-            else:
-                # Chercher dans tb_sortie pour les BS
-                sql_max_id = """
-                    SELECT refsortie 
-                    FROM tb_sortie 
-                    WHERE EXTRACT(YEAR FROM dateregistre) = %s 
-                      AND refsortie LIKE %s
-                    ORDER BY id DESC 
-                    LIMIT 1
-                """
-            
-            cursor.execute(sql_max_id, (annee, f"{annee}-{type_prefix}-%"))
-            derniere_ref = cursor.fetchone()
-
-            nouveau_numero = 1
-            if derniere_ref:
-                partie_num = derniere_ref[0].split('-')[-1]
-                nouveau_numero = int(partie_num) + 1
-            
-            nouvelle_ref = f"{annee}-{type_prefix}-{nouveau_numero:05d}"
-            
-            self.entry_ref_sortie.configure(state="normal")
-            self.entry_ref_sortie.delete(0, "end")
-            self.entry_ref_sortie.insert(0, nouvelle_ref)
-            self.entry_ref_sortie.configure(state="readonly")
+            # ✅ Aperçu : la référence définitive est attribuée à l'enregistrement
+            self.afficher_reference(numerotation.apercu(cursor, self.type_sortie))  # "BS" ou "CI"
             
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur lors de la génération de la référence: {str(e)}")
         finally:
             conn.close()
 
+    def afficher_reference(self, reference):
+        self.entry_ref_sortie.configure(state="normal")
+        self.entry_ref_sortie.delete(0, "end")
+        self.entry_ref_sortie.insert(0, reference)
+        self.entry_ref_sortie.configure(state="readonly")
+
     def charger_magasins(self):
         """Charge les magasins depuis la DB pour la combobox."""
         conn = self.connect_db()
@@ -558,72 +421,21 @@ class PageSortie(ctk.CTkFrame):
             conn.close()
 
     def charger_infos_societe(self):
-        """Charge les informations de la société depuis tb_infosociete (CORRIGÉ)."""
-        conn = self.connect_db()
-        if not conn: return
-    
+        """Informations société (tb_infosociete lue une fois par processus, cf. rendu_pdf)."""
         try:
-            cursor = conn.cursor()
-            # Utiliser tb_infosociete avec les bonnes colonnes
-            sql = """
-                SELECT 
-                    nomsociete, adressesociete, contactsociete, villesociete, 
-                    nifsociete, statsociete, cifsociete
-                FROM tb_infosociete 
-                LIMIT 1
-            """
-            cursor.execute(sql)
-            result = cursor.fetchone()
-        
-            if result:
-                # Mapper directement les colonnes
-                self.infos_societe = {
-                    'nomsociete': result[0] or 'SOCIÉTÉ',
-                    'adressesociete': result[1] or 'N/A',
-                    'contactsociete': result[2] or 'N/A',
-                    'villesociete': result[3] or 'N/A',
-                    'nifsociete': result[4] or 'N/A',
-                    'statsociete': result[5] or 'N/A',
-                    'cifsociete': result[6] or 'N/A'
-                }
-            else:
-                # Valeurs par défaut si aucune info n'est trouvée
-                self.infos_societe = {
-                    'nomsociete': 'SOCIÉTÉ',
-                    'adressesociete': 'N/A',
-                    'contactsociete': 'N/A',
-                    'villesociete': 'N/A',
-                    'nifsociete': 'N/A',
-                    'statsociete': 'N/A',
-                    'cifsociete': 'N/A'
-                }
-        
-        except psycopg2.ProgrammingError as e:
-            # La table pourrait ne pas exister ou les colonnes sont différentes
-            print(f"Erreur SQL: {e}")
-            self.infos_societe = {
-                'nomsociete': 'SOCIÉTÉ',
-                'adressesociete': 'N/A',
-                'contactsociete': 'N/A',
-                'villesociete': 'N/A',
-                'nifsociete': 'N/A',
-                'statsociete': 'N/A',
-                'cifsociete': 'N/A'
-            }
+            infos = rendu_pdf.societe()
         except Exception as e:
-            print(f"Erreur chargement infos société: {str(e)}")
-            self.infos_societe = {
-                'nomsociete': 'SOCIÉTÉ',
-                'adressesociete': 'N/A',
-                'contactsociete': 'N/A',
-                'villesociete': 'N/A',
-                'nifsociete': 'N/A',
-                'statsociete': 'N/A',
-                'cifsociete': 'N/A'
-            }
-        finally:
-            if 'cursor' in locals() and cursor: cursor.close()
-            if conn: conn.close()
+            print(f"Erreur chargement infos société: {e}")
+            infos = {}
+        self.infos_societe = {
+            'nomsociete': infos.get('nomsociete') or 'SOCIÉTÉ',
+            'adressesociete': infos.get('adressesociete') or 'N/A',
+            'contactsociete': infos.get('contactsociete') or 'N/A',
+            'villesociete': infos.get('villesociete') or 'N/A',
+            'nifsociete': infos.get('nifsociete') or 'N/A',
+            'statsociete': infos.get('statsociete') or 'N/A',
+            'cifsociete': infos.get('cifsociete') or 'N/A'
+        }
 
    
     # --- FONCTION DE RECHERCHE D'ARTICLE (CODE CORRIGÉ) ---
@@ -686,258 +498,57 @@ class PageSortie(ctk.CTkFrame):
         tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
 
-        # Fonction de chargement avec la requête consolidée (réservoir commun)
-        def charger_articles(filtre=""):
+        # Recherche en arrière-plan : filtrage local du cache catalogue, puis
+        # même logique réservoir que page_stock (solde du magasin actif en unité
+        # de base, divisé par le coefficient hiérarchique de chaque ligne).
+        def requete_articles(cur, filtre, idmag_actif):
+            lignes = catalogue().rechercher(filtre)
+            soldes = soldes_base_par_magasin({l.idarticle for l in lignes}, conn=cur.connection)
+            return [
+                (l.idarticle, l.idunite, l.codearticle, l.designation, l.designationunite,
+                 max(soldes.get((l.idarticle, idmag_actif), 0.0) / (l.coeff_hierarchique or 1), 0),
+                 l.prix)
+                for l in lignes
+            ]
+
+        def afficher_articles(articles, filtre, idmag_actif):
             for item in tree.get_children():
                 tree.delete(item)
 
-            conn = self.connect_db()
-            if not conn:
-                return
-            try:
-                cur = conn.cursor()
-                filtre_like = f"%{filtre}%"
-
-                # Même logique réservoir que page_stock :
-                # tous les mouvements sont convertis en "unité de base" via qtunite,
-                # puis le solde du magasin actif est divisé par le qtunite de chaque ligne.
-                # ✅ Requête consolidée (9 sources + coefficient hiérarchique)
-                query = """
-                WITH mouvements_bruts AS (
-                    -- Réceptions
-                    SELECT
-                        lf.idarticle,
-                        lf.idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        lf.qtlivrefrs as quantite,
-                        'reception' as type_mouvement
-                    FROM tb_livraisonfrs lf
-                    INNER JOIN tb_unite u ON lf.idarticle = u.idarticle AND lf.idunite = u.idunite
-                    WHERE lf.deleted = 0
-
-                    UNION ALL
-
-                    -- Ventes
-                    SELECT
-                        vd.idarticle,
-                        v.idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        vd.qtvente as quantite,
-                        'vente' as type_mouvement
-                    FROM tb_ventedetail vd
-                    INNER JOIN tb_vente v ON vd.idvente = v.id AND v.deleted = 0 AND v.statut = 'VALIDEE'
-                    INNER JOIN tb_unite u ON vd.idarticle = u.idarticle AND vd.idunite = u.idunite
-                    WHERE vd.deleted = 0
-
-                    UNION ALL
-
-                    -- Transferts entrants
-                    SELECT
-                        t.idarticle,
-                        t.idmagentree as idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        t.qttransfert as quantite,
-                        'transfert_in' as type_mouvement
-                    FROM tb_transfertdetail t
-                    INNER JOIN tb_unite u ON t.idarticle = u.idarticle AND t.idunite = u.idunite
-                    WHERE t.deleted = 0
-
-                    UNION ALL
-
-                    -- Transferts sortants
-                    SELECT
-                        t.idarticle,
-                        t.idmagsortie as idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        t.qttransfert as quantite,
-                        'transfert_out' as type_mouvement
-                    FROM tb_transfertdetail t
-                    INNER JOIN tb_unite u ON t.idarticle = u.idarticle AND t.idunite = u.idunite
-                    WHERE t.deleted = 0
-
-                    UNION ALL
-
-                    -- Sorties
-                    SELECT
-                        sd.idarticle,
-                        sd.idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        sd.qtsortie as quantite,
-                        'sortie' as type_mouvement
-                    FROM tb_sortiedetail sd
-                    INNER JOIN tb_unite u ON sd.idarticle = u.idarticle AND sd.idunite = u.idunite
-
-                    UNION ALL
-
-                    -- Inventaires (une seule fois par article = unité de base)
-                    SELECT
-                        u.idarticle,
-                        i.idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        i.qtinventaire as quantite,
-                        'inventaire' as type_mouvement
-                    FROM tb_inventaire i
-                    INNER JOIN tb_unite u ON i.codearticle = u.codearticle
-                    WHERE u.idunite IN (
-                        SELECT DISTINCT ON (idarticle) idunite
-                        FROM tb_unite
-                        WHERE deleted = 0
-                        ORDER BY idarticle, qtunite ASC
-                    )
-
-                    UNION ALL
-
-                    -- Avoirs
-                    SELECT
-                        ad.idarticle,
-                        ad.idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        ad.qtavoir as quantite,
-                        'avoir' as type_mouvement
-                    FROM tb_avoir a
-                    INNER JOIN tb_avoirdetail ad ON a.id = ad.idavoir
-                    INNER JOIN tb_unite u ON ad.idarticle = u.idarticle AND ad.idunite = u.idunite
-                    WHERE a.deleted = 0 AND ad.deleted = 0
-
-                    UNION ALL
-
-                    -- Consommation interne
-                    SELECT
-                        cd.idarticle,
-                        cd.idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        cd.qtconsomme as quantite,
-                        'consommation_interne' as type_mouvement
-                    FROM tb_consommationinterne_details cd
-                    INNER JOIN tb_unite u ON cd.idarticle = u.idarticle AND cd.idunite = u.idunite
-
-                    UNION ALL
-
-                    -- Échanges entrée
-                    SELECT
-                        dce.idarticle,
-                        dce.idmagasin,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        dce.quantite_entree as quantite,
-                        'echange_entree' as type_mouvement
-                    FROM tb_detailchange_entree dce
-                    INNER JOIN tb_unite u ON dce.idarticle = u.idarticle AND dce.idunite = u.idunite
-
-                    UNION ALL
-
-                    -- Échanges sortie
-                    SELECT
-                        dcs.idarticle,
-                        dcs.idmagasin,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        dcs.quantite_sortie as quantite,
-                        'echange_sortie' as type_mouvement
-                    FROM tb_detailchange_sortie dcs
-                    INNER JOIN tb_unite u ON dcs.idarticle = u.idarticle AND dcs.idunite = u.idunite
-                ),
-
-                solde_base_par_mag AS (
-                    SELECT
-                        idarticle,
-                        idmag,
-                        SUM(
-                            CASE type_mouvement
-                                WHEN 'reception'             THEN  quantite * qtunite_source
-                                WHEN 'transfert_in'          THEN  quantite * qtunite_source
-                                WHEN 'inventaire'            THEN  quantite * qtunite_source
-                                WHEN 'avoir'                 THEN  quantite * qtunite_source
-                                WHEN 'echange_entree'        THEN  quantite * qtunite_source
-                                WHEN 'vente'                 THEN -quantite * qtunite_source
-                                WHEN 'sortie'                THEN -quantite * qtunite_source
-                                WHEN 'transfert_out'         THEN -quantite * qtunite_source
-                                WHEN 'consommation_interne'  THEN -quantite * qtunite_source
-                                WHEN 'echange_sortie'        THEN -quantite * qtunite_source
-                                ELSE 0
-                            END
-                        ) as solde_base
-                    FROM mouvements_bruts
-                    GROUP BY idarticle, idmag
-                ),
-
-                unite_hierarchie AS (
-                    SELECT idarticle, idunite, niveau, qtunite, designationunite
-                    FROM tb_unite
-                    WHERE deleted = 0
-                ),
-
-                unite_coeff AS (
-                    SELECT
-                        idarticle,
-                        idunite,
-                        niveau,
-                        qtunite,
-                        designationunite,
-                        exp(sum(ln(NULLIF(CASE WHEN qtunite > 0 THEN qtunite ELSE 1 END, 0)))
-                            OVER (PARTITION BY idarticle ORDER BY niveau ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
-                        ) as coeff_hierarchique
-                    FROM unite_hierarchie
-                ),
-
-                -- ✅ Récupérer SEULEMENT le dernier prix pour chaque (idarticle, idunite)
-                dernier_prix AS (
-                    SELECT
-                        idarticle,
-                        idunite,
-                        prix,
-                        ROW_NUMBER() OVER (PARTITION BY idarticle, idunite ORDER BY id DESC) AS rn
-                    FROM tb_prix
-                )
-
-                SELECT
-                    u.idarticle,
-                    u.idunite,
-                    u.codearticle,
-                    a.designation,
-                    uc.designationunite,
-                    GREATEST(COALESCE(sb.solde_base, 0) / NULLIF(COALESCE(uc.coeff_hierarchique, 1), 0), 0) as stock_total,
-                    COALESCE(p.prix, 0) as prix_unitaire
-                FROM tb_article a
-                INNER JOIN tb_unite u ON a.idarticle = u.idarticle
-                LEFT JOIN unite_coeff uc ON uc.idarticle = u.idarticle AND uc.idunite = u.idunite
-                LEFT JOIN solde_base_par_mag sb ON sb.idarticle = u.idarticle AND sb.idmag = %s
-                LEFT JOIN dernier_prix p ON a.idarticle = p.idarticle AND u.idunite = p.idunite AND p.rn = 1
-                WHERE a.deleted = 0
-                  AND (u.codearticle ILIKE %s OR a.designation ILIKE %s)
-                ORDER BY a.designation ASC, u.codearticle ASC, u.idunite ASC
-                """
-
-                designationmag = (self.combo_magasin.get() or "").strip()
-                idmag_actif = self.magasins_map.get(designationmag)
-                tree.heading("Stock", text=f"Magasin {designationmag}" if designationmag else "Magasin")
-
-                if idmag_actif is None:
-                    return
+            for idx, row in enumerate(articles):
+                zebra_tag = "even" if idx % 2 == 0 else "odd"
+                tree.insert('', 'end', values=(
+                    row[0],          # idarticle
+                    row[1],          # idunite
+                    row[2] or "",    # codearticle
+                    row[3] or "",    # designation
+                    row[4] or "",    # designationunite
+                    self.formater_nombre(row[5]),  # stock_total formaté
+                    self.formater_nombre(row[6])   # prix_unitaire formaté *** NOUVEAU ***
+                ), tags=(zebra_tag,))
+
+        recherche = ControleurRecherche(
+            fenetre_recherche, requete_articles, afficher_articles,
+            erreur=lambda e: messagebox.showerror("Erreur", f"Erreur chargement articles: {str(e)}")
+        )
 
-                cur.execute(query, (idmag_actif, filtre_like, filtre_like))
-                articles = cur.fetchall()
+        def charger_articles(filtre="", immediat=True):
+            designationmag = (self.combo_magasin.get() or "").strip()
+            idmag_actif = self.magasins_map.get(designationmag)
+            tree.heading("Stock", text=f"Magasin {designationmag}" if designationmag else "Magasin")
 
-                for idx, row in enumerate(articles):
-                    zebra_tag = "even" if idx % 2 == 0 else "odd"
-                    tree.insert('', 'end', values=(
-                        row[0],          # idarticle
-                        row[1],          # idunite
-                        row[2] or "",    # codearticle
-                        row[3] or "",    # designation
-                        row[4] or "",    # designationunite
-                        self.formater_nombre(row[5]),  # stock_total formaté
-                        self.formater_nombre(row[6])   # prix_unitaire formaté *** NOUVEAU ***
-                    ), tags=(zebra_tag,))
+            if idmag_actif is None:
+                for item in tree.get_children():
+                    tree.delete(item)
+                return
 
-            except Exception as e:
-                messagebox.showerror("Erreur", f"Erreur chargement articles: {str(e)}")
-            finally:
-                if 'cur' in locals() and cur:
-                    cur.close()
-                if conn:
-                    conn.close()
+            if immediat:
+                recherche.lancer(filtre, idmag_actif)
+            else:
+                recherche.declencher(filtre, idmag_actif)
 
         def rechercher(*args):
-            charger_articles(entry_search.get())
+            charger_articles(entry_search.get(), immediat=False)
 
         entry_search.bind('<KeyRelease>', rechercher)
 
@@ -1535,6 +1146,10 @@ class PageSortie(ctk.CTkFrame):
             messagebox.showerror("Erreur Session", f"Impossible de récupérer l'utilisateur: {e}")
             return
         
+        # ✅ Référence attribuée dans la transaction (unique même entre postes)
+        ref_sortie = numerotation.prochaine_reference(cursor, "BS")
+        self.afficher_reference(ref_sortie)
+
         # 1. Insérer en-tête de sortie avec iduser
         sql_sortie = """
             INSERT INTO tb_sortie (refsortie, iduser, dateregistre, description, deleted)
@@ -1557,6 +1172,11 @@ class PageSortie(ctk.CTkFrame):
                 detail['qtsortie']
             ))
 
+        # Solde de stock (tb_stock_solde) mis à jour dans la même transaction
+        appliquer_mouvements(cursor, [
+            (d['idarticle'], d['idunite'], d['idmag'], -d['qtsortie']) for d in self.detail_sortie
+        ])
+
         conn.commit()
         messagebox.showinfo("Succès", f"Sortie N°{ref_sortie} enregistrée.")
         self.derniere_idsortie_enregistree = idsortie
@@ -1581,6 +1201,10 @@ class PageSortie(ctk.CTkFrame):
             messagebox.showerror("Erreur Session", f"Impossible de récupérer l'utilisateur: {e}")
             return
         
+        # ✅ Référence attribuée dans la transaction (unique même entre postes)
+        ref_sortie = numerotation.prochaine_reference(cursor, "CI")
+        self.afficher_reference(ref_sortie)
+
         # 1. Insérer en-tête de consommation
         sql_ci = """
             INSERT INTO tb_consommationinterne (refconsommation, iduser, observation, valeur_totale)
@@ -1605,6 +1229,11 @@ class PageSortie(ctk.CTkFrame):
                 motif_sortie
             ))
 
+        # Solde de stock (tb_stock_solde) mis à jour dans la même transaction
+        appliquer_mouvements(cursor, [
+            (d['idarticle'], d['idunite'], d['idmag'], -d['qtsortie']) for d in self.detail_sortie
+        ])
+
         conn.commit()
         messagebox.showinfo("Succès", f"Consommation N°{ref_sortie} enregistrée.")
         
@@ -1809,15 +1438,10 @@ class PageSortie(ctk.CTkFrame):
             try:
                 from EtatsPDF_Mouvements import EtatPDFMouvements
 
-                etat = EtatPDFMouvements()
-                # Connecter la classe centrale pour qu'elle puisse lire tb_infosociete
-                try:
-                    etat.connect_db()
-                except Exception:
-                    pass
-
-                result = etat._build_pdf_a5(
-                    output_path=filename,
+                # ✅ Rendu dans le pool : le formulaire est réinitialisé sans attendre le PDF
+                EtatPDFMouvements().rendre_pdf_a5(
+                    self, filename,
+                    rappel=rendu_pdf.ouvrir if sys.platform == 'win32' else None,
                     titre_entete="BON DE SORTIE",
                     reference=ref_sortie,
                     date_operation=datetime.now().strftime('%d/%m/%Y'),
@@ -1828,20 +1452,7 @@ class PageSortie(ctk.CTkFrame):
                     responsable_1="Le Magasinier",
                     responsable_2="Le Contrôleur",
                 )
-                # Fermer la connexion si ouverte
-                try:
-                    etat.close_db()
-                except Exception:
-                    pass
-
-                # Ouvrir automatiquement sur Windows (ouvrir le fichier généré)
-                if result and sys.platform == 'win32':
-                    try:
-                        os.startfile(filename)
-                    except Exception:
-                        pass
-
-                return result
+                return filename
             except Exception as e:
                 # Si l'appel au builder central échoue, loguer et remonter l'erreur
                 print(f"Erreur utilisation _build_pdf_a5: {e}")
@@ -1904,14 +1515,10 @@ class PageSortie(ctk.CTkFrame):
             try:
                 from EtatsPDF_Mouvements import EtatPDFMouvements
 
-                etat = EtatPDFMouvements()
-                try:
-                    etat.connect_db()
-                except Exception:
-                    pass
-
-                result = etat._build_pdf_a5(
-                    output_path=filename,
+                # ✅ Rendu dans le pool : le formulaire est réinitialisé sans attendre le PDF
+                EtatPDFMouvements().rendre_pdf_a5(
+                    self, filename,
+                    rappel=rendu_pdf.ouvrir if sys.platform == 'win32' else None,
                     titre_entete="CONSOMMATION INTERNE",
                     reference=ref_sortie,
                     date_operation=datetime.now().strftime('%d/%m/%Y'),
@@ -1922,20 +1529,7 @@ class PageSortie(ctk.CTkFrame):
                     responsable_1="Le Magasinier",
                     responsable_2="Le Contrôleur",
                 )
-
-                try:
-                    etat.close_db()
-                except Exception:
-                    pass
-
-                # Ouvrir le fichier généré sur Windows
-                if result and sys.platform == 'win32':
-                    try:
-                        os.startfile(filename)
-                    except Exception:
-                        pass
-
-                return result
+                return filename
             except Exception as e:
                 print(f"Erreur utilisation _build_pdf_a5 (CI): {e}")
                 import traceback
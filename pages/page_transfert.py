@@ -11,9 +11,25 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
 import os
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+from stock_engine import stock_article, appliquer_mouvements, appliquer_requete, soldes_base_par_magasin
+from catalogue_cache import catalogue
+from recherche_async import ControleurRecherche
+import rendu_pdf
+import numerotation
 
 
 class PageTransfert(ctk.CTkFrame):
+    # Annulation des lignes actives d'un transfert dans tb_stock_solde
+    # (retour au magasin de sortie, retrait du magasin d'entrée)
+    SQL_ANNULER_SOLDES_TRANSFERT = """
+        SELECT idarticle, idunite, idmagsortie, qttransfert
+        FROM tb_transfertdetail WHERE idtransfert = %s AND deleted = 0
+        UNION ALL
+        SELECT idarticle, idunite, idmagentree, -qttransfert
+        FROM tb_transfertdetail WHERE idtransfert = %s AND deleted = 0
+    """
+
     def __init__(self, parent, user_id):
         super().__init__(parent)
         self.user_id = user_id
@@ -159,7 +175,7 @@ class PageTransfert(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -190,41 +206,20 @@ class PageTransfert(ctk.CTkFrame):
                 return
             
             cur = conn.cursor()
-            
-            annee = datetime.now().year
-            cur.execute("""
-                SELECT reftransfert FROM tb_transfert 
-                WHERE reftransfert LIKE %s 
-                ORDER BY reftransfert DESC LIMIT 1
-            """, (f"{annee}-TRA-%",))
-            
-            result = cur.fetchone()
-            if result:
-                # Assurez-vous que la référence est bien au format "YYYY-TRA-NNNNN"
-                parts = result[0].split('-')
-                if len(parts) == 3 and parts[1] == 'TRA':
-                    try:
-                        dernier_num = int(parts[2])
-                        nouveau_num = dernier_num + 1
-                    except ValueError:
-                        # Si le numéro n'est pas un entier valide
-                        nouveau_num = 1
-                else:
-                    nouveau_num = 1
-            else:
-                nouveau_num = 1
-                
-            reference = f"{annee}-TRA-{nouveau_num:05d}"
-            self.entry_ref.configure(state="normal")
-            self.entry_ref.delete(0, "end")
-            self.entry_ref.insert(0, reference)
-            self.entry_ref.configure(state="readonly")
+            # ✅ Aperçu : la référence définitive est attribuée à l'enregistrement
+            self.afficher_reference(numerotation.apercu(cur, "TRA"))
             
             cur.close()
             conn.close()
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur génération référence: {str(e)}")
     
+    def afficher_reference(self, reference):
+        self.entry_ref.configure(state="normal")
+        self.entry_ref.delete(0, "end")
+        self.entry_ref.insert(0, reference)
+        self.entry_ref.configure(state="readonly")
+
     def charger_magasins(self):
         try:
             conn = self.get_connection()
@@ -333,241 +328,55 @@ class PageTransfert(ctk.CTkFrame):
             except Exception:
                 return 0.0
 
-        # Fonction de chargement avec la requête consolidée (réservoir commun)
-        def charger_articles(filtre=""):
+        # Recherche en arrière-plan : filtrage local du cache catalogue, puis
+        # soldes du magasin en unité de base divisés par le coefficient hiérarchique.
+        def requete_articles(cur, filtre, idmag_actif):
+            lignes = catalogue().rechercher(filtre)
+            soldes = soldes_base_par_magasin({l.idarticle for l in lignes}, conn=cur.connection)
+            return [
+                (l.idarticle, l.idunite, l.codearticle, l.designation, l.designationunite,
+                 max(soldes.get((l.idarticle, idmag_actif), 0.0) / (l.coeff_hierarchique or 1), 0),
+                 l.prix)
+                for l in lignes
+            ]
+
+        def afficher_articles(articles, filtre, idmag_actif):
             for item in tree.get_children():
                 tree.delete(item)
 
-            conn = self.get_connection()
-            if not conn:
-                return
-            try:
-                cur = conn.cursor()
-                filtre_like = f"%{filtre}%"
-
-                # Même logique réservoir que page_stock :
-                # tous les mouvements sont convertis en "unité de base" via qtunite,
-                # puis le solde du magasin actif est divisé par le qtunite de chaque ligne.
-                query = """
-                WITH mouvements_bruts AS (
-                    SELECT
-                        lf.idarticle,
-                        lf.idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        lf.qtlivrefrs as quantite,
-                        'reception' as type_mouvement
-                    FROM tb_livraisonfrs lf
-                    INNER JOIN tb_unite u ON lf.idarticle = u.idarticle AND lf.idunite = u.idunite
-                    WHERE lf.deleted = 0
-
-                    UNION ALL
-
-                    SELECT
-                        vd.idarticle,
-                        v.idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        vd.qtvente as quantite,
-                        'vente' as type_mouvement
-                    FROM tb_ventedetail vd
-                    INNER JOIN tb_vente v ON vd.idvente = v.id AND v.deleted = 0 AND v.statut = 'VALIDEE'
-                    INNER JOIN tb_unite u ON vd.idarticle = u.idarticle AND vd.idunite = u.idunite
-                    WHERE vd.deleted = 0
-
-                    UNION ALL
-
-                    SELECT
-                        t.idarticle,
-                        t.idmagentree as idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        t.qttransfert as quantite,
-                        'transfert_in' as type_mouvement
-                    FROM tb_transfertdetail t
-                    INNER JOIN tb_unite u ON t.idarticle = u.idarticle AND t.idunite = u.idunite
-                    WHERE t.deleted = 0
-
-                    UNION ALL
-
-                    SELECT
-                        t.idarticle,
-                        t.idmagsortie as idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        t.qttransfert as quantite,
-                        'transfert_out' as type_mouvement
-                    FROM tb_transfertdetail t
-                    INNER JOIN tb_unite u ON t.idarticle = u.idarticle AND t.idunite = u.idunite
-                    WHERE t.deleted = 0
-
-                    UNION ALL
-
-                    SELECT
-                        u.idarticle,
-                        i.idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        i.qtinventaire as quantite,
-                        'inventaire' as type_mouvement
-                    FROM tb_inventaire i
-                    INNER JOIN tb_unite u ON i.codearticle = u.codearticle
-                    WHERE u.idunite IN (
-                        SELECT DISTINCT ON (idarticle) idunite
-                        FROM tb_unite
-                        WHERE deleted = 0
-                        ORDER BY idarticle, qtunite ASC
-                    )
-
-                    UNION ALL
-
-                    SELECT
-                        sd.idarticle,
-                        sd.idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        sd.qtsortie as quantite,
-                        'sortie' as type_mouvement
-                    FROM tb_sortiedetail sd
-                    INNER JOIN tb_unite u ON sd.idarticle = u.idarticle AND sd.idunite = u.idunite
-
-                    UNION ALL
-
-                    SELECT
-                        ad.idarticle,
-                        ad.idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        ad.qtavoir as quantite,
-                        'avoir' as type_mouvement
-                    FROM tb_avoir a
-                    INNER JOIN tb_avoirdetail ad ON a.id = ad.idavoir
-                    INNER JOIN tb_unite u ON ad.idarticle = u.idarticle AND ad.idunite = u.idunite
-                    WHERE a.deleted = 0 AND ad.deleted = 0
-
-                    UNION ALL
-
-                    SELECT
-                        ci.idarticle,
-                        ci.idmag,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        ci.qtconsomme as quantite,
-                        'consommation_interne' as type_mouvement
-                    FROM tb_consommationinterne_details ci
-                    INNER JOIN tb_unite u ON ci.idarticle = u.idarticle AND ci.idunite = u.idunite
-
-                    UNION ALL
-
-                    SELECT
-                        dce.idarticle,
-                        dce.idmagasin,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        dce.quantite_entree as quantite,
-                        'echange_entree' as type_mouvement
-                    FROM tb_detailchange_entree dce
-                    INNER JOIN tb_unite u ON dce.idarticle = u.idarticle AND dce.idunite = u.idunite
-
-                    UNION ALL
-
-                    SELECT
-                        dcs.idarticle,
-                        dcs.idmagasin,
-                        COALESCE(u.qtunite, 1) as qtunite_source,
-                        dcs.quantite_sortie as quantite,
-                        'echange_sortie' as type_mouvement
-                    FROM tb_detailchange_sortie dcs
-                    INNER JOIN tb_unite u ON dcs.idarticle = u.idarticle AND dcs.idunite = u.idunite
-                ),
-
-                solde_base_par_mag AS (
-                    SELECT
-                        idarticle,
-                        idmag,
-                        SUM(
-                            CASE type_mouvement
-                                WHEN 'reception'           THEN  quantite * qtunite_source
-                                WHEN 'transfert_in'        THEN  quantite * qtunite_source
-                                WHEN 'inventaire'          THEN  quantite * qtunite_source
-                                WHEN 'avoir'               THEN  quantite * qtunite_source
-                                WHEN 'echange_entree'      THEN  quantite * qtunite_source
-                                WHEN 'vente'               THEN -quantite * qtunite_source
-                                WHEN 'sortie'              THEN -quantite * qtunite_source
-                                WHEN 'transfert_out'       THEN -quantite * qtunite_source
-                                WHEN 'consommation_interne' THEN -quantite * qtunite_source
-                                WHEN 'echange_sortie'      THEN -quantite * qtunite_source
-                                ELSE 0
-                            END
-                        ) as solde
-                    FROM mouvements_bruts
-                    GROUP BY idarticle, idmag
-                ),
-                unite_hierarchie AS (
-                    SELECT idarticle, idunite, niveau, qtunite, designationunite
-                    FROM tb_unite
-                    WHERE deleted = 0
-                ),
-                unite_coeff AS (
-                    SELECT
-                        idarticle,
-                        idunite,
-                        niveau,
-                        qtunite,
-                        designationunite,
-                        exp(sum(ln(NULLIF(CASE WHEN qtunite > 0 THEN qtunite ELSE 1 END, 0)))
-                            OVER (PARTITION BY idarticle ORDER BY niveau ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
-                        ) as coeff_hierarchique
-                    FROM unite_hierarchie
-                ),
-                dernier_prix AS (
-                    SELECT
-                        idarticle,
-                        idunite,
-                        prix,
-                        ROW_NUMBER() OVER (PARTITION BY idarticle, idunite ORDER BY id DESC) AS rn
-                    FROM tb_prix
-                )
-
-                SELECT
-                    u.idarticle,
-                    u.idunite,
-                    u.codearticle,
-                    a.designation,
-                    uc.designationunite,
-                    GREATEST(COALESCE(sb.solde, 0) / NULLIF(COALESCE(uc.coeff_hierarchique, 1), 0), 0) as stock_total,
-                    COALESCE(p.prix, 0) as prix_unitaire
-                FROM tb_article a
-                INNER JOIN tb_unite u ON a.idarticle = u.idarticle
-                LEFT JOIN unite_coeff uc ON uc.idarticle = u.idarticle AND uc.idunite = u.idunite
-                LEFT JOIN solde_base_par_mag sb ON sb.idarticle = u.idarticle AND sb.idmag = %s
-                LEFT JOIN dernier_prix p ON a.idarticle = p.idarticle AND u.idunite = p.idunite AND p.rn = 1
-                WHERE a.deleted = 0
-                  AND (u.codearticle ILIKE %s OR a.designation ILIKE %s)
-                ORDER BY a.designation ASC, u.codearticle ASC, u.idunite ASC
-                """
-                designationmag = (self.combo_mag_sortie.get() or "").strip()
-                idmag_actif = self.magasins_data.get(designationmag)
-                tree.heading("Stock", text=f"Magasin {designationmag}" if designationmag else "Magasin")
-                if idmag_actif is None:
-                    return
+            for idx, row in enumerate(articles):
+                zebra_tag = "even" if idx % 2 == 0 else "odd"
+                tree.insert('', 'end', values=(
+                    row[0],          # idarticle
+                    row[1],          # idunite
+                    row[2] or "",    # codearticle
+                    row[3] or "",    # designation
+                    row[4] or "",    # designationunite
+                    formater_nombre(row[5]),  # stock_total
+                    formater_nombre(row[6])   # prix_unitaire
+                ), tags=(zebra_tag,))
+
+        recherche = ControleurRecherche(
+            fenetre_recherche, requete_articles, afficher_articles,
+            erreur=lambda e: messagebox.showerror("Erreur", f"Erreur chargement articles: {str(e)}")
+        )
 
-                cur.execute(query, (idmag_actif, filtre_like, filtre_like))
-                articles = cur.fetchall()
-
-                for idx, row in enumerate(articles):
-                    zebra_tag = "even" if idx % 2 == 0 else "odd"
-                    tree.insert('', 'end', values=(
-                        row[0],          # idarticle
-                        row[1],          # idunite
-                        row[2] or "",    # codearticle
-                        row[3] or "",    # designation
-                        row[4] or "",    # designationunite
-                        formater_nombre(row[5]),  # stock_total
-                        formater_nombre(row[6])   # prix_unitaire
-                    ), tags=(zebra_tag,))
+        def charger_articles(filtre="", immediat=True):
+            designationmag = (self.combo_mag_sortie.get() or "").strip()
+            idmag_actif = self.magasins_data.get(designationmag)
+            tree.heading("Stock", text=f"Magasin {designationmag}" if designationmag else "Magasin")
+            if idmag_actif is None:
+                for item in tree.get_children():
+                    tree.delete(item)
+                return
 
-            except Exception as e:
-                messagebox.showerror("Erreur", f"Erreur chargement articles: {str(e)}")
-            finally:
-                if 'cur' in locals() and cur:
-                    cur.close()
-                if conn:
-                    conn.close()
+            if immediat:
+                recherche.lancer(filtre, idmag_actif)
+            else:
+                recherche.declencher(filtre, idmag_actif)
 
         def rechercher(*args):
-            charger_articles(entry_search.get())
+            charger_articles(entry_search.get(), immediat=False)
 
         entry_search.bind('<KeyRelease>', rechercher)
 
@@ -625,150 +434,15 @@ class PageTransfert(ctk.CTkFrame):
         
     def calculer_stock_article(self, idarticle, idunite_cible, idmag=None):
         """
-        ✅ CALCUL CONSOLIDÉ (identique à page_venteParMsin / page_stock.py) :
-        Relie tous les mouvements de toutes les unités (PIECE, CARTON, etc.)
-        d'un même idarticle via le coefficient 'qtunite' de tb_unite.
-
-        LOGIQUE :
-          1) On récupère toutes les unités sœurs (même idarticle).
-          2) Pour chaque unité sœur, on somme ses mouvements puis on les convertit
-             en "unité de base" en multipliant par son qtunite.
-          3) Le solde total (réservoir commun) est divisé par le qtunite de
-             l'unité cible pour obtenir le stock affiché.
-
-        Exemple : vente de 20 PIECES → réservoir diminue de 20×1 = 20.
-                  CARTON (qtunite=20) → stock = réservoir / 20  →  -1 CARTON.
+        ✅ CALCUL CONSOLIDÉ via le moteur partagé (stock_engine) :
+        réservoir commun en unité de base sur les 10 sources de mouvements,
+        divisé par le qtunite de l'unité cible. Une seule requête ensembliste.
         """
-        conn = self.get_connection()
-        if not conn:
-            return 0
-
         try:
-            cursor = conn.cursor()
-
-            # 1. Récupérer TOUTES les unités liées à cet idarticle
-            cursor.execute("""
-                SELECT idunite, codearticle, COALESCE(qtunite, 1)
-                FROM tb_unite
-                WHERE idarticle = %s
-            """, (idarticle,))
-            unites_liees = cursor.fetchall()
-
-            # 2. Identifier le qtunite de l'unité cible
-            qtunite_affichage = 1
-            for idu, code, qt_u in unites_liees:
-                if idu == idunite_cible:
-                    qtunite_affichage = qt_u if qt_u > 0 else 1
-                    break
-
-            total_stock_global_base = 0  # Réservoir commun en unité de base
-
-            # 3. Sommer les mouvements de chaque unité sœur
-            for idu_boucle, code_boucle, qtunite_boucle in unites_liees:
-
-                # --- Réceptions ---
-                q_rec = "SELECT COALESCE(SUM(qtlivrefrs), 0) FROM tb_livraisonfrs WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_rec = [idarticle, idu_boucle]
-                if idmag:
-                    q_rec += " AND idmag = %s"
-                    p_rec.append(idmag)
-                cursor.execute(q_rec, p_rec)
-                receptions = cursor.fetchone()[0] or 0
-
-                # --- Ventes ---
-                q_ven = "SELECT COALESCE(SUM(qtvente), 0) FROM tb_ventedetail WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_ven = [idarticle, idu_boucle]
-                if idmag:
-                    q_ven += " AND idmag = %s"
-                    p_ven.append(idmag)
-                cursor.execute(q_ven, p_ven)
-                ventes = cursor.fetchone()[0] or 0
-
-                # --- Transferts entrants ---
-                q_tin = "SELECT COALESCE(SUM(qttransfert), 0) FROM tb_transfertdetail WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_tin = [idarticle, idu_boucle]
-                if idmag:
-                    q_tin += " AND idmagentree = %s"
-                    p_tin.append(idmag)
-                cursor.execute(q_tin, p_tin)
-                t_in = cursor.fetchone()[0] or 0
-
-                # --- Transferts sortants ---
-                q_tout = "SELECT COALESCE(SUM(qttransfert), 0) FROM tb_transfertdetail WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_tout = [idarticle, idu_boucle]
-                if idmag:
-                    q_tout += " AND idmagsortie = %s"
-                    p_tout.append(idmag)
-                cursor.execute(q_tout, p_tout)
-                t_out = cursor.fetchone()[0] or 0
-
-                # --- Inventaires (via codearticle) ---
-                q_inv = "SELECT COALESCE(SUM(qtinventaire), 0) FROM tb_inventaire WHERE codearticle = %s"
-                p_inv = [code_boucle]
-                if idmag:
-                    q_inv += " AND idmag = %s"
-                    p_inv.append(idmag)
-                cursor.execute(q_inv, p_inv)
-                inv = cursor.fetchone()[0] or 0
-
-                # --- Avoirs (AUGMENTENT le stock - annulation de vente) ---
-                q_avoir = """
-                    SELECT COALESCE(SUM(ad.qtavoir), 0) 
-                    FROM tb_avoirdetail ad
-                    INNER JOIN tb_avoir a ON ad.idavoir = a.id
-                    WHERE ad.idarticle = %s AND ad.idunite = %s 
-                    AND a.deleted = 0 AND ad.deleted = 0
-                """
-                p_avoir = [idarticle, idu_boucle]
-                if idmag:
-                    q_avoir += " AND ad.idmag = %s"
-                    p_avoir.append(idmag)
-                cursor.execute(q_avoir, p_avoir)
-                avoirs = cursor.fetchone()[0] or 0
-
-                # --- Consommation interne (RÉDUIT le stock) ---
-                q_consomm = "SELECT COALESCE(SUM(qtconsomme), 0) FROM tb_consommationinterne_details WHERE idarticle = %s AND idunite = %s"
-                p_consomm = [idarticle, idu_boucle]
-                if idmag:
-                    q_consomm += " AND idmag = %s"
-                    p_consomm.append(idmag)
-                cursor.execute(q_consomm, p_consomm)
-                consomm = cursor.fetchone()[0] or 0
-
-                # --- Échange entrant (AUGMENTE le stock) ---
-                q_echange_in = "SELECT COALESCE(SUM(quantite_entree), 0) FROM tb_detailchange_entree WHERE idarticle = %s AND idunite = %s"
-                p_echange_in = [idarticle, idu_boucle]
-                if idmag:
-                    q_echange_in += " AND idmagasin = %s"
-                    p_echange_in.append(idmag)
-                cursor.execute(q_echange_in, p_echange_in)
-                echange_in = cursor.fetchone()[0] or 0
-
-                # --- Échange sortant (RÉDUIT le stock) ---
-                q_echange_out = "SELECT COALESCE(SUM(quantite_sortie), 0) FROM tb_detailchange_sortie WHERE idarticle = %s AND idunite = %s"
-                p_echange_out = [idarticle, idu_boucle]
-                if idmag:
-                    q_echange_out += " AND idmagasin = %s"
-                    p_echange_out.append(idmag)
-                cursor.execute(q_echange_out, p_echange_out)
-                echange_out = cursor.fetchone()[0] or 0
-
-                # Conversion en unité de base puis accumulation dans le réservoir
-                # Entrées: receptions, transferts entrants, inventaires, avoirs (retour), échanges entrants
-                # Sorties: ventes, sorties, transferts sortants, consommation interne, échanges sortants
-                solde_unite = (receptions + t_in + inv + avoirs + echange_in - ventes - t_out - consomm - echange_out)
-                total_stock_global_base += (solde_unite * qtunite_boucle)
-
-            # 4. Conversion finale : réservoir / qtunite de l'unité cible
-            stock_final = total_stock_global_base / qtunite_affichage
-            return max(0, stock_final)
-
+            return stock_article(idarticle, idunite_cible, idmag)
         except Exception as e:
             print(f"Erreur calcul stock consolidé : {e}")
             return 0
-        finally:
-            cursor.close()
-            conn.close()
     
     def ajouter_article(self):
         # 1. Vérifications de base (Article et Unité)
@@ -899,6 +573,9 @@ class PageTransfert(ctk.CTkFrame):
                     idtransfert
                 ))
 
+                # Annuler l'effet des anciennes lignes sur tb_stock_solde
+                appliquer_requete(cur, self.SQL_ANNULER_SOLDES_TRANSFERT, (idtransfert, idtransfert))
+
                 # Supprimer les anciennes lignes de détail (soft-delete)
                 cur.execute("""
                     UPDATE tb_transfertdetail SET deleted = 1
@@ -923,6 +600,7 @@ class PageTransfert(ctk.CTkFrame):
                         self.magasins_data[mag_entree]
                     ))
 
+                self._appliquer_soldes_transfert(cur, mag_sortie, mag_entree)
                 conn.commit()
                 cur.close()
                 conn.close()
@@ -933,6 +611,8 @@ class PageTransfert(ctk.CTkFrame):
                 return   # fin du chemin UPDATE
 
             # ---------- MODE CRÉATION (INSERT) ----------
+            # ✅ Référence attribuée dans la transaction (unique même entre postes)
+            self.afficher_reference(numerotation.prochaine_reference(cur, "TRA"))
             cur.execute("""
                 INSERT INTO tb_transfert 
                 (reftransfert, iduser, idmagsortie, idmagentree, dateregistre, description, deleted)
@@ -967,6 +647,7 @@ class PageTransfert(ctk.CTkFrame):
                     self.magasins_data[mag_entree]
                 ))
             
+            self._appliquer_soldes_transfert(cur, mag_sortie, mag_entree)
             conn.commit()
             cur.close()
             conn.close()
@@ -978,6 +659,16 @@ class PageTransfert(ctk.CTkFrame):
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur enregistrement: {str(e)}")
     
+    def _appliquer_soldes_transfert(self, cur, mag_sortie, mag_entree):
+        """Reporte les lignes du transfert courant dans tb_stock_solde (même transaction)."""
+        idmag_sortie = self.magasins_data[mag_sortie]
+        idmag_entree = self.magasins_data[mag_entree]
+        mouvements = []
+        for art in self.articles_transfert:
+            mouvements.append((art['idarticle'], art['idunite'], idmag_sortie, -art['quantite']))
+            mouvements.append((art['idarticle'], art['idunite'], idmag_entree, art['quantite']))
+        appliquer_mouvements(cur, mouvements)
+
     def imprimer_transfert(self, idtransfert):
         try:
             conn = self.get_connection()
@@ -1049,14 +740,10 @@ class PageTransfert(ctk.CTkFrame):
             try:
                 from EtatsPDF_Mouvements import EtatPDFMouvements
 
-                etat = EtatPDFMouvements()
-                try:
-                    etat.connect_db()
-                except Exception:
-                    pass
-
-                result = etat._build_pdf_a5(
-                    output_path=filename,
+                # ✅ Rendu dans le pool : la page reste utilisable pendant la génération
+                EtatPDFMouvements().rendre_pdf_a5(
+                    self, filename,
+                    rappel=rendu_pdf.ouvrir if os.name == 'nt' else None,
                     titre_entete="BON DE TRANSFERT",
                     reference=reftransfert,
                     date_operation=date_operation,
@@ -1067,18 +754,7 @@ class PageTransfert(ctk.CTkFrame):
                     responsable_1="Le Magasinier",
                     responsable_2="Le Contrôleur",
                 )
-
-                try:
-                    etat.close_db()
-                except Exception:
-                    pass
-
-                if result:
-                    try:
-                        os.startfile(filename)
-                    except Exception:
-                        pass
-                return result
+                return filename
             except Exception as e:
                 messagebox.showerror("Erreur", f"Erreur génération PDF transfert (builder): {str(e)}")
                 return None
@@ -1275,6 +951,9 @@ class PageTransfert(ctk.CTkFrame):
                     return
                 cur = conn.cursor()
 
+                # Remettre les quantités dans tb_stock_solde avant le soft-delete
+                appliquer_requete(cur, self.SQL_ANNULER_SOLDES_TRANSFERT, (id_transfert, id_transfert))
+
                 # Soft-delete détails puis en-tête
                 cur.execute("UPDATE tb_transfertdetail SET deleted = 1 WHERE idtransfert = %s AND deleted = 0",
                             (id_transfert,))
@@ -3,6 +3,7 @@ from tkinter import messagebox, ttk
 import psycopg2
 import json
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
 
 
 
@@ -21,7 +22,7 @@ class DBConnector:
             with open(get_config_path('config.json')) as f:
                 config = json.load(f)
                 db_config = config['database']
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -10,7 +10,14 @@ import os
 import sys # Ajouté pour open_file sur Linux/macOS
 import textwrap # Ajouté pour le formatage du ticket de caisse
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+from stock_engine import stock_article, stock_unites, appliquer_requete
+from catalogue_cache import catalogue
+from recherche_index import search_clients
+import numerotation
+import mesures
 
+journal = mesures.journal(__name__)
 
 # --- NOUVELLES IMPORTATIONS POUR L'IMPRESSION ---
 from reportlab.lib.pagesizes import A5, landscape
@@ -199,6 +206,14 @@ class PageVente(ctk.CTkFrame):
     """
     Fenêtre de gestion des ventes de stock.
     """
+    # Lignes d'une facture VALIDEE (seules les ventes validées sortent du stock)
+    SQL_LIGNES_VENTE_VALIDEE = """
+        SELECT vd.idarticle, vd.idunite, v.idmag, vd.qtvente
+        FROM tb_ventedetail vd
+        JOIN tb_vente v ON v.id = vd.idvente
+        WHERE v.id = %s AND v.deleted = 0 AND vd.deleted = 0 AND v.statut = 'VALIDEE'
+    """
+
     def __init__(self, master, id_user_connecte=None, **kwargs):
         super().__init__(master, **kwargs)
         self.id_user_connecte = id_user_connecte
@@ -242,7 +257,6 @@ class PageVente(ctk.CTkFrame):
         self.charger_magasins()
         self.charger_client()
         self.charger_infos_societe()
-        self.conn = self.connect_db() 
 
     def connect_db(self):
         """Connexion à la base de données PostgreSQL (Méthode fournie par l'utilisateur)"""
@@ -251,7 +265,7 @@ class PageVente(ctk.CTkFrame):
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -288,7 +302,13 @@ class PageVente(ctk.CTkFrame):
 
     def get_article_price(self, idarticle, idunite):
         """Récupère le dernier prix unitaire pour l'article et l'unité donnés."""
-        conn = self.conn   # <<< UTILISATION DE LA CONNEXION PRINCIPALE
+        # ✅ Cache catalogue (aucun aller-retour base dans le cas courant)
+        prix = catalogue().prix_unite(idarticle, idunite)
+        if prix > 0:
+            return float(prix)
+
+        # ✅ Connexion empruntée au pool le temps de la lecture (plus de self.conn gardée)
+        conn = self.connect_db()
         if not conn:
             return 0.0
 
@@ -330,33 +350,22 @@ class PageVente(ctk.CTkFrame):
         finally:
             if 'cursor' in locals():
                 cursor.close()
+            conn.close()
 
     
-    def calculer_stock_article(self, id_art, id_uni, id_mag):
-        """Calcule le stock actuel pour un article, une unité et un magasin précis."""
-        conn = self.connect_db()
-        stock_total = 0
-        if conn:
-            try:
-                cursor = conn.cursor()
-                query = """
-                SELECT 
-                    (SELECT COALESCE(SUM(quantite), 0) FROM tb_entree_stock 
-                     WHERE idarticle = %s AND idunite = %s AND idmagasin = %s) -
-                                        (SELECT COALESCE(SUM(quantite), 0) FROM tb_ligne_vente lv
-                                         JOIN tb_vente v ON lv.idvente = v.idvente
-                                         WHERE lv.idarticle = %s AND lv.idunite = %s AND v.idmagasin = %s
-                                             AND v.statut = 'VALIDEE')
-            """
-                cursor.execute(query, (id_art, id_uni, id_mag, id_art, id_uni, id_mag))
-                res = cursor.fetchone()
-                stock_total = res[0] if res else 0
-                cursor.close()
-                conn.close()
-            except Exception as e:
-                print(f"Erreur calcul stock: {e}")
-        return stock_total
+    def calculer_stock_article(self, idarticle, idunite_cible, idmag=None):
+        """
+        ✅ CALCUL CONSOLIDÉ via le moteur partagé (stock_engine) :
+        réservoir commun en unité de base sur les 10 sources de mouvements,
+        divisé par le qtunite de l'unité cible. Une seule requête ensembliste.
+        """
+        try:
+            return stock_article(idarticle, idunite_cible, idmag)
+        except Exception as e:
+            print(f"Erreur calcul stock consolidé : {e}")
+            return 0
     
+    @mesures.chronometre()
     def charger_stocks(self):
         """Charge tous les stocks dans le Treeview"""
         # Créer/recréer le Treeview
@@ -391,7 +400,13 @@ class PageVente(ctk.CTkFrame):
             cursor.execute(query)
             articles = cursor.fetchall()
             
-            # Pour chaque article, calculer le stock par magasin
+            # Stocks de toutes les lignes × magasins en un seul appel au moteur
+            stocks = stock_unites(
+                [(a[0], a[4], idmag) for a in articles for idmag, _ in self.magasins],
+                conn=conn
+            )
+            
+            # Pour chaque article, lire le stock par magasin
             for article in articles:
                 idarticle, code, designation, unite, idunite, prix = article
                 
@@ -400,7 +415,7 @@ class PageVente(ctk.CTkFrame):
                 total_stock = 0
                 
                 for idmag, nom_mag in self.magasins:
-                    stock = self.calculer_stock_article(idarticle, idunite, idmag)
+                    stock = stocks[(idarticle, idunite, idmag)]
                     stocks_magasins.append(stock)
                     total_stock += stock
                 
@@ -762,16 +777,9 @@ class PageVente(ctk.CTkFrame):
             conn = self.connect_db()
             if not conn: return
             try:
-                cursor = conn.cursor()
-                filtre_like = f"%{filtre}%"
-                cursor.execute("""
-                    SELECT idclient, nomcli FROM tb_client 
-                    WHERE deleted = 0 AND nomcli ILIKE %s
-                    ORDER BY nomcli
-                """, (filtre_like,))
-                clients = cursor.fetchall()
-                for id_client, nom_client in clients:
-                    tree.insert("", "end", values=(id_client, nom_client))
+                # Recherche indexée (trigrammes, sans accents), classée par pertinence
+                for c in search_clients(filtre, conn=conn):
+                    tree.insert("", "end", values=(c.idclient, c.nomcli))
             except Exception as e:
                 messagebox.showerror("Erreur", f"Erreur lors du chargement des clients: {str(e)}")
             finally:
@@ -823,40 +831,20 @@ class PageVente(ctk.CTkFrame):
         
         try:
             cursor = conn.cursor()
-            annee = datetime.now().year
-            
-            # Trouver la dernière référence de l'année
-            cursor.execute("""
-                SELECT refvente FROM tb_vente 
-                WHERE refvente ILIKE %s 
-                ORDER BY id DESC 
-                LIMIT 1
-            """, (f"%{annee}-FA-%",))
-            
-            derniere_ref = cursor.fetchone()
-            nouveau_numero = 1
-            
-            if derniere_ref:
-                parts = derniere_ref[0].split('-')
-                if len(parts) == 3 and parts[1] == 'FA':
-                    try:
-                        partie_num = parts[-1]
-                        nouveau_numero = int(partie_num) + 1
-                    except ValueError:
-                        nouveau_numero = 1
-            
-            nouvelle_ref = f"{annee}-FA-{nouveau_numero:05d}"
-            
-            self.entry_ref_vente.configure(state="normal")
-            self.entry_ref_vente.delete(0, "end")
-            self.entry_ref_vente.insert(0, nouvelle_ref)
-            self.entry_ref_vente.configure(state="readonly")
+            # ✅ Aperçu : la référence définitive est attribuée à l'enregistrement
+            self.afficher_reference(numerotation.apercu(cursor, "FA"))
 
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur lors de la génération de la référence: {str(e)}")
         finally:
             conn.close()
 
+    def afficher_reference(self, reference):
+        self.entry_ref_vente.configure(state="normal")
+        self.entry_ref_vente.delete(0, "end")
+        self.entry_ref_vente.insert(0, reference)
+        self.entry_ref_vente.configure(state="readonly")
+
     def charger_magasins(self):
         """Récupère la liste des magasins depuis la base de données."""
         conn = self.connect_db()
@@ -959,20 +947,18 @@ class PageVente(ctk.CTkFrame):
         if not conn: return
 
         try:
-            cursor = conn.cursor()
-            # Requête SQL (Identique à la logique de page_stock.py)
-            query = """
-            SELECT DISTINCT ON (u.codearticle)
-                a.idarticle, u.idunite, u.codearticle, a.designation, 
-                u.designationunite, COALESCE(p.prix, 0)
-            FROM tb_article a
-            INNER JOIN tb_unite u ON a.idarticle = u.idarticle
-            LEFT JOIN tb_prix p ON (a.idarticle = p.idarticle AND u.idunite = p.idunite)
-            WHERE a.deleted = 0 AND (LOWER(u.codearticle) LIKE %s OR LOWER(a.designation) LIKE %s)
-            ORDER BY u.codearticle, p.dateregistre DESC
-        """
-            cursor.execute(query, (f"%{search_query}%", f"%{search_query}%"))
-            articles = cursor.fetchall()
+            # ✅ Filtrage local du cache catalogue (une ligne par code article)
+            par_code = {}
+            for l in catalogue().rechercher(search_query):
+                par_code.setdefault(l.codearticle, (
+                    l.idarticle, l.idunite, l.codearticle, l.designation, l.designationunite, l.prix
+                ))
+            articles = [par_code[code] for code in sorted(par_code)]
+
+            stocks = stock_unites(
+                [(a[0], a[1], mag[0]) for a in articles for mag in self.magasins],
+                conn=conn
+            )
 
             for art in articles:
                 id_art, id_uni, code, desig, unite, prix = art
@@ -982,8 +968,7 @@ class PageVente(ctk.CTkFrame):
                 # Boucle sur les magasins pour remplir les colonnes dynamiques
                 for mag in self.magasins:
                     id_mag = mag[0]
-                    # Utilisation de votre fonction existante de calcul de stock
-                    s = self.calculer_stock_article(id_art, id_uni, id_mag)
+                    s = stocks[(id_art, id_uni, id_mag)]
                     stocks_mag.append(self.formater_nombre(s))
                     total_stock += s
 
@@ -1602,11 +1587,16 @@ class PageVente(ctk.CTkFrame):
                     print(f"🔄 UPDATE avec params: {params}")
                     cursor.execute(sql_vente, params)
 
+                    # Facture déjà VALIDEE : retirer l'effet des anciennes lignes de tb_stock_solde
+                    appliquer_requete(cursor, self.SQL_LIGNES_VENTE_VALIDEE, (idvente,), signe=1)
+
                     # Suppression des anciens détails pour réinsertion
                     cursor.execute("DELETE FROM tb_ventedetail WHERE idvente = %s", (idvente,))
                 
                 else:
-                    # Mode Ajout
+                    # Mode Ajout : référence attribuée dans la transaction (unique même entre postes)
+                    ref_vente = numerotation.prochaine_reference(cursor, "FA")
+                    self.afficher_reference(ref_vente)
                     sql_vente = """
                         INSERT INTO tb_vente (refvente, dateregistre, description, iduser, idclient, totmtvente, statut, deleted) 
                         VALUES (%s, %s, %s, %s, %s, %s, %s, 0) 
@@ -1640,6 +1630,9 @@ class PageVente(ctk.CTkFrame):
 
                 cursor.executemany(sql_vente_detail, details_a_inserer)
 
+                # Facture déjà VALIDEE : appliquer les nouvelles lignes à tb_stock_solde
+                appliquer_requete(cursor, self.SQL_LIGNES_VENTE_VALIDEE, (idvente,), signe=-1)
+
                 # 4. Commit et mise à jour de l'interface
                 conn.commit()
             
@@ -1752,15 +1745,12 @@ class PageVente(ctk.CTkFrame):
         except Exception as e:
             pass # Ignorer les erreurs d'ouverture de fichier
 
+    @mesures.chronometre()
     def get_data_facture(self, idvente: int) -> Optional[Dict[str, Any]]:
         """Récupère toutes les données nécessaires pour l'impression d'une facture."""
-        print(f"\n{'='*60}")
-        print(f"🔍 GET_DATA_FACTURE - ID Vente: {idvente}")
-        print(f"{'='*60}")
-    
         conn = self.connect_db()
         if not conn:
-            print("❌ ERREUR: Connexion DB impossible")
+            journal.error("get_data_facture : connexion DB impossible")
             return None
 
         data = {
@@ -1773,11 +1763,6 @@ class PageVente(ctk.CTkFrame):
         try:
             cursor = conn.cursor()
 
-            # DEBUG: Vérifier que l'ID existe dans la table
-            cursor.execute("SELECT COUNT(*) FROM tb_vente WHERE id = %s", (idvente,))
-            count = cursor.fetchone()[0]
-            print(f"📊 Nombre de ventes trouvées avec id={idvente}: {count}")
-
             # 1. Infos Vente & Client
             sql_vente = """
                 SELECT 
@@ -1789,16 +1774,13 @@ class PageVente(ctk.CTkFrame):
                 LEFT JOIN tb_client c ON v.idclient = c.idclient 
                 WHERE v.id = %s
             """
-            print(f"📝 Exécution requête vente avec id={idvente}")
             cursor.execute(sql_vente, (idvente,))
             result = cursor.fetchone()
         
             if not result:
-                print(f"❌ ERREUR: Aucune vente trouvée pour id={idvente}")
+                journal.warning("get_data_facture : aucune vente pour id=%s", idvente)
                 return None
         
-            print(f"✅ Vente trouvée: {result[0]}")
-        
             (refvente, dateregistre, description, nomuser, prenomuser, nomcli, adressecli, contactcli) = result
 
             data['vente'] = {
@@ -1828,12 +1810,9 @@ class PageVente(ctk.CTkFrame):
                 WHERE vd.idvente = %s
                 ORDER BY a.designation
             """
-            print(f"📝 Exécution requête détails pour idvente={idvente}")
             cursor.execute(sql_details, (idvente,))
             details_rows = cursor.fetchall()
         
-            print(f"📦 Nombre de détails trouvés: {len(details_rows)}")
-        
             data['details'] = [
                 {
                     'code_article': row[0],
@@ -1846,16 +1825,12 @@ class PageVente(ctk.CTkFrame):
                 }
                 for row in details_rows
             ]
-        
-            print(f"✅ Données complètes récupérées avec succès")
-            print(f"{'='*60}\n")
+            journal.debug("Facture %s : %d ligne(s)", refvente, len(details_rows))
 
             return data
 
         except Exception as e:
-            print(f"❌ ERREUR CRITIQUE dans get_data_facture: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            journal.exception("get_data_facture(%s)", idvente)
             messagebox.showerror("Erreur", f"Erreur lors de la récupération des données de facture : {e}")
             return None
         finally:
@@ -6,21 +6,34 @@ from datetime import datetime
 import calendar 
 from typing import Optional, Dict, Any, List
 import traceback 
-import os
-import sys # Ajouté pour open_file sur Linux/macOS
+import threading
 import textwrap # Ajouté pour le formatage du ticket de caisse
 import winsound
 from resource_utils import get_config_path, safe_file_read
+from db_pool import connecter
+from stock_engine import stock_article, sql_soldes, soldes_base_par_magasin
+from catalogue_cache import catalogue
+from recherche_async import ControleurRecherche
+from recherche_index import search_clients
+from session_vente import session_vente, INFOS_SOCIETE_DEFAUT
+import rendu_pdf
+import numerotation
+import enregistrement_vente
+import mesures
+import thread_tk
+from facture_a5 import generer_facture_a5, nombre_en_lettres_fr
+from export_factures import lire_factures
+
+journal = mesures.journal(__name__)
 
 
 # --- NOUVELLES IMPORTATIONS POUR L'IMPRESSION ---
 from reportlab.lib.pagesizes import A5, landscape
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
 
-from pages.page_avoir import PageAvoir
-from pages.page_proforma import PageCommandeCli
+# ✅ PageAvoir / PageCommandeCli sont importées à l'ouverture de leur fenêtre :
+# la caisse ne paie plus leur chargement au démarrage.
 
 class PasswordDialog(ctk.CTkToplevel):
     def __init__(self, title, text):
@@ -48,128 +61,6 @@ class PasswordDialog(ctk.CTkToplevel):
 
 # -----------------------------------------------
 
-# ==============================================================================
-# FONCTION UTILITAIRE : CONVERSION NOMBRE EN LETTRES (FRANÇAIS)
-# ==============================================================================
-
-def nombre_en_lettres_fr(montant: float) -> str:
-    """
-    Convertit un montant numérique en sa représentation en lettres en français.
-    Gère les Millions et les Milliers correctement.
-    """
-    from math import floor
-    
-    if montant is None: return ""
-    
-    try:
-        montant = round(float(montant), 2)
-    except ValueError:
-        return ""
-
-    unites = ["", "un", "deux", "trois", "quatre", "cinq", "six", "sept", "huit", "neuf"]
-    dix_a_dixneuf = ["dix", "onze", "douze", "treize", "quatorze", "quinze", "seize"]
-    dizaines = ["", "dix", "vingt", "trente", "quarante", "cinquante", "soixante", "soixante", "quatre-vingt", "quatre-vingt"]
-    
-    def convertir_nombre_simple(n):
-        if n == 0: return ""
-        texte = []
-        
-        # Unités (0-9)
-        if n < 10:
-            texte.append(unites[n])
-        # 10-16
-        elif n < 17:
-            texte.append(dix_a_dixneuf[n - 10])
-        # 17-19
-        elif n < 20:
-            texte.append("dix-" + unites[n - 10])
-        # 20-99 (simplifié)
-        elif n < 100:
-            d = n // 10
-            u = n % 10
-            
-            partie_dizaine = dizaines[d]
-            if (d == 2 or d > 6) and u == 1: # 21, 71, 91 (simplifié)
-                 partie_dizaine += " et"
-            
-            texte.append(partie_dizaine)
-            if u > 0:
-                if d == 7 or d == 9: # 70-79, 90-99
-                    texte.append("-" + convertir_nombre_simple(n - (d * 10)))
-                else:
-                    texte.append("-" + unites[u])
-        
-        return "".join(texte).replace("--", "-") # Corrige double trait d'union
-
-    def convertir_bloc(n):
-        if n == 0: return ""
-        if n < 100: return convertir_nombre_simple(n)
-        
-        texte = []
-        c = n // 100
-        r = n % 100
-        
-        if c == 1: texte.append("cent")
-        else: 
-            texte.append(convertir_nombre_simple(c) + "-cent")
-            if r == 0: texte[-1] += "s" # Quatre-cents
-        
-        if r > 0:
-            texte.append("-" + convertir_bloc(r))
-
-        return "".join(texte).replace("un-cent", "cent") # Corrige 'un-cent' -> 'cent'
-    
-    entier = floor(montant)
-    centimes = int(round((montant - entier) * 100))
-    
-    # ====================================================================
-    # Gestion des blocs Millions, Milliers, Unités
-    # ====================================================================
-    million = entier // 1_000_000
-    mille_reste = (entier % 1_000_000) // 1_000 
-    reste_unites = entier % 1_000 
-    
-    resultat = []
-    
-    # 1. MILLIONS
-    if million > 0:
-        lettres_million = convertir_bloc(million)
-        bloc_million = "million"
-        if million > 1: bloc_million += "s"
-        resultat.append(f"{lettres_million} {bloc_million}")
-    
-    # 2. MILLIERS (0 à 999)
-    if mille_reste > 0:
-        lettres_mille = convertir_bloc(mille_reste)
-        resultat.append(f"{lettres_mille} mille")
-    
-    # 3. UNITÉS (0 à 999)
-    if reste_unites > 0:
-        resultat.append(convertir_bloc(reste_unites))
-    
-    # 4. CAS SPECIAL: ZÉRO
-    if entier == 0 and centimes == 0 and not resultat:
-        resultat.append("zéro")
-
-    
-    # Monnaie
-    result_str = " ".join(resultat).strip().replace("  ", " ").replace("-", " ") 
-    if not result_str: result_str = "zéro"
-    
-    #unite_monetaire = "Ariary" # Assurez-vous que cette unité est correcte (était "Francs" dans le code précédent)
-    #result_str += " " + unite_monetaire
-    
-    # Centimes
-    if centimes > 0:
-        centime_lettres = convertir_bloc(centimes)
-        centime_monetaire = "centimes"
-        centime_lettres = centime_lettres.replace("-", " ")
-        result_str += " et " + centime_lettres + " " + centime_monetaire
-
-    return result_str.capitalize().replace(" et-", " et ")
-    
-# ==============================================================================
-
 # ==============================================================================
 # CLASSE UTILITAIRE : DIALOGUE DE CHOIX D'IMPRESSION (CTKTOPLEVEL)
 # ==============================================================================
@@ -235,7 +126,7 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         else:
             self.id_user_connecte = id_user_connecte
             print(f"✅ Utilisateur connecté - ID: {self.id_user_connecte}") 
-        self.conn: Optional[psycopg2.connection] = None
+        self.session = session_vente()   # ✅ données de référence partagées entre onglets
         self.article_selectionne = None
         self.stock_temporaire_selection = None
         self.detail_vente = []
@@ -252,7 +143,7 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         self.details_proforma_a_ajouter: Optional[List[Dict]] = None # NOUVEAU: Stocke temporairement les lignes du proforma
         self.details_proforma_a_ajouter_idprof: Optional[int] = None # NOUVEAU: ID du proforma chargé
         
-        # Charger les paramètres d'impression
+        # Charger les paramètres d'impression (settings.json lu une fois par session)
         self.settings = self.load_settings()
         
         self.grid_columnconfigure(0, weight=1)
@@ -269,7 +160,6 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         self.charger_magasins()
         self.charger_client()
         self.charger_infos_societe()
-        self.conn = self.connect_db() 
 
     def connect_db(self):
         """Connexion à la base de données PostgreSQL (Méthode fournie par l'utilisateur)"""
@@ -278,7 +168,7 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
                 config = json.load(f)
                 db_config = config['database']
 
-            conn = psycopg2.connect(
+            conn = connecter(
                 host=db_config['host'],
                 user=db_config['user'],
                 password=db_config['password'],
@@ -294,32 +184,8 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
             return None
     
     def load_settings(self) -> Dict[str, Any]:
-        """Charge les paramètres d'impression depuis settings.json"""
-        try:
-            with open('settings.json', 'r', encoding='utf-8') as f:
-                settings = json.load(f)
-                print(f"✅ Paramètres d'impression chargés depuis settings.json")
-                return settings
-        except FileNotFoundError:
-            print("⚠️ Fichier settings.json non trouvé, utilisation des paramètres par défaut")
-            return {
-                'Vente_ImpressionConfirmation': 1,
-                'Vente_ImpressionA5': 1,
-                'Vente_ImpressionTicket': 0,
-                'Avoir_ImpressionConfirmation': 1,
-                'Avoir_ImpressionA5': 1,
-                'Avoir_ImpressionTicket': 0
-            }
-        except json.JSONDecodeError:
-            print("⚠️ Erreur dans le format de settings.json, utilisation des paramètres par défaut")
-            return {
-                'Vente_ImpressionConfirmation': 1,
-                'Vente_ImpressionA5': 1,
-                'Vente_ImpressionTicket': 0,
-                'Avoir_ImpressionConfirmation': 1,
-                'Avoir_ImpressionA5': 1,
-                'Avoir_ImpressionTicket': 0
-            }
+        """Paramètres d'impression de settings.json (partagés par la session de vente)."""
+        return self.session.settings()
     
     # --- FONCTIONS DE FORMATAGE ET DE CALCUL DE STOCK ---
     def formater_nombre(self, nombre):
@@ -353,80 +219,24 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
 
     def get_article_price(self, idarticle, idunite):
         """Récupère le dernier prix unitaire pour l'article et l'unité donnés."""
-        conn = self.conn   # <<< UTILISATION DE LA CONNEXION PRINCIPALE
-        if not conn:
-            return 0.0
-
+        # ✅ Cache catalogue, puis tb_prix mémorisé par la session (aucune connexion par onglet)
         try:
-            cursor = conn.cursor()
-
-            # 1. Dernier prix dans tb_prix
-            sql_prix = """
-                SELECT COALESCE(prix) as prix FROM tb_prix 
-                WHERE idarticle = %s AND idunite = %s 
-                ORDER BY id DESC 
-                LIMIT 1
-            """
-            cursor.execute(sql_prix, (idarticle, idunite))
-            result = cursor.fetchone()
-
-            if result and result[0] is not None and result[0] > 0:
-                return float(result[0])
-
-            # 2. Sinon, prixventeunite dans tb_unite
-            sql_unite = """
-                SELECT prix 
-                FROM tb_prix 
-                WHERE idarticle = %s AND idunite = %s 
-                LIMIT 1
-            """
-            cursor.execute(sql_unite, (idarticle, idunite))
-            result_unite = cursor.fetchone()
-
-            if result_unite and result_unite[0] is not None:
-                return float(result_unite[0])
-
-            return 0.0
-
+            return self.session.prix(idarticle, idunite)
         except Exception as e:
             print("ERREUR get_article_price :", e)
             return 0.0
 
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
-
     def get_unite_niveau_max(self, idarticle):
         """
-        Récupère l'unité de niveau maximum pour un article donné.
+        Récupère l'unité de niveau maximum pour un article donné (cache catalogue).
         Retourne: (idunite, niveau, designationunite) ou None
         """
-        conn = self.connect_db()
-        if not conn:
-            return None
-    
         try:
-            cursor = conn.cursor()
-        
-            # Récupérer l'unité avec le niveau maximum
-            sql = """
-            SELECT idunite, niveau, designationunite 
-            FROM tb_unite 
-            WHERE idarticle = %s 
-            ORDER BY niveau DESC 
-            LIMIT 1
-        """
-            cursor.execute(sql, (idarticle,))
-            result = cursor.fetchone()
-        
-            return result if result else None
-        
+            ligne = catalogue().niveau_max(idarticle)
+            return (ligne.idunite, ligne.niveau, ligne.designationunite) if ligne else None
         except Exception as e:
             print(f"Erreur get_unite_niveau_max: {e}")
             return None
-        finally:
-            cursor.close()
-            conn.close()
 
 
     def verifier_unite_depot_b(self, idarticle, idunite):
@@ -443,43 +253,23 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         if "B" not in magasin_selectionne_nom.upper():
             return (True, "")
     
-        conn = self.connect_db()
-        if not conn:
-            return (False, "Erreur de connexion à la base de données")
-    
         try:
-            cursor = conn.cursor()
-        
-            # Récupérer le niveau de l'unité sélectionnée
-            cursor.execute("""
-                SELECT niveau, designationunite 
-                FROM tb_unite 
-                WHERE idarticle = %s AND idunite = %s
-            """, (idarticle, idunite))
-        
-            unite_selectionnee = cursor.fetchone()
-        
-            if not unite_selectionnee:
+            cat = catalogue()
+
+            # Niveau de l'unité sélectionnée (cache catalogue)
+            unite_selectionnee = cat.unite(idunite)
+            if not unite_selectionnee or unite_selectionnee.idarticle != int(idarticle):
                 return (False, "Unité introuvable")
         
-            niveau_selectionne, designation_selectionnee = unite_selectionnee
-        
-            # Récupérer le niveau maximum pour cet article
-            cursor.execute("""
-                SELECT MAX(niveau), designationunite 
-                FROM tb_unite 
-                WHERE idarticle = %s 
-                GROUP BY designationunite
-                ORDER BY MAX(niveau) DESC
-                LIMIT 1
-            """, (idarticle,))
-        
-            niveau_max_result = cursor.fetchone()
+            niveau_selectionne = unite_selectionnee.niveau
+            designation_selectionnee = unite_selectionnee.designationunite
         
-            if not niveau_max_result:
+            # Niveau maximum pour cet article
+            unite_max = cat.niveau_max(idarticle)
+            if not unite_max:
                 return (False, "Impossible de déterminer le niveau maximum")
         
-            niveau_max, designation_max = niveau_max_result
+            niveau_max, designation_max = unite_max.niveau, unite_max.designationunite
         
             # Vérifier si l'unité sélectionnée est bien celle de niveau maximum
             if niveau_selectionne < niveau_max:
@@ -493,113 +283,20 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         except Exception as e:
             print(f"Erreur verifier_unite_depot_b: {e}")
             return (False, f"Erreur lors de la vérification: {str(e)}")
-        finally:
-            cursor.close()
-            conn.close()
     
     def calculer_stock_article(self, idarticle, idunite_cible, idmag=None):
         """
-        ✅ CALCUL CONSOLIDÉ (identique à page_stock.py) :
-        Relie tous les mouvements de toutes les unités (PIECE, CARTON, etc.)
-        d'un même idarticle via le coefficient 'qtunite' de tb_unite.
-
-        LOGIQUE :
-          1) On récupère toutes les unités sœurs (même idarticle).
-          2) Pour chaque unité sœur, on somme ses mouvements puis on les convertit
-             en "unité de base" en multipliant par son qtunite.
-          3) Le solde total (réservoir commun) est divisé par le qtunite de
-             l'unité cible pour obtenir le stock affiché.
-
-        Exemple : vente de 20 PIECES → réservoir diminue de 20×1 = 20.
-                  CARTON (qtunite=20) → stock = réservoir / 20  →  -1 CARTON.
+        ✅ CALCUL CONSOLIDÉ via le moteur partagé (stock_engine) :
+        réservoir commun en unité de base sur les 10 sources de mouvements,
+        divisé par le qtunite de l'unité cible. Une seule requête ensembliste.
         """
-        conn = self.connect_db()
-        if not conn:
-            return 0
-
         try:
-            cursor = conn.cursor()
-
-            # 1. Récupérer TOUTES les unités liées à cet idarticle
-            cursor.execute("""
-                SELECT idunite, codearticle, COALESCE(qtunite, 1)
-                FROM tb_unite
-                WHERE idarticle = %s
-            """, (idarticle,))
-            unites_liees = cursor.fetchall()
-
-            # 2. Identifier le qtunite de l'unité cible
-            qtunite_affichage = 1
-            for idu, code, qt_u in unites_liees:
-                if idu == idunite_cible:
-                    qtunite_affichage = qt_u if qt_u > 0 else 1
-                    break
-
-            total_stock_global_base = 0  # Réservoir commun en unité de base
-
-            # 3. Sommer les mouvements de chaque unité sœur
-            for idu_boucle, code_boucle, qtunite_boucle in unites_liees:
-
-                # --- Réceptions ---
-                q_rec = "SELECT COALESCE(SUM(qtlivrefrs), 0) FROM tb_livraisonfrs WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_rec = [idarticle, idu_boucle]
-                if idmag:
-                    q_rec += " AND idmag = %s"
-                    p_rec.append(idmag)
-                cursor.execute(q_rec, p_rec)
-                receptions = cursor.fetchone()[0] or 0
-
-                # --- Ventes ---
-                q_ven = "SELECT COALESCE(SUM(qtvente), 0) FROM tb_ventedetail vd INNER JOIN tb_vente v ON vd.idvente = v.id WHERE vd.idarticle = %s AND vd.idunite = %s AND v.deleted = 0 AND v.statut = 'VALIDEE'"
-                p_ven = [idarticle, idu_boucle]
-                if idmag:
-                    q_ven += " AND v.idmag = %s"
-                    p_ven.append(idmag)
-                cursor.execute(q_ven, p_ven)
-                ventes = cursor.fetchone()[0] or 0
-
-                # --- Transferts entrants ---
-                q_tin = "SELECT COALESCE(SUM(qttransfert), 0) FROM tb_transfertdetail WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_tin = [idarticle, idu_boucle]
-                if idmag:
-                    q_tin += " AND idmagentree = %s"
-                    p_tin.append(idmag)
-                cursor.execute(q_tin, p_tin)
-                t_in = cursor.fetchone()[0] or 0
-
-                # --- Transferts sortants ---
-                q_tout = "SELECT COALESCE(SUM(qttransfert), 0) FROM tb_transfertdetail WHERE idarticle = %s AND idunite = %s AND deleted = 0"
-                p_tout = [idarticle, idu_boucle]
-                if idmag:
-                    q_tout += " AND idmagsortie = %s"
-                    p_tout.append(idmag)
-                cursor.execute(q_tout, p_tout)
-                t_out = cursor.fetchone()[0] or 0
-
-                # --- Inventaires (via codearticle) ---
-                q_inv = "SELECT COALESCE(SUM(qtinventaire), 0) FROM tb_inventaire WHERE codearticle = %s"
-                p_inv = [code_boucle]
-                if idmag:
-                    q_inv += " AND idmag = %s"
-                    p_inv.append(idmag)
-                cursor.execute(q_inv, p_inv)
-                inv = cursor.fetchone()[0] or 0
-
-                # Conversion en unité de base puis accumulation dans le réservoir
-                solde_unite = (receptions + t_in + inv - ventes - t_out)
-                total_stock_global_base += (solde_unite * qtunite_boucle)
-
-            # 4. Conversion finale : réservoir / qtunite de l'unité cible
-            stock_final = total_stock_global_base / qtunite_affichage
-            return max(0, stock_final)
-
+            return stock_article(idarticle, idunite_cible, idmag)
         except Exception as e:
             print(f"Erreur calcul stock consolidé : {e}")
             return 0
-        finally:
-            cursor.close()
-            conn.close()
     
+    @mesures.chronometre()
     def charger_stocks(self):
         """Charge les stocks détaillés par magasin - VERSION ULTRA OPTIMISÉE"""
         self.creer_treeview()
@@ -609,97 +306,13 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
     
         try:
             cursor = conn.cursor()
-            
-            print("Chargement des stocks en cours...")
         
             # ✅ REQUÊTE CORRIGÉE : même logique réservoir que page_stock.py.
             # Les articles liés (même idarticle, unités différentes) sont reliés
             # via qtunite de tb_unite.
-            query_optimisee = """
-            WITH mouvements_bruts AS (
-                SELECT
-                    lf.idarticle,
-                    lf.idmag,
-                    COALESCE(u.qtunite, 1) as qtunite_source,
-                    lf.qtlivrefrs as quantite,
-                    'reception' as type_mouvement
-                FROM tb_livraisonfrs lf
-                INNER JOIN tb_unite u ON lf.idarticle = u.idarticle AND lf.idunite = u.idunite
-                WHERE lf.deleted = 0
-
-                UNION ALL
-
-                SELECT
-                    vd.idarticle,
-                    v.idmag,
-                    COALESCE(u.qtunite, 1) as qtunite_source,
-                    vd.qtvente as quantite,
-                    'vente' as type_mouvement
-                FROM tb_ventedetail vd
-                INNER JOIN tb_vente v ON vd.idvente = v.id AND v.deleted = 0
-                INNER JOIN tb_unite u ON vd.idarticle = u.idarticle AND vd.idunite = u.idunite
-                WHERE vd.deleted = 0
-
-                UNION ALL
-
-                SELECT
-                    t.idarticle,
-                    t.idmagentree as idmag,
-                    COALESCE(u.qtunite, 1) as qtunite_source,
-                    t.qttransfert as quantite,
-                    'transfert_in' as type_mouvement
-                FROM tb_transfertdetail t
-                INNER JOIN tb_unite u ON t.idarticle = u.idarticle AND t.idunite = u.idunite
-                WHERE t.deleted = 0
-
-                UNION ALL
-
-                SELECT
-                    t.idarticle,
-                    t.idmagsortie as idmag,
-                    COALESCE(u.qtunite, 1) as qtunite_source,
-                    t.qttransfert as quantite,
-                    'transfert_out' as type_mouvement
-                FROM tb_transfertdetail t
-                INNER JOIN tb_unite u ON t.idarticle = u.idarticle AND t.idunite = u.idunite
-                WHERE t.deleted = 0
-
-                UNION ALL
-
-                SELECT
-                    u.idarticle,
-                    i.idmag,
-                    COALESCE(u.qtunite, 1) as qtunite_source,
-                    i.qtinventaire as quantite,
-                    'inventaire' as type_mouvement
-                FROM tb_inventaire i
-                INNER JOIN tb_unite u ON i.codearticle = u.codearticle
-                WHERE u.idunite IN (
-                    -- Sélectionner UNIQUEMENT l'unité de base (plus petit qtunite)
-                    -- pour chaque idarticle afin d'éviter le double-comptage
-                    SELECT DISTINCT ON (idarticle) idunite
-                    FROM tb_unite
-                    WHERE deleted = 0
-                    ORDER BY idarticle, qtunite ASC
-                )
-            ),
-
-            solde_base_par_mag AS (
-                SELECT
-                    idarticle,
-                    idmag,
-                    SUM(
-                        CASE type_mouvement
-                            WHEN 'reception'     THEN  quantite * qtunite_source
-                            WHEN 'transfert_in'  THEN  quantite * qtunite_source
-                            WHEN 'inventaire'    THEN  quantite * qtunite_source
-                            WHEN 'vente'         THEN -quantite * qtunite_source
-                            WHEN 'transfert_out' THEN -quantite * qtunite_source
-                            ELSE 0
-                        END
-                    ) as solde_base
-                FROM mouvements_bruts
-                GROUP BY idarticle, idmag
+            query_optimisee = f"""
+            WITH solde_base_par_mag AS (
+                {sql_soldes(cursor)}
             )
 
             SELECT
@@ -734,7 +347,7 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
             cursor.execute(query_optimisee)
             resultats = cursor.fetchall()
             
-            print(f"Données récupérées: {len(resultats)} lignes")
+            journal.debug("Stocks : %d lignes lues", len(resultats))
         
             # Regrouper par article
             articles_dict = {}
@@ -755,10 +368,7 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
                     articles_dict[code]['stocks'][nom_mag] = stock_val
                     articles_dict[code]['total'] += stock_val
             
-            print(f"Articles traités: {len(articles_dict)}")
-            
             # Insérer dans le Treeview
-            compteur = 0
             for idx, (code, data) in enumerate(articles_dict.items()):
                 valeurs = [
                     code, 
@@ -780,10 +390,6 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
                     self.tree.insert("", "end", values=valeurs, tags=(zebra_tag, "stock_bas"))
                 else:
                     self.tree.insert("", "end", values=valeurs, tags=(zebra_tag,))
-                
-                compteur += 1
-                if compteur % 100 == 0:
-                    print(f"Insertion: {compteur} articles...")
         
             # Style pour les stocks bas
             self.tree.tag_configure("even", background="#FFFFFF", foreground="#000000")
@@ -794,7 +400,7 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
             self.label_total_articles.configure(text=f"Total articles: {len(articles_dict)}")
             self.label_derniere_maj.configure(text=f"Dernière mise à jour: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
             
-            print(f"Chargement terminé: {len(articles_dict)} articles affichés")
+            journal.debug("Stocks : %d articles affichés", len(articles_dict))
         
             # Vérifier les péremptions
             self.mettre_a_jour_badge_peremption()
@@ -942,8 +548,8 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         self.btn_suivi_depot.grid(row=0, column=9, padx=2, pady=2) # Ajustez la colonne selon votre grille
         self.btn_suivi_depot.grid_remove()  # Cacher le bouton
 
-        # Lancer la vérification en arrière-plan
-        self.verifier_alerte_stock_silencieuse()
+        # Alerte stock : une seule minuterie pour tous les onglets (session de vente)
+        self.session.abonner_alerte(self, self.appliquer_alerte_stock)
 
         # Bouton d'action principal sur la ligne des infos article
         self.btn_ajouter = ctk.CTkButton(detail_frame, text="➕ Ajouter", command=self.valider_detail, 
@@ -1136,39 +742,6 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         finally:
             conn.close()
             
-    def verifier_alerte_stock_silencieuse(self):
-        """Vérifie le stock et affiche/cache la cloche de notification"""
-        conn = self.connect_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                # On cherche s'il existe au moins un article dont le stock <= alertdepot
-                query = "SELECT COUNT(*) FROM tb_article WHERE deleted = 0 AND alertdepot >= 0" 
-                cursor.execute(query)
-                count = cursor.fetchone()[0]
-        
-                if count > 0:
-                    # 1. On affiche la cloche si elle était cachée
-                    self.notif_stock_depot.pack(side="right", padx=20)
-                    self.notif_stock_depot.configure(text_color="red")
-                
-                    # 2. Optionnel : Son d'alerte
-                    try:
-                        import winsound
-                        winsound.PlaySound("SystemAsterisk", winsound.SND_ALIAS)
-                    except: pass
-                else:
-                    # On cache la cloche s'il n'y a plus d'alerte
-                    self.notif_stock_depot.pack_forget()
-            
-            except Exception as e:
-                print(f"Erreur vérification stock: {e}")
-            finally: 
-                conn.close()
-
-        # Vérifier toutes les 5 minutes (300 000 ms)
-        self.after(300000, self.verifier_alerte_stock_silencieuse)
-    
     def sort_tree(self, tree, col):
         """
         Trie les éléments du treeview selon la colonne `col`.
@@ -1270,38 +843,16 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
             conn = self.connect_db()
             if not conn: return
             try:
-                cursor = conn.cursor()
-                filtre_like = f"%{filtre}%"
                 selected_type = type_filter_combo.get()
-                type_condition = ""
-                if selected_type == "Client à crédit":
-                    type_condition = " AND COALESCE(idtypeclient, 1) = 2 "
-                elif selected_type == "Client au comptant":
-                    type_condition = " AND COALESCE(idtypeclient, 1) = 1 "
-
-                cursor.execute("""
-                    SELECT
-                        idclient,
-                        nomcli,
-                        CASE
-                            WHEN COALESCE(idtypeclient, 1) = 1 AND (contactcli IS NULL OR TRIM(contactcli) = '')
-                                THEN 'Aucun contact enregistré'
-                            ELSE COALESCE(NULLIF(TRIM(contactcli), ''), 'Aucun contact enregistré')
-                        END AS contact_affiche,
-                        CASE
-                            WHEN COALESCE(idtypeclient, 1) = 1 AND (adressecli IS NULL OR TRIM(adressecli) = '')
-                                THEN 'Aucun adrresse enregistré'
-                            ELSE COALESCE(NULLIF(TRIM(adressecli), ''), 'Aucun adrresse enregistré')
-                        END AS adresse_affiche
-                    FROM tb_client
-                    WHERE deleted = 0 AND nomcli ILIKE %s
-                """ + type_condition + """
-                    ORDER BY nomcli
-                """, (filtre_like,))
-                clients = cursor.fetchall()
-                for idx, (id_client, nom_client, contact, adresse) in enumerate(clients):
+                idtypeclient = {"Client à crédit": 2, "Client au comptant": 1}.get(selected_type)
+
+                # Recherche indexée (trigrammes, sans accents), classée par pertinence
+                clients = search_clients(filtre, conn=conn, idtypeclient=idtypeclient)
+                for idx, c in enumerate(clients):
+                    contact = (c.contactcli or "").strip() or 'Aucun contact enregistré'
+                    adresse = (c.adressecli or "").strip() or 'Aucun adrresse enregistré'
                     zebra_tag = "even" if idx % 2 == 0 else "odd"
-                    tree.insert("", "end", values=(id_client, nom_client, contact, adresse), tags=(zebra_tag,))
+                    tree.insert("", "end", values=(c.idclient, c.nomcli, contact, adresse), tags=(zebra_tag,))
             except Exception as e:
                 messagebox.showerror("Erreur", f"Erreur lors du chargement des clients: {str(e)}")
             finally:
@@ -1351,29 +902,8 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         
         try:
             cursor = conn.cursor()
-            annee = datetime.now().year
-            
-            # Trouver la dernière référence de l'année
-            cursor.execute("""
-                SELECT refvente FROM tb_vente 
-                WHERE refvente ILIKE %s 
-                ORDER BY id DESC 
-                LIMIT 1
-            """, (f"%{annee}-FA-%",))
-            
-            derniere_ref = cursor.fetchone()
-            nouveau_numero = 1
-            
-            if derniere_ref:
-                parts = derniere_ref[0].split('-')
-                if len(parts) == 3 and parts[1] == 'FA':
-                    try:
-                        partie_num = parts[-1]
-                        nouveau_numero = int(partie_num) + 1
-                    except ValueError:
-                        nouveau_numero = 1
-            
-            nouvelle_ref = f"{annee}-FA-{nouveau_numero:05d}"
+            # ✅ Aperçu : la référence définitive est attribuée à l'enregistrement
+            nouvelle_ref = numerotation.apercu(cursor, "FA")
             
             self.entry_ref_vente.configure(state="normal")
             self.entry_ref_vente.delete(0, "end")
@@ -1386,13 +916,9 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
             conn.close()
 
     def charger_magasins(self):
-        """Charge les magasins pour le combobox."""
-        conn = self.connect_db()
-        if not conn: return
+        """Charge les magasins pour le combobox (liste partagée par la session de vente)."""
         try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT idmag, designationmag FROM tb_magasin WHERE deleted = 0 ORDER BY designationmag")
-            magasins = cursor.fetchall()
+            magasins = self.session.magasins()
             self.magasin_map = {nom: id_ for id_, nom in magasins}
             self.magasin_ids = [id_ for id_, nom in magasins]
             noms_magasins = list(self.magasin_map.keys())
@@ -1400,15 +926,7 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
             # 🔥 INITIALISER LE COMBOBOX DE LIGNE
             self.combo_magasin.configure(values=noms_magasins)
             if noms_magasins:
-                idmag_defaut_user = None
-                if self.id_user_connecte is not None:
-                    cursor.execute(
-                        "SELECT idmag FROM tb_users WHERE iduser = %s AND deleted = 0",
-                        (self.id_user_connecte,)
-                    )
-                    user_row = cursor.fetchone()
-                    if user_row:
-                        idmag_defaut_user = user_row[0]
+                idmag_defaut_user = self.session.idmag_utilisateur(self.id_user_connecte)
 
                 nom_magasin_defaut = next(
                     (nom for nom, id_ in self.magasin_map.items() if id_ == idmag_defaut_user),
@@ -1419,77 +937,23 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
                 self.combo_magasin.set("Aucun magasin trouvé")
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur lors du chargement des magasins: {str(e)}")
-        finally:
-            conn.close()
 
     def charger_client(self):
-        """Charge uniquement la map des clients pour la recherche"""
-        conn = self.connect_db()
-        if not conn: return
+        """Charge uniquement la map des clients pour la recherche (partagée entre onglets)"""
         try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT idclient, nomcli FROM tb_client WHERE deleted = 0 ORDER BY nomcli")
-            clients = cursor.fetchall()
-            self.client_map = {nom: id_ for id_, nom in clients}
-            self.client_ids = [id_ for id_, nom in clients]
+            self.client_map = self.session.clients()
+            self.client_ids = list(self.client_map.values())
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur lors du chargement des clients: {str(e)}")
-        finally:
-            conn.close()
 
     def charger_infos_societe(self):
-        """Charge les informations de la société pour l'impression."""
-        conn = self.connect_db()
-        if not conn: 
-            self.infos_societe = {}  # ✅ Initialiser avec un dict vide
-            return
-    
+        """Charge les informations de la société pour l'impression (lues une fois par session)."""
         try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT nomsociete, adressesociete, villesociete, contactsociete, nifsociete, statsociete, cifsociete, ambleme, autre FROM tb_infosociete LIMIT 1")
-            info = cursor.fetchone()
-            if info:
-                self.infos_societe = {
-                'nomsociete': info[0],
-                'adressesociete': info[1],
-                'villesociete': info[2],
-                'contactsociete': info[3],
-                'nifsociete': info[4],
-                'statsociete': info[5],
-                'cifsociete': info[6],
-                'ambleme': info[7],
-                'autre': info[8]
-            }
-            else:
-                # ✅ Si aucune info trouvée, initialiser avec des valeurs par défaut
-                self.infos_societe = {
-                'nomsociete': 'NOM SOCIÉTÉ',
-                'adressesociete': 'N/A',
-                'villesociete': 'N/A',
-                'contactsociete': 'N/A',
-                'nifsociete': 'N/A',
-                'statsociete': 'N/A',
-                'cifsociete': 'N/A',
-                'ambleme': '',
-                'autre': ''
-            }
+            self.infos_societe = self.session.infos_societe()
         except Exception as e:
             messagebox.showwarning("Avertissement", f"Impossible de charger les infos société pour l'impression: {str(e)}")
             # ✅ En cas d'erreur, initialiser avec des valeurs par défaut
-            self.infos_societe = {
-            'nomsociete': 'NOM SOCIÉTÉ',
-            'adressesociete': 'N/A',
-            'villesociete': 'N/A',
-            'contactsociete': 'N/A',
-            'nifsociete': 'N/A',
-            'statsociete': 'N/A',
-            'cifsociete': 'N/A',
-            'ambleme': '',
-            'autre': ''
-            }
-        finally:
-            cursor.close()
-            conn.close()
+            self.infos_societe = dict(INFOS_SOCIETE_DEFAUT)
 
     def open_recherche_article(self):
         """Ouvre une fenêtre pour rechercher et sélectionner un article."""
@@ -1550,194 +1014,59 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
     
-        # Fonction de chargement
-        def charger_articles(filtre=""):
+        # Recherche en arrière-plan (ControleurRecherche) : filtrage local du cache
+        # catalogue, puis soldes du magasin en unité de base (une seule requête),
+        # divisés par le coefficient hiérarchique de chaque unité.
+        def requete_articles(cursor, filtre, idmag_selectionne):
+            lignes = catalogue().rechercher(filtre)
+            soldes = soldes_base_par_magasin({l.idarticle for l in lignes}, conn=cursor.connection)
+            return [
+                (l.idarticle, l.idunite, l.codearticle, l.designation, l.designationunite, l.prix,
+                 round(soldes.get((l.idarticle, idmag_selectionne), 0.0) / (l.coeff_hierarchique or 1)))
+                for l in lignes
+            ]
+
+        # Affichage sur le thread Tk, uniquement si la recherche est toujours d'actualité
+        def afficher_articles(articles, filtre, idmag_selectionne):
             for item in tree.get_children():
                 tree.delete(item)
 
-            conn = self.connect_db()
-            if not conn: return
-            try:
-                cursor = conn.cursor()
-                filtre_like = f"%{filtre}%"
-                magasin_selectionne_nom = self.combo_magasin.get()
-                idmag_selectionne = self.magasin_map.get(magasin_selectionne_nom)
-                heading_stock = f"Magasin '{magasin_selectionne_nom}'" if magasin_selectionne_nom else "Stock Magasin"
-                tree.heading("Stock", text=heading_stock)
-
-                if not idmag_selectionne:
-                    return
-            
-                # Requête consolidée (inclut consommations et échanges, coefficient hiérarchique)
-                query = """
-                WITH mouvements_bruts AS (
-                    -- Réceptions
-                    SELECT lf.idarticle, lf.idmag, COALESCE(u.qtunite, 1) AS qtunite_source, lf.qtlivrefrs AS quantite, 'reception' AS type_mouvement
-                    FROM tb_livraisonfrs lf
-                    INNER JOIN tb_unite u ON lf.idarticle = u.idarticle AND lf.idunite = u.idunite
-                    WHERE lf.deleted = 0
-
-                    UNION ALL
-
-                    -- Ventes validées
-                    SELECT vd.idarticle, v.idmag, COALESCE(u.qtunite, 1) AS qtunite_source, vd.qtvente AS quantite, 'vente' AS type_mouvement
-                    FROM tb_ventedetail vd
-                    INNER JOIN tb_vente v ON vd.idvente = v.id AND v.deleted = 0 AND v.statut = 'VALIDEE'
-                    INNER JOIN tb_unite u ON vd.idarticle = u.idarticle AND vd.idunite = u.idunite
-                    WHERE vd.deleted = 0
-
-                    UNION ALL
-
-                    -- Transferts entrants
-                    SELECT t.idarticle, t.idmagentree AS idmag, COALESCE(u.qtunite, 1) AS qtunite_source, t.qttransfert AS quantite, 'transfert_in' AS type_mouvement
-                    FROM tb_transfertdetail t
-                    INNER JOIN tb_unite u ON t.idarticle = u.idarticle AND t.idunite = u.idunite
-                    WHERE t.deleted = 0
-
-                    UNION ALL
-
-                    -- Transferts sortants
-                    SELECT t.idarticle, t.idmagsortie AS idmag, COALESCE(u.qtunite, 1) AS qtunite_source, t.qttransfert AS quantite, 'transfert_out' AS type_mouvement
-                    FROM tb_transfertdetail t
-                    INNER JOIN tb_unite u ON t.idarticle = u.idarticle AND t.idunite = u.idunite
-                    WHERE t.deleted = 0
-
-                    UNION ALL
-
-                    -- Sorties (BS)
-                    SELECT sd.idarticle, sd.idmag, COALESCE(u.qtunite, 1) AS qtunite_source, sd.qtsortie AS quantite, 'sortie' AS type_mouvement
-                    FROM tb_sortiedetail sd
-                    INNER JOIN tb_unite u ON sd.idarticle = u.idarticle AND sd.idunite = u.idunite
-                    WHERE sd.deleted = 0
-
-                    UNION ALL
-
-                    -- Inventaires (une seule fois par article via unité de base)
-                    SELECT u.idarticle, i.idmag, COALESCE(u.qtunite, 1) AS qtunite_source, i.qtinventaire AS quantite, 'inventaire' AS type_mouvement
-                    FROM tb_inventaire i
-                    INNER JOIN tb_unite u ON i.codearticle = u.codearticle
-                    WHERE u.idunite IN (
-                        SELECT DISTINCT ON (idarticle) idunite FROM tb_unite WHERE deleted = 0 ORDER BY idarticle, qtunite ASC
-                    )
-
-                    UNION ALL
-
-                    -- Avoirs
-                    SELECT ad.idarticle, ad.idmag, COALESCE(u.qtunite, 1) AS qtunite_source, ad.qtavoir AS quantite, 'avoir' AS type_mouvement
-                    FROM tb_avoir a
-                    INNER JOIN tb_avoirdetail ad ON a.id = ad.idavoir
-                    INNER JOIN tb_unite u ON ad.idarticle = u.idarticle AND ad.idunite = u.idunite
-                    WHERE a.deleted = 0 AND ad.deleted = 0
-
-                    UNION ALL
-
-                    -- Consommation interne
-                    SELECT cd.idarticle, cd.idmag, COALESCE(u.qtunite, 1) AS qtunite_source, cd.qtconsomme AS quantite, 'consommation_interne' AS type_mouvement
-                    FROM tb_consommationinterne_details cd
-                    INNER JOIN tb_unite u ON cd.idarticle = u.idarticle AND cd.idunite = u.idunite
-
-                    UNION ALL
-
-                    -- Échanges entrée
-                    SELECT dce.idarticle, dce.idmagasin AS idmag, COALESCE(u.qtunite, 1) AS qtunite_source, dce.quantite_entree AS quantite, 'echange_entree' AS type_mouvement
-                    FROM tb_detailchange_entree dce
-                    INNER JOIN tb_unite u ON dce.idarticle = u.idarticle AND dce.idunite = u.idunite
-
-                    UNION ALL
-
-                    -- Échanges sortie
-                    SELECT dcs.idarticle, dcs.idmagasin AS idmag, COALESCE(u.qtunite, 1) AS qtunite_source, dcs.quantite_sortie AS quantite, 'echange_sortie' AS type_mouvement
-                    FROM tb_detailchange_sortie dcs
-                    INNER JOIN tb_unite u ON dcs.idarticle = u.idarticle AND dcs.idunite = u.idunite
-                ),
-
-                -- On agrège par idarticle pour le magasin sélectionné uniquement
-                solde_base AS (
-                    SELECT idarticle,
-                        SUM(
-                            CASE
-                                WHEN type_mouvement IN ('reception','transfert_in','inventaire','avoir','echange_entree') THEN quantite * qtunite_source
-                                WHEN type_mouvement IN ('vente','sortie','transfert_out','consommation_interne','echange_sortie') THEN - quantite * qtunite_source
-                                ELSE 0
-                            END
-                        ) AS solde_global
-                    FROM mouvements_bruts
-                    WHERE idmag = %s
-                    GROUP BY idarticle
-                ),
-
-                -- CTE pour la hiérarchie des unités et calcul du coefficient cumulatif
-                unite_hierarchie AS (
-                    SELECT idarticle, idunite, niveau, qtunite, designationunite
-                    FROM tb_unite
-                    WHERE deleted = 0
-                ),
-
-                unite_coeff AS (
-                    SELECT
-                        idarticle,
-                        idunite,
-                        niveau,
-                        qtunite,
-                        designationunite,
-                        exp(sum(ln(NULLIF(CASE WHEN qtunite > 0 THEN qtunite ELSE 1 END, 0)))
-                            OVER (PARTITION BY idarticle ORDER BY niveau ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
-                        ) AS coeff_hierarchique
-                    FROM unite_hierarchie
-                ),
-
-                -- ✅ Récupérer SEULEMENT le dernier prix pour chaque (idarticle, idunite)
-                dernier_prix AS (
-                    SELECT
-                        idarticle,
-                        idunite,
-                        prix,
-                        ROW_NUMBER() OVER (PARTITION BY idarticle, idunite ORDER BY id DESC) AS rn
-                    FROM tb_prix
-                )
-
-                SELECT
-                    u.idarticle,
-                    u.idunite,
-                    u.codearticle,
-                    a.designation,
-                    uc.designationunite,
-                    COALESCE(p.prix, 0) AS prix,
-                    ROUND(COALESCE(sb.solde_global, 0) / NULLIF(COALESCE(uc.coeff_hierarchique, 1), 0)) AS stock_total
-                FROM tb_article a
-                INNER JOIN tb_unite u ON a.idarticle = u.idarticle
-                LEFT JOIN unite_coeff uc ON uc.idarticle = u.idarticle AND uc.idunite = u.idunite
-                LEFT JOIN solde_base sb ON sb.idarticle = u.idarticle
-                LEFT JOIN dernier_prix p ON a.idarticle = p.idarticle AND u.idunite = p.idunite AND p.rn = 1
-                WHERE a.deleted = 0 AND (u.codearticle ILIKE %s OR a.designation ILIKE %s)
-                ORDER BY a.designation ASC, u.codearticle ASC
-                """
+            # On insère directement les données reçues
+            for idx, row in enumerate(articles):
+                zebra_tag = "even" if idx % 2 == 0 else "odd"
+                tree.insert('', 'end', values=(
+                    row[0], # idarticle
+                    row[1], # idunite
+                    row[2] or "", # code
+                    row[3] or "", # désignation
+                    row[4] or "", # unité
+                    self.formater_nombre(row[5]), # prix (déjà calculé en SQL)
+                    self.formater_nombre(row[6])  # stock (déjà lu dans tb_stock)
+                ), tags=(zebra_tag,))
+
+        recherche = ControleurRecherche(
+            fenetre_recherche, requete_articles, afficher_articles,
+            erreur=lambda e: messagebox.showerror("Erreur", f"Erreur chargement: {str(e)}")
+        )
 
-                
-                cursor.execute(query, (idmag_selectionne, filtre_like, filtre_like))
-                articles = cursor.fetchall()
+        def charger_articles(filtre="", immediat=True):
+            magasin_selectionne_nom = self.combo_magasin.get()
+            idmag_selectionne = self.magasin_map.get(magasin_selectionne_nom)
+            heading_stock = f"Magasin '{magasin_selectionne_nom}'" if magasin_selectionne_nom else "Stock Magasin"
+            tree.heading("Stock", text=heading_stock)
 
-                # On insère directement les données reçues
-                for idx, row in enumerate(articles):
-                    zebra_tag = "even" if idx % 2 == 0 else "odd"
-                    tree.insert('', 'end', values=(
-                        row[0], # idarticle
-                        row[1], # idunite
-                        row[2] or "", # code
-                        row[3] or "", # désignation
-                        row[4] or "", # unité
-                        self.formater_nombre(row[5]), # prix (déjà calculé en SQL)
-                        self.formater_nombre(row[6])  # stock (déjà lu dans tb_stock)
-                    ), tags=(zebra_tag,))
+            if not idmag_selectionne:
+                for item in tree.get_children():
+                    tree.delete(item)
+                return
 
-            except Exception as e:
-                messagebox.showerror("Erreur", f"Erreur chargement: {str(e)}")
-            finally:
-                if 'cursor' in locals() and cursor: cursor.close()
-                if conn: conn.close()
+            if immediat:
+                recherche.lancer(filtre, idmag_selectionne)
+            else:
+                recherche.declencher(filtre, idmag_selectionne)
 
         def rechercher(*args):
-            charger_articles(entry_search.get())
+            charger_articles(entry_search.get(), immediat=False)
 
         entry_search.bind('<KeyRelease>', rechercher)
 
@@ -2371,278 +1700,162 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         self.reset_proforma_state()
 
 
-    def enregistrer_facture(self):
-        """Sauvegarde les factures (une par magasin) dans la base de données."""
+    def enregistrer_facture(self, forcer_stock=False):
+        """
+        Sauvegarde les factures (une par magasin) en une seule transaction,
+        hors du thread Tk (cf. enregistrement_vente).
+        """
     
         # Protection contre le double-clic
-        if hasattr(self, '_enregistrement_en_cours') and self._enregistrement_en_cours:
+        if getattr(self, '_enregistrement_en_cours', False):
             print("⚠️ Enregistrement déjà en cours, ignoré")
             return
+
+        if not self.detail_vente:
+            messagebox.showwarning("Attention", "Veuillez ajouter des articles avant d'enregistrer.")
+            return
     
-        self._enregistrement_en_cours = True
-        self.btn_enregistrer.configure(state="disabled")
+        if self.id_user_connecte is None:
+            messagebox.showerror("Erreur Critique", 
+                               "Aucun utilisateur connecté. Impossible d'enregistrer la facture.\n"
+                               "Veuillez vous reconnecter.")
+            return
     
+        # --- RÉCUPÉRATION DES INFOS ---
+        date_vente_str = self.entry_date_vente.get()
+        description = self.entry_designation.get().strip()
+        client_nom = self.entry_client.get().strip()
+    
+        if client_nom == "":
+            messagebox.showerror("Erreur", "Veuillez entrer ou choisir un client.")
+            return
+
         try:
-            if not self.detail_vente:
-                messagebox.showwarning("Attention", "Veuillez ajouter des articles avant d'enregistrer.")
-                return
-        
-            if self.id_user_connecte is None:
-                messagebox.showerror("Erreur Critique", 
-                                   "Aucun utilisateur connecté. Impossible d'enregistrer la facture.\n"
-                                   "Veuillez vous reconnecter.")
-                return
-        
-            # --- RÉCUPÉRATION DES INFOS ---
-            date_vente_str = self.entry_date_vente.get()
-            description = self.entry_designation.get().strip()
-            client_nom = self.entry_client.get().strip()
-        
-            if client_nom == "":
-                messagebox.showerror("Erreur", "Veuillez entrer ou choisir un client.")
-                return
+            # Capturer la date saisie et ajouter l'heure précise actuelle
+            maintenant = datetime.now()
+            date_vente = datetime.strptime(date_vente_str, "%d/%m/%Y").replace(hour=maintenant.hour, minute=maintenant.minute, second=maintenant.second)
+        except ValueError:
+            messagebox.showerror("Erreur de Date", "Format de date invalide (attendu: JJ/MM/AAAA).")
+            return
 
-            conn = self.connect_db()
-            if not conn: return
-            cursor = conn.cursor()
+        self._enregistrement_en_cours = True
+        self.btn_enregistrer.configure(state="disabled")
+
+        lignes = list(self.detail_vente)
+        parametres = dict(
+            client_nom=client_nom,
+            lignes=lignes,
+            date_vente=date_vente,
+            description=description,
+            iduser=self.id_user_connecte,
+            idclient=self.client_map.get(client_nom),
+            forcer_stock=forcer_stock,
+        )
 
-            # --- ✅ NOUVEAU : VÉRIFICATION OBLIGATOIRE DU CRÉDIT CLIENT ---
+        def travail():
             try:
-                # Récupérer le crédit du client
-                cursor.execute("SELECT credit FROM tb_client WHERE nomcli = %s AND deleted = 0", (client_nom,))
-                result = cursor.fetchone()
-                
-                if result:
-                    limite_credit = result[0]
-                    
-                    # Calculer le total global de la vente actuelle (tous magasins confondus)
-                    total_general_vente = 0.0
-                    for d in self.detail_vente:
-                        qtvente = float(d['qtvente'])
-                        prixunit = float(d['prixunit'])
-                        remise = float(d.get('remise', 0))
-                        montant_ligne = qtvente * prixunit - (remise * qtvente)
-                        if montant_ligne < 0:
-                            montant_ligne = 0
-                        total_general_vente += montant_ligne
-                    
-                    # 🚫 BLOCAGE SI DÉPASSEMENT DU CRÉDIT
-                    if limite_credit is not None and total_general_vente > limite_credit:
-                        messagebox.showerror(
-                            "❌ Crédit Dépassé", 
-                            f"ENREGISTREMENT BLOQUÉ !\n\n"
-                            f"Client : {client_nom}\n"
-                            f"Montant total vente : {self.formater_nombre(total_general_vente)} Ar\n"
-                            f"Crédit autorisé : {self.formater_nombre(limite_credit)} Ar\n"
-                            f"Dépassement : {self.formater_nombre(total_general_vente - limite_credit)} Ar\n\n"
-                            f"Veuillez réduire le montant ou augmenter le crédit du client."
-                        )
-                        return  # ⛔ ARRÊT DE L'ENREGISTREMENT
-                else:
-                    # Si le client n'existe pas encore (nouveau client), on continue car crédit = 0 par défaut
-                    pass
+                resultat = enregistrement_vente.enregistrer_vente(**parametres)
             except Exception as e:
-                messagebox.showerror("Erreur", f"Erreur lors de la vérification du crédit : {e}")
-                return
-
-            # --- SUITE DU CODE ORIGINAL (INSERTION) ---
-            # 1. Gestion du Client
-            idclient = self.client_map.get(client_nom)
-            if not idclient: 
-                try:
-                    cursor.execute("""
-                        INSERT INTO tb_client (nomcli, deleted) 
-                        VALUES (%s, 0) RETURNING idclient
-                    """, (client_nom,))
-                    idclient = cursor.fetchone()[0]
-                    conn.commit() # Commit pour créer le client
-                    self.client_map[client_nom] = idclient
-                except Exception as e:
-                    conn.rollback()
-                    messagebox.showerror("Erreur", f"Impossible d'ajouter le client : {e}")
-                    return
+                thread_tk.sur_thread_tk(self, lambda e=e: self._enregistrement_refuse(e, lignes))
+            else:
+                thread_tk.sur_thread_tk(self, lambda: self._enregistrement_termine(client_nom, resultat))
 
-            try:
-                cursor = conn.cursor()
-                try:
-                    # Capturer la date saisie et ajouter l'heure précise actuelle
-                    date_vente = datetime.strptime(date_vente_str, "%d/%m/%Y").replace(hour=datetime.now().hour, minute=datetime.now().minute, second=datetime.now().second)
-                except ValueError:
-                    messagebox.showerror("Erreur de Date", "Format de date invalide (attendu: JJ/MM/AAAA).")
-                    return
-            
-                # 🔥 NOUVEAU: Grouper les détails par magasin
-                details_par_magasin = {}
-                for detail in self.detail_vente:
-                    idmag = detail['idmag']
-                    if idmag not in details_par_magasin:
-                        details_par_magasin[idmag] = []
-                    details_par_magasin[idmag].append(detail)
-            
-                # Réinitialiser le dictionnaire des IDs de vente
-                self.idventes_par_magasin = {}
-                factures_creees = []
-            
-                # 🔥 NOUVEAU: Créer une facture par magasin
-                for idmag, details_mag in details_par_magasin.items():
-                    # ✅ Calculer le total pour ce magasin avec conversion en float
-                    total_magasin = 0
-                    for d in details_mag:
-                        qtvente = float(d['qtvente'])
-                        prixunit = float(d['prixunit'])
-                        remise = float(d.get('remise', 0))
-                        montant_ligne = qtvente * prixunit - (remise * qtvente)
-                        if montant_ligne < 0:
-                            montant_ligne = 0
-                        total_magasin += montant_ligne
-                    
-                    # 🔍 DEBUG: Afficher les détails du calcul pour chaque ligne
-                    print(f"\n🧮 Calcul Total Magasin: {details_mag[0]['designationmag']}")
-                    for d in details_mag:
-                        qtvente = float(d['qtvente'])
-                        prixunit = float(d['prixunit'])
-                        remise = float(d.get('remise', 0))
-                        montant_ht = qtvente * prixunit
-                        montant_remise_ligne = remise * qtvente
-                        montant_net = montant_ht - montant_remise_ligne
-                        print(f"  Article: {d.get('nom_article', 'N/A')}")
-                        print(f"    Qt={qtvente}, PU={prixunit:.0f}, Remise/U={remise:.0f}")
-                        print(f"    Montant HT={montant_ht:.0f}, Total Remise={montant_remise_ligne:.0f}, Net={montant_net:.0f}")
-                    print(f"📊 TOTAL FINAL À INSÉRER en tb_vente.totmtvente: {total_magasin:.0f} Ar\n")
-        
-                    # Récupérer le nom du magasin
-                    nom_magasin = details_mag[0]['designationmag']
-                
-                    # Générer une référence unique pour ce magasin
-                    annee = datetime.now().year
-                    cursor.execute("""
-                        SELECT refvente FROM tb_vente 
-                        WHERE refvente ILIKE %s 
-                        ORDER BY id DESC 
-                        LIMIT 1
-                    """, (f"%{annee}-FA-%",))
-                
-                    derniere_ref = cursor.fetchone()
-                    nouveau_numero = 1
-                
-                    if derniere_ref:
-                        parts = derniere_ref[0].split('-')
-                        if len(parts) == 3 and parts[1] == 'FA':
-                            try:
-                                partie_num = parts[-1]
-                                nouveau_numero = int(partie_num) + 1
-                            except ValueError:
-                                nouveau_numero = 1
-                
-                    ref_facture_mag = f"{annee}-FA-{nouveau_numero:05d}"
-                
-                    # Créer la facture pour ce magasin
-                    sql_vente = """
-                        INSERT INTO tb_vente (refvente, dateregistre, description, iduser, idclient, totmtvente, idmag, statut, deleted) 
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 0) 
-                        RETURNING id
-                    """
-                    desc_with_mag = f"{description} - {nom_magasin}"
-                    params = (ref_facture_mag, date_vente, desc_with_mag, self.id_user_connecte, idclient, total_magasin, idmag, 'EN_ATTENTE')
-                
-                    print(f"➕ INSERT Facture pour magasin {nom_magasin}: {ref_facture_mag}")
-                    cursor.execute(sql_vente, params)
-                    idvente = cursor.fetchone()[0]
-                
-                    # Stocker l'ID de vente pour ce magasin
-                    self.idventes_par_magasin[idmag] = idvente
-                
-                    # Insérer les détails pour cette facture
-                    sql_vente_detail = """
-                        INSERT INTO tb_ventedetail (idvente, idarticle, idunite, qtvente, prixunit, remise, idmag)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """
-                    details_a_inserer = []
-                    for detail in details_mag:
-                        details_a_inserer.append((
-                            idvente,
-                            detail['idarticle'],
-                            detail['idunite'],
-                            detail['qtvente'],
-                            detail['prixunit'],
-                            detail.get('remise', 0),  # ✅ Ajout remise
-                            detail['idmag']
-                        ))
-
-                    cursor.executemany(sql_vente_detail, details_a_inserer)
-                
-                    factures_creees.append({
-                        'ref': ref_facture_mag,
-                        'magasin': nom_magasin,
-                        'total': total_magasin,
-                        'idvente': idvente
-                    })
-                
-                    print(f"✅ Facture {ref_facture_mag} créée pour {nom_magasin} - Total: {self.formater_nombre(total_magasin)} Ar")
+        thread_tk.preparer(self)
+        threading.Thread(target=travail, daemon=True).start()
 
-                # Commit de toutes les factures
-                conn.commit()
-            
-                # Message de succès avec le détail de toutes les factures
-                message_factures = "\n".join([
-                    f"• {f['ref']} ({f['magasin']}): {self.formater_nombre(f['total'])} Ar" 
-                    for f in factures_creees
-                ])
-            
-                total_general = sum(f['total'] for f in factures_creees)
-            
-                # ✅ UTILISER LES PARAMÈTRES D'IMPRESSION
-                show_confirmation = self.settings.get('Vente_ImpressionConfirmation', 1)
-                impression_a5 = self.settings.get('Vente_ImpressionA5', 1)
-                impression_ticket = self.settings.get('Vente_ImpressionTicket', 0)
-                
-                if show_confirmation:
-                    # Afficher la messagebox de confirmation
-                    messagebox.showinfo("Succès", 
-                        f"{len(factures_creees)} facture(s) créée(s) avec succès:\n\n{message_factures}\n\nTotal général: {self.formater_nombre(total_general)} Ar")
-                else:
-                    # Pas de confirmation, impression directe silencieuse
-                    print(f"✅ {len(factures_creees)} facture(s) créée(s) avec succès (impression directe)")
-            
-                # --- DÉCLENCHEMENT DE L'IMPRESSION AUTOMATIQUE ---
-                # Pour chaque facture créée, ouvre directement le dialogue de choix
-                # de format (A5 PDF Paysage ou Ticket 80mm) via imprimer_facture_unique()
-                try:
-                    for facture in factures_creees:
-                        if impression_a5 or impression_ticket:
-                            self.imprimer_facture_avec_settings(facture['idvente'], impression_a5, impression_ticket)
-                except Exception as e:
-                    messagebox.showerror("Erreur Impression", f"La vente est enregistrée mais l'impression a échoué : {e}")
+    def _fin_enregistrement(self):
+        self._enregistrement_en_cours = False
+        try:
+            self.btn_enregistrer.configure(state="normal")
+        except Exception:
+            pass
 
-                # Après enregistrement: réinitialiser le formulaire pour une nouvelle facture
-                try:
-                    self.nouveau_facture()
-                except Exception:
-                    # Fallback: réactiver le bouton d'enregistrement si nouveau_facture échoue
-                    try:
-                        self.btn_enregistrer.configure(state="normal", text="💾 Enregistrer la Facture", fg_color="#2196f3", hover_color="#1976d2")
-                    except Exception:
-                        pass
-
-            except psycopg2.errors.UniqueViolation as e:
-                conn.rollback()
-                messagebox.showerror(
-                    "Erreur de doublon", 
-                    f"Une des factures existe déjà dans la base de données.\n\nDétails: {e}"
-                )
-            except Exception as e:
-                conn.rollback()
-                messagebox.showerror("Erreur", f"Une erreur s'est produite: {e}")
-                import traceback
-                traceback.print_exc()
-            finally:
-                if 'cursor' in locals() and cursor: cursor.close()
-                if conn: conn.close()
+    def _enregistrement_refuse(self, erreur, lignes):
+        """Vente non enregistrée (rien n'a été écrit) : crédit, stock ou erreur base."""
+        self._fin_enregistrement()
+
+        if isinstance(erreur, enregistrement_vente.CreditDepasse):
+            # 🚫 BLOCAGE SI DÉPASSEMENT DU CRÉDIT
+            messagebox.showerror(
+                "❌ Crédit Dépassé", 
+                f"ENREGISTREMENT BLOQUÉ !\n\n"
+                f"Client : {self.entry_client.get().strip()}\n"
+                f"Montant total vente : {self.formater_nombre(erreur.total)} Ar\n"
+                f"Crédit autorisé : {self.formater_nombre(erreur.limite)} Ar\n"
+                f"Dépassement : {self.formater_nombre(erreur.total - erreur.limite)} Ar\n\n"
+                f"Veuillez réduire le montant ou augmenter le crédit du client."
+            )
+        elif isinstance(erreur, enregistrement_vente.StockInsuffisant):
+            # Le stock a pu bouger depuis l'ajout des lignes (autres postes)
+            detail = "\n".join(
+                f"• {lignes[i].get('nom_article', '')} ({lignes[i].get('designationmag', '')}) : "
+                f"{self.formater_nombre(demande)} demandé(s), {self.formater_nombre(disponible)} "
+                f"{lignes[i].get('nom_unite', '')} disponible(s)"
+                for i, demande, disponible in erreur.manques
+            )
+            if messagebox.askyesno(
+                "Stock Insuffisant",
+                f"Stock insuffisant pour :\n\n{detail}\n\nVoulez-vous enregistrer quand même ?",
+                icon="warning"
+            ):
+                self.enregistrer_facture(forcer_stock=True)
+        elif isinstance(erreur, psycopg2.errors.UniqueViolation):
+            messagebox.showerror(
+                "Erreur de doublon", 
+                f"Une des factures existe déjà dans la base de données.\n\nDétails: {erreur}"
+            )
+        else:
+            messagebox.showerror("Erreur", f"Une erreur s'est produite: {erreur}")
+            traceback.print_exception(type(erreur), erreur, erreur.__traceback__)
+
+    def _enregistrement_termine(self, client_nom, resultat):
+        """Factures validées en base : messages, impression puis formulaire vierge."""
+        self._fin_enregistrement()
+
+        self.client_map[client_nom] = resultat['idclient']
+        factures_creees = resultat['factures']
+        self.idventes_par_magasin = {f['idmag']: f['idvente'] for f in factures_creees}
+        for f in factures_creees:
+            print(f"✅ Facture {f['ref']} créée pour {f['magasin']} - Total: {self.formater_nombre(f['total'])} Ar")
+
+        # Message de succès avec le détail de toutes les factures
+        message_factures = "\n".join([
+            f"• {f['ref']} ({f['magasin']}): {self.formater_nombre(f['total'])} Ar" 
+            for f in factures_creees
+        ])
+    
+        total_general = sum(f['total'] for f in factures_creees)
+    
+        # ✅ UTILISER LES PARAMÈTRES D'IMPRESSION
+        show_confirmation = self.settings.get('Vente_ImpressionConfirmation', 1)
+        impression_a5 = self.settings.get('Vente_ImpressionA5', 1)
+        impression_ticket = self.settings.get('Vente_ImpressionTicket', 0)
+        
+        if show_confirmation:
+            # Afficher la messagebox de confirmation
+            messagebox.showinfo("Succès", 
+                f"{len(factures_creees)} facture(s) créée(s) avec succès:\n\n{message_factures}\n\nTotal général: {self.formater_nombre(total_general)} Ar")
+        else:
+            # Pas de confirmation, impression directe silencieuse
+            print(f"✅ {len(factures_creees)} facture(s) créée(s) avec succès (impression directe)")
     
-        finally:
-            self._enregistrement_en_cours = False
+        # --- DÉCLENCHEMENT DE L'IMPRESSION AUTOMATIQUE ---
+        # Pour chaque facture créée, ouvre directement le dialogue de choix
+        # de format (A5 PDF Paysage ou Ticket 80mm) via imprimer_facture_unique()
+        try:
+            for facture in factures_creees:
+                if impression_a5 or impression_ticket:
+                    self.imprimer_facture_avec_settings(facture['idvente'], impression_a5, impression_ticket)
+        except Exception as e:
+            messagebox.showerror("Erreur Impression", f"La vente est enregistrée mais l'impression a échoué : {e}")
+
+        # Après enregistrement: réinitialiser le formulaire pour une nouvelle facture
+        try:
+            self.nouveau_facture()
+        except Exception:
+            # Fallback: réactiver le bouton d'enregistrement si nouveau_facture échoue
             try:
-                self.btn_enregistrer.configure(state="normal")
+                self.btn_enregistrer.configure(state="normal", text="💾 Enregistrer la Facture", fg_color="#2196f3", hover_color="#1976d2")
             except Exception:
                 pass
 
@@ -2663,14 +1876,16 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
             pass
 
         try:
-            # Exécute le flux d'enregistrement métier existant.
+            # Exécute le flux d'enregistrement métier existant (en arrière-plan).
             self.enregistrer_facture()
         finally:
-            # Réactive le bouton si présent (enregistrer_facture gère déjà son état interne).
-            try:
-                self.btn_enregistrer.configure(state='normal')
-            except Exception:
-                pass
+            # Réactive le bouton si l'enregistrement n'a pas démarré ; sinon
+            # _fin_enregistrement() s'en charge à la fin du thread.
+            if not getattr(self, '_enregistrement_en_cours', False):
+                try:
+                    self.btn_enregistrer.configure(state='normal')
+                except Exception:
+                    pass
 
     def open_impression_dialogue(self):
         """Ouvre un dialogue pour choisir quelle facture imprimer."""
@@ -2743,9 +1958,7 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
     
         def imprimer_toutes():
             fen.destroy()
-            for idvente in self.idventes_par_magasin.values():
-                self.imprimer_facture_unique(idvente)
-            messagebox.showinfo("Impression", f"{len(self.idventes_par_magasin)} facture(s) générée(s).")
+            self.imprimer_factures(list(self.idventes_par_magasin.values()))
     
         # Boutons
         btn_frame = ctk.CTkFrame(frame)
@@ -2771,18 +1984,18 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
             return
         
         try:
+            # ✅ Les documents sont rendus dans le pool de rendu_pdf puis ouverts :
+            # le caissier peut saisir la vente suivante pendant la génération.
             # Imprimer A5 si configuré
             if imprimer_a5 == 1:
                 filename_a5 = f"Facture_{data['vente']['refvente']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-                self.generate_pdf_a5(data, filename_a5)
-                self.open_file(filename_a5)
+                rendu_pdf.rendre(self, filename_a5, lambda: self.generate_pdf_a5(data, filename_a5))
                 print(f"✅ Impression A5 lancée : {filename_a5}")
             
             # Imprimer Ticket si configuré
             if imprimer_ticket == 1:
                 filename_ticket = f"Ticket_{data['vente']['refvente']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-                self.generate_ticket_80mm(data, filename_ticket)
-                self.open_file(filename_ticket)
+                rendu_pdf.rendre(self, filename_ticket, lambda: self.generate_ticket_80mm(data, filename_ticket))
                 print(f"✅ Impression Ticket lancée : {filename_ticket}")
         
         except Exception as e:
@@ -2810,170 +2023,78 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
     
         if result == "A5 PDF (Paysage)":
             filename = f"Facture_{data['vente']['refvente']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            self.generate_pdf_a5(data, filename)
-            self.open_file(filename)
+            rendu_pdf.rendre(self, filename, lambda: self.generate_pdf_a5(data, filename))
         elif result == "Ticket 80mm":
             filename = f"Ticket_{data['vente']['refvente']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            self.generate_ticket_80mm(data, filename)
-            self.open_file(filename)
+            rendu_pdf.rendre(self, filename, lambda: self.generate_ticket_80mm(data, filename))
 
 
-    def open_file(self, filename):
-        """Ouvre le fichier généré avec le programme par défaut."""
+    def imprimer_factures(self, idventes):
+        """
+        Imprime plusieurs factures : format demandé UNE fois, données lues en
+        une seule fois, rendus envoyés ensemble au pool de rendu_pdf.
+        """
+        factures = self.get_data_factures(idventes)
+        if not factures:
+            messagebox.showerror("Erreur", "Impossible de récupérer les données des factures.")
+            return
+
         try:
-            if sys.platform == 'win32':
-                os.startfile(filename)
-            elif sys.platform == 'darwin':
-                os.system(f'open "{filename}"')
-            else:
-                os.system(f'xdg-open "{filename}"')
+            choice_dialog = SimpleDialogWithChoice(
+                self,
+                title="Choix du format d'impression",
+                message="Veuillez sélectionner le format des factures à imprimer:"
+            )
+            result = choice_dialog.result
         except Exception as e:
-            pass # Ignorer les erreurs d'ouverture de fichier
+            messagebox.showerror("Erreur de Dialogue", f"Impossible d'ouvrir la fenêtre de choix : {e}")
+            return
+
+        horodatage = datetime.now().strftime('%Y%m%d_%H%M%S')
+        for data in factures:
+            if result == "A5 PDF (Paysage)":
+                filename = f"Facture_{data['vente']['refvente']}_{horodatage}.pdf"
+                rendu_pdf.rendre(self, filename, lambda d=data, f=filename: self.generate_pdf_a5(d, f))
+            elif result == "Ticket 80mm":
+                filename = f"Ticket_{data['vente']['refvente']}_{horodatage}.pdf"
+                rendu_pdf.rendre(self, filename, lambda d=data, f=filename: self.generate_ticket_80mm(d, f))
+            else:
+                return
+        messagebox.showinfo("Impression", f"{len(factures)} facture(s) en cours de génération.")
+
+    def open_file(self, filename):
+        """Ouvre le fichier généré avec le programme par défaut."""
+        rendu_pdf.ouvrir(filename)
 
     def get_data_facture(self, idvente: int) -> Optional[Dict[str, Any]]:
         """Récupère toutes les données nécessaires pour l'impression d'une facture."""
-        print(f"\n{'='*60}")
-        print(f"🔍 GET_DATA_FACTURE - ID Vente: {idvente}")
-        print(f"{'='*60}")
+        factures = self.get_data_factures([idvente])
+        return factures[0] if factures else None
 
+    @mesures.chronometre()
+    def get_data_factures(self, idventes) -> list:
+        """
+        Données d'impression de plusieurs factures en deux requêtes
+        (export_factures.lire_factures) au lieu de deux par facture.
+        """
         conn = self.connect_db()
         if not conn:
             print("❌ ERREUR: Connexion DB impossible")
-            return None
-
-        data = {
-            'societe': self.infos_societe,
-            'vente': None,
-            'utilisateur': None,
-            'details': []
-        }
+            return []
 
         try:
             cursor = conn.cursor()
-
-            # DEBUG: Vérifier que l'ID existe dans la table
-            cursor.execute("SELECT COUNT(*) FROM tb_vente WHERE id = %s", (idvente,))
-            count = cursor.fetchone()[0]
-            print(f"📊 Nombre de ventes trouvées avec id={idvente}: {count}")
-
-            # 1. Infos Vente & Client
-            sql_vente = """
-                SELECT 
-                    v.refvente, v.dateregistre, v.description, 
-                    u.nomuser, u.prenomuser, 
-                    c.nomcli, c.adressecli, c.contactcli
-                FROM tb_vente v 
-                INNER JOIN tb_users u ON v.iduser = u.iduser 
-                LEFT JOIN tb_client c ON v.idclient = c.idclient 
-                WHERE v.id = %s
-            """
-            print(f"🔍 Exécution requête vente avec id={idvente}")
-            cursor.execute(sql_vente, (idvente,))
-            result = cursor.fetchone()
-    
-            if not result:
-                print(f"❌ ERREUR: Aucune vente trouvée pour id={idvente}")
-                return None
-    
-            print(f"✅ Vente trouvée: {result[0]}")
-    
-            (refvente, dateregistre, description, nomuser, prenomuser, nomcli, adressecli, contactcli) = result
-
-            data['vente'] = {
-                'refvente': refvente,
-                'dateregistre': dateregistre.strftime("%d/%m/%Y %H:%M"),
-                'description': description,
-            }
-            # Normaliser les valeurs utilisateur pour éviter d'afficher 'None' dans les PDF
-            data['utilisateur'] = {
-                'nomuser': nomuser or '',
-                'prenomuser': prenomuser or '',
-            }
-            data['client'] = {
-                'nomcli': nomcli or "Client Divers",
-                'adressecli': adressecli or "N/A",
-                'contactcli': contactcli or "N/A",
-            }
-    
-            # 2. Détails de vente AVEC REMISE ✅
-            sql_details = """
-                SELECT 
-                    u.codearticle, a.designation, u.designationunite, 
-                    vd.qtvente, vd.prixunit, COALESCE(vd.remise, 0) as remise, m.designationmag
-                FROM tb_ventedetail vd 
-                INNER JOIN tb_article a ON vd.idarticle = a.idarticle 
-                INNER JOIN tb_unite u ON vd.idunite = u.idunite
-                INNER JOIN tb_magasin m ON vd.idmag = m.idmag
-                WHERE vd.idvente = %s
-                ORDER BY a.designation
-            """
-            print(f"🔍 Exécution requête détails pour idvente={idvente}")
-            cursor.execute(sql_details, (idvente,))
-            details_rows = cursor.fetchall()
-    
-            print(f"📦 Nombre de détails trouvés: {len(details_rows)}")
-    
-            # ✅ Calcul avec remise (remise = nouveau prix unitaire si > 0)
-            data['details'] = []
-            premier_magasin = None  # Pour stocker le premier magasin trouvé
-            
-            for row in details_rows:
-                code_article = row[0]
-                designation = row[1]
-                unite = row[2]
-                qte = float(row[3])
-                prixunit = float(row[4])
-                remise = float(row[5])
-                magasin = row[6]
-                
-                # Capturer le premier magasin pour l'ajouter à la description
-                if premier_magasin is None:
-                    premier_magasin = magasin
-                # Interpréter la remise comme remise unitaire (Ar) appliquée à la quantité
-                montant_ht = qte * prixunit
-                montant_remise = remise * qte
-                montant_ttc = montant_ht - montant_remise
-                if montant_ttc < 0:
-                    montant_ttc = 0
-            
-                data['details'].append({
-                    'code_article': code_article,
-                    'designation': designation,
-                    'unite': unite,
-                    'qte': qte,
-                    'prixunit': prixunit,
-                    'remise': remise,
-                    'magasin': magasin,
-                    'montant_ht': montant_ht,
-                    'montant_remise': montant_remise,
-                    'montant_ttc': montant_ttc
-                })
-            
-            # Ajouter le magasin à la description de la vente
-            if premier_magasin:
-                description_avec_depot = f"Magasin {premier_magasin}"
-                # Ajouter la description seulement si elle existe, n'est pas vide, 
-                # et ne contient pas déjà le nom du dépôt
-                if description and description.strip() and premier_magasin not in description:
-                    # Nettoyer la description des tirets vides
-                    description_clean = description.strip().strip('-').strip()
-                    if description_clean:
-                        description_avec_depot = f"{description_avec_depot} - {description_clean}"
-                data['vente']['description'] = description_avec_depot
-            # Ajouter le magasin séparément pour l'impression
-            data['magasin'] = premier_magasin or ''
-    
-            print(f"✅ Données complètes récupérées avec succès")
-            print(f"{'='*60}\n")
-
-            return data
+            factures = lire_factures(cursor, idventes, societe=self.infos_societe)
+            if len(factures) < len(idventes):
+                print(f"❌ ERREUR: {len(idventes) - len(factures)} vente(s) introuvable(s) parmi {list(idventes)}")
+            return factures
 
         except Exception as e:
-            print(f"❌ ERREUR CRITIQUE dans get_data_facture: {str(e)}")
+            print(f"❌ ERREUR CRITIQUE dans get_data_factures: {str(e)}")
             import traceback
             traceback.print_exc()
             messagebox.showerror("Erreur", f"Erreur lors de la récupération des données de facture : {e}")
-            return None
+            return []
         finally:
             if 'cursor' in locals() and cursor:
                 cursor.close()
@@ -2986,193 +2107,21 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
 
     def generate_pdf_a5(self, data: Dict[str, Any], filename: str):
         """
-        Génère le PDF de la facture au format A5 avec le modèle canvas amélioré.
-        Utilise les données existantes du dictionnaire data.
+        Génère le PDF de la facture au format A5 (modèle canvas de facture_a5,
+        partagé avec l'export par lot). Appelée dans un thread de rendu_pdf.
         """
-        from reportlab.lib.pagesizes import A5
-        from reportlab.lib import colors
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.units import mm
-        from reportlab.pdfgen import canvas
-        from reportlab.platypus import Table, TableStyle, Paragraph
-
-        # ✅ CRÉATION DU PDF AVEC CANVAS
-        c = canvas.Canvas(filename, pagesize=A5)
-        width, height = A5
-
-        # ✅ 1. CADRE DU VERSET (Haut de page avec bordure)
-        verset = "Ankino amin'ny Jehovah ny asanao dia ho lavorary izay kasainao. Ohabolana 16:3"
-        c.setLineWidth(1)
-        c.rect(10*mm, height - 13*mm, width - 20*mm, 8*mm)
-        c.setFont("Helvetica-Bold", 9)
-        c.drawCentredString(width/2, height - 10.5*mm, verset)
-
-        # ✅ 2. EN-TÊTE DEUX COLONNES
-        styles = getSampleStyleSheet()
-        style_p = ParagraphStyle('style_p', fontSize=9, leading=11, parent=styles['Normal'])
-
-        societe = data['societe']
-        utilisateur = data['utilisateur']
-        client = data['client']
-        vente = data['vente']
-        magasin = data.get('magasin', '')
-
-        # Adapter les clés de données si nécessaire
-        nomsociete = societe.get('nomsociete', 'N/A')
-        adressesociete = societe.get('adressesociete') or societe.get('adresse', 'N/A')
-        villesociete = societe.get('villesociete') or ''
-        contactsociete = societe.get('contactsociete') or societe.get('tel', 'N/A')
-        nifsociete = societe.get('nifsociete') or societe.get('nif', 'N/A')
-        statsociete = societe.get('statsociete') or societe.get('stat', 'N/A')
-
-        # Insérer la ville juste en dessous de l'adresse si disponible
-        villes_line = f"{villesociete}<br/>" if villesociete else ""
-
-        gauche_text = f"<b><font size='11'>{nomsociete}</font></b><br/>{adressesociete}<br/>{villes_line}TEL: {contactsociete}<br/>NIF: {nifsociete} <br/>STAT: {statsociete}"
-
-        # Gérer si utilisateur est un dict ou une string et éviter d'afficher 'None'
-        if isinstance(utilisateur, dict):
-            pren = utilisateur.get('prenomuser') or ''
-            nomu = utilisateur.get('nomuser') or ''
-            user_name = f"{pren} {nomu}".strip()
-        else:
-            user_name = str(utilisateur) if utilisateur is not None else ''
-
-        # Affichage: titre magasin en gras à la place du label client, puis
-        # le nom du client en italique juste en dessous (vide si absent)
-        magasin_display = magasin or ''
-        client_display = client.get('nomcli') or ''
-        droite_text = (
-            f"<b>Facture N°: {vente['refvente']}</b><br/>"
-            f"{vente['dateregistre']}<br/>"
-            f"<b>MAGASIN {magasin_display}</b><br/><br/>"
-            f"<i>Client: {client_display}</i><br/>"
-            f"<font size='7'>Op: {user_name}</font>"
-        )
-
-        gauche = Paragraph(gauche_text, style_p)
-        droite = Paragraph(droite_text, style_p)
-
-        header_table = Table([[gauche, droite]], colWidths=[64*mm, 64*mm])
-        header_table.setStyle(TableStyle([
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 5),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-        ]))
-
-        header_table.wrapOn(c, width, height)
-        header_table.drawOn(c, 10*mm, height - 42*mm)
-
-        # ✅ 3. TABLEAU DES ARTICLES
-        table_top = height - 45*mm
-        table_bottom = 55*mm
-        frame_height = table_top - table_bottom
-
-        row_height = 5.5*mm
-        max_rows = int(frame_height / row_height)
-
-        # Préparer les données du tableau
-        table_data = [['QTE', 'UNITE', 'DESIGNATION', 'PU TTC', 'MONTANT']]
-
-        total_montant = 0
-        num_articles = 0
-        for detail in data['details']:
-            montant = detail.get('montant_ttc', detail.get('montant', 0))
-            total_montant += montant
-            num_articles += 1
-            table_data.append([
-                str(int(detail.get('qte', 0))),
-                str(detail.get('unite', '')),
-                str(detail.get('designation', '')),
-                self.formater_nombre_pdf(detail.get('prixunit', 0)),
-                self.formater_nombre_pdf(montant)
-            ])
-
-        # Ajouter des lignes vides
-        montant_fmg = int(total_montant * 5)
-        empty_rows_needed = max_rows - 1 - num_articles - 2
-        for i in range(max(0, empty_rows_needed)):
-            table_data.append(['', '', '', '', ''])
-
-        # Totaux
-        table_data.append(['', '', 'TOTAL Ar:', self.formater_nombre_pdf(total_montant), ''])
-        table_data.append(['', '', 'Fmg:', self.formater_nombre_pdf(montant_fmg), ''])
-
-        col_widths = [12*mm, 15*mm, 62*mm, 19.5*mm, 19.5*mm]
-
-        # Dessiner le cadre et lignes
-        c.setLineWidth(1)
-        c.rect(10*mm, table_bottom, width - 20*mm, frame_height)
-
-        x_pos = 10*mm
-        for w in col_widths[:-1]:
-            x_pos += w
-            c.line(x_pos, table_top, x_pos, table_bottom)
-
-        # Créer le tableau avec hauteurs proportionnelles
-        actual_row_height = frame_height / len(table_data)
-        row_heights = [actual_row_height] * len(table_data)
-
-        articles_table = Table(table_data, colWidths=col_widths, rowHeights=row_heights)
-        articles_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-            ('BACKGROUND', (0, -2), (-1, -1), colors.lightgrey),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTNAME', (0, -2), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (0, 1), (-1, -3), 8),
-            ('FONTSIZE', (0, -2), (-1, -1), 9),
-            ('LINEBELOW', (0, 0), (-1, 0), 1, colors.black),
-            ('LINEABOVE', (0, -2), (-1, -2), 1, colors.black),
-            ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
-            ('ALIGN', (0, 0), (2, 0), 'LEFT'),
-            ('ALIGN', (2, -2), (2, -1), 'RIGHT'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 1),
-            ('RIGHTPADDING', (3, 0), (-1, -1), 1),
-            ('TOPPADDING', (0, 0), (-1, -1), 0),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-        ]))
-
-        articles_table.wrapOn(c, width, height)
-        assert actual_row_height, 'actual_row_height must not be None'
-        actual_total_height = len(table_data) * actual_row_height
-        articles_table.drawOn(c, 10*mm, table_top - actual_total_height)
-
-        # ✅ 4. TEXTE EN LETTRES
-        montant_lettres = nombre_en_lettres_fr(int(total_montant)).upper()
-        text_y = table_bottom - 18*mm
-        c.setFont("Helvetica-Bold", 10)
-        c.drawCentredString(width/2, text_y, f"ARRETE A LA SOMME DE {montant_lettres} ARIARY TTC")
-
-        # ✅ 5. MENTION LÉGALE
-        c.setFont("Helvetica-Oblique", 8)
-        c.drawCentredString(width/2, text_y - 5*mm, "Nous déclinons la responsabilité des marchandises non livrées au-delà de 5 jours")
-
-        # ✅ 6. SIGNATURES
-        sig_y = 15*mm
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(15*mm, sig_y, "Le Client")
-        c.drawCentredString(width/2, sig_y, "Le Caissier")
-        c.drawString(width - 35*mm, sig_y, "Le Magasinier")
-
-        # ✅ SAUVEGARDER
-        try:
-            c.save()
-            print(f"✅ PDF généré avec succès : {filename}")
-        except Exception as e:
-            print(f"❌ Erreur PDF : {e}")
-            import traceback
-            traceback.print_exc()
+        generer_facture_a5(data, filename)
+        print(f"✅ PDF généré avec succès : {filename}")
         
     # ==============================================================================
     # MÉTHODES D'IMPRESSION TICKET 80MM (Texte Brut)
     # ==============================================================================
 
     def generate_ticket_80mm(self, data: Dict[str, Any], filename: str):
-        """Génère un PDF pour un ticket de caisse 80mm (format étroit)."""
+        """
+        Génère un PDF pour un ticket de caisse 80mm (format étroit).
+        Appelée dans un thread de rendu_pdf : aucun accès aux widgets ici.
+        """
         from reportlab.lib.units import mm
         from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
         
@@ -3195,7 +2144,6 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         )
         
         elements = []
-        styles = getSampleStyleSheet()
         
         # Données
         societe = data['societe']
@@ -3203,28 +2151,12 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         client = data['client']
         details = data['details']
         
-        # Style centré
-        style_center = styles['Normal'].clone('CenterStyle')
-        style_center.alignment = TA_CENTER
-        style_center.fontSize = 10
-        style_center.leading = 12
-        
-        # Style centré gras
-        style_center_bold = styles['Normal'].clone('CenterBoldStyle')
-        style_center_bold.alignment = TA_CENTER
-        style_center_bold.fontSize = 11
-        style_center_bold.fontName = 'Helvetica-Bold'
-        style_center_bold.leading = 13
-        
-        # Style normal
-        style_normal = styles['Normal'].clone('NormalStyle')
-        style_normal.fontSize = 9
-        style_normal.leading = 11
-        
-        # Style petit
-        style_small = styles['Normal'].clone('SmallStyle')
-        style_small.fontSize = 8
-        style_small.leading = 10
+        # Styles partagés entre tickets (construits une fois)
+        style_center = rendu_pdf.style('CenterStyle', alignment=TA_CENTER, fontSize=10, leading=12)
+        style_center_bold = rendu_pdf.style('CenterBoldStyle', alignment=TA_CENTER, fontSize=11,
+                                            fontName='Helvetica-Bold', leading=13)
+        style_normal = rendu_pdf.style('NormalStyle', fontSize=9, leading=11)
+        style_small = rendu_pdf.style('SmallStyle', fontSize=8, leading=10)
         
         # --- EN-TÊTE SOCIÉTÉ ---
         elements.append(Paragraph(f"<b>{societe.get('nomsociete', 'NOM SOCIÉTÉ')}</b>", style_center_bold))
@@ -3317,22 +2249,16 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         # --- MONTANT À PAYER ---
         elements.append(Paragraph("<b>*** MONTANT À PAYER ***</b>", style_center_bold))
         
-        style_montant = styles['Normal'].clone('MontantStyle')
-        style_montant.alignment = TA_CENTER
-        style_montant.fontSize = 14
-        style_montant.fontName = 'Helvetica-Bold'
-        style_montant.leading = 16
+        style_montant = rendu_pdf.style('MontantStyle', alignment=TA_CENTER, fontSize=14,
+                                        fontName='Helvetica-Bold', leading=16)
         
         elements.append(Paragraph(f"<b>{self.formater_nombre_pdf(total_ttc)} Ar</b>", style_montant))
         elements.append(Spacer(1, 2 * mm))
         
         # --- MONTANT EN FMG ---
         montant_fmg = total_ttc * 5
-        style_fmg = styles['Normal'].clone('FMGStyle')
-        style_fmg.alignment = TA_CENTER
-        style_fmg.fontSize = 11
-        style_fmg.fontName = 'Helvetica-Bold'
-        style_fmg.leading = 13
+        style_fmg = rendu_pdf.style('FMGStyle', alignment=TA_CENTER, fontSize=11,
+                                    fontName='Helvetica-Bold', leading=13)
         
         elements.append(Paragraph(f"<b>Montant en FMG: {self.formater_nombre_pdf(montant_fmg)} FMG</b>", style_fmg))
         elements.append(Spacer(1, 2 * mm))
@@ -3352,13 +2278,9 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         elements.append(Paragraph(datetime.now().strftime("%d/%m/%Y %H:%M:%S"), style_center))
         elements.append(Spacer(1, 10 * mm))
         
-        # Génération du PDF
-        try:
-            doc.build(elements)
-            print(f"✅ Ticket PDF généré avec succès : {filename}")
-        except Exception as e:
-            print(f"❌ Erreur lors de la génération du ticket PDF : {e}")
-            messagebox.showerror("Erreur", f"Erreur lors de la génération du ticket : {e}")
+        # Génération du PDF (une erreur remonte à rendu_pdf, qui l'affiche sur le thread Tk)
+        doc.build(elements)
+        print(f"✅ Ticket PDF généré avec succès : {filename}")
 
     # ==============================================================================
     # GESTION DES PROFORMAS (NOUVEAU)
@@ -3777,7 +2699,7 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
                 with open(get_config_path('config.json')) as f:
                     config = json.load(f)
                     db_config = config['database']
-                self.db_connection = psycopg2.connect(**db_config)
+                self.db_connection = connecter(**db_config)
             except Exception as e:
                 print(f"Erreur de connexion base de données : {e}")
                 return False
@@ -3818,6 +2740,8 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         # S'assurer que la fenêtre est modale (optionnel, mais recommandé)
         self.fenetre_avoir.grab_set()
 
+        from pages.page_avoir import PageAvoir
+
         # Initialise PageAvoir dans la nouvelle fenêtre
         # NOTE : On passe 'self.id_user_connecte' pour que la PageAvoir sache qui est l'utilisateur
         page_avoir = PageAvoir(self.fenetre_avoir, id_user_connecte=self.id_user_connecte)
@@ -3850,6 +2774,8 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         # S'assurer que la fenêtre est modale
         self.fenetre_proforma.grab_set()
 
+        from pages.page_proforma import PageCommandeCli
+
         # CORRECTION ICI : Changer 'id_user_connecte=' par 'iduser='
         page_proforma = PageCommandeCli(self.fenetre_proforma, iduser=self.id_user_connecte)
         
@@ -3896,30 +2822,20 @@ class PageVenteParMsin(ctk.CTkFrame): # MODIFICATION : Hérite de CTkFrame pour
         except Exception as e:
             messagebox.showerror("Erreur d'ouverture", f"Impossible d'ouvrir la page : {e}")
 
-    def verifier_alerte_stock_silencieuse(self):
-        """Vérifie si un article est en alerte dépôt pour faire clignoter la cloche."""
-        conn = self.connect_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                # On cherche s'il existe au moins un article dont le stock <= alertdepot
-                query = "SELECT COUNT(*) FROM tb_article WHERE deleted = 0 AND alertdepot >= 0" 
-                # Note: Idéalement, utilisez votre fonction calculer_stock_article ici
-                cursor.execute(query)
-                count = cursor.fetchone()[0]
-            
-                # Si alerte trouvée
-                if count > 0:
-                    self.notif_stock_depot.configure(text_color="red")
+    def appliquer_alerte_stock(self, nb_alertes, sonner=False):
+        """
+        Cloche rouge si un article est en alerte dépôt (appelée par la minuterie de la session) ;
+        son seulement si la session le demande (vérification périodique, nouvelles alertes).
+        """
+        if nb_alertes > 0:
+            self.notif_stock_depot.configure(text_color="red")
+            if sonner and self.winfo_ismapped():   # un seul son : l'onglet visible
+                try:
                     winsound.PlaySound("SystemAsterisk", winsound.SND_ALIAS) # Son clochette Windows
-                else:
-                    self.notif_stock_depot.configure(text_color="gray")
-                
-            except: pass
-            finally: conn.close()
-    
-        # Vérifier toutes les 5 minutes
-        self.after(300000, self.verifier_alerte_stock_silencieuse)        
+                except Exception:
+                    pass
+        else:
+            self.notif_stock_depot.configure(text_color="gray")
 
 # --- Partie pour exécuter la fenêtre de test ---
 if __name__ == "__main__":
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Profileur SQL (facultatif) : chaque cursor.execute des connexions du pool,
+rattaché à la page, à la méthode et à l'action utilisateur qui l'ont lancé.
+
+Pour prouver, par exemple, qu'une page lance une requête par ligne affichée
+(N+1) au lieu d'une requête ensembliste, les histogrammes de mesures.py ne
+suffisent pas : il faut savoir QUI exécute QUOI, et combien de fois pour un
+même clic.
+
+✅ Par requête : empreinte du SQL (littéraux et paramètres remplacés par ?),
+   nombre de paramètres, lignes renvoyées / modifiées, durée, page
+   (module pages.*), appelant (module.Classe.méthode:ligne), action, thread.
+✅ Action utilisateur = un rappel Tk (clic, touche, after...) sur le thread
+   principal ; action("...") pour nommer un traitement en arrière-plan.
+   Un thread sans action nommée forme une seule action.
+✅ N+1 : même empreinte exécutée plus de seuil_n_plus_1 fois dans une action
+   -> suspects_n_plus_1() et avertissement dans le journal.
+✅ resume_par_page(), exporter_csv(chemin), exporter_json(chemin) ; export
+   JSON automatique à la fermeture (profil_sql_AAAAMMJJ_HHMMSS.json).
+
+Désactivé par défaut (le curseur du pool reste mesures.CurseurMesure).
+Activation : variable d'environnement IJEERY_PROFILEUR=1, ou config.json
+(section "profileur", valeurs par défaut) :
+    "profileur": {"actif": false, "seuil_n_plus_1": 10, "max_requetes": 200000,
+                  "export_a_la_fermeture": true}
+
+Exemple :
+    with profileur_sql.action("import inventaire"):
+        ...
+    profileur_sql.exporter_csv("profil.csv")
+"""
+
+import atexit
+import csv
+import hashlib
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import mesures
+from resource_utils import get_config_path
+
+
+SEUIL_N_PLUS_1 = 10
+MAX_REQUETES = 200_000      # requêtes gardées en mémoire (les plus anciennes sont oubliées)
+
+COLONNES = ["horodatage", "action_id", "action", "page", "appelant", "empreinte",
+            "nb_params", "lignes", "duree_ms", "thread", "sql"]
+
+journal = mesures.journal(__name__)
+
+
+def _reglages():
+    """Section "profileur" facultative de config.json."""
+    try:
+        with open(get_config_path('config.json'), encoding='utf-8') as f:
+            return json.load(f).get('profileur', {}) or {}
+    except Exception:
+        return {}
+
+
+_reglages_lus = _reglages()
+ACTIF = os.environ.get("IJEERY_PROFILEUR", "") not in ("", "0") or bool(_reglages_lus.get('actif', False))
+_seuil = int(_reglages_lus.get('seuil_n_plus_1', SEUIL_N_PLUS_1))
+
+_requetes = deque(maxlen=int(_reglages_lus.get('max_requetes', MAX_REQUETES)))
+_suspects = {}              # (action_id, empreinte) -> suspect N+1
+_verrou = threading.Lock()
+_numeros = itertools.count(1)
+_local = threading.local()
+
+
+# ==============================================================================
+# Empreinte
+# ==============================================================================
+_RE_COMMENTAIRES = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_RE_CHAINES = re.compile(r"'(?:[^']|'')*'")
+_RE_PARAMETRES = re.compile(r"%\(\w+\)s|%s")
+_RE_NOMBRES = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_LISTES = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_VALEURS = re.compile(r"(\(\?\))(?:\s*,\s*\(\?\))+")
+
+
+def normaliser(sql):
+    """SQL sans commentaires ni littéraux : les requêtes qui ne diffèrent que par leurs valeurs coïncident."""
+    texte = _RE_COMMENTAIRES.sub(" ", sql)
+    texte = _RE_CHAINES.sub("?", texte)
+    texte = _RE_PARAMETRES.sub("?", texte)
+    texte = _RE_NOMBRES.sub("?", texte)
+    texte = _RE_LISTES.sub("(?)", texte)            # IN (?, ?, ?) -> IN (?)
+    texte = _RE_VALEURS.sub(r"\1", texte)           # VALUES (?), (?) -> VALUES (?)
+    return " ".join(texte.split())
+
+
+def empreinte(sql_normalise):
+    return hashlib.md5(sql_normalise.encode("utf-8")).hexdigest()[:12]
+
+
+# ==============================================================================
+# Actions utilisateur
+# ==============================================================================
+class Action:
+    def __init__(self, nom):
+        self.id = next(_numeros)
+        self.nom = nom
+        self.compteurs = {}     # empreinte -> exécutions dans l'action
+
+
+def _action_courante():
+    pile = getattr(_local, "pile", None)
+    if pile:
+        return pile[-1]
+    # Thread sans action nommée : une action pour toute la vie du thread
+    action = getattr(_local, "defaut", None)
+    if action is None:
+        action = _local.defaut = Action(f"thread {threading.current_thread().name}")
+    return action
+
+
+@contextmanager
+def action(nom):
+    """Regroupe les requêtes du bloc sous une action (détection N+1 par action)."""
+    pile = getattr(_local, "pile", None)
+    if pile is None:
+        pile = _local.pile = []
+    pile.append(Action(nom))
+    try:
+        yield
+    finally:
+        pile.pop()
+
+
+def _nom_rappel(fonction):
+    fonction = getattr(fonction, "__func__", fonction)
+    module = getattr(fonction, "__module__", None) or "?"
+    return f"{module}.{getattr(fonction, '__qualname__', repr(fonction))}"
+
+
+def _suivre_rappels_tk():
+    """Chaque rappel Tk (commande, bind, after) devient une action."""
+    import tkinter
+
+    appel_origine = tkinter.CallWrapper.__call__
+
+    def appel(self, *args):
+        with action(_nom_rappel(self.func)):
+            return appel_origine(self, *args)
+
+    tkinter.CallWrapper.__call__ = appel
+
+
+# ==============================================================================
+# Appelant
+# ==============================================================================
+_FICHIERS_IGNORES = {os.path.abspath(__file__), os.path.abspath(mesures.__file__)}
+_MODULES_IGNORES = ("db_pool", "psycopg2", "contextlib", "functools")
+
+
+def _appelant():
+    """(page, appelant) : premier module pages.* de la pile, première fonction hors infrastructure."""
+    page = appelant = None
+    cadre = sys._getframe(2)
+    while cadre is not None and page is None:
+        code = cadre.f_code
+        module = cadre.f_globals.get("__name__", "?")
+        if os.path.abspath(code.co_filename) not in _FICHIERS_IGNORES \
+                and not module.startswith(_MODULES_IGNORES):
+            nom = getattr(code, "co_qualname", code.co_name)
+            if appelant is None:
+                appelant = f"{module}.{nom}:{cadre.f_lineno}"
+            if module.startswith("pages."):
+                page = module[len("pages."):]
+        cadre = cadre.f_back
+    return page or (appelant or "?").split(".")[0], appelant or "?"
+
+
+# ==============================================================================
+# Curseur
+# ==============================================================================
+def _texte(curseur, sql):
+    if isinstance(sql, bytes):
+        return sql.decode("utf-8", "replace")
+    if not isinstance(sql, str):                # psycopg2.sql.Composed
+        try:
+            return sql.as_string(curseur)
+        except Exception:
+            return str(sql)
+    return sql
+
+
+class CurseurProfile(mesures.CurseurMesure):
+    """CurseurMesure qui enregistre aussi chaque requête dans le profileur."""
+
+    def _noter(self, sql, params, duree):
+        super()._noter(sql, params, duree)
+        try:
+            noter(_texte(self, sql), params, self.rowcount, duree)
+        except Exception as e:              # le profilage ne doit jamais casser une requête
+            journal.debug("Profileur : requête non enregistrée (%s)", e)
+
+
+def noter(sql, params, lignes, duree):
+    normalise = normaliser(sql)
+    cle = empreinte(normalise)
+    page, appelant = _appelant()
+    courante = _action_courante()
+    nombre = courante.compteurs[cle] = courante.compteurs.get(cle, 0) + 1
+
+    requete = {
+        "horodatage": datetime.now().isoformat(timespec="milliseconds"),
+        "action_id": courante.id,
+        "action": courante.nom,
+        "page": page,
+        "appelant": appelant,
+        "empreinte": cle,
+        "nb_params": len(params) if isinstance(params, (list, tuple, dict)) else 0,
+        "lignes": lignes,
+        "duree_ms": round(duree * 1000, 3),
+        "thread": threading.current_thread().name,
+        "sql": normalise,
+    }
+    with _verrou:
+        _requetes.append(requete)
+        if nombre > _seuil:
+            suspect = _suspects.get((courante.id, cle))
+            if suspect is None:
+                suspect = _suspects[(courante.id, cle)] = {
+                    "action_id": courante.id, "action": courante.nom, "page": page,
+                    "appelant": appelant, "empreinte": cle, "sql": normalise,
+                    "nombre": 0, "duree_ms": 0.0,
+                }
+                journal.warning("N+1 probable : %s exécutée plus de %d fois dans %s (%s)",
+                                cle, _seuil, courante.nom, appelant)
+            suspect["nombre"] = nombre
+            suspect["duree_ms"] = round(suspect["duree_ms"] + duree * 1000, 3)
+
+
+def classe_curseur():
+    """cursor_factory des connexions du pool : CurseurProfile si le profileur est actif."""
+    return CurseurProfile if ACTIF else mesures.CurseurMesure
+
+
+# ==============================================================================
+# Résultats
+# ==============================================================================
+def requetes():
+    with _verrou:
+        return list(_requetes)
+
+
+def suspects_n_plus_1():
+    """Suspects N+1, les plus répétés d'abord ('duree_ms' : temps au-delà du seuil)."""
+    with _verrou:
+        suspects = [dict(s) for s in _suspects.values()]
+    return sorted(suspects, key=lambda s: -s["nombre"])
+
+
+def resume_par_page():
+    """[{page, requetes, duree_ms, empreintes, actions, n_plus_1, plus_frequentes}] trié par durée totale."""
+    pages = {}
+    for r in requetes():
+        p = pages.setdefault(r["page"], {"page": r["page"], "requetes": 0, "duree_ms": 0.0,
+                                         "empreintes": {}, "actions": set()})
+        p["requetes"] += 1
+        p["duree_ms"] += r["duree_ms"]
+        p["actions"].add(r["action_id"])
+        stat = p["empreintes"].setdefault(r["empreinte"], {"empreinte": r["empreinte"], "sql": r["sql"],
+                                                           "nombre": 0, "duree_ms": 0.0})
+        stat["nombre"] += 1
+        stat["duree_ms"] += r["duree_ms"]
+
+    suspects = {}
+    for s in suspects_n_plus_1():
+        suspects[s["page"]] = suspects.get(s["page"], 0) + 1
+
+    resume = []
+    for p in pages.values():
+        frequentes = sorted(p["empreintes"].values(), key=lambda e: -e["nombre"])[:5]
+        resume.append({
+            "page": p["page"],
+            "requetes": p["requetes"],
+            "duree_ms": round(p["duree_ms"], 3),
+            "empreintes": len(p["empreintes"]),
+            "actions": len(p["actions"]),
+            "n_plus_1": suspects.get(p["page"], 0),
+            "plus_frequentes": [dict(e, duree_ms=round(e["duree_ms"], 3)) for e in frequentes],
+        })
+    return sorted(resume, key=lambda p: -p["duree_ms"])
+
+
+def exporter_csv(chemin):
+    """Une ligne par requête (COLONNES) ; retourne le nombre de requêtes écrites."""
+    lignes = requetes()
+    with open(chemin, "w", newline="", encoding="utf-8-sig") as f:     # BOM : ouverture directe dans Excel
+        ecrivain = csv.DictWriter(f, fieldnames=COLONNES, delimiter=";")
+        ecrivain.writeheader()
+        ecrivain.writerows(lignes)
+    return len(lignes)
+
+
+def exporter_json(chemin):
+    """Requêtes, résumé par page et suspects N+1 ; retourne le nombre de requêtes écrites."""
+    lignes = requetes()
+    with open(chemin, "w", encoding="utf-8") as f:
+        json.dump({
+            "genere": datetime.now().isoformat(timespec="seconds"),
+            "seuil_n_plus_1": _seuil,
+            "pages": resume_par_page(),
+            "n_plus_1": suspects_n_plus_1(),
+            "requetes": lignes,
+        }, f, ensure_ascii=False, indent=1)
+    return len(lignes)
+
+
+def reinitialiser():
+    with _verrou:
+        _requetes.clear()
+        _suspects.clear()
+
+
+def _exporter_a_la_fermeture():
+    if not _requetes:
+        return
+    dossier = os.path.dirname(sys.executable) if getattr(sys, 'frozen', False) \
+        else os.path.dirname(os.path.abspath(__file__))
+    chemin = os.path.join(dossier, f"profil_sql_{datetime.now():%Y%m%d_%H%M%S}.json")
+    try:
+        exporter_json(chemin)
+    except OSError as e:
+        journal.error("Profil SQL non écrit : %s", e)
+
+
+if ACTIF:
+    _suivre_rappels_tk()
+    if _reglages_lus.get('export_a_la_fermeture', True):
+        atexit.register(_exporter_a_la_fermeture)
+    journal.info("Profileur SQL actif (seuil N+1 : %d)", _seuil)
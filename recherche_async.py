@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Recherche d'articles en arrière-plan pour les fenêtres de sélection.
+
+Avant : chaque <KeyRelease> exécutait la requête complète (stock + prix) sur
+le thread Tk ; taper "ciment" lançait six agrégations et gelait la caisse.
+
+✅ ControleurRecherche :
+    - anti-rebond : la requête ne part qu'après DELAI_MS sans nouvelle frappe ;
+    - exécution dans un thread, sur une connexion empruntée au pool (db_pool) ;
+    - une nouvelle recherche annule la requête en cours côté serveur
+      (connection.cancel(), équivalent de pg_cancel_backend) ;
+    - compteur de génération : seul le résultat de la DERNIÈRE recherche est
+      appliqué au Treeview, sur le thread Tk (via la file de thread_tk).
+
+Exemple :
+    def requete(cursor, filtre, idmag):          # thread de travail
+        cursor.execute(SQL, (idmag, f"%{filtre}%"))
+        return cursor.fetchall()
+
+    def afficher(lignes, filtre, idmag):         # thread Tk
+        tree.delete(*tree.get_children())
+        ...
+
+    recherche = ControleurRecherche(fenetre, requete, afficher)
+    entry.bind('<KeyRelease>', lambda e: recherche.declencher(entry.get(), idmag))
+    recherche.lancer(entry.get(), idmag)         # chargement initial, sans délai
+"""
+
+import threading
+import tkinter
+
+from psycopg2 import extensions
+from psycopg2.errors import QueryCanceled
+
+import db_pool
+import thread_tk
+
+
+DELAI_MS = 250   # fenêtre d'anti-rebond entre deux frappes
+
+
+class ControleurRecherche:
+    """Anti-rebond + requête en arrière-plan + annulation des recherches périmées."""
+
+    def __init__(self, widget, requete, appliquer, delai_ms=DELAI_MS, erreur=None, connexion=None,
+                 avec_base=True):
+        """
+        widget    : widget Tk servant à planifier (after) ; la recherche s'arrête
+                    quand il est détruit.
+        requete   : requete(cursor, *args) -> résultat, exécutée dans le thread.
+        appliquer : appliquer(resultat, *args), appelée sur le thread Tk et
+                    seulement si la recherche est toujours la plus récente.
+        erreur    : erreur(exception) sur le thread Tk (par défaut : console).
+        connexion : fabrique de connexion (par défaut : pool partagé).
+        avec_base : False si la requête n'interroge que des données en mémoire
+                    (cache catalogue) : elle reçoit alors cursor=None.
+        """
+        self.widget = widget
+        self.requete = requete
+        self.appliquer = appliquer
+        self.delai_ms = delai_ms
+        self.erreur = erreur
+        self.connexion = connexion or (lambda: db_pool.pool_global().emprunter())
+        self.avec_base = avec_base
+        self._generation = 0
+        self._minuterie = None
+        self._conn_en_cours = None
+        self._verrou = threading.Lock()
+        thread_tk.preparer(widget)
+        # tkinter.Misc.bind : CTkFrame.bind lierait le canevas interne, pas le cadre
+        tkinter.Misc.bind(widget, '<Destroy>', self._sur_destruction, '+')
+
+    def declencher(self, *args):
+        """À lier sur <KeyRelease> : relance le délai d'anti-rebond."""
+        self._annuler_minuterie()
+        self._minuterie = self.widget.after(self.delai_ms, lambda: self.lancer(*args))
+
+    def lancer(self, *args):
+        """Lance immédiatement la recherche (chargement initial, touche Entrée...)."""
+        self._annuler_minuterie()
+        with self._verrou:
+            self._generation += 1
+            generation = self._generation
+        self._annuler_requete_en_cours()
+        threading.Thread(target=self._executer, args=(generation, args), daemon=True).start()
+
+    def annuler(self):
+        """Abandonne toute recherche planifiée ou en cours."""
+        self._annuler_minuterie()
+        with self._verrou:
+            self._generation += 1
+        self._annuler_requete_en_cours()
+
+    # ------------------------------------------------------------------
+    def _executer(self, generation, args):
+        if not self._est_courante(generation):
+            return
+        conn = None
+        try:
+            if not self.avec_base:
+                resultat = self.requete(None, *args)
+                self._sur_thread_tk(lambda: self._appliquer(generation, resultat, args))
+                return
+            conn = self.connexion()
+            with self._verrou:
+                if generation != self._generation:
+                    return
+                self._conn_en_cours = conn
+            cursor = conn.cursor()
+            try:
+                resultat = self.requete(cursor, *args)
+            finally:
+                cursor.close()
+            self._sur_thread_tk(lambda: self._appliquer(generation, resultat, args))
+        except QueryCanceled:
+            pass  # remplacée par une recherche plus récente
+        except Exception as e:
+            if self._est_courante(generation):
+                self._sur_thread_tk(lambda e=e: self._signaler(e))
+        finally:
+            with self._verrou:
+                if self._conn_en_cours is conn:
+                    self._conn_en_cours = None
+            if conn is not None:
+                conn.close()
+
+    def _appliquer(self, generation, resultat, args):
+        if self._est_courante(generation):
+            self.appliquer(resultat, *args)
+
+    def _signaler(self, exception):
+        if self.erreur:
+            self.erreur(exception)
+        else:
+            print(f"Erreur recherche : {exception}")
+
+    def _est_courante(self, generation):
+        with self._verrou:
+            return generation == self._generation
+
+    def _annuler_requete_en_cours(self):
+        with self._verrou:
+            conn = self._conn_en_cours
+        if conn is not None:
+            try:
+                if conn.get_transaction_status() == extensions.TRANSACTION_STATUS_ACTIVE:
+                    conn.cancel()
+            except Exception:
+                pass
+
+    def _annuler_minuterie(self):
+        if self._minuterie is not None:
+            try:
+                self.widget.after_cancel(self._minuterie)
+            except Exception:
+                pass
+            self._minuterie = None
+
+    def _sur_thread_tk(self, action):
+        thread_tk.sur_thread_tk(self.widget, action)
+
+    def _sur_destruction(self, event):
+        if event.widget is self.widget:
+            self.annuler()
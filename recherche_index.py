@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Recherche indexée des articles et des clients (pg_trgm + unaccent).
+
+Avant : `codearticle ILIKE '%x%' OR designation ILIKE '%x%'`,
+`LPAD(codearticle, 10, '0') LIKE ...`, `nomcli ILIKE ...` : aucun index
+utilisable, chaque frappe parcourait tb_unite / tb_article / tb_client.
+
+✅ installer() crée (une fois, sans bloquer les écritures) :
+    - les extensions pg_trgm et unaccent (si les droits le permettent) ;
+    - f_normaliser(texte) = lower(unaccent(texte)), IMMUTABLE donc indexable :
+      "Béton" et "beton" se retrouvent ;
+    - des index GIN trigrammes sur f_normaliser(designation / codearticle /
+      nomcli) : LIKE '%x%' devient un Bitmap Index Scan ;
+    - un index sur LPAD(codearticle, 10, '0') pour la recherche par code exact ;
+    - un index (dateregistre, id) sur tb_vente pour la liste paginée des factures.
+
+✅ API classée, utilisée par les fenêtres de recherche :
+    search_articles(terme, limite)  -> [ResultatArticle]
+    search_clients(terme, limite)   -> [ResultatClient]
+    filtre_articles(cursor, terme)  -> (sql, params) pour les requêtes
+                                       qui ajoutent leurs propres colonnes.
+    filtre_clients(cursor, terme)   -> idem sur le nom du client.
+
+Classement : code identique, code commençant par le terme, désignation
+commençant par le terme, puis similarité trigramme.
+Chaque mot du terme doit apparaître ("ciment 50" trouve "CIMENT PORTLAND 50KG").
+
+Sans pg_trgm / unaccent (droits insuffisants), les mêmes fonctions
+fonctionnent en mode dégradé (lower + LIKE, sans index ni similarité).
+"""
+
+import threading
+import unicodedata
+from collections import namedtuple
+
+import db_pool
+
+
+LIMITE = 200    # nombre de lignes par défaut d'une recherche
+
+ResultatArticle = namedtuple(
+    "ResultatArticle", "idarticle idunite codearticle designation designationunite score"
+)
+ResultatClient = namedtuple(
+    "ResultatClient", "idclient nomcli contactcli adressecli idtypeclient"
+)
+
+# (nom, table, méthode, expression indexée)
+INDEX_TRIGRAMMES = [
+    ("idx_article_designation_trgm", "tb_article", "gin", "f_normaliser(designation) gin_trgm_ops"),
+    ("idx_unite_code_trgm", "tb_unite", "gin", "f_normaliser(codearticle) gin_trgm_ops"),
+    ("idx_client_nom_trgm", "tb_client", "gin", "f_normaliser(nomcli) gin_trgm_ops"),
+]
+INDEX_BTREE = [
+    ("idx_unite_code_lpad", "tb_unite", "btree", "(LPAD(codearticle::TEXT, 10, '0'))"),
+    ("idx_vente_date_id", "tb_vente", "btree", "(dateregistre, id)"),
+]
+
+
+def normaliser(texte):
+    """Équivalent Python de f_normaliser : minuscules, sans accents."""
+    texte = unicodedata.normalize('NFKD', (texte or "").lower())
+    return "".join(c for c in texte if not unicodedata.combining(c))
+
+
+def _motif(mot, prefixe=False):
+    """Motif LIKE échappé ('%' et '_' saisis par l'utilisateur pris littéralement)."""
+    mot = mot.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"{mot}%" if prefixe else f"%{mot}%"
+
+
+# ==============================================================================
+# Installation
+# ==============================================================================
+_capacites = {}            # dsn -> {'normaliser': bool, 'trgm': bool}
+_verrou = threading.Lock()
+
+
+def _corps_normaliser(cursor):
+    """Corps de f_normaliser selon la présence d'unaccent (schéma qualifié)."""
+    cursor.execute("""
+        SELECT n.nspname FROM pg_extension e
+        JOIN pg_namespace n ON n.oid = e.extnamespace
+        WHERE e.extname = 'unaccent'
+    """)
+    schema = cursor.fetchone()
+    if schema:
+        s = schema[0]
+        return f"SELECT lower({s}.unaccent('{s}.unaccent'::regdictionary, COALESCE($1, '')))"
+    return "SELECT lower(COALESCE($1, ''))"
+
+
+def _creer_extension(cursor, nom):
+    try:
+        cursor.execute(f"CREATE EXTENSION IF NOT EXISTS {nom}")
+        return True
+    except Exception as e:
+        print(f"Extension {nom} indisponible : {e}")
+        return False
+
+
+def installer(conn=None):
+    """
+    Crée extensions, fonction et index (idempotent).
+    Les index sont créés CONCURRENTLY : les ventes continuent pendant la construction.
+    """
+    proprietaire = conn is None
+    if proprietaire:
+        conn = db_pool.pool_global().emprunter()
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        _creer_extension(cursor, "unaccent")
+        trgm = _creer_extension(cursor, "pg_trgm")
+
+        corps = _corps_normaliser(cursor)
+        cursor.execute("SELECT prosrc FROM pg_proc WHERE proname = 'f_normaliser'")
+        existant = cursor.fetchone()
+        if existant is None or existant[0].strip() != corps:
+            cursor.execute(f"""
+                CREATE OR REPLACE FUNCTION f_normaliser(TEXT) RETURNS TEXT
+                AS $$ {corps} $$
+                LANGUAGE sql IMMUTABLE PARALLEL SAFE
+            """)
+            if existant is not None:
+                # La définition a changé (unaccent ajouté) : les index doivent suivre
+                for nom, _, _, _ in INDEX_TRIGRAMMES:
+                    cursor.execute(f"DROP INDEX IF EXISTS {nom}")
+
+        for nom, table, methode, expression in (INDEX_TRIGRAMMES if trgm else []) + INDEX_BTREE:
+            cursor.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nom} ON {table} USING {methode} ({expression})"
+            )
+    finally:
+        cursor.close()
+        conn.autocommit = autocommit
+        with _verrou:
+            _capacites.pop(conn.dsn, None)
+        if proprietaire:
+            conn.close()
+
+
+def installer_en_arriere_plan():
+    """installer() dans un thread (au démarrage de l'application)."""
+    def travail():
+        try:
+            installer()
+        except Exception as e:
+            print(f"Index de recherche non installés : {e}")
+    threading.Thread(target=travail, daemon=True).start()
+
+
+def _capacites_de(cursor):
+    """f_normaliser et pg_trgm disponibles sur cette base ? (lu une fois par base)"""
+    dsn = cursor.connection.dsn
+    with _verrou:
+        capacites = _capacites.get(dsn)
+    if capacites is None:
+        cursor.execute("""
+            SELECT EXISTS (SELECT 1 FROM pg_proc WHERE proname = 'f_normaliser'),
+                   EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')
+        """)
+        normaliser_ok, trgm_ok = cursor.fetchone()
+        capacites = {'normaliser': normaliser_ok, 'trgm': trgm_ok and normaliser_ok}
+        with _verrou:
+            _capacites[dsn] = capacites
+    return capacites
+
+
+def _norm(capacites, colonne):
+    return f"f_normaliser({colonne})" if capacites['normaliser'] else f"lower(COALESCE({colonne}, ''))"
+
+
+def _mots(terme):
+    return normaliser(terme).split()
+
+
+# ==============================================================================
+# Recherche
+# ==============================================================================
+def filtre_articles(cursor, terme, article='a', unite='u'):
+    """
+    Prédicat indexé "chaque mot dans la désignation ou le code" : (sql, params).
+    unite=None pour une requête sur tb_article seule. ("TRUE", []) si terme vide.
+
+        sql, params = filtre_articles(cursor, filtre, article='T2', unite='T1')
+        query += " AND " + sql
+    """
+    mots = _mots(terme)
+    if not mots:
+        return "TRUE", []
+    capacites = _capacites_de(cursor)
+    designation = _norm(capacites, f"{article}.designation")
+    code = _norm(capacites, f"{unite}.codearticle") if unite else None
+    conditions, params = [], []
+    for mot in mots:
+        if code:
+            conditions.append(f"({designation} LIKE %s OR {code} LIKE %s)")
+            params += [_motif(mot), _motif(mot)]
+        else:
+            conditions.append(f"{designation} LIKE %s")
+            params.append(_motif(mot))
+    return "(" + " AND ".join(conditions) + ")", params
+
+
+def filtre_clients(cursor, terme, colonne='c.nomcli'):
+    """Prédicat indexé "chaque mot dans le nom du client" : (sql, params), ("TRUE", []) si vide."""
+    mots = _mots(terme)
+    if not mots:
+        return "TRUE", []
+    nom = _norm(_capacites_de(cursor), colonne)
+    return "(" + " AND ".join(f"{nom} LIKE %s" for _ in mots) + ")", [_motif(m) for m in mots]
+
+
+def _emprunter(conn):
+    if conn is not None:
+        return conn, False
+    return db_pool.pool_global().emprunter(), True
+
+
+def search_articles(terme, limite=LIMITE, conn=None, inclure_supprimees=False):
+    """
+    Unités d'articles actifs correspondant au terme, les plus pertinentes d'abord.
+    limite=None : toutes les lignes (LIMIT NULL), pour les listes qui affichent tout.
+    """
+    conn, proprietaire = _emprunter(conn)
+    try:
+        cursor = conn.cursor()
+        capacites = _capacites_de(cursor)
+        filtre, params = filtre_articles(cursor, terme)
+        terme_norm = " ".join(_mots(terme))
+        designation = _norm(capacites, "a.designation")
+        code = _norm(capacites, "u.codearticle")
+        score = (f"GREATEST(similarity({designation}, %s), similarity({code}, %s))"
+                 if capacites['trgm'] else "0")
+        score_params = [terme_norm, terme_norm] if capacites['trgm'] else []
+
+        cursor.execute(f"""
+            SELECT u.idarticle, u.idunite, u.codearticle, a.designation, u.designationunite,
+                   {score} AS score
+            FROM tb_unite u
+            INNER JOIN tb_article a ON a.idarticle = u.idarticle
+            WHERE a.deleted = 0
+              {"" if inclure_supprimees else "AND COALESCE(u.deleted, 0) = 0"}
+              AND {filtre}
+            ORDER BY ({code} = %s) DESC,
+                     ({code} LIKE %s) DESC,
+                     ({designation} LIKE %s) DESC,
+                     score DESC, a.designation, u.codearticle
+            LIMIT %s
+        """, score_params + params + [
+            terme_norm, _motif(terme_norm, prefixe=True), _motif(terme_norm, prefixe=True), limite
+        ])
+        resultats = [ResultatArticle(*ligne) for ligne in cursor.fetchall()]
+        cursor.close()
+        return resultats
+    finally:
+        if proprietaire:
+            conn.close()
+
+
+def search_clients(terme, limite=LIMITE, conn=None, idtypeclient=None):
+    """
+    Clients actifs correspondant au terme, les plus pertinents d'abord.
+    idtypeclient : 1 (comptant) / 2 (crédit) pour restreindre, None pour tous.
+    """
+    conn, proprietaire = _emprunter(conn)
+    try:
+        cursor = conn.cursor()
+        capacites = _capacites_de(cursor)
+        nom = _norm(capacites, "nomcli")
+        terme_norm = " ".join(_mots(terme))
+        filtre, params = filtre_clients(cursor, terme, colonne="nomcli")
+        conditions = f" AND {filtre}"
+        if idtypeclient is not None:
+            conditions += " AND COALESCE(idtypeclient, 1) = %s"
+            params.append(idtypeclient)
+        score = f"similarity({nom}, %s)" if capacites['trgm'] else "0"
+        score_params = [terme_norm] if capacites['trgm'] else []
+
+        cursor.execute(f"""
+            SELECT idclient, nomcli, contactcli, adressecli, COALESCE(idtypeclient, 1)
+            FROM tb_client
+            WHERE deleted = 0{conditions}
+            ORDER BY ({nom} LIKE %s) DESC, {score} DESC, nomcli
+            LIMIT %s
+        """, params + [_motif(terme_norm, prefixe=True)] + score_params + [limite])
+        resultats = [ResultatClient(*ligne) for ligne in cursor.fetchall()]
+        cursor.close()
+        return resultats
+    finally:
+        if proprietaire:
+            conn.close()
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Registre des pages de l'application, chargées à la demande.
+
+Avant : app_main importait ~80 modules de pages au démarrage ; chacun tirait
+reportlab, pandas, openpyxl, PIL, num2words... La fenêtre principale payait le
+chargement de toutes les pages avant le premier clic.
+
+✅ PAGES : clé du menu -> PageDiffere(module, classe, signature).
+   Le module n'est importé qu'à la première navigation (PageDiffere.charger()).
+   La signature indique comment app_main construit la page :
+       "standard"         page(master, db_conn=..., session_data=...) avec replis
+       "id_user_connecte" page(master=..., id_user_connecte=iduser)
+       "iduser"           page(master=..., iduser=iduser)
+       "chat"             page(master=..., session_data={"iduser", "username"})
+       "app_root"         page(master=..., app_root=app)
+       "toplevel"         fenêtre modale séparée (open_top_level_window)
+✅ prechauffer(cles) : importe en arrière-plan les pages les plus utilisées,
+   une fois la fenêtre principale affichée.
+✅ Rapport de démarrage : jalon("...") horodate les étapes, rapport_demarrage()
+   les affiche et les ajoute à demarrage.log (temps d'import de chaque page
+   chargée compris) pour repérer les régressions.
+
+Exemple :
+    entree = registre_pages.page("PageStock")
+    classe = entree.charger()            # import au premier appel seulement
+"""
+
+import importlib
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+
+_T0 = time.perf_counter()   # référence : import du registre, au tout début d'app_main
+
+SEUIL_DEMARRAGE = 2.0       # secondes : au-delà, le rapport signale une régression
+FICHIER_RAPPORT = "demarrage.log"
+
+# Pages importées en arrière-plan après l'affichage de la fenêtre principale
+PAGES_PRECHAUFFEES = ["PageVente", "PageStock", "PageListeFacture", "PageCaisse", "page_listeArticle"]
+
+
+class PageDiffere:
+    """Page référencée par son module : importée au premier charger()."""
+
+    def __init__(self, cle, module, classe, signature="standard"):
+        self.cle = cle
+        self.module = module
+        self.classe = classe
+        self.signature = signature
+        self._cible = None
+        self._verrou = threading.Lock()
+
+    def charger(self):
+        """Importe le module (une fois) et renvoie la classe ou fonction de page."""
+        if self._cible is None:
+            with self._verrou:
+                if self._cible is None:
+                    debut = time.perf_counter()
+                    module = importlib.import_module(self.module)
+                    self._cible = getattr(module, self.classe)
+                    _noter_import(self.cle, time.perf_counter() - debut)
+        return self._cible
+
+    @property
+    def chargee(self):
+        return self._cible is not None
+
+    def __call__(self, *args, **kwargs):
+        return self.charger()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<PageDiffere {self.cle} ({self.module}.{self.classe}, {self.signature})>"
+
+
+def _p(cle, module, classe=None, signature="standard"):
+    return cle, PageDiffere(cle, f"pages.{module}", classe or cle, signature)
+
+
+PAGES = dict([
+    _p("PageArticle", "page_article"),
+    _p("PageAbsence", "page_absence"),
+    _p("PageArticleFrs", "page_articleFrs"),
+    _p("page_listeArticle", "page_ArticleListe"),
+    _p("PageArticleMouvement", "page_articleMouvement"),
+    _p("PageAutorisation", "page_autorisation"),
+    _p("PageAvoir", "page_avoir"),
+    _p("PageAVQ", "page_avance15e", signature="iduser"),
+    _p("FenetreAvanceSpec", "page_avanceSpecial_", signature="iduser"),
+    _p("PageBanque", "page_banque"),
+    _p("PageBanqueNv", "page_banqueAjout"),
+    _p("PageBaseListe", "page_BaseListe"),
+    _p("PageCaisse", "page_caisse"),
+    _p("PageCategorieArticle", "page_categorieArticle"),
+    _p("PageCategorieCompte", "page_categorieCompte"),
+    _p("PageClient", "page_client"),
+    _p("PageClientCrédit", "page_clientCrédit"),
+    _p("PageCommandeFrs", "page_CmdFrs"),
+    _p("PageCodeAutorisation", "page_CodeAutorisation"),
+    _p("PageDecaissement", "page_decaissement"),
+    _p("PageDecaissementBq", "page_decaissementBq"),
+    _p("PageDiagnostics", "page_diagnostics"),
+    _p("PageEncaissement", "page_encaissement"),
+    _p("PageEncaissementBq", "page_encaissementBq"),
+    _p("PageEvenement", "page_evenement"),
+    _p("PageFacturation", "page_Facturation", signature="id_user_connecte"),
+    _p("PageFactureListe", "page_factureListe"),
+    _p("PageFonction", "page_fonction"),
+    _p("PageFournisseur", "page_fournisseur"),
+    _p("PageFrsDette", "page_FrsDette"),
+    _p("page_home", "page_home"),
+    _p("PageChat", "page_chat", signature="chat"),
+    _p("PageInfoArticle", "page_infoArticle"),
+    _p("PageInfoMouvementStock", "page_infoMouvement", signature="iduser"),
+    _p("PageBonReception", "page_livrFrs"),
+    _p("PageLivraisonClient", "page_LivraisonClient", signature="id_user_connecte"),
+    _p("PageListeFacture", "page_ListeFacture"),
+    _p("PageListeMouvement", "page_listeMouvement"),
+    _p("PageMainPersonnel", "page_mainPers"),
+    _p("PageMagasin", "page_magasin"),
+    _p("PageMenu", "page_menu"),
+    _p("PageMouvementStock", "page_mouvementStock"),
+    _p("PagePrixListe", "page_prixListe"),
+    _p("PagePresence", "page_presence"),
+    _p("PageSalaireBase", "page_salaireBase_", signature="app_root"),
+    _p("PageSalaireEtatSB", "page_salaireEtatBase_"),
+    _p("PageEtatSalaireHoraire", "page_salaireEtatHoraire_"),
+    _p("PageSauvegarde", "page_sauvegarde"),
+    _p("PageSortie", "page_sortie"),
+    _p("PageStock", "page_stock"),
+    _p("PageStockLivraison", "page_StockLivraison"),
+    _p("PageSuiviCommande", "page_SuiviCommande"),
+    _p("PageTransfert", "page_transfert"),
+    _p("PageTransfertBanque", "page_transfertBanque", signature="id_user_connecte"),
+    _p("PageTransfertCaisse", "page_transfertCaisse", signature="id_user_connecte"),
+    _p("PageTypePmt", "page_typePmt"),
+    _p("PageUnite", "page_unite"),
+    _p("PageUsers", "page_users"),
+    _p("PageVente", "page_vente", signature="id_user_connecte"),
+    _p("PageVenteParMsin", "page_venteParMsin", signature="id_user_connecte"),
+    _p("PageValidationSalaire", "page_pmtSalaire"),
+    _p("PageTauxHoraire", "page_tauxhoraire", signature="app_root"),
+    _p("DBInitializerApp", "page_reinit", signature="toplevel"),
+])
+
+
+def page(cle):
+    """Entrée du registre pour une clé de menu (KeyError si inconnue, comme page_mapping)."""
+    return PAGES[cle]
+
+
+# ==============================================================================
+# Préchauffage
+# ==============================================================================
+def prechauffer(cles=None):
+    """Importe en arrière-plan les pages indiquées (PAGES_PRECHAUFFEES par défaut)."""
+    cles = [c for c in (cles or PAGES_PRECHAUFFEES) if c in PAGES]
+
+    def travail():
+        for cle in cles:
+            try:
+                PAGES[cle].charger()
+            except Exception as e:
+                print(f"Préchauffage de {cle} impossible : {e}")
+        jalon(f"préchauffage terminé ({len(cles)} pages)")
+
+    threading.Thread(target=travail, daemon=True).start()
+
+
+# ==============================================================================
+# Rapport de démarrage
+# ==============================================================================
+_jalons = []                # [(étape, secondes depuis _T0)]
+_imports = []               # [(clé, secondes d'import)]
+_verrou_rapport = threading.Lock()
+
+
+def jalon(etape):
+    """Horodate une étape du démarrage (secondes depuis le début d'app_main)."""
+    with _verrou_rapport:
+        _jalons.append((etape, time.perf_counter() - _T0))
+
+
+def _noter_import(cle, duree):
+    with _verrou_rapport:
+        _imports.append((cle, duree))
+
+
+def _chemin_rapport():
+    if getattr(sys, 'frozen', False):
+        base = os.path.dirname(sys.executable)
+    else:
+        base = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base, FICHIER_RAPPORT)
+
+
+def rapport_demarrage(ecrire=True):
+    """Texte du rapport (jalons + imports de pages) ; ajouté à demarrage.log si ecrire."""
+    with _verrou_rapport:
+        jalons = list(_jalons)
+        imports = list(_imports)
+    lignes = [f"=== Démarrage {datetime.now():%Y-%m-%d %H:%M:%S} ==="]
+    precedent = 0.0
+    for etape, instant in jalons:
+        lignes.append(f"{instant * 1000:9.0f} ms  (+{(instant - precedent) * 1000:6.0f})  {etape}")
+        precedent = instant
+    if imports:
+        lignes.append("Pages importées :")
+        for cle, duree in sorted(imports, key=lambda i: -i[1]):
+            lignes.append(f"{duree * 1000:9.0f} ms  {cle}")
+    total = jalons[-1][1] if jalons else 0.0
+    if total > SEUIL_DEMARRAGE:
+        lignes.append(f"⚠️ Démarrage lent : {total:.2f} s (seuil {SEUIL_DEMARRAGE:.1f} s)")
+    texte = "\n".join(lignes)
+    if ecrire:
+        try:
+            with open(_chemin_rapport(), "a", encoding="utf-8") as f:
+                f.write(texte + "\n")
+        except OSError as e:
+            print(f"Rapport de démarrage non écrit : {e}")
+    return texte
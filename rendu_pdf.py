@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Service de rendu PDF en arrière-plan (factures, tickets, bons de mouvement).
+
+Avant : generate_pdf_a5 / generate_ticket_80mm (vente), _build_pdf_a5
+(EtatsPDF_Mouvements, page_infoMouvement) et les bons de réception, sortie,
+transfert ou reçus de paiement étaient construits sur le thread Tk juste
+après l'enregistrement : la caisse restait figée pendant le rendu. Chaque
+document relisait tb_infosociete et reconstruisait getSampleStyleSheet().
+
+✅ rendre(widget, chemin, travail) : travail() écrit le PDF dans un thread du
+   pool (NB_OUVRIERS), puis le fichier est ouvert et rappel(chemin) appelé sur
+   le thread Tk. La vente suivante peut commencer pendant le rendu.
+✅ Ce qui ne change pas d'un document à l'autre est préparé une fois :
+       feuille_styles()      getSampleStyleSheet() partagée
+       style(nom, **attrs)   ParagraphStyle mémorisé par (nom, attributs)
+       societe()             ligne de tb_infosociete (invalider() pour relire)
+   Les polices standard sont chargées à la création du pool, avant le
+   premier rendu concurrent.
+✅ Les flowables (Paragraph, Table...) restent propres à chaque document :
+   reportlab les modifie pendant la mise en page, ils ne sont pas partagés.
+
+Réglage optionnel dans config.json (section "pdf", valeur par défaut) :
+    "pdf": {"ouvriers": 2}
+
+Exemple :
+    import rendu_pdf
+    rendu_pdf.rendre(self, filename, lambda: self.generate_pdf_a5(data, filename))
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import db_pool
+from resource_utils import get_config_path
+import thread_tk
+
+
+NB_OUVRIERS = 2     # rendus simultanés (reportlab est surtout du calcul Python)
+
+POLICES_STANDARD = ["Helvetica", "Helvetica-Bold", "Helvetica-Oblique", "Helvetica-BoldOblique"]
+
+COLONNES_SOCIETE = [
+    'nomsociete', 'adressesociete', 'villesociete', 'contactsociete',
+    'nifsociete', 'statsociete', 'cifsociete'
+]
+
+
+def _reglages():
+    """Section "pdf" facultative de config.json."""
+    try:
+        with open(get_config_path('config.json'), encoding='utf-8') as f:
+            return json.load(f).get('pdf', {}) or {}
+    except Exception:
+        return {}
+
+
+# ==============================================================================
+# Ressources partagées entre documents
+# ==============================================================================
+_verrou = threading.Lock()
+_feuille = None
+_styles = {}                # (nom, parent, attributs) -> ParagraphStyle
+_societe = None
+
+
+def feuille_styles():
+    """getSampleStyleSheet() construite une fois (ne pas modifier ses styles)."""
+    global _feuille
+    with _verrou:
+        if _feuille is None:
+            from reportlab.lib.styles import getSampleStyleSheet
+            _feuille = getSampleStyleSheet()
+        return _feuille
+
+
+def style(nom, parent='Normal', **attributs):
+    """
+    ParagraphStyle dérivé d'un style de la feuille, mémorisé :
+        style('OpInfo', fontSize=9, alignment=TA_LEFT, leading=12)
+    """
+    cle = (nom, parent, repr(sorted(attributs.items())))
+    with _verrou:
+        resultat = _styles.get(cle)
+    if resultat is None:
+        from reportlab.lib.styles import ParagraphStyle
+        resultat = ParagraphStyle(nom, parent=feuille_styles()[parent], **attributs)
+        with _verrou:
+            resultat = _styles.setdefault(cle, resultat)
+    return resultat
+
+
+def societe():
+    """Infos société (chaînes, '' si vides), lues une fois par processus."""
+    global _societe
+    with _verrou:
+        if _societe is not None:
+            return dict(_societe)
+    with db_pool.curseur() as cursor:
+        cursor.execute(f"SELECT {', '.join(COLONNES_SOCIETE)} FROM tb_infosociete LIMIT 1")
+        ligne = cursor.fetchone() or [None] * len(COLONNES_SOCIETE)
+    infos = {col: (valeur or '') for col, valeur in zip(COLONNES_SOCIETE, ligne)}
+    with _verrou:
+        _societe = infos
+    return dict(infos)
+
+
+def invalider():
+    """Oublie les infos société (à appeler après leur modification)."""
+    global _societe
+    with _verrou:
+        _societe = None
+
+
+def _charger_polices():
+    """Charge les métriques des polices standard avant tout rendu concurrent."""
+    from reportlab.pdfbase import pdfmetrics
+    for police in POLICES_STANDARD:
+        pdfmetrics.getFont(police)
+    feuille_styles()
+
+
+# ==============================================================================
+# Pool de rendu
+# ==============================================================================
+_pool = None
+_verrou_pool = threading.Lock()
+
+
+def pool():
+    """Pool de rendu du processus (créé au premier document)."""
+    global _pool
+    with _verrou_pool:
+        if _pool is None:
+            nb = int(_reglages().get('ouvriers', NB_OUVRIERS))
+            _pool = ThreadPoolExecutor(
+                max_workers=max(1, nb), thread_name_prefix="rendu_pdf", initializer=_charger_polices
+            )
+        return _pool
+
+
+def ouvrir(chemin):
+    """Ouvre le fichier avec le programme par défaut du système."""
+    try:
+        if sys.platform == 'win32':
+            os.startfile(chemin)
+        elif sys.platform == 'darwin':
+            subprocess.Popen(['open', chemin])
+        else:
+            subprocess.Popen(['xdg-open', chemin])
+    except Exception as e:
+        print(f"⚠️ Ouverture de {chemin} impossible : {e}")
+
+
+def _erreur_defaut(e):
+    from tkinter import messagebox
+    messagebox.showerror("Erreur PDF", f"Erreur lors de la génération du PDF : {e}")
+
+
+def soumettre(widget, travail, rappel=None, erreur=None):
+    """
+    travail() dans le pool ; rappel(resultat) ou erreur(exception) sur le
+    thread Tk. Les rappels passent par la fenêtre racine : ils arrivent même
+    si le widget (fenêtre de paiement, onglet...) a été fermé entre-temps.
+    """
+    racine = widget.nametowidget('.')
+    erreur = erreur or _erreur_defaut
+    thread_tk.preparer(racine)
+
+    def sur_thread_tk(action):
+        thread_tk.sur_thread_tk(racine, action)
+
+    def executer():
+        try:
+            resultat = travail()
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            sur_thread_tk(lambda e=e: erreur(e))
+            return
+        if rappel:
+            sur_thread_tk(lambda: rappel(resultat))
+
+    return pool().submit(executer)
+
+
+def rendre(widget, chemin, travail, ouvrir_apres=True, rappel=None, erreur=None):
+    """
+    travail() écrit le PDF `chemin` dans le pool. Un travail qui renvoie False
+    ou ne produit pas le fichier est une erreur. Ensuite, sur le thread Tk :
+    ouvrir(chemin) si ouvrir_apres, puis rappel(chemin).
+    """
+    def executer():
+        if travail() is False or not os.path.exists(chemin):
+            raise RuntimeError(f"PDF non généré : {chemin}")
+        return chemin
+
+    def termine(resultat):
+        print(f"✅ PDF prêt : {resultat}")
+        if ouvrir_apres:
+            ouvrir(resultat)
+        if rappel:
+            rappel(resultat)
+
+    return soumettre(widget, executer, termine, erreur)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Session de vente partagée par tous les onglets de caisse du processus.
+
+Avant : chaque onglet de VenteTabManager construisait une PageVenteParMsin
+complète qui relisait magasins, clients, infos société et settings.json,
+gardait sa propre connexion ouverte et lançait sa propre minuterie
+verifier_alerte_stock_silencieuse (5 minutes). Dix onglets = dix fois le travail.
+
+✅ Données de référence chargées UNE fois, à la première demande :
+    magasins(), idmag_utilisateur(iduser), clients(), infos_societe(), settings()
+✅ Prix : cache catalogue (catalogue_cache) puis, à défaut, tb_prix lu une
+   fois par (article, unité) ; le mémo est vidé quand le catalogue est rechargé.
+✅ UNE minuterie d'alerte stock pour tous les onglets : abonner_alerte(widget,
+   rappel) ; rappel(nb_alertes, sonner) est appelé sur le thread Tk de chaque
+   onglet encore ouvert. La minuterie s'arrête après la fermeture du dernier
+   onglet. Elle est réveillée par les mouvements de stock (bus evenements)
+   et vérifie aussi toutes les PERIODE_ALERTE secondes.
+   sonner : True à la vérification périodique (rappel sonore comme avant),
+   et après un mouvement seulement si le nombre d'alertes a augmenté ; une
+   vente sur un autre poste ne fait plus sonner tous les onglets.
+
+Exemple :
+    from session_vente import session_vente
+    session = session_vente()
+    self.client_map = session.clients()          # dict partagé nom -> idclient
+    session.abonner_alerte(self, self.appliquer_alerte_stock)
+"""
+
+import json
+import threading
+import tkinter
+
+import db_pool
+import evenements
+from catalogue_cache import catalogue
+import thread_tk
+
+
+PERIODE_ALERTE = 300      # secondes entre deux vérifications d'alerte stock (sans NOTIFY)
+
+SQL_ALERTE_STOCK = "SELECT COUNT(*) FROM tb_article WHERE deleted = 0 AND alertdepot >= 0"
+
+SETTINGS_DEFAUT = {
+    'Vente_ImpressionConfirmation': 1,
+    'Vente_ImpressionA5': 1,
+    'Vente_ImpressionTicket': 0,
+    'Avoir_ImpressionConfirmation': 1,
+    'Avoir_ImpressionA5': 1,
+    'Avoir_ImpressionTicket': 0
+}
+
+INFOS_SOCIETE_DEFAUT = {
+    'nomsociete': 'NOM SOCIÉTÉ',
+    'adressesociete': 'N/A',
+    'villesociete': 'N/A',
+    'contactsociete': 'N/A',
+    'nifsociete': 'N/A',
+    'statsociete': 'N/A',
+    'cifsociete': 'N/A',
+    'ambleme': '',
+    'autre': ''
+}
+
+
+class SessionVente:
+    """Données de référence et minuterie d'alerte communes aux onglets de vente."""
+
+    def __init__(self):
+        self._verrou = threading.RLock()
+        self._magasins = None            # [(idmag, designationmag)]
+        self._idmag_users = {}           # iduser -> idmag par défaut
+        self._clients = None             # {nomcli: idclient}, partagé et complété par les onglets
+        self._infos_societe = None
+        self._settings = None
+        self._prix = {}                  # (idarticle, idunite) -> prix hors catalogue
+        self._prix_catalogue = None      # instantané catalogue pour lequel _prix est valable
+        self._abonnes = {}               # id(widget) -> (widget, rappel)
+        self._minuterie = None           # thread de la minuterie d'alerte
+        self._reveil = threading.Event()  # mouvement de stock signalé par le bus d'événements
+        self.derniere_alerte = None      # dernier nombre d'articles en alerte
+
+    # ------------------------------------------------------------------
+    # Données de référence
+    # ------------------------------------------------------------------
+    def magasins(self):
+        """[(idmag, designationmag)] des magasins actifs, triés par nom."""
+        with self._verrou:
+            if self._magasins is None:
+                with db_pool.curseur() as cursor:
+                    cursor.execute(
+                        "SELECT idmag, designationmag FROM tb_magasin WHERE deleted = 0 ORDER BY designationmag"
+                    )
+                    self._magasins = cursor.fetchall()
+            return list(self._magasins)
+
+    def idmag_utilisateur(self, iduser):
+        """Magasin par défaut de l'utilisateur (None si aucun)."""
+        if iduser is None:
+            return None
+        with self._verrou:
+            if iduser not in self._idmag_users:
+                with db_pool.curseur() as cursor:
+                    cursor.execute("SELECT idmag FROM tb_users WHERE iduser = %s AND deleted = 0", (iduser,))
+                    ligne = cursor.fetchone()
+                self._idmag_users[iduser] = ligne[0] if ligne else None
+            return self._idmag_users[iduser]
+
+    def clients(self):
+        """
+        {nomcli: idclient} des clients actifs. Le MÊME dict est rendu à tous les
+        onglets : un client créé dans un onglet est connu des autres.
+        """
+        with self._verrou:
+            if self._clients is None:
+                with db_pool.curseur() as cursor:
+                    cursor.execute("SELECT idclient, nomcli FROM tb_client WHERE deleted = 0 ORDER BY nomcli")
+                    self._clients = {nom: id_ for id_, nom in cursor.fetchall()}
+            return self._clients
+
+    def infos_societe(self):
+        """Infos société pour l'impression (valeurs par défaut si absentes)."""
+        with self._verrou:
+            if self._infos_societe is None:
+                with db_pool.curseur() as cursor:
+                    cursor.execute(
+                        "SELECT nomsociete, adressesociete, villesociete, contactsociete, nifsociete, "
+                        "statsociete, cifsociete, ambleme, autre FROM tb_infosociete LIMIT 1"
+                    )
+                    info = cursor.fetchone()
+                self._infos_societe = dict(zip(INFOS_SOCIETE_DEFAUT, info)) if info else dict(INFOS_SOCIETE_DEFAUT)
+            return self._infos_societe
+
+    def settings(self):
+        """Paramètres d'impression de settings.json (valeurs par défaut si absent ou invalide)."""
+        with self._verrou:
+            if self._settings is None:
+                try:
+                    with open('settings.json', 'r', encoding='utf-8') as f:
+                        self._settings = json.load(f)
+                    print("✅ Paramètres d'impression chargés depuis settings.json")
+                except FileNotFoundError:
+                    print("⚠️ Fichier settings.json non trouvé, utilisation des paramètres par défaut")
+                    self._settings = dict(SETTINGS_DEFAUT)
+                except json.JSONDecodeError:
+                    print("⚠️ Erreur dans le format de settings.json, utilisation des paramètres par défaut")
+                    self._settings = dict(SETTINGS_DEFAUT)
+            return self._settings
+
+    def prix(self, idarticle, idunite):
+        """Dernier prix de l'unité : cache catalogue, sinon tb_prix (lu une fois)."""
+        cat = catalogue()
+        prix = cat.prix_unite(idarticle, idunite)
+        if prix > 0:
+            return float(prix)
+        cle = (int(idarticle), int(idunite))
+        with self._verrou:
+            if self._prix_catalogue is not cat:
+                self._prix = {}
+                self._prix_catalogue = cat
+            if cle in self._prix:
+                return self._prix[cle]
+        with db_pool.curseur() as cursor:
+            cursor.execute(
+                "SELECT prix FROM tb_prix WHERE idarticle = %s AND idunite = %s "
+                "AND prix IS NOT NULL ORDER BY id DESC LIMIT 1",
+                cle
+            )
+            ligne = cursor.fetchone()
+        prix = float(ligne[0]) if ligne and ligne[0] is not None else 0.0
+        with self._verrou:
+            self._prix[cle] = prix
+        return prix
+
+    def invalider(self):
+        """Oublie les données de référence (relues à la prochaine demande)."""
+        with self._verrou:
+            self._magasins = None
+            self._idmag_users = {}
+            self._clients = None
+            self._infos_societe = None
+            self._settings = None
+            self._prix = {}
+
+    # ------------------------------------------------------------------
+    # Alerte stock : une seule minuterie pour tous les onglets
+    # ------------------------------------------------------------------
+    def abonner_alerte(self, widget, rappel):
+        """
+        rappel(nb_alertes, sonner) sur le thread Tk du widget, tout de suite puis
+        à chaque vérification ; désabonnement automatique à sa destruction.
+        """
+        thread_tk.preparer(widget)
+        with self._verrou:
+            self._abonnes[id(widget)] = (widget, rappel)
+            derniere = self.derniere_alerte
+            demarrer = self._minuterie is None
+            if demarrer:
+                self._minuterie = threading.Thread(target=self._boucle_alerte, daemon=True)
+                self._minuterie.start()
+        # tkinter.Misc.bind : CTkFrame.bind lierait le canevas interne, pas le cadre
+        tkinter.Misc.bind(widget, '<Destroy>', lambda e: e.widget is widget and self.desabonner_alerte(widget), '+')
+        if not demarrer and derniere is not None:
+            thread_tk.sur_thread_tk(widget, lambda: rappel(derniere, False))
+
+    def desabonner_alerte(self, widget):
+        with self._verrou:
+            self._abonnes.pop(id(widget), None)
+
+    def _boucle_alerte(self):
+        """
+        Minuterie commune : vérifie après un mouvement de stock et toutes les
+        PERIODE_ALERTE secondes ; s'arrête au premier réveil sans onglet abonné.
+        """
+        jeton = evenements.ecouter(evenements.STOCK, lambda idarticles: self._reveil.set())
+        periodique = True
+        try:
+            while True:
+                try:
+                    with db_pool.curseur() as cursor:
+                        cursor.execute(SQL_ALERTE_STOCK)
+                        nb = cursor.fetchone()[0]
+                    # Après un mouvement : son seulement si de nouveaux articles passent en alerte
+                    sonner = periodique or nb > (self.derniere_alerte or 0)
+                    self.derniere_alerte = nb
+                    self._diffuser(nb, sonner)
+                except Exception as e:
+                    print(f"Erreur vérification stock: {e}")
+                periodique = not self._reveil.wait(PERIODE_ALERTE)
+                self._reveil.clear()
+                with self._verrou:
+                    if not self._abonnes:
+                        self._minuterie = None
+                        return
+        finally:
+            evenements.retirer(jeton)
+
+    def _diffuser(self, nb, sonner):
+        with self._verrou:
+            abonnes = list(self._abonnes.values())
+        for widget, rappel in abonnes:
+            thread_tk.sur_thread_tk(widget, lambda r=rappel: r(nb, sonner))
+
+
+_session = None
+_verrou_session = threading.Lock()
+
+
+def session_vente():
+    """Session de vente du processus (créée à la première demande)."""
+    global _session
+    with _verrou_session:
+        if _session is None:
+            _session = SessionVente()
+        return _session
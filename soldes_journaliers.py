@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+"""
+Soldes de caisse (par mode de paiement) et de banque (par tb_banque) tenus
+par clôtures journalières.
+
+Avant : PageCaisse.update_solde_global, page_home.get_solde_caisse, le
+tableau de bord et PageBanque.update_solde_global ré-additionnaient TOUT
+l'historique des paiements à chaque rafraîchissement : plus les années
+passent, plus l'affichage du solde ralentit.
+
+✅ tb_solde_journalier : solde cumulé à la clôture d'un jour, une ligne par
+   (compte, jour, idcompte) ; compte = 'caisse' (idcompte = idmode, 0 sans
+   mode) ou 'banque' (idcompte = id_banque).
+✅ Solde = dernière clôture + mouvements depuis : un parcours de plage
+   (index sur datepmt) limité aux jours non clôturés.
+✅ Clôture paresseuse : la première lecture du jour clôture la veille
+   (cloturer(), verrou consultatif : un seul poste écrit la clôture).
+✅ Opération saisie, modifiée ou supprimée à une date déjà clôturée :
+   invalider_depuis(jour, conn) dans la même transaction ; le trigger
+   trg_invalider_soldes des tables du journal et des banques le fait aussi
+   pour toute écriture (saisie antidatée, correction directe en base).
+✅ verifier() rejoue l'historique et compare chaque clôture ; reconstruire()
+   les efface et reclôture.
+
+    python soldes_journaliers.py cloturer
+    python soldes_journaliers.py verifier
+    python soldes_journaliers.py reconstruire
+
+Sans la table (droits insuffisants), les soldes sont calculés sur tout
+l'historique comme avant.
+
+Exemple :
+    from soldes_journaliers import solde_caisse, solde_banque
+    solde = solde_caisse(cursor)            # toutes les caisses
+    solde = solde_banque(id_banque, cursor)
+"""
+
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import db_pool
+import journal_caisse
+
+
+DEBUT_HISTOIRE = date(1900, 1, 1)
+FIN_HISTOIRE = date(9999, 12, 30)   # borne haute : les opérations postdatées comptent aussi
+VERROU_CLOTURE = 731_017    # clé pg_advisory_xact_lock de la clôture
+
+SIGNE = "CASE WHEN idtypeoperation = 1 THEN mtpaye ELSE -mtpaye END"
+
+# Opérations bancaires (mêmes tables que PageBanque)
+TABLES_BANQUE = ["tb_encaissementbq", "tb_decaissementbq", "tb_pmtfacture", "tb_pmtcom", "tb_transfertbanque"]
+
+SQL_JOURNAL_BANQUE = "\n    UNION ALL\n".join(
+    f"    SELECT id_banque, datepmt, idtypeoperation, mtpaye FROM {table} WHERE id_banque IS NOT NULL"
+    for table in TABLES_BANQUE
+)
+
+INDEX_BANQUE = [
+    (f"idx_{table[3:]}_banque_datepmt", table, "(id_banque, datepmt) WHERE id_banque IS NOT NULL")
+    for table in TABLES_BANQUE
+]
+
+SQL_CREATE_SOLDE = """
+    CREATE TABLE IF NOT EXISTS tb_solde_journalier (
+        compte VARCHAR(10) NOT NULL,
+        jour DATE NOT NULL,
+        idcompte INTEGER NOT NULL,
+        solde NUMERIC(18, 2) NOT NULL,
+        datemaj TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (compte, jour, idcompte)
+    )
+"""
+
+# Tables dont une écriture antidatée rend les clôtures fausses
+TABLES_INVALIDANTES = list(dict.fromkeys([table for table, _, _, _ in journal_caisse.SOURCES] + TABLES_BANQUE))
+
+# Le verrou partagé fait attendre une clôture en cours (verrou exclusif) avant d'effacer
+SQL_FONCTION_INVALIDATION = f"""
+    CREATE OR REPLACE FUNCTION fn_invalider_soldes() RETURNS trigger AS $$
+    DECLARE
+        depuis DATE;
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            depuis := NEW.datepmt::date;
+        ELSIF TG_OP = 'DELETE' THEN
+            depuis := OLD.datepmt::date;
+        ELSIF OLD IS NOT DISTINCT FROM NEW THEN
+            RETURN NULL;
+        ELSE
+            depuis := LEAST(OLD.datepmt, NEW.datepmt)::date;
+        END IF;
+        IF depuis < CURRENT_DATE THEN
+            PERFORM pg_advisory_xact_lock_shared({VERROU_CLOTURE});
+            DELETE FROM tb_solde_journalier WHERE jour >= depuis;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+SQL_TRIGGER_INVALIDATION = """
+    DO $$
+    BEGIN
+        IF to_regclass('{table}') IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM pg_trigger
+            WHERE tgname = 'trg_invalider_soldes' AND tgrelid = to_regclass('{table}')
+        ) THEN
+            CREATE TRIGGER trg_invalider_soldes
+                AFTER INSERT OR UPDATE OR DELETE ON {table}
+                FOR EACH ROW EXECUTE PROCEDURE fn_invalider_soldes();
+        END IF;
+    END
+    $$
+"""
+
+
+def _sql_mouvements(cursor, compte):
+    """(idcompte, somme signée) sur [%s, %s[ pour le compte."""
+    if compte == "caisse":
+        return f"""
+            SELECT COALESCE(j.idmode, 0), SUM({SIGNE})
+            FROM {journal_caisse.source(cursor)} j
+            WHERE j.datepmt >= %s AND j.datepmt < %s
+            GROUP BY 1
+        """
+    return f"""
+        SELECT b.id_banque, SUM({SIGNE})
+        FROM (
+{SQL_JOURNAL_BANQUE}
+        ) b
+        WHERE b.datepmt >= %s AND b.datepmt < %s
+        GROUP BY 1
+    """
+
+
+def _mouvements(cursor, compte, debut, fin=FIN_HISTOIRE):
+    """{idcompte: somme signée} des jours debut à fin inclus."""
+    cursor.execute(_sql_mouvements(cursor, compte), (debut, fin + timedelta(days=1)))
+    return {idcompte: float(total or 0) for idcompte, total in cursor.fetchall()}
+
+
+# ==============================================================================
+# Installation
+# ==============================================================================
+_verrou = threading.Lock()
+_table_disponible = {}      # dsn -> bool
+
+
+@contextmanager
+def _connexion(conn=None):
+    """Connexion fournie (l'appelant valide la transaction) ou empruntée au pool (commit en sortie)."""
+    if conn is not None:
+        yield conn
+    else:
+        with db_pool.emprunt() as conn:
+            yield conn
+
+
+def installer(conn=None):
+    """Crée tb_solde_journalier, ses triggers d'invalidation et les index des opérations bancaires (idempotent)."""
+    proprietaire = conn is None
+    if proprietaire:
+        conn = db_pool.pool_global().emprunter()
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SQL_CREATE_SOLDE)
+        cursor.execute(SQL_FONCTION_INVALIDATION)
+        for table in TABLES_INVALIDANTES:
+            cursor.execute(SQL_TRIGGER_INVALIDATION.format(table=table))
+        for nom, table, expression in INDEX_BANQUE:
+            cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nom} ON {table} {expression}")
+    finally:
+        cursor.close()
+        conn.autocommit = autocommit
+        with _verrou:
+            _table_disponible.pop(conn.dsn, None)
+        if proprietaire:
+            conn.close()
+
+
+def installer_en_arriere_plan():
+    """installer() puis clôture de la veille, dans un thread (au démarrage)."""
+    def travail():
+        try:
+            installer()
+            cloturer()
+        except Exception as e:
+            print(f"Soldes journaliers non installés : {e}")
+    threading.Thread(target=travail, daemon=True).start()
+
+
+def table_disponible(cursor):
+    """True si tb_solde_journalier existe sur cette base (vérifié une fois)."""
+    dsn = cursor.connection.dsn
+    with _verrou:
+        disponible = _table_disponible.get(dsn)
+    if disponible is None:
+        cursor.execute("SELECT to_regclass('tb_solde_journalier') IS NOT NULL")
+        disponible = bool(cursor.fetchone()[0])
+        with _verrou:
+            _table_disponible[dsn] = disponible
+    return disponible
+
+
+# ==============================================================================
+# Clôtures
+# ==============================================================================
+def _derniere_cloture(cursor, compte):
+    """(jour, {idcompte: solde}) de la dernière clôture, (None, {}) sinon."""
+    cursor.execute("SELECT MAX(jour) FROM tb_solde_journalier WHERE compte = %s", (compte,))
+    jour = cursor.fetchone()[0]
+    if jour is None:
+        return None, {}
+    cursor.execute(
+        "SELECT idcompte, solde FROM tb_solde_journalier WHERE compte = %s AND jour = %s", (compte, jour)
+    )
+    return jour, {idcompte: float(solde) for idcompte, solde in cursor.fetchall()}
+
+
+def cloturer(jusqu_au=None, conn=None):
+    """
+    Clôture caisse et banques au soir de `jusqu_au` (la veille par défaut) :
+    dernière clôture + mouvements depuis. Renvoie le nombre de lignes écrites.
+    """
+    jusqu_au = jusqu_au or date.today() - timedelta(days=1)
+    with _connexion(conn) as conn:
+        cursor = conn.cursor()
+        try:
+            if not table_disponible(cursor):
+                return 0
+            # Un seul poste clôture ; les autres attendent puis trouvent la clôture faite
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (VERROU_CLOTURE,))
+            ecrites = 0
+            for compte in ("caisse", "banque"):
+                jour, valeurs = _derniere_cloture(cursor, compte)
+                if jour is not None and jour >= jusqu_au:
+                    continue
+                debut = jour + timedelta(days=1) if jour else DEBUT_HISTOIRE
+                for idcompte, total in _mouvements(cursor, compte, debut, jusqu_au).items():
+                    valeurs[idcompte] = valeurs.get(idcompte, 0.0) + total
+                for idcompte, solde in valeurs.items():
+                    cursor.execute("""
+                        INSERT INTO tb_solde_journalier (compte, jour, idcompte, solde, datemaj)
+                        VALUES (%s, %s, %s, %s, NOW())
+                        ON CONFLICT (compte, jour, idcompte) DO UPDATE SET solde = EXCLUDED.solde, datemaj = NOW()
+                    """, (compte, jusqu_au, idcompte, round(solde, 2)))
+                    ecrites += 1
+            return ecrites
+        finally:
+            cursor.close()
+
+
+def invalider_depuis(jour, conn=None):
+    """
+    Efface les clôtures à partir de `jour` (date ou datepmt d'une opération
+    antidatée) ; refaites à la lecture suivante. Avec `conn`, l'effacement
+    est validé avec la modification de l'appelant.
+    """
+    if jour is None:
+        return
+    if isinstance(jour, datetime):
+        jour = jour.date()      # la clôture du jour même est fausse aussi
+    with _connexion(conn) as conn:
+        cursor = conn.cursor()
+        try:
+            if not table_disponible(cursor):
+                return
+            cursor.execute("SELECT pg_advisory_xact_lock_shared(%s)", (VERROU_CLOTURE,))
+            cursor.execute("DELETE FROM tb_solde_journalier WHERE jour >= %s", (jour,))
+        finally:
+            cursor.close()
+
+
+def reconstruire(conn=None):
+    """Efface toutes les clôtures puis clôture la veille depuis l'historique complet."""
+    with _connexion(conn) as conn:
+        invalider_depuis(DEBUT_HISTOIRE, conn)
+        return cloturer(conn=conn)
+
+
+def verifier(tolerance=0.01, conn=None):
+    """
+    🔍 Rejoue l'historique jusqu'à chaque clôture.
+    Retourne les écarts [(compte, jour, idcompte, solde_cloture, solde_historique)].
+    """
+    with _connexion(conn) as conn:
+        cursor = conn.cursor()
+        try:
+            if not table_disponible(cursor):
+                return []
+            cursor.execute("SELECT compte, jour, idcompte, solde FROM tb_solde_journalier ORDER BY compte, jour")
+            ecarts = []
+            rejoues = {}    # (compte, jour) -> {idcompte: solde rejoué}
+            for compte, jour, idcompte, solde in cursor.fetchall():
+                if (compte, jour) not in rejoues:
+                    rejoues[(compte, jour)] = _mouvements(cursor, compte, DEBUT_HISTOIRE, jour)
+                attendu = rejoues[(compte, jour)].get(idcompte, 0.0)
+                if abs(float(solde) - attendu) > tolerance:
+                    ecarts.append((compte, jour, idcompte, float(solde), attendu))
+            return ecarts
+        finally:
+            cursor.close()
+
+
+# ==============================================================================
+# Lecture des soldes
+# ==============================================================================
+def soldes(compte, cursor=None):
+    """{idcompte: solde courant} : dernière clôture + mouvements depuis."""
+    if cursor is None:
+        with db_pool.curseur() as cursor:
+            return soldes(compte, cursor)
+
+    if not table_disponible(cursor):
+        return _mouvements(cursor, compte, DEBUT_HISTOIRE)
+
+    hier = date.today() - timedelta(days=1)
+    jour, resultat = _derniere_cloture(cursor, compte)
+    if jour is None or jour < hier:
+        # Première lecture du jour : clôture de la veille (transaction séparée)
+        try:
+            cloturer(hier)
+            jour, resultat = _derniere_cloture(cursor, compte)
+        except Exception as e:
+            print(f"Clôture des soldes impossible : {e}")
+    debut = jour + timedelta(days=1) if jour else DEBUT_HISTOIRE
+    for idcompte, total in _mouvements(cursor, compte, debut).items():
+        resultat[idcompte] = resultat.get(idcompte, 0.0) + total
+    return resultat
+
+
+def solde_caisse(cursor=None, idmode=None):
+    """Solde de caisse (tous modes, ou un mode)."""
+    valeurs = soldes("caisse", cursor)
+    return valeurs.get(idmode, 0.0) if idmode is not None else sum(valeurs.values())
+
+
+def solde_banque(id_banque, cursor=None):
+    """Solde d'un compte bancaire (tb_banque)."""
+    return soldes("banque", cursor).get(id_banque, 0.0)
+
+
+if __name__ == "__main__":
+    commande = sys.argv[1] if len(sys.argv) > 1 else ""
+
+    if commande == "cloturer":
+        installer()
+        print(f"✅ Clôture : {cloturer()} ligne(s)")
+    elif commande == "verifier":
+        ecarts = verifier()
+        for compte, jour, idcompte, solde, attendu in ecarts:
+            print(f"⚠️ {compte} {idcompte} au {jour:%d/%m/%Y} : clôture={solde} historique={attendu}")
+        print(f"{'✅ Aucun écart' if not ecarts else f'❌ {len(ecarts)} écart(s)'}")
+        sys.exit(1 if ecarts else 0)
+    elif commande == "reconstruire":
+        installer()
+        print(f"✅ Clôtures reconstruites : {reconstruire()} ligne(s)")
+    else:
+        print("Usage : python soldes_journaliers.py [cloturer|verifier|reconstruire]")
@@ -0,0 +1,510 @@
+# -*- coding: utf-8 -*-
+"""
+Moteur de calcul de stock partagé (réservoir en unité de base).
+
+Remplace les copies de ``calculer_stock_article`` présentes dans les pages.
+Toutes les unités d'un même idarticle (PIECE, CARTON, ...) partagent un
+réservoir commun exprimé en unité de base : chaque mouvement est multiplié
+par le ``qtunite`` de son unité, puis le solde est divisé par le ``qtunite``
+de l'unité affichée.
+
+Les 10 sources de mouvements sont agrégées en UNE seule requête ensembliste,
+quel que soit le nombre d'articles / magasins demandés :
+    ENTRÉES (+) : Réceptions, Transferts IN, Inventaires, Avoirs, Échanges Entrée
+    SORTIES (-) : Ventes validées, Sorties BS, Transferts OUT,
+                  Consommation interne, Échanges Sortie
+
+✅ TABLE DE SOLDES (tb_stock_solde) :
+Quand elle existe, les lectures se font dans tb_stock_solde (une ligne par
+(idarticle, idmag)) au lieu de ré-agréger tout l'historique. Elle est tenue à
+jour par delta dans la transaction de chaque document (``appliquer_mouvements``
+/ ``appliquer_requete``), reconstruite par ``reconstruire_soldes`` et contrôlée
+par ``verifier_derive`` ; les mêmes appels tiennent le registre des lots de
+péremption (lots_peremption, consommation FEFO) :
+
+    python stock_engine.py reconstruire
+    python stock_engine.py verifier
+
+✅ reserver(cursor, lignes) : contrôle de toutes les lignes d'une sortie en
+une requête, soldes verrouillés jusqu'au commit (validation des ventes).
+
+Exemple :
+    from stock_engine import stock_for_many, stock_article
+
+    soldes = stock_for_many([(12, 1), (12, 2), (40, None)], conn=conn)
+    # {(12, 1): 240.0, (12, 2): 0.0, (40, None): 35.0}   (unité de base)
+
+    stock_carton = stock_article(12, idunite_carton, 1, conn=conn)
+"""
+
+import json
+import sys
+from contextlib import contextmanager
+
+from psycopg2.extras import execute_values
+
+from resource_utils import get_config_path
+from db_pool import connecter
+import lots_peremption
+
+
+# Mouvements signés (quantité saisie, dans l'unité du document) par
+# (idarticle, idunite, idmag). Requête sans paramètre : un filtre posé sur le
+# résultat (WHERE idarticle = ANY(...)) est poussé dans chaque branche.
+SQL_MOUVEMENTS = """
+    -- Réceptions (tb_livraisonfrs)
+    SELECT lf.idarticle, lf.idunite, lf.idmag, lf.qtlivrefrs AS quantite
+    FROM tb_livraisonfrs lf
+    WHERE lf.deleted = 0
+
+    UNION ALL
+    -- Ventes validées (tb_ventedetail)
+    SELECT vd.idarticle, vd.idunite, v.idmag, -vd.qtvente
+    FROM tb_ventedetail vd
+    INNER JOIN tb_vente v ON vd.idvente = v.id AND v.deleted = 0 AND v.statut = 'VALIDEE'
+    WHERE vd.deleted = 0
+
+    UNION ALL
+    -- Transferts entrants
+    SELECT t.idarticle, t.idunite, t.idmagentree, t.qttransfert
+    FROM tb_transfertdetail t
+    WHERE t.deleted = 0
+
+    UNION ALL
+    -- Transferts sortants
+    SELECT t.idarticle, t.idunite, t.idmagsortie, -t.qttransfert
+    FROM tb_transfertdetail t
+    WHERE t.deleted = 0
+
+    UNION ALL
+    -- Sorties (tb_sortiedetail)
+    SELECT sd.idarticle, sd.idunite, sd.idmag, -sd.qtsortie
+    FROM tb_sortiedetail sd
+
+    UNION ALL
+    -- Inventaires (rattachés à l'unité via codearticle)
+    SELECT u.idarticle, u.idunite, i.idmag, i.qtinventaire
+    FROM tb_inventaire i
+    INNER JOIN tb_unite u ON i.codearticle = u.codearticle
+
+    UNION ALL
+    -- Avoirs (retour marchandise)
+    SELECT ad.idarticle, ad.idunite, ad.idmag, ad.qtavoir
+    FROM tb_avoirdetail ad
+    INNER JOIN tb_avoir a ON ad.idavoir = a.id
+    WHERE a.deleted = 0 AND ad.deleted = 0
+
+    UNION ALL
+    -- Consommation interne
+    SELECT cd.idarticle, cd.idunite, cd.idmag, -cd.qtconsomme
+    FROM tb_consommationinterne_details cd
+
+    UNION ALL
+    -- Échanges entrée
+    SELECT dce.idarticle, dce.idunite, dce.idmagasin, dce.quantite_entree
+    FROM tb_detailchange_entree dce
+
+    UNION ALL
+    -- Échanges sortie
+    SELECT dcs.idarticle, dcs.idunite, dcs.idmagasin, -dcs.quantite_sortie
+    FROM tb_detailchange_sortie dcs
+"""
+
+# Coefficient vers l'unité de base (qtunite <= 0 ou NULL ramené à 1)
+COEFF_BASE = "CASE WHEN COALESCE(u.qtunite, 1) > 0 THEN COALESCE(u.qtunite, 1) ELSE 1 END"
+
+# Solde en unité de base par (idarticle, idmag), recalculé depuis l'historique.
+SQL_SOLDES_LEDGER = """
+    SELECT m.idarticle,
+           m.idmag,
+           SUM(m.quantite * """ + COEFF_BASE + """) AS solde_base
+    FROM (""" + SQL_MOUVEMENTS + """) AS m (idarticle, idunite, idmag, quantite)
+    INNER JOIN tb_unite u ON u.idarticle = m.idarticle AND u.idunite = m.idunite
+    WHERE m.idmag IS NOT NULL
+    GROUP BY m.idarticle, m.idmag
+"""
+
+# Solde limité aux articles demandés : un seul aller-retour.
+SQL_SOLDES_BASE = """
+    SELECT idarticle, idmag, solde_base
+    FROM (""" + SQL_SOLDES_LEDGER + """) AS s
+    WHERE s.idarticle = ANY(%(articles)s)
+"""
+
+SQL_QTUNITE = """
+    SELECT idarticle, idunite, COALESCE(qtunite, 1)
+    FROM tb_unite
+    WHERE idarticle = ANY(%s)
+"""
+
+# --- Table de soldes maintenue par delta ---
+SQL_CREATE_SOLDE = """
+    CREATE TABLE IF NOT EXISTS tb_stock_solde (
+        idarticle INT NOT NULL,
+        idmag INT NOT NULL,
+        solde_base NUMERIC(18, 4) NOT NULL DEFAULT 0,
+        datemaj TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (idarticle, idmag)
+    )
+"""
+
+SQL_LIRE_SOLDES = """
+    SELECT idarticle, idmag, solde_base
+    FROM tb_stock_solde
+    WHERE idarticle = ANY(%(articles)s)
+"""
+
+# Delta : lignes (idarticle, idunite, idmag, quantite_signee) converties en
+# unité de base puis cumulées dans tb_stock_solde.
+SQL_APPLIQUER_DELTA = """
+    INSERT INTO tb_stock_solde (idarticle, idmag, solde_base, datemaj)
+    SELECT m.idarticle, m.idmag, SUM(m.quantite * """ + COEFF_BASE + """), NOW()
+    FROM ({source}) AS m (idarticle, idunite, idmag, quantite)
+    INNER JOIN tb_unite u ON u.idarticle = m.idarticle AND u.idunite = m.idunite
+    WHERE m.idmag IS NOT NULL
+    GROUP BY m.idarticle, m.idmag
+    ON CONFLICT (idarticle, idmag) DO UPDATE
+        SET solde_base = tb_stock_solde.solde_base + EXCLUDED.solde_base,
+            datemaj = NOW()
+"""
+
+SQL_VERIFIER_DERIVE = """
+    SELECT COALESCE(t.idarticle, l.idarticle),
+           COALESCE(t.idmag, l.idmag),
+           COALESCE(t.solde_base, 0),
+           COALESCE(l.solde_base, 0)
+    FROM tb_stock_solde t
+    FULL OUTER JOIN (""" + SQL_SOLDES_LEDGER + """) AS l
+        ON l.idarticle = t.idarticle AND l.idmag = t.idmag
+    WHERE ABS(COALESCE(t.solde_base, 0) - COALESCE(l.solde_base, 0)) > %s
+    ORDER BY 1, 2
+"""
+
+# --- Réservation avant une sortie (validation d'une vente) ---
+VERROU_STOCK = 731_023     # pg_advisory_xact_lock(VERROU_STOCK, idarticle) sans tb_stock_solde
+
+# Lignes demandées (unnest, dans l'ordre) converties en unité de base
+SQL_LIGNES_RESERVEES = """
+    SELECT l.i, l.idarticle, l.idmag, """ + COEFF_BASE + """ AS coeff,
+           l.quantite * """ + COEFF_BASE + """ AS base
+    FROM unnest(%(articles)s::INT[], %(unites)s::INT[], %(magasins)s::INT[], %(quantites)s::NUMERIC[])
+         WITH ORDINALITY AS l (idarticle, idunite, idmag, quantite, i)
+    LEFT JOIN tb_unite u ON u.idarticle = l.idarticle AND u.idunite = l.idunite
+"""
+
+# (disponible, demande totale de l'article dans le magasin), dans l'unité de chaque ligne
+SQL_RESERVER = """
+    WITH lignes AS (""" + SQL_LIGNES_RESERVEES + """),
+    demande AS (
+        SELECT idarticle, idmag, SUM(base) AS base FROM lignes GROUP BY idarticle, idmag
+    ),
+    solde AS ({solde})
+    SELECT GREATEST(COALESCE(s.solde_base, 0), 0) / l.coeff, d.base / l.coeff
+    FROM lignes l
+    INNER JOIN demande d ON d.idarticle = l.idarticle AND d.idmag = l.idmag
+    LEFT JOIN solde s ON s.idarticle = l.idarticle AND s.idmag = l.idmag
+    ORDER BY l.i
+"""
+
+# Soldes verrouillés ligne à ligne (FOR UPDATE relit la dernière version validée)
+SQL_SOLDES_VERROUILLES = """
+    SELECT t.idarticle, t.idmag, t.solde_base FROM tb_stock_solde t
+    WHERE (t.idarticle, t.idmag) IN (SELECT idarticle, idmag FROM lignes)
+    ORDER BY t.idarticle, t.idmag
+    FOR UPDATE OF t
+"""
+
+SQL_SOLDES_LIGNES = """
+    SELECT s.idarticle, s.idmag, s.solde_base FROM (""" + SQL_SOLDES_LEDGER + """) AS s
+    WHERE s.idarticle = ANY(%(articles)s::INT[])
+"""
+
+# Verrous pris dans un ordre fixe (pas d'interblocage entre deux caisses)
+SQL_VERROUS_ARTICLES = """
+    SELECT pg_advisory_xact_lock(%(cle)s, x.idarticle)
+    FROM (SELECT DISTINCT unnest(%(articles)s::INT[]) AS idarticle ORDER BY 1) AS x
+"""
+
+# État de tb_stock_solde pour ce processus (None = pas encore vérifié)
+_solde_disponible = None
+
+
+def _connect():
+    """Emprunte une connexion au pool partagé (repli si aucune n'est fournie)."""
+    with open(get_config_path('config.json'), encoding='utf-8') as f:
+        db_config = json.load(f)['database']
+    return connecter(
+        host=db_config['host'],
+        user=db_config['user'],
+        password=db_config['password'],
+        database=db_config['database'],
+        port=db_config['port']
+    )
+
+
+@contextmanager
+def _cursor(conn=None):
+    """Curseur sur la connexion fournie, ou sur une connexion temporaire."""
+    proprietaire = conn is None
+    if proprietaire:
+        conn = _connect()
+    cursor = conn.cursor()
+    try:
+        yield cursor
+    finally:
+        cursor.close()
+        if proprietaire:
+            conn.close()
+
+
+def table_solde_disponible(cursor):
+    """True si tb_stock_solde a été construite (vérifié une fois par processus)."""
+    global _solde_disponible
+    if _solde_disponible is None:
+        cursor.execute("SELECT to_regclass('tb_stock_solde') IS NOT NULL")
+        _solde_disponible = bool(cursor.fetchone()[0])
+    return _solde_disponible
+
+
+def sql_soldes(cursor):
+    """
+    Fragment SQL sans paramètre renvoyant (idarticle, idmag, solde_base),
+    à intégrer dans les requêtes des pages (WITH solde AS (...)).
+    Lit tb_stock_solde si elle existe, sinon agrège l'historique.
+    """
+    if table_solde_disponible(cursor):
+        return "SELECT idarticle, idmag, solde_base FROM tb_stock_solde"
+    return SQL_SOLDES_LEDGER
+
+
+def soldes_base_par_magasin(idarticles, conn=None):
+    """
+    Retourne {(idarticle, idmag): solde en unité de base} pour les articles donnés.
+    Les couples sans aucun mouvement sont absents du dictionnaire.
+    """
+    idarticles = sorted({int(a) for a in idarticles if a is not None})
+    if not idarticles:
+        return {}
+
+    with _cursor(conn) as cursor:
+        sql = SQL_LIRE_SOLDES if table_solde_disponible(cursor) else SQL_SOLDES_BASE
+        cursor.execute(sql, {'articles': idarticles})
+        return {
+            (idarticle, idmag): float(solde or 0)
+            for idarticle, idmag, solde in cursor.fetchall()
+        }
+
+
+def stock_for_many(pairs, conn=None):
+    """
+    ✅ API BATCH : solde en unité de base pour chaque couple (idarticle, idmag).
+
+    Un idmag à None signifie "tous magasins confondus".
+    Retourne {(idarticle, idmag): solde_base} avec une entrée par couple demandé
+    (0.0 si aucun mouvement). Les soldes négatifs sont conservés tels quels.
+    """
+    pairs = list(pairs)
+    soldes = soldes_base_par_magasin((a for a, _ in pairs), conn=conn)
+
+    totaux = {}
+    for (idarticle, _), solde in soldes.items():
+        totaux[idarticle] = totaux.get(idarticle, 0.0) + solde
+
+    resultat = {}
+    for idarticle, idmag in pairs:
+        if idmag is None:
+            resultat[(idarticle, idmag)] = totaux.get(idarticle, 0.0)
+        else:
+            resultat[(idarticle, idmag)] = soldes.get((idarticle, idmag), 0.0)
+    return resultat
+
+
+def qtunite_par_unite(idarticles, conn=None):
+    """Retourne {(idarticle, idunite): qtunite} (qtunite <= 0 ramené à 1)."""
+    idarticles = sorted({int(a) for a in idarticles if a is not None})
+    if not idarticles:
+        return {}
+
+    with _cursor(conn) as cursor:
+        cursor.execute(SQL_QTUNITE, (idarticles,))
+        return {
+            (idarticle, idunite): (float(qt) if qt and qt > 0 else 1.0)
+            for idarticle, idunite, qt in cursor.fetchall()
+        }
+
+
+def stock_unites(triples, conn=None):
+    """
+    Stock affiché pour chaque triplet (idarticle, idunite, idmag).
+
+    Réservoir de base / qtunite de l'unité cible, borné à 0 comme dans les
+    anciennes versions de ``calculer_stock_article``.
+    Deux requêtes au total, quel que soit le nombre de lignes.
+    """
+    triples = list(triples)
+    if not triples:
+        return {}
+
+    proprietaire = conn is None
+    if proprietaire:
+        conn = _connect()
+    try:
+        soldes = stock_for_many({(a, m) for a, _, m in triples}, conn=conn)
+        coefficients = qtunite_par_unite((a for a, _, _ in triples), conn=conn)
+    finally:
+        if proprietaire:
+            conn.close()
+
+    return {
+        (idarticle, idunite, idmag): max(
+            0, soldes[(idarticle, idmag)] / coefficients.get((idarticle, idunite), 1.0)
+        )
+        for idarticle, idunite, idmag in triples
+    }
+
+
+def stock_article(idarticle, idunite, idmag=None, conn=None):
+    """Stock affiché d'une unité d'article (remplaçant direct de calculer_stock_article)."""
+    triple = (idarticle, idunite, idmag)
+    return stock_unites([triple], conn=conn)[triple]
+
+
+# ==============================================================================
+# Mise à jour par delta (à appeler AVANT le commit du document)
+# ==============================================================================
+def appliquer_mouvements(cursor, mouvements):
+    """
+    Cumule des mouvements dans tb_stock_solde, dans la transaction du curseur.
+
+    mouvements : itérable de (idarticle, idunite, idmag, quantite_signee[, dateperemption]),
+    quantité dans l'unité du document (+ entrée, - sortie) ; la date de
+    péremption (réceptions) ne sert qu'au registre des lots.
+    Sans effet tant que tb_stock_solde n'a pas été construite.
+    """
+    mouvements = list(mouvements)
+    lots_peremption.appliquer_mouvements(cursor, mouvements)
+    lignes = [
+        (int(a), int(u), int(m), float(q or 0))
+        for a, u, m, q, *_ in mouvements
+        if a is not None and u is not None and m is not None and q
+    ]
+    if not lignes or not table_solde_disponible(cursor):
+        return
+
+    sql = SQL_APPLIQUER_DELTA.format(source="VALUES %s")
+    execute_values(cursor, sql, lignes, template="(%s::int, %s::int, %s::int, %s::numeric)",
+                   page_size=len(lignes))
+
+
+def appliquer_requete(cursor, select_sql, params=None, signe=1):
+    """
+    Cumule dans tb_stock_solde les lignes d'un SELECT (idarticle, idunite, idmag, quantite).
+    Permet d'appliquer un document déjà en base en un seul aller-retour, ex :
+
+        appliquer_requete(cursor,
+            "SELECT vd.idarticle, vd.idunite, v.idmag, vd.qtvente FROM ... WHERE v.id = %s",
+            (idvente,), signe=-1)
+    """
+    lots_peremption.appliquer_requete(cursor, select_sql, params, signe)
+    if not table_solde_disponible(cursor):
+        return
+
+    source = f"SELECT q.idarticle, q.idunite, q.idmag, {int(signe)} * q.quantite FROM ({select_sql}) AS q (idarticle, idunite, idmag, quantite)"
+    cursor.execute(SQL_APPLIQUER_DELTA.format(source=source), params)
+
+
+def reserver(cursor, lignes):
+    """
+    ✅ Vérifie des sorties contre les soldes courants et verrouille les
+    réservoirs concernés jusqu'à la fin de la transaction du curseur : une
+    autre caisse qui valide le même article attend le commit puis lit le
+    solde déjà diminué (pas de survente).
+
+    lignes : (idarticle, idunite, idmag, quantite) ; à appeler AVANT
+    d'appliquer la sortie (appliquer_requete / appliquer_mouvements).
+    Retourne, dans l'ordre des lignes, (disponible, demande) dans l'unité
+    de la ligne ; demande = total de l'article dans ce magasin sur toutes
+    les lignes. Un seul aller-retour quand tb_stock_solde existe (FOR UPDATE),
+    deux sinon (verrous consultatifs par article puis calcul sur l'historique).
+    """
+    lignes = list(lignes)
+    if not lignes:
+        return []
+    params = {
+        'articles': [int(a) for a, _, _, _ in lignes],
+        'unites': [int(u) for _, u, _, _ in lignes],
+        'magasins': [int(m) for _, _, m, _ in lignes],
+        'quantites': [float(q or 0) for _, _, _, q in lignes],
+    }
+    if table_solde_disponible(cursor):
+        solde = SQL_SOLDES_VERROUILLES
+    else:
+        cursor.execute(SQL_VERROUS_ARTICLES, dict(params, cle=VERROU_STOCK))
+        solde = SQL_SOLDES_LIGNES
+    cursor.execute(SQL_RESERVER.format(solde=solde), params)
+    return [(float(disponible), float(demande)) for disponible, demande in cursor.fetchall()]
+
+
+# ==============================================================================
+# Commandes de maintenance
+# ==============================================================================
+def reconstruire_soldes(conn=None):
+    """
+    🔄 Reconstruit tb_stock_solde depuis l'historique complet (crée la table au besoin).
+    Retourne le nombre de couples (idarticle, idmag) écrits.
+    """
+    global _solde_disponible
+    proprietaire = conn is None
+    if proprietaire:
+        conn = _connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(SQL_CREATE_SOLDE)
+        # Bloque les deltas concurrents pendant la reconstruction
+        cursor.execute("LOCK TABLE tb_stock_solde IN ACCESS EXCLUSIVE MODE")
+        cursor.execute("DELETE FROM tb_stock_solde")
+        cursor.execute(
+            "INSERT INTO tb_stock_solde (idarticle, idmag, solde_base, datemaj) "
+            "SELECT idarticle, idmag, solde_base, NOW() FROM (" + SQL_SOLDES_LEDGER + ") AS s"
+        )
+        nb_lignes = cursor.rowcount
+        conn.commit()
+        cursor.close()
+        _solde_disponible = True
+        return nb_lignes
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if proprietaire:
+            conn.close()
+
+
+def verifier_derive(conn=None, tolerance=0.001):
+    """
+    🔍 Compare tb_stock_solde à l'historique.
+    Retourne la liste des écarts (idarticle, idmag, solde_table, solde_historique).
+    """
+    with _cursor(conn) as cursor:
+        if not table_solde_disponible(cursor):
+            return []
+        cursor.execute(SQL_VERIFIER_DERIVE, (tolerance,))
+        return [
+            (idarticle, idmag, float(solde_table), float(solde_ledger))
+            for idarticle, idmag, solde_table, solde_ledger in cursor.fetchall()
+        ]
+
+
+if __name__ == "__main__":
+    commande = sys.argv[1] if len(sys.argv) > 1 else ""
+
+    if commande == "reconstruire":
+        print(f"✅ tb_stock_solde reconstruite : {reconstruire_soldes()} lignes")
+    elif commande == "verifier":
+        ecarts = verifier_derive()
+        for idarticle, idmag, solde_table, solde_ledger in ecarts:
+            print(f"⚠️ Article {idarticle} / Magasin {idmag} : table={solde_table} historique={solde_ledger}")
+        print(f"{'✅ Aucun écart' if not ecarts else f'❌ {len(ecarts)} écart(s)'}")
+        sys.exit(1 if ecarts else 0)
+    else:
+        print("Usage : python stock_engine.py [reconstruire|verifier]")
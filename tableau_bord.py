@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Indicateurs du tableau de bord (page d'accueil).
+
+Avant : page_home appelait neuf fonctions get_* l'une après l'autre sur le
+thread Tk ; chacune relisait config.json, ouvrait sa connexion et lançait
+UNE agrégation. L'accueil n'apparaissait qu'après la dixième requête.
+
+✅ Tous les indicateurs + les derniers événements en UN aller-retour :
+   un seul SELECT de sous-requêtes scalaires, sur une connexion du pool.
+   Si ce SELECT échoue (table absente sur une ancienne base...), chaque
+   indicateur est recalculé séparément : un indicateur en erreur vaut 0
+   sans masquer les autres.
+✅ Solde de caisse : dernière clôture journalière + mouvements depuis
+   (soldes_journaliers) au lieu de tout l'historique à chaque affichage.
+✅ Filtres de date sargables (datepmt >= CURRENT_DATE AND < CURRENT_DATE + 1)
+   au lieu de DATE(datepmt) = CURRENT_DATE.
+✅ Cache avec durée de vie (DUREE_CACHE) partagé par le processus : revenir
+   sur l'accueil affiche immédiatement les dernières valeurs connues.
+✅ rafraichir(widget, appliquer) calcule dans un thread et rappelle
+   appliquer(indicateurs) sur le thread Tk.
+
+Exemple :
+    valeurs = tableau_bord.en_cache()            # None au premier affichage
+    tableau_bord.rafraichir(frame, afficher)     # afficher(valeurs) plus tard
+"""
+
+import threading
+import time
+
+import db_pool
+import soldes_journaliers
+import thread_tk
+
+
+DUREE_CACHE = 60    # secondes avant de recalculer les indicateurs
+NB_EVENEMENTS = 4
+
+# (clé, expression SQL scalaire) — l'ordre est celui des colonnes du SELECT
+INDICATEURS = [
+    ("total_client", """
+        SELECT COALESCE(SUM(CASE WHEN idtypeoperation = 1 THEN mtpaye ELSE -mtpaye END), 0)
+        FROM (
+            SELECT idtypeoperation, mtpaye FROM tb_pmtfacture
+            WHERE datepmt >= CURRENT_DATE AND datepmt < CURRENT_DATE + 1
+              AND id_banque IS NULL
+            UNION ALL
+            SELECT idtypeoperation, mtpaye FROM tb_pmtcredit
+            WHERE datepmt >= CURRENT_DATE AND datepmt < CURRENT_DATE + 1
+              AND id_banque IS NULL
+        ) AS clients
+    """),
+    ("total_fournisseur", """
+        SELECT COALESCE(SUM(totcmd), 0) FROM tb_commande
+        WHERE datecom >= CURRENT_DATE AND datecom < CURRENT_DATE + 1
+    """),
+    ("dettes", """
+        SELECT COALESCE(SUM(solde_total), 0)
+        FROM (
+            SELECT tc.totcmd - COALESCE(SUM(tp.mtpaye), 0.00) AS solde_total
+            FROM tb_commande tc
+            JOIN tb_livraisonfrs tlf ON tlf.idcom = tc.idcom
+            LEFT JOIN tb_pmtcom tp ON tp.refcom = tc.refcom
+            WHERE tlf.reflivfrs IS NOT NULL
+            GROUP BY tc.idcom, tc.totcmd
+        ) AS calcul_solde
+        WHERE solde_total > 0
+    """),
+    ("absences", """
+        SELECT COUNT(*) FROM tb_absence WHERE date = CURRENT_DATE
+    """),
+    ("credit", """
+        SELECT COALESCE(SUM(solde), 0)
+        FROM (
+            SELECT tv.totmtvente - COALESCE(SUM(tp.mtpaye), 0.00) AS solde
+            FROM tb_vente tv
+            INNER JOIN tb_modepaiement tmp ON tv.idmode = tmp.idmode
+            LEFT JOIN tb_pmtcredit tp ON tv.refvente = tp.refvente
+            WHERE tmp.modedepaiement = 'Crédit'
+            GROUP BY tv.refvente, tv.totmtvente
+            HAVING tv.totmtvente - COALESCE(SUM(tp.mtpaye), 0.00) > 0
+        ) AS credits_actifs
+    """),
+    ("appro", """
+        SELECT COUNT(DISTINCT reflivfrs) FROM tb_livraisonfrs
+        WHERE dateregistre >= CURRENT_DATE AND dateregistre < CURRENT_DATE + 1
+    """),
+    ("encaissement", """
+        SELECT COALESCE(SUM(mtpaye), 0) FROM tb_encaissement
+        WHERE datepmt >= CURRENT_DATE AND datepmt < CURRENT_DATE + 1
+          AND idtypeoperation = 1
+    """),
+    ("decaissement", """
+        SELECT COALESCE(SUM(mtpaye), 0) FROM tb_decaissement
+        WHERE datepmt >= CURRENT_DATE AND datepmt < CURRENT_DATE + 1
+          AND idtypeoperation = 2
+    """),
+]
+
+SQL_EVENEMENTS = f"""
+    SELECT evenements, date FROM tb_evenement ORDER BY date DESC LIMIT {NB_EVENEMENTS}
+"""
+
+# Les événements voyagent dans la même ligne, sous forme de tableau JSON
+SQL_TABLEAU_BORD = "SELECT " + ",\n       ".join(
+    [f"({sql.strip()}) AS {cle}" for cle, sql in INDICATEURS]
+    + [f"(SELECT COALESCE(json_agg(json_build_array(e.evenements, e.date::TEXT) ORDER BY e.date DESC), '[]'::json) "
+       f"FROM ({SQL_EVENEMENTS.strip()}) e) AS evenements"]
+)
+
+
+# ==============================================================================
+# Formatage
+# ==============================================================================
+def format_ariary(montant):
+    """1250000 -> '1 250 000 Ar'"""
+    return f"{montant or 0:,.0f} Ar".replace(",", " ")
+
+
+def format_evenement(evenement, date_event):
+    """('Inventaire', '2026-03-01') -> '📅 Inventaire - 01/03/2026'"""
+    if date_event:
+        date_str = "/".join(reversed(str(date_event)[:10].split("-")))
+    else:
+        date_str = "Date non définie"
+    return f"📅 {evenement} - {date_str}"
+
+
+def formater(brut):
+    """Valeurs brutes de la base -> textes affichés par les cartes de page_home."""
+    return {
+        "total_client": format_ariary(brut["total_client"]),
+        "total_fournisseur": format_ariary(brut["total_fournisseur"]),
+        "dettes": format_ariary(brut["dettes"]),
+        "absences": str(brut["absences"] or 0),
+        "solde_caisse": format_ariary(brut["solde_caisse"]),
+        "credit": format_ariary(brut["credit"]),
+        "appro": f"{brut['appro'] or 0} BR",
+        "encaissement": format_ariary(brut["encaissement"]),
+        "decaissement": format_ariary(brut["decaissement"]),
+        "evenements": [format_evenement(e, d) for e, d in brut["evenements"]],
+    }
+
+
+# ==============================================================================
+# Calcul
+# ==============================================================================
+def _un_par_un(conn):
+    """Repli : chaque indicateur dans sa propre requête, 0 en cas d'erreur."""
+    brut = {}
+    cursor = conn.cursor()
+    try:
+        for cle, sql in INDICATEURS:
+            try:
+                cursor.execute(sql)
+                brut[cle] = cursor.fetchone()[0]
+            except Exception as e:
+                conn.rollback()
+                print(f"Indicateur {cle} indisponible : {e}")
+                brut[cle] = 0
+        try:
+            cursor.execute(SQL_EVENEMENTS)
+            brut["evenements"] = cursor.fetchall()
+        except Exception as e:
+            conn.rollback()
+            print(f"Événements indisponibles : {e}")
+            brut["evenements"] = []
+    finally:
+        cursor.close()
+    return brut
+
+
+def calculer(conn=None):
+    """Lit tous les indicateurs (un aller-retour) et renvoie les textes formatés."""
+    proprietaire = conn is None
+    if proprietaire:
+        conn = db_pool.pool_global().emprunter()
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(SQL_TABLEAU_BORD)
+            ligne = cursor.fetchone()
+            brut = {cle: valeur for (cle, _), valeur in zip(INDICATEURS, ligne)}
+            brut["evenements"] = ligne[-1] or []
+        except Exception as e:
+            conn.rollback()
+            print(f"Tableau de bord groupé impossible, calcul indicateur par indicateur : {e}")
+            brut = _un_par_un(conn)
+        try:
+            brut["solde_caisse"] = soldes_journaliers.solde_caisse(cursor)
+        except Exception as e:
+            conn.rollback()
+            print(f"Indicateur solde_caisse indisponible : {e}")
+            brut["solde_caisse"] = 0
+        finally:
+            cursor.close()
+        conn.rollback()  # lecture seule : ne pas garder la transaction ouverte
+        return formater(brut)
+    finally:
+        if proprietaire:
+            conn.close()
+
+
+# ==============================================================================
+# Cache + rafraîchissement en arrière-plan
+# ==============================================================================
+_cache = {"instant": 0.0, "valeurs": None}
+_verrou = threading.Lock()
+
+
+def en_cache(duree=None):
+    """
+    Dernières valeurs calculées (même expirées si duree est None), sinon None.
+    duree : n'accepter que des valeurs plus récentes que `duree` secondes.
+    """
+    with _verrou:
+        valeurs, instant = _cache["valeurs"], _cache["instant"]
+    if valeurs is None:
+        return None
+    if duree is not None and time.monotonic() - instant > duree:
+        return None
+    return valeurs
+
+
+def invalider():
+    """Force le prochain rafraichir() à relire la base."""
+    with _verrou:
+        _cache["instant"] = 0.0
+
+
+def indicateurs(force=False):
+    """Valeurs formatées, depuis le cache si elles ont moins de DUREE_CACHE secondes."""
+    valeurs = None if force else en_cache(DUREE_CACHE)
+    if valeurs is None:
+        valeurs = calculer()
+        with _verrou:
+            _cache["valeurs"] = valeurs
+            _cache["instant"] = time.monotonic()
+    return valeurs
+
+
+def rafraichir(widget, appliquer, force=False, erreur=None):
+    """
+    Calcule les indicateurs dans un thread puis appelle appliquer(valeurs) sur
+    le thread Tk (si le widget existe encore). Sans effet immédiat sur l'UI :
+    à appeler après avoir construit la page avec en_cache() ou des "…".
+    """
+    valeurs = None if force else en_cache(DUREE_CACHE)
+    if valeurs is not None:
+        thread_tk.sur_thread_tk(widget, lambda: appliquer(valeurs))
+        return
+
+    thread_tk.preparer(widget)
+
+    def travail():
+        try:
+            resultat = indicateurs(force=force)
+            thread_tk.sur_thread_tk(widget, lambda: appliquer(resultat))
+        except Exception as e:
+            if erreur:
+                thread_tk.sur_thread_tk(widget, lambda e=e: erreur(e))
+            else:
+                print(f"Erreur lors de la récupération des indicateurs : {e}")
+
+    threading.Thread(target=travail, daemon=True).start()
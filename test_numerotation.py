@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+🧪 TEST DE CHARGE - NUMÉROTATION DES DOCUMENTS
+Plusieurs threads (une connexion chacun, comme plusieurs postes) attribuent des
+références en parallèle : aucune référence en double, aucun trou après les
+rollbacks, apercu() annonce bien la référence suivante.
+
+    python test_numerotation.py     (ou pytest test_numerotation.py)
+Sans base accessible (ou sans psycopg2), les tests sont ignorés (SkipTest).
+"""
+
+import random
+import sys
+import threading
+import unittest
+
+import json
+import os
+from resource_utils import get_config_path
+
+try:
+    import psycopg2
+    import numerotation
+except ImportError:     # pas de pilote PostgreSQL : tests ignorés
+    psycopg2 = numerotation = None
+
+TYPE_TEST = "TST"       # type hors numerotation.TYPES : compteur démarré à 1
+ANNEE_TEST = 1900       # année qu'aucun document réel n'utilise
+NB_THREADS = 16
+NB_PAR_THREAD = 50
+
+
+def connect_db():
+    """Établit la connexion à la base de données"""
+    if psycopg2 is None:
+        return None
+    try:
+        config_path = get_config_path('config.json')
+        if not os.path.exists(config_path):
+            config_path = 'config.json'
+
+        with open(config_path, 'r', encoding='utf-8') as f:
+            db_config = json.load(f)['database']
+
+        return psycopg2.connect(
+            host=db_config['host'],
+            user=db_config['user'],
+            password=db_config['password'],
+            database=db_config['database'],
+            port=db_config['port'],
+            client_encoding='UTF8'
+        )
+    except Exception as err:
+        print(f"❌ Erreur de connexion: {err}")
+        return None
+
+
+def nettoyer(conn):
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM tb_compteur_document WHERE type_doc = %s AND annee = %s",
+                   (TYPE_TEST, ANNEE_TEST))
+    conn.commit()
+    cursor.close()
+
+
+def preparer():
+    """Table installée et compteur de test remis à zéro ; SkipTest sans base."""
+    conn = connect_db()
+    if not conn:
+        raise unittest.SkipTest("base de données inaccessible")
+    try:
+        numerotation.installer(conn)
+        conn.commit()
+        nettoyer(conn)
+    finally:
+        conn.close()
+
+
+def test_threads():
+    """Test 1: NB_THREADS threads x NB_PAR_THREAD attributions, ~1 sur 5 annulée"""
+    print("\n" + "="*80)
+    print(f"🧪 TEST 1: {NB_THREADS} THREADS x {NB_PAR_THREAD} RÉFÉRENCES")
+    print("="*80)
+    preparer()
+
+    validees = []
+    erreurs = []
+    verrou = threading.Lock()
+    depart = threading.Barrier(NB_THREADS)
+
+    def poste():
+        conn = connect_db()
+        if not conn:
+            erreurs.append("connexion")
+            depart.abort()
+            return
+        try:
+            cursor = conn.cursor()
+            depart.wait()
+            for _ in range(NB_PAR_THREAD):
+                ref = numerotation.prochaine_reference(cursor, TYPE_TEST, ANNEE_TEST)
+                if random.random() < 0.2:
+                    conn.rollback()     # enregistrement abandonné : le numéro doit être rendu
+                    continue
+                conn.commit()
+                with verrou:
+                    validees.append(ref)
+        except Exception as e:
+            erreurs.append(str(e))
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=poste) for _ in range(NB_THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not erreurs, f"{len(erreurs)} erreur(s) : {erreurs[:3]}"
+
+    doublons = len(validees) - len(set(validees))
+    assert not doublons, f"{doublons} référence(s) en double"
+
+    attendues = {numerotation.formater(TYPE_TEST, ANNEE_TEST, n) for n in range(1, len(validees) + 1)}
+    assert set(validees) == attendues, \
+        f"numérotation avec trous ({len(attendues - set(validees))} manquant(s))"
+
+    print(f"✅ PASS: {len(validees)} références validées, uniques et sans trou")
+
+
+def test_apercu():
+    """Test 2: apercu() = référence attribuée ensuite"""
+    print("\n" + "="*80)
+    print("🧪 TEST 2: APERÇU")
+    print("="*80)
+    preparer()
+
+    conn = connect_db()
+    try:
+        cursor = conn.cursor()
+        prevue = numerotation.apercu(cursor, TYPE_TEST, ANNEE_TEST)
+        attribuee = numerotation.prochaine_reference(cursor, TYPE_TEST, ANNEE_TEST)
+        conn.rollback()
+        assert prevue == attribuee, f"aperçu {prevue} / attribuée {attribuee}"
+        print(f"✅ PASS: {prevue}")
+    finally:
+        conn.close()
+
+
+def teardown_module(module=None):
+    """Compteur de test supprimé (appelé par pytest, et par main())."""
+    conn = connect_db()
+    if conn:
+        try:
+            nettoyer(conn)
+        finally:
+            conn.close()
+
+
+def main():
+    tests = [
+        ("Attribution concurrente", test_threads),
+        ("Aperçu", test_apercu),
+    ]
+    results = {}
+    try:
+        for nom, test in tests:
+            try:
+                test()
+                results[nom] = True
+            except unittest.SkipTest as e:
+                print(f"⏭️ IGNORÉ: {e}")
+                return 1
+            except AssertionError as e:
+                print(f"❌ FAIL: {e}")
+                results[nom] = False
+    finally:
+        teardown_module()
+
+    print("\n" + "="*80)
+    for nom, ok in results.items():
+        print(f"{'✅ PASSÉ' if ok else '❌ ÉCHOUÉ'} - {nom}")
+    print("="*80)
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
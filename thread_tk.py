@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Retour sur le thread Tk des résultats calculés dans un thread de travail.
+
+Avant : les threads de travail (recherche d'articles, tableau de bord, export
+PDF, enregistrement des ventes...) appelaient eux-mêmes widget.after(0, ...).
+Tkinter n'est pas thread-safe : selon la construction de Tcl, un appel Tk
+hors du thread principal lève RuntimeError (« main thread is not in main
+loop »), bloque, ou corrompt l'interpréteur de façon aléatoire.
+
+✅ Une file (queue.Queue) par fenêtre racine : les threads de travail y
+   déposent (widget, action) sans aucun appel Tk.
+✅ Le thread Tk relève la file toutes les PERIODE_MS ms (after) et exécute
+   chaque action si son widget existe encore.
+✅ preparer(widget) sur le thread Tk AVANT de lancer le thread de travail
+   (idempotent : démarre la relève de sa racine une seule fois).
+
+Exemple :
+    thread_tk.preparer(self)                                  # thread Tk
+
+    def travail():                                            # thread de travail
+        resultat = calcul()
+        thread_tk.sur_thread_tk(self, lambda: self.afficher(resultat))
+
+    threading.Thread(target=travail, daemon=True).start()
+"""
+
+import queue
+import sys
+import threading
+
+
+PERIODE_MS = 50     # délai maximal entre le dépôt d'une action et son exécution
+
+_files = {}         # id(racine) -> queue.Queue de (widget, action), None une fois la racine détruite
+_verrou = threading.Lock()
+
+
+def _racine(widget):
+    # Misc._root() remonte les .master en Python, sans appel Tcl
+    return widget._root()
+
+
+def preparer(widget):
+    """Thread Tk uniquement : démarre (une fois par racine) la relève de la file."""
+    racine = _racine(widget)
+    with _verrou:
+        if _files.get(id(racine)) is not None:
+            return
+        file_ = _files[id(racine)] = queue.Queue()
+
+    def relever():
+        while True:
+            try:
+                cible, action = file_.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if cible.winfo_exists():
+                    action()
+            except Exception:
+                racine.report_callback_exception(*sys.exc_info())
+        try:
+            racine.after(PERIODE_MS, relever)
+        except Exception:
+            with _verrou:       # application fermée : rappels tardifs ignorés
+                _files[id(racine)] = None
+
+    relever()
+
+
+def sur_thread_tk(widget, action):
+    """Depuis n'importe quel thread : action() sur le thread Tk, si le widget existe encore."""
+    if threading.current_thread() is threading.main_thread():
+        preparer(widget)
+    with _verrou:
+        cle = id(_racine(widget))
+        if cle not in _files:
+            raise RuntimeError("thread_tk.preparer(widget) doit être appelé sur le thread Tk avant le thread de travail")
+        file_ = _files[cle]
+    if file_ is not None:
+        file_.put((widget, action))
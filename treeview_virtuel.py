@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Treeview virtuel pour les grandes grilles (stock, articles, factures, mouvements).
+
+Avant : chaque ligne était insérée dans le ttk.Treeview (des dizaines de
+milliers de tree.insert, avec calcul du tag zébré ligne par ligne) et chaque
+filtrage supprimait puis réinsérait tout.
+
+✅ TreeviewVirtuel garde les lignes dans une liste Python et ne crée que les
+items VISIBLES (une trentaine) : défiler ne fait que réécrire leurs valeurs.
+Ouvrir la page, filtrer ou trier ne touche donc qu'une fenêtre de lignes,
+quel que soit le nombre total.
+
+    - s'utilise comme un ttk.Treeview (columns, heading, column, tag_configure,
+      bind, selection, item(sel)['values'] sur la ligne sélectionnée...) ;
+    - barre de défilement : command=tree.yview et yscrollcommand=sb.set,
+      exactement comme avant ;
+    - tags zébrés calculés à l'affichage (restent alternés après un tri ou un
+      filtre), plus un tag d'alerte éventuel via tag_ligne ;
+    - tri par clic sur l'en-tête (activer_tri), redimensionnement natif des colonnes.
+
+Exemple :
+    tree = TreeviewVirtuel(frame, columns=cols, show="headings")
+    tree.definir_lignes(lignes, vide=("", "Aucun article trouvé", ""))
+    tree.filtrer(lambda l: terme in l[1].lower())
+    for valeurs in tree.lignes_affichees(): ...      # export
+"""
+
+import tkinter as tk
+from tkinter import ttk
+
+
+def tag_zebre(ligne, position):
+    """Tag par défaut : alternance even / odd."""
+    return ("even",) if position % 2 == 0 else ("odd",)
+
+
+def cle_tri(valeur):
+    """Clé de tri : nombres (y compris "1 234,50") avant le texte, sans casse."""
+    if isinstance(valeur, (int, float)):
+        return (0, valeur, "")
+    texte = str(valeur if valeur is not None else "")
+    try:
+        return (0, float(texte.replace(" ", "").replace("\xa0", "").replace(",", ".")), "")
+    except ValueError:
+        return (1, 0, texte.lower())
+
+
+class TreeviewVirtuel(ttk.Treeview):
+    """ttk.Treeview qui n'affiche que la fenêtre visible d'une liste de lignes."""
+
+    def __init__(self, master=None, valeurs_ligne=None, tag_ligne=None, sur_fin=None, **kw):
+        """
+        valeurs_ligne : valeurs_ligne(ligne) -> tuple affiché (par défaut la ligne elle-même).
+        tag_ligne     : tag_ligne(ligne, position) -> tuple de tags (par défaut zébré).
+        sur_fin       : sur_fin() appelée quand la dernière ligne devient visible
+                        (chargement de la page suivante côté serveur).
+        Les autres options sont celles de ttk.Treeview.
+        """
+        self._yscroll = kw.pop('yscrollcommand', None)
+        super().__init__(master, **kw)
+        self._valeurs_ligne = valeurs_ligne or (lambda ligne: ligne)
+        self._tag_ligne = tag_ligne or tag_zebre
+        self._sur_fin = sur_fin
+        self._lignes = []          # toutes les lignes
+        self._vue = []             # indices des lignes affichées (filtre + tri)
+        self._vide = None          # valeurs de la ligne "aucun résultat"
+        self._predicat = None
+        self._tri = None           # (colonne, décroissant)
+        self._textes_entetes = {}
+        self._premiere = 0         # position de la première ligne visible dans _vue
+        self._nb_visibles = int(kw.get('height', 10) or 10)
+        self._slots = []           # iids des items réellement créés
+        self._selection = None     # position sélectionnée dans _vue
+
+        self.bind('<Configure>', lambda e: self.after_idle(self._ajuster_hauteur), add='+')
+        self.bind('<MouseWheel>', self._sur_molette, add='+')
+        self.bind('<Button-4>', lambda e: self._defiler(-3), add='+')
+        self.bind('<Button-5>', lambda e: self._defiler(3), add='+')
+        for touche, pas in (('<Up>', -1), ('<Down>', 1), ('<Prior>', 'page-'),
+                            ('<Next>', 'page+'), ('<Home>', 'debut'), ('<End>', 'fin')):
+            self.bind(touche, lambda e, p=pas: self._sur_touche(p))
+
+    # ------------------------------------------------------------------
+    # Données
+    # ------------------------------------------------------------------
+    def definir_lignes(self, lignes, vide=None):
+        """Remplace toutes les lignes (filtre et tri courants réappliqués)."""
+        self._lignes = list(lignes)
+        self._vide = tuple(vide) if vide is not None else None
+        self._recalculer_vue()
+
+    def ajouter_lignes(self, lignes):
+        """Ajoute des lignes à la fin sans perdre la position de défilement ni la sélection."""
+        self._memoriser_selection()
+        debut = len(self._lignes)
+        self._lignes.extend(lignes)
+        nouvelles = range(debut, len(self._lignes))
+        if self._predicat is not None:
+            nouvelles = [i for i in nouvelles if self._predicat(self._lignes[i])]
+        self._vue.extend(nouvelles)
+        if self._tri is not None:
+            self._trier_vue()
+        self._rendre()
+
+    def vider(self):
+        """Supprime toutes les lignes."""
+        self.definir_lignes([])
+
+    def filtrer(self, predicat=None, vide=None):
+        """
+        N'affiche que les lignes pour lesquelles predicat(ligne) est vrai (None : toutes).
+        vide : valeurs de la ligne affichée si aucune ne correspond (inchangée par défaut).
+        """
+        self._predicat = predicat
+        if vide is not None:
+            self._vide = tuple(vide)
+        self._recalculer_vue()
+
+    def trier(self, colonne, decroissant=None):
+        """Trie l'affichage sur une colonne (clic répété : inverse l'ordre)."""
+        if decroissant is None:
+            decroissant = bool(self._tri and self._tri[0] == colonne and not self._tri[1])
+        self._tri = (colonne, decroissant)
+        self._afficher_fleche()
+        self._recalculer_vue()
+
+    def activer_tri(self, colonnes=None):
+        """Tri par clic sur l'en-tête des colonnes données (toutes par défaut)."""
+        for colonne in colonnes or self['columns']:
+            self.heading(colonne, command=lambda c=colonne: self.trier(c))
+
+    def lignes(self):
+        """Toutes les lignes (non filtrées)."""
+        return list(self._lignes)
+
+    def lignes_affichees(self):
+        """Valeurs des lignes filtrées, dans l'ordre affiché (export)."""
+        return [self._valeurs_ligne(self._lignes[i]) for i in self._vue]
+
+    def nombre(self):
+        """Nombre de lignes affichées (après filtre)."""
+        return len(self._vue)
+
+    def ligne_selectionnee(self):
+        """Ligne (objet d'origine) sélectionnée, ou None."""
+        self._memoriser_selection()
+        if self._selection is None or self._selection >= len(self._vue):
+            return None
+        return self._lignes[self._vue[self._selection]]
+
+    def _recalculer_vue(self):
+        vue = range(len(self._lignes))
+        if self._predicat is not None:
+            vue = [i for i in vue if self._predicat(self._lignes[i])]
+        self._vue = list(vue)
+        if self._tri is not None:
+            self._trier_vue()
+        self._premiere = 0
+        self._selection = None
+        self._rendre()
+
+    def _trier_vue(self):
+        colonnes = list(self['columns'])
+        if self._tri[0] not in colonnes:
+            return
+        rang = colonnes.index(self._tri[0])
+
+        def cle(i):
+            valeurs = self._valeurs_ligne(self._lignes[i])
+            return cle_tri(valeurs[rang] if rang < len(valeurs) else "")
+        self._vue.sort(key=cle, reverse=self._tri[1])
+
+    def _afficher_fleche(self):
+        for colonne in self['columns']:
+            texte = self._textes_entetes.setdefault(colonne, self.heading(colonne, 'text'))
+            if self._tri and self._tri[0] == colonne:
+                texte += " ▼" if self._tri[1] else " ▲"
+            self.heading(colonne, text=texte)
+
+    # ------------------------------------------------------------------
+    # Rendu de la fenêtre visible
+    # ------------------------------------------------------------------
+    def _rendre(self):
+        total = len(self._vue)
+        self._premiere = max(0, min(self._premiere, total - self._nb_visibles))
+        if total:
+            contenu = [
+                (self._valeurs_ligne(self._lignes[self._vue[p]]), self._tag_ligne(self._lignes[self._vue[p]], p))
+                for p in range(self._premiere, min(total, self._premiere + self._nb_visibles))
+            ]
+        elif self._vide is not None:
+            contenu = [(self._vide, ("even",))]
+        else:
+            contenu = []
+
+        while len(self._slots) < len(contenu):
+            self._slots.append(super().insert("", "end"))
+        while len(self._slots) > len(contenu):
+            super().delete(self._slots.pop())
+        for iid, (valeurs, tags) in zip(self._slots, contenu):
+            super().item(iid, values=valeurs, tags=tags)
+
+        # La sélection suit la ligne de données, pas l'emplacement
+        rang = None if self._selection is None or not total else self._selection - self._premiere
+        if rang is not None and 0 <= rang < len(self._slots):
+            if tuple(super().selection()) != (self._slots[rang],):
+                super().selection_set(self._slots[rang])
+            super().focus(self._slots[rang])
+        elif super().selection():
+            super().selection_set(())
+        self._notifier_defilement()
+
+        if self._sur_fin is not None and total and self._premiere + self._nb_visibles >= total:
+            # Après le rendu : le rappel peut ajouter des lignes (ajouter_lignes)
+            self.after_idle(self._sur_fin)
+
+    def _notifier_defilement(self):
+        if self._yscroll is None:
+            return
+        total = len(self._vue)
+        if total <= self._nb_visibles:
+            debut, fin = 0.0, 1.0
+        else:
+            debut = self._premiere / total
+            fin = min(1.0, (self._premiere + self._nb_visibles) / total)
+        self._yscroll(debut, fin)
+
+    def _ajuster_hauteur(self):
+        """Nombre d'items = lignes entièrement visibles dans la hauteur actuelle."""
+        if not self._slots:
+            return
+        try:
+            boite = super().bbox(self._slots[0])
+        except tk.TclError:
+            return
+        if not boite:
+            return
+        _, y, _, hauteur_ligne = boite
+        if hauteur_ligne <= 0:
+            return
+        nb = max(1, (self.winfo_height() - y) // hauteur_ligne)
+        if nb != self._nb_visibles:
+            self._memoriser_selection()
+            self._nb_visibles = nb
+            self._rendre()
+
+    # ------------------------------------------------------------------
+    # Défilement et clavier
+    # ------------------------------------------------------------------
+    def yview(self, *args):
+        """Défilement virtuel (appelé par la barre de défilement)."""
+        total = len(self._vue)
+        if not args:
+            if total <= self._nb_visibles:
+                return (0.0, 1.0)
+            return (self._premiere / total, min(1.0, (self._premiere + self._nb_visibles) / total))
+        self._memoriser_selection()
+        if args[0] == 'moveto':
+            self._premiere = int(float(args[1]) * total)
+        elif args[0] == 'scroll':
+            pas = int(float(args[1]))
+            self._premiere += pas * self._nb_visibles if args[2] == 'pages' else pas
+        self._rendre()
+
+    def yview_moveto(self, fraction):
+        self.yview('moveto', fraction)
+
+    def yview_scroll(self, nombre, quoi):
+        self.yview('scroll', nombre, quoi)
+
+    def configure(self, cnf=None, **kw):
+        if cnf and 'yscrollcommand' in cnf:
+            cnf = dict(cnf)
+            self._yscroll = cnf.pop('yscrollcommand')
+        if 'yscrollcommand' in kw:
+            self._yscroll = kw.pop('yscrollcommand')
+            self._notifier_defilement()
+        if 'columns' in kw or (cnf and 'columns' in cnf):
+            # Nouvelles colonnes : le tri et les en-têtes mémorisés ne s'appliquent plus
+            self._tri = None
+            self._textes_entetes = {}
+        if cnf or kw:
+            return super().configure(cnf, **kw)
+
+    config = configure
+
+    def voir(self, position):
+        """Fait défiler jusqu'à la position (dans l'ordre affiché)."""
+        if position < self._premiere:
+            self._premiere = position
+        elif position >= self._premiere + self._nb_visibles:
+            self._premiere = position - self._nb_visibles + 1
+        self._rendre()
+
+    def selectionner(self, position):
+        """Sélectionne la ligne à cette position (dans l'ordre affiché) et la rend visible."""
+        if not self._vue:
+            return
+        self._selection = max(0, min(position, len(self._vue) - 1))
+        self.voir(self._selection)
+        self.event_generate('<<TreeviewSelect>>')
+
+    def _defiler(self, lignes):
+        self._memoriser_selection()
+        self._premiere += lignes
+        self._rendre()
+        return "break"
+
+    def _sur_molette(self, event):
+        return self._defiler(-3 if event.delta > 0 else 3)
+
+    def _sur_touche(self, pas):
+        self._memoriser_selection()
+        position = self._selection if self._selection is not None else self._premiere
+        if pas == 'page-':
+            position -= self._nb_visibles
+        elif pas == 'page+':
+            position += self._nb_visibles
+        elif pas == 'debut':
+            position = 0
+        elif pas == 'fin':
+            position = len(self._vue) - 1
+        else:
+            position += pas
+        self.selectionner(position)
+        return "break"
+
+    def _memoriser_selection(self):
+        """Traduit l'item sélectionné par l'utilisateur en position de données (avant de défiler)."""
+        selection = super().selection()
+        if selection and selection[0] in self._slots and self._vue:
+            self._selection = self._premiere + self._slots.index(selection[0])